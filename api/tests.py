@@ -0,0 +1,178 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from bikes.models import Bike
+from bikes.views import BIKE_ORDERINGS
+from core.testing import QueryBudgetMixin
+from rentals.models import Rental
+from reviews.models import Review
+
+
+class BikeApiTest(QueryBudgetMixin, TestCase):
+    """
+    Tests for the bike list and detail endpoints.
+    """
+
+    def setUp(self):
+        """
+        Set up 25 available bikes and one rented bike.
+        """
+        self.bikes = [
+            Bike.objects.create(
+                name=f'Bike {number:02}', type='City', size='M',
+                price_per_hour=number % 7 + 1,
+                description='<p>Long rich text</p>',
+            )
+            for number in range(25)
+        ]
+        self.rented = Bike.objects.create(
+            name='Rented', type='Road', price_per_hour=9.00,
+            is_available=False,
+        )
+        self.url = reverse('api_bike_list')
+
+    def test_list_walks_every_sort_in_one_query_per_page(self):
+        """
+        Test each sort returns every available bike once, in order.
+        """
+        for sort_by, ordering in BIKE_ORDERINGS.items():
+            with self.subTest(sort_by=sort_by):
+                expected = list(
+                    Bike.objects.filter(is_available=True)
+                    .order_by(*ordering).values_list('id', flat=True)
+                )
+                seen = []
+                url = f'{self.url}?sort_by={sort_by}'
+                while url:
+                    with self.assertQueryBudget(1):
+                        data = self.client.get(url).json()
+                    seen.extend(bike['id'] for bike in data['results'])
+                    url = data['next']
+                self.assertEqual(seen, expected)
+
+    def test_list_skips_description_unless_requested(self):
+        """
+        Test the default list fields and the fields= projection.
+        """
+        bike = self.client.get(self.url).json()['results'][0]
+        self.assertNotIn('description', bike)
+        self.assertIn('rating_average', bike)
+        bike = self.client.get(
+            self.url, {'fields': 'id,name,description'}
+        ).json()['results'][0]
+        self.assertEqual(
+            bike,
+            {'id': bike['id'], 'name': 'Bike 00',
+             'description': '<p>Long rich text</p>'},
+        )
+
+    def test_unknown_field_is_rejected(self):
+        """
+        Test an unknown field name returns a 400 error.
+        """
+        response = self.client.get(self.url, {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['error'])
+
+    def test_etag_returns_not_modified_until_catalog_changes(self):
+        """
+        Test If-None-Match polls get a 304 with a single query.
+        """
+        etag = self.client.get(self.url)['ETag']
+        with self.assertQueryBudget(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.bikes[0].price_per_hour = 99
+        self.bikes[0].save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_detail_returns_all_fields(self):
+        """
+        Test the detail endpoint, including a missing bike.
+        """
+        url = reverse('api_bike_detail', kwargs={'pk': self.rented.pk})
+        data = self.client.get(url).json()
+        self.assertEqual(data['name'], 'Rented')
+        self.assertFalse(data['is_available'])
+        self.assertEqual(data['price_per_hour'], '9.00')
+        self.assertIn('description', data)
+        response = self.client.get(
+            reverse('api_bike_detail', kwargs={'pk': 0})
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class ReviewAndRentalApiTest(QueryBudgetMixin, TestCase):
+    """
+    Tests for the bike reviews and the user rentals endpoints.
+    """
+
+    def setUp(self):
+        """
+        Set up a bike with reviews and a user with rentals.
+        """
+        self.user = User.objects.create_user(
+            username='apiuser', password='password'
+        )
+        self.bike = Bike.objects.create(
+            name='Reviewed', type='City', price_per_hour=5.00
+        )
+        for number in range(25):
+            author = User.objects.create_user(
+                username=f'author{number}', password='password'
+            )
+            Review.objects.create(
+                bike=self.bike, user=author, rating=5,
+                comment=f"Comment {number}",
+            )
+        for number in range(3):
+            Rental.objects.create(
+                user=self.user, bike=self.bike,
+                end_time=timezone.now(), total_cost=5 + number,
+            )
+
+    def test_reviews_are_paginated_with_authors(self):
+        """
+        Test every review is listed once, one query per page.
+        """
+        url = reverse('api_bike_reviews', kwargs={'pk': self.bike.pk})
+        seen = []
+        while url:
+            with self.assertQueryBudget(1):
+                data = self.client.get(url).json()
+            seen.extend(review['id'] for review in data['results'])
+            url = data['next']
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+        self.assertTrue(data['results'][0]['author'].startswith('author'))
+
+    def test_rentals_require_login(self):
+        """
+        Test anonymous users get a 401 error.
+        """
+        response = self.client.get(reverse('api_my_rentals'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_rentals_list_own_rentals(self):
+        """
+        Test the logged-in user's rentals, newest first.
+        """
+        other = User.objects.create_user(
+            username='other', password='password'
+        )
+        Rental.objects.create(user=other, bike=self.bike)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('api_my_rentals'))
+        self.assertIn('private', response['Cache-Control'])
+        results = response.json()['results']
+        self.assertEqual(
+            [rental['total_cost'] for rental in results],
+            ['7.00', '6.00', '5.00'],
+        )
+        self.assertEqual(results[0]['bike']['name'], 'Reviewed')
+        self.assertFalse(results[0]['active'])
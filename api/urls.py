@@ -0,0 +1,16 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    # Available bikes, sorted and paginated like the home page.
+    path('bikes/', views.bike_list, name='api_bike_list'),
+    # One bike, by primary key.
+    path('bikes/<int:pk>/', views.bike_detail, name='api_bike_detail'),
+    # The reviews of one bike, newest first.
+    path(
+        'bikes/<int:pk>/reviews/', views.bike_reviews,
+        name='api_bike_reviews'
+        ),
+    # The logged-in user's rentals, newest first.
+    path('rentals/', views.my_rentals, name='api_my_rentals'),
+]
@@ -0,0 +1,240 @@
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_GET
+
+from bikes.models import Bike
+from bikes.views import BIKE_ORDERINGS, get_sort_by
+from core.pagination import cursor_url, paginate_keyset
+from rentals.models import Rental
+from reviews.views import review_page
+
+# Number of objects in each page of results.
+PAGE_SIZE = 20
+# Newest rentals first; 'id' breaks ties for the cursor pagination.
+RENTAL_ORDERING = ('-start_time', '-id')
+
+
+def bike_image(bike):
+    """
+    Returns the URL of the bike's image (built locally, no request).
+    """
+    return bike.featured_image.url if bike.featured_image else None
+
+
+# The bike fields a client can ask for, mapped to the model fields they
+# need and the function that reads them.
+BIKE_FIELDS = {
+    'id': (('id',), lambda bike: bike.id),
+    'name': (('name',), lambda bike: bike.name),
+    'type': (('type',), lambda bike: bike.type),
+    'size': (('size',), lambda bike: bike.size),
+    'description': (('description',), lambda bike: bike.description),
+    'is_available': (('is_available',), lambda bike: bike.is_available),
+    'price_per_hour': (
+        ('price_per_hour',), lambda bike: bike.price_per_hour
+    ),
+    'image': (('featured_image',), bike_image),
+    'rating_average': (
+        ('rating_average',), lambda bike: bike.rating_average
+    ),
+    'rating_count': (('rating_count',), lambda bike: bike.rating_count),
+}
+# Lists leave out the description, a large rich-text field.
+DEFAULT_LIST_FIELDS = tuple(
+    field for field in BIKE_FIELDS if field != 'description'
+)
+
+
+class BadRequest(Exception):
+    """
+    An invalid query parameter, answered with a 400 JSON error.
+    """
+
+
+def error_response(message, status):
+    """
+    Returns a JSON error response.
+    """
+    return JsonResponse({'error': message}, status=status)
+
+
+def requested_fields(request, default):
+    """
+    Returns the fields selected with `?fields=a,b`, or the default ones.
+
+    **Raises:**
+    - `BadRequest`: If an unknown field is requested.
+    """
+    value = request.GET.get('fields')
+    if not value:
+        return default
+    fields = tuple(dict.fromkeys(
+        field.strip() for field in value.split(',') if field.strip()
+    ))
+    unknown = [field for field in fields if field not in BIKE_FIELDS]
+    if unknown:
+        raise BadRequest(f"Unknown fields: {', '.join(unknown)}.")
+    return fields
+
+
+def load_bikes(queryset, fields):
+    """
+    Restricts a bike queryset to the columns the fields need.
+    """
+    columns = {
+        column for field in fields for column in BIKE_FIELDS[field][0]
+    }
+    # The cursor is built from the ordering fields, always load them.
+    columns.update(
+        field.lstrip('-') for field in queryset.query.order_by
+    )
+    return queryset.only(*columns)
+
+
+def serialize_bike(bike, fields):
+    """
+    Returns the requested fields of a bike as a dict.
+    """
+    return {field: BIKE_FIELDS[field][1](bike) for field in fields}
+
+
+def page_links(request, page):
+    """
+    Returns the `next` and `previous` links of a `CursorPage`.
+    """
+    return {
+        'next': request.path + cursor_url(request, page.next_cursor)
+        if page.has_next else None,
+        'previous': request.path + cursor_url(request, page.previous_cursor)
+        if page.has_previous else None,
+    }
+
+
+def etag_response(request, data, private=False):
+    """
+    Returns `data` as JSON with a strong ETag, or a 304 Not Modified.
+
+    The ETag is a hash of the exact body, so a client polling with
+    `If-None-Match` gets an empty 304 while nothing it can see changed.
+
+    **Args:**
+    - `request`: The HTTP request object.
+    - `data`: The JSON serializable response data.
+    - `private`: True if the data belongs to the logged-in user.
+
+    **Returns:**
+    - An `HttpResponse`.
+    """
+    body = json.dumps(data, cls=DjangoJSONEncoder)
+    etag = '"%s"' % hashlib.md5(body.encode()).hexdigest()
+    response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    # Clients may keep the response, but must check it is still current.
+    patch_cache_control(response, no_cache=True, private=private)
+    return get_conditional_response(request, etag=etag, response=response)
+
+
+@require_GET
+def bike_list(request):
+    """
+    Lists the available bikes, one page at a time.
+
+    **Query parameters:**
+    - `sort_by`: One of the home page sort keys (default `name_asc`).
+    - `cursor`: The `next` or `previous` cursor of another page.
+    - `fields`: Comma separated fields to return (the description is
+    only returned when requested).
+
+    **Returns:**
+    - `{"results": [...], "next": url, "previous": url}`; a single query.
+    """
+    try:
+        fields = requested_fields(request, DEFAULT_LIST_FIELDS)
+    except BadRequest as error:
+        return error_response(str(error), 400)
+    sort_by = get_sort_by(request)
+    bikes = Bike.objects.filter(is_available=True).order_by(
+        *BIKE_ORDERINGS[sort_by]
+    )
+    page = paginate_keyset(
+        load_bikes(bikes, fields), request.GET.get('cursor'), PAGE_SIZE
+    )
+    return etag_response(request, {
+        'results': [serialize_bike(bike, fields) for bike in page],
+        **page_links(request, page),
+    })
+
+
+@require_GET
+def bike_detail(request, pk):
+    """
+    Returns one bike, with all fields unless `fields` is given.
+    """
+    try:
+        fields = requested_fields(request, tuple(BIKE_FIELDS))
+    except BadRequest as error:
+        return error_response(str(error), 400)
+    bike = load_bikes(Bike.objects.filter(pk=pk), fields).first()
+    if bike is None:
+        return error_response("Bike not found.", 404)
+    return etag_response(request, serialize_bike(bike, fields))
+
+
+@require_GET
+def bike_reviews(request, pk):
+    """
+    Lists the reviews of a bike, newest first, with their authors.
+
+    Unknown bikes return an empty list rather than spending a query
+    on checking the bike exists.
+    """
+    page = review_page(pk, request.GET.get('cursor'))
+    return etag_response(request, {
+        'results': [
+            {
+                'id': review.id,
+                'rating': review.rating,
+                'comment': review.comment,
+                'author': review.user.username,
+                'created_at': review.created_at,
+            }
+            for review in page
+        ],
+        **page_links(request, page),
+    })
+
+
+@require_GET
+def my_rentals(request):
+    """
+    Lists the logged-in user's rentals, newest first.
+
+    **Returns:**
+    - The rentals with their bike, or a 401 error for anonymous users.
+    """
+    if not request.user.is_authenticated:
+        return error_response("Authentication required.", 401)
+    rentals = Rental.objects.filter(user=request.user).select_related(
+        'bike'
+    ).only(
+        'start_time', 'end_time', 'total_cost', 'bike__id', 'bike__name'
+    ).order_by(*RENTAL_ORDERING)
+    page = paginate_keyset(rentals, request.GET.get('cursor'), PAGE_SIZE)
+    return etag_response(request, {
+        'results': [
+            {
+                'id': rental.id,
+                'bike': {'id': rental.bike.id, 'name': rental.bike.name},
+                'start_time': rental.start_time,
+                'end_time': rental.end_time,
+                'total_cost': rental.total_cost,
+                'active': rental.end_time is None,
+            }
+            for rental in page
+        ],
+        **page_links(request, page),
+    }, private=True)
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bike_rental.settings')
+# Serve the read-heavy pages with their async views (see settings.py).
+os.environ.setdefault('ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
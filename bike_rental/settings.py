@@ -46,7 +46,8 @@ if HEROKU_HOSTNAME:
 # Application definition
 
 INSTALLED_APPS = [
-    'django.contrib.admin',
+    # django.contrib.admin, with the admin pages read from the replica.
+    'core.apps.ReplicaAdminConfig',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -68,6 +69,7 @@ INSTALLED_APPS = [
     'rentals',
     'reviews',
     'profiles',
+    'api',
 ]
 
 # Required by django-allauth
@@ -78,6 +80,10 @@ CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 
 MIDDLEWARE = [
+    # First, so the recorded latency covers the whole stack.
+    'core.metrics.MetricsMiddleware',
+    # Logs the slow queries of the whole stack.
+    'core.slow_queries.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -87,6 +93,8 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     #  Add allauth middleware
     'allauth.account.middleware.AccountMiddleware',
+    # Profiles the requests of staff asking for it (needs the user).
+    'core.profiling.ProfilerMiddleware',
     # Add whitenoise middleware
     'whitenoise.middleware.WhiteNoiseMiddleware',
 
@@ -96,7 +104,8 @@ ROOT_URLCONF = 'bike_rental.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # The Django backend, timing renders for the metrics.
+        'BACKEND': 'core.metrics.TimedDjangoTemplates',
         # Update 'DIRS' key, look for templates in a 'templates' folder
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
@@ -112,6 +121,12 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'bike_rental.wsgi.application'
+ASGI_APPLICATION = 'bike_rental.asgi.application'
+
+# Route the read-heavy pages (bike list, bike detail, profile) to their
+# async views. bike_rental/asgi.py turns it on by default; under WSGI
+# the sync views are faster, as each async view needs an event loop.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '').lower() in ('1', 'true')
 
 
 # Database
@@ -137,6 +152,145 @@ if 'test' in sys.argv:
         'NAME': ':memory:',
     }
 
+# Optional read replica (e.g. a Heroku follower of the primary).
+# The read-only pages read from it, see core/db_router.py.
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+if DATABASE_REPLICA_URL:
+    DATABASES['replica'] = dj_database_url.parse(DATABASE_REPLICA_URL)
+# Alias of the replica, None to read everything from the primary.
+READ_REPLICA = 'replica' if DATABASE_REPLICA_URL else None
+# How long (seconds) a client that wrote reads from the primary, longer
+# than the replication lag, so it always sees its own changes.
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 10))
+
+DATABASE_ROUTERS = ['core.db_router.PrimaryReplicaRouter']
+
+# Tests get a second, separate database to check the routing against,
+# and only the routing tests turn the replica on.
+if 'test' in sys.argv:
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+    READ_REPLICA = None
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+# Use Redis when REDIS_URL is set (shared by all dynos).
+# Otherwise fall back to a file cache, which the gunicorn workers
+# on one machine share, or to local memory if CACHE_DIR is empty.
+REDIS_URL = os.environ.get('REDIS_URL')
+CACHE_DIR = os.environ.get(
+    'CACHE_DIR', os.path.join(BASE_DIR, '.cache', 'django')
+)
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+elif CACHE_DIR:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': CACHE_DIR,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Tests run without a cache, cache tests enable one with override_settings.
+if 'test' in sys.argv:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+        }
+    }
+
+# How long (seconds) rendered bike cards and cached catalog pages live.
+# Entries are also invalidated by version keys when bikes change.
+BIKE_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+CATALOG_CACHE_TIMEOUT = 60 * 5
+# How long (seconds) whole pages are cached for anonymous visitors.
+# Short, as the upcoming reservations on a detail page expire.
+PAGE_CACHE_TIMEOUT = 60 * 5
+
+
+# Request metrics (core/metrics.py), served at /metrics.
+# Every gunicorn worker of the machine adds its numbers to this SQLite
+# file; an empty METRICS_DB turns metrics off.
+METRICS_DB = os.environ.get(
+    'METRICS_DB', os.path.join(BASE_DIR, '.cache', 'metrics.sqlite3')
+)
+# How often (seconds) a worker writes its numbers to the file.
+METRICS_FLUSH_SECONDS = 5
+# Bearer token of the Prometheus scraper, staff can always read them.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+# Tests keep their metrics in memory.
+if 'test' in sys.argv:
+    METRICS_DB = ':memory:'
+
+
+# On-demand request profiling (core/profiling.py), off by default.
+# Staff members send an X-Profile header to profile a request, and
+# PROFILE_SAMPLE_RATE (0 to 1) profiles a share of all requests.
+PROFILING = os.environ.get('PROFILING', '').lower() in ('1', 'true')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+# Number of profiles kept, the oldest are deleted.
+PROFILE_KEEP = 200
+
+
+# Slow query log (core/slow_queries.py), browsed in the admin.
+# Queries slower than SLOW_QUERY_MS milliseconds are saved with their
+# EXPLAIN plan by a background thread; 0 turns the log off.
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))
+# Number of slow queries kept, the oldest are deleted.
+SLOW_QUERY_KEEP = 1000
+# Capture plans, at most once per query and process every interval
+# (seconds): EXPLAIN ANALYZE runs the query again.
+SLOW_QUERY_EXPLAIN = os.environ.get(
+    'SLOW_QUERY_EXPLAIN', 'true'
+).lower() in ('1', 'true')
+SLOW_QUERY_EXPLAIN_INTERVAL = 600
+SLOW_QUERY_EXPLAIN_TIMEOUT_MS = 5000
+SLOW_QUERY_ASYNC = True
+# Tests turn the log on where they check it, and save the slow queries
+# before the response, in their transaction.
+if 'test' in sys.argv:
+    SLOW_QUERY_MS = 0
+    SLOW_QUERY_ASYNC = False
+
+
+# Background jobs (core/jobs.py), stored in the database and run by
+# `manage.py run_worker`. A failed job is retried after
+# JOB_RETRY_DELAY seconds, doubled on each attempt up to
+# JOB_MAX_RETRY_DELAY, then fails for good after JOB_MAX_ATTEMPTS.
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_DELAY = 10
+JOB_MAX_RETRY_DELAY = 3600
+# A job running for longer is considered left behind by a crashed
+# worker and queued again: keep it above the longest job.
+JOB_LEASE_SECONDS = 600
+# Days done jobs are kept (failed jobs are kept until deleted).
+JOB_RETENTION_DAYS = 7
+
+
+# Rental sweeper (`manage.py sweep_rentals`, rentals/sweeper.py).
+# Rentals open for longer than RENTAL_OVERDUE_HOURS are flagged as
+# overdue; after RENTAL_CLOSE_HOURS they are closed and charged as if
+# returned, and their bikes are available again (0 only flags them).
+RENTAL_OVERDUE_HOURS = int(os.environ.get('RENTAL_OVERDUE_HOURS', 24))
+RENTAL_CLOSE_HOURS = int(os.environ.get('RENTAL_CLOSE_HOURS', 72))
+# Rentals flagged or closed per transaction.
+RENTAL_SWEEP_BATCH_SIZE = 500
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
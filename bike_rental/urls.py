@@ -18,6 +18,8 @@ from django.contrib import admin
 # Add include
 from django.urls import path, include
 
+from core.views import metrics
+
 # Define custom 404 handler
 handler404 = 'core.views.handler404'
 
@@ -35,4 +37,8 @@ urlpatterns = [
     path('summernote/', include('django_summernote.urls')),
     # Include Reviews URLs
     path('reviews/', include('reviews.urls')),
+    # Include the read-only JSON API URLs
+    path('api/', include('api.urls')),
+    # Prometheus metrics, for staff and the scraper's token.
+    path('metrics', metrics, name='metrics'),
 ]
@@ -1,6 +1,6 @@
 from django.contrib import admin
 # Import Bike model.
-from .models import Bike
+from .models import RATING_FIELDS, Bike
 # Import SummernoteModelAdmin for rich text.
 from django_summernote.admin import SummernoteModelAdmin
 
@@ -14,9 +14,13 @@ class BikeAdmin(SummernoteModelAdmin):
     **Admin Panel Features:**
     - Uses the Summernote editor for the `description` field
     for a rich text editing experience.
+    - Shows the stored rating aggregates as read-only fields,
+    they are maintained from the reviews.
 
     **Inherits from:**
     - `django_summernote.admin.SummernoteModelAdmin`: Provides
     the Summernote widget for specified fields.
     """
     summernote_fields = ('description',)
+    # Rating aggregates are updated by the review signals.
+    readonly_fields = RATING_FIELDS
@@ -1,6 +1,22 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def restore_search_triggers(sender, using, **kwargs):
+    """
+    Puts back the SQLite search triggers after a migration that
+    rebuilt the bikes table (see `bikes.search.restore_sqlite_search`).
+    """
+    from bikes.search import restore_sqlite_search
+    restore_sqlite_search(using)
 
 
 class BikesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bikes'
+
+    # Import signals that invalidate the cached bike cards and pages,
+    # and keep the search index in sync after every migrate.
+    def ready(self):
+        import bikes.signals  # noqa: F401
+        post_migrate.connect(restore_search_triggers, sender=self)
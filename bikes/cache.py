@@ -0,0 +1,339 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from core.pagination import CursorPage, apaginate_keyset
+from .models import Bike
+from .search import afacet_rows, facet_rows
+
+# Cache key of the catalog version. Any change that can move a bike
+# in or out of a page (availability, price, rating...) bumps it, which
+# makes every cached page id list unreachable at once.
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+def get_version(key):
+    """
+    Returns the version number stored under `key`, creating it if needed.
+
+    A new version starts from the current time in milliseconds, so a
+    version lost by cache eviction never reuses an old number.
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key, 0)
+    return version
+
+
+async def aget_version(key):
+    """
+    Async version of `get_version`.
+    """
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, int(time.time() * 1000), None)
+        version = await cache.aget(key, 0)
+    return version
+
+
+def catalog_version():
+    """
+    Returns the current catalog version.
+    """
+    return get_version(CATALOG_VERSION_KEY)
+
+
+async def acatalog_version():
+    """
+    Async version of `catalog_version`.
+    """
+    return await aget_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    """
+    Invalidates all cached catalog pages.
+    """
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        # The key does not exist (yet), start a new version.
+        cache.add(CATALOG_VERSION_KEY, int(time.time() * 1000), None)
+
+
+def invalidate_catalog():
+    """
+    Invalidates the cached catalog pages once the current transaction
+    commits (right away outside a transaction).
+
+    Bumping before the commit would let a concurrent request cache the
+    old rows under the new version.
+    """
+    transaction.on_commit(bump_catalog_version)
+
+
+# Cache key of the version shared by all the bike detail pages.
+# Bumped by bulk changes that bypass the model signals.
+BIKE_PAGES_VERSION_KEY = 'bike-page:version'
+
+
+def bike_page_version(bike_id):
+    """
+    Returns the version of a bike's cached detail page.
+    """
+    return '{}.{}'.format(
+        get_version(BIKE_PAGES_VERSION_KEY),
+        get_version(f'bike-page:version:{bike_id}'),
+    )
+
+
+def invalidate_bike_page(bike_id):
+    """
+    Invalidates the cached detail page of a bike after the commit.
+    """
+    def bump():
+        try:
+            cache.incr(f'bike-page:version:{bike_id}')
+        except ValueError:
+            # Not cached (or evicted), nothing to invalidate.
+            pass
+    transaction.on_commit(bump)
+
+
+def invalidate_all_bike_pages():
+    """
+    Invalidates every cached bike detail page after the commit.
+
+    Used by bulk updates instead of one invalidation per bike.
+    """
+    def bump():
+        try:
+            cache.incr(BIKE_PAGES_VERSION_KEY)
+        except ValueError:
+            # Not cached (or evicted), nothing to invalidate.
+            pass
+    transaction.on_commit(bump)
+
+
+# Number of cards on the first row of the catalog. Their images are
+# visible when the page opens; the next ones are lazy loaded.
+EAGER_CARDS = 3
+
+
+def card_key(bike, eager=False):
+    """
+    Returns the cache key of a bike's rendered card.
+
+    Cards whose image loads right away (`eager`) are cached apart.
+    """
+    loading = 'eager' if eager else 'lazy'
+    return f'bike-card:{bike.pk}:{bike.card_version}:{loading}'
+
+
+def card_entries(bikes):
+    """
+    Returns the `(key, bike, eager)` of each card, in display order.
+    """
+    return [
+        (card_key(bike, index < EAGER_CARDS), bike, index < EAGER_CARDS)
+        for index, bike in enumerate(bikes)
+    ]
+
+
+def page_key(sort_by, cursor, page_size, version=None):
+    """
+    Returns the cache key of one page of the catalog id list.
+
+    `version` defaults to the current catalog version.
+    """
+    if version is None:
+        version = catalog_version()
+    position = hashlib.md5((cursor or '').encode()).hexdigest()
+    return f'catalog:{version}:{sort_by}:{page_size}:{position}'
+
+
+def cached_page(cached):
+    """
+    Returns the `CursorPage` of a cached catalog page.
+    """
+    bikes = [
+        Bike(id=bike_id, card_version=version)
+        for bike_id, version in cached['rows']
+    ]
+    page = CursorPage(bikes, cached['next'], cached['previous'])
+    page.from_cache = True
+    return page
+
+
+def page_entry(page):
+    """
+    Returns the cache entry of a catalog page.
+    """
+    return {
+        'rows': [(bike.pk, bike.card_version) for bike in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    }
+
+
+def get_catalog_page(queryset, sort_by, cursor, page_size, paginate):
+    """
+    Returns a catalog page, from the cache when possible.
+
+    Only the ordered `(id, card_version)` pairs and the cursors are
+    cached. On a hit the page holds unsaved `Bike` instances that only
+    have `id` and `card_version` set, enough to find their cards.
+
+    **Args:**
+    - `queryset`: The ordered queryset of listed bikes.
+    - `sort_by`: The sort key, part of the cache key.
+    - `cursor`, `page_size`: The page to return.
+    - `paginate`: The function that paginates the queryset on a miss.
+
+    **Returns:**
+    - A `CursorPage`, with `from_cache` set to True on a hit.
+    """
+    key = page_key(sort_by, cursor, page_size)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached_page(cached)
+
+    page = paginate(queryset, cursor, page_size)
+    cache.set(key, page_entry(page), settings.CATALOG_CACHE_TIMEOUT)
+    page.from_cache = False
+    return page
+
+
+async def aget_catalog_page(queryset, sort_by, cursor, page_size):
+    """
+    Async version of `get_catalog_page`, paginating with
+    `apaginate_keyset` on a miss.
+    """
+    version = await acatalog_version()
+    key = page_key(sort_by, cursor, page_size, version)
+    cached = await cache.aget(key)
+    if cached is not None:
+        return cached_page(cached)
+
+    page = await apaginate_keyset(queryset, cursor, page_size)
+    await cache.aset(key, page_entry(page), settings.CATALOG_CACHE_TIMEOUT)
+    page.from_cache = False
+    return page
+
+
+def get_facet_rows(queryset):
+    """
+    Returns the `facet_rows` of the catalog, from the cache when possible.
+
+    Only for the catalog without a search or an availability period:
+    its rows, cached under the catalog version, give the counts of
+    every combination of facet filters.
+
+    **Args:**
+    - `queryset`: The listed bikes, before the facet filters.
+    """
+    key = f'catalog:{catalog_version()}:facets'
+    rows = cache.get(key)
+    if rows is None:
+        rows = facet_rows(queryset)
+        cache.set(key, rows, settings.CATALOG_CACHE_TIMEOUT)
+    return rows
+
+
+async def aget_facet_rows(queryset):
+    """
+    Async version of `get_facet_rows`.
+    """
+    key = f'catalog:{await acatalog_version()}:facets'
+    rows = await cache.aget(key)
+    if rows is None:
+        rows = await afacet_rows(queryset)
+        await cache.aset(key, rows, settings.CATALOG_CACHE_TIMEOUT)
+    return rows
+
+
+def render_bike_cards(bikes, complete=True):
+    """
+    Returns the HTML card of each bike, reusing cached cards.
+
+    Cards are cached under the bike's `card_version`, so a card is
+    rendered again only after that bike (or one of its reviews)
+    changed. All cards are fetched with one `get_many` call.
+    The first `EAGER_CARDS` cards load their image right away, the
+    next ones lazily, and both kinds are cached apart.
+
+    **Args:**
+    - `bikes`: The bikes to render, in display order.
+    - `complete`: False if the bikes only have `id` and `card_version`
+    (a cached page); missing cards then load their bikes in one query.
+
+    **Returns:**
+    - A list of HTML strings, one per bike.
+    """
+    entries = card_entries(bikes)
+    cards = cache.get_many([key for key, _, _ in entries])
+    missing = {
+        key: (bike, eager) for key, bike, eager in entries
+        if key not in cards
+    }
+    if missing:
+        if not complete:
+            loaded = Bike.objects.in_bulk(
+                [bike.pk for bike, _ in missing.values()]
+            )
+            missing = loaded_cards(missing, loaded)
+        rendered = render_cards(missing)
+        cache.set_many(rendered, settings.BIKE_CARD_CACHE_TIMEOUT)
+        cards.update(rendered)
+    return [mark_safe(cards[key]) for key, _, _ in entries if key in cards]
+
+
+async def arender_bike_cards(bikes, complete=True):
+    """
+    Async version of `render_bike_cards`.
+    """
+    entries = card_entries(bikes)
+    cards = await cache.aget_many([key for key, _, _ in entries])
+    missing = {
+        key: (bike, eager) for key, bike, eager in entries
+        if key not in cards
+    }
+    if missing:
+        if not complete:
+            loaded = await Bike.objects.ain_bulk(
+                [bike.pk for bike, _ in missing.values()]
+            )
+            missing = loaded_cards(missing, loaded)
+        rendered = render_cards(missing)
+        await cache.aset_many(rendered, settings.BIKE_CARD_CACHE_TIMEOUT)
+        cards.update(rendered)
+    return [mark_safe(cards[key]) for key, _, _ in entries if key in cards]
+
+
+def loaded_cards(missing, loaded):
+    """
+    Replaces the id-only bikes of missing cards with the loaded bikes
+    (bikes deleted since the page was cached are dropped).
+    """
+    return {
+        key: (loaded[bike.pk], eager)
+        for key, (bike, eager) in missing.items() if bike.pk in loaded
+    }
+
+
+def render_cards(cards):
+    """
+    Renders the cards of a `{key: (bike, eager)}` dict.
+    """
+    return {
+        key: render_to_string(
+            'bikes/bike_card.html', {'bike': bike, 'lazy_image': not eager}
+        )
+        for key, (bike, eager) in cards.items()
+    }
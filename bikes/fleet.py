@@ -0,0 +1,178 @@
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from .models import Bike
+
+# Columns of a fleet file, in export order. `id` is blank for new bikes.
+FLEET_FIELDS = (
+    'id', 'name', 'type', 'size', 'description', 'is_available',
+    'price_per_hour', 'featured_image',
+)
+# Bike fields written by an import (the rating fields come from reviews).
+IMPORT_FIELDS = FLEET_FIELDS[1:]
+# File formats, chosen with --format or from the file extension.
+FLEET_FORMATS = ('csv', 'jsonl')
+# Accepted spellings of is_available.
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'f'}
+
+
+class FleetRowError(ValueError):
+    """
+    A row of a fleet file that cannot be imported.
+    """
+
+
+def guess_format(path, default='csv'):
+    """
+    Returns the fleet format matching a file name's extension.
+    """
+    for fleet_format in FLEET_FORMATS:
+        if str(path).lower().endswith('.' + fleet_format):
+            return fleet_format
+    return default
+
+
+def read_rows(stream, fleet_format):
+    """
+    Yields `(line_number, row)` pairs from a fleet file, one at a time.
+
+    **Args:**
+    - `stream`: A text file object.
+    - `fleet_format`: 'csv' (with a header line) or 'jsonl'.
+
+    **Yields:**
+    - The line number and a dict of the row's values. A JSON line that
+    cannot be parsed yields a `FleetRowError` instead of a dict.
+    """
+    if fleet_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+            if not isinstance(row, dict):
+                raise ValueError("not a JSON object")
+        except ValueError as error:
+            row = FleetRowError(f"invalid JSON ({error})")
+        yield line_number, row
+
+
+def batched(iterable, size):
+    """
+    Yields lists of up to `size` items from an iterable.
+    """
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def clean_text(row, name, required=True):
+    """
+    Returns a stripped text value, checked against the field's max_length.
+    """
+    value = row.get(name)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise FleetRowError(f"{name} is required")
+    max_length = Bike._meta.get_field(name).max_length
+    if max_length and len(value) > max_length:
+        raise FleetRowError(
+            f"{name} is longer than {max_length} characters"
+        )
+    return value
+
+
+def clean_bool(value):
+    """
+    Returns is_available as a bool (True when missing).
+    """
+    if value is None or value == '':
+        return True
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise FleetRowError(
+        f"is_available must be true or false, not {value!r}"
+    )
+
+
+def clean_price(value):
+    """
+    Returns price_per_hour as a Decimal that fits the model field.
+    """
+    field = Bike._meta.get_field('price_per_hour')
+    try:
+        price = Decimal(str(value).strip())
+    except (InvalidOperation, TypeError):
+        raise FleetRowError(f"price_per_hour is not a number: {value!r}")
+    if not price.is_finite() or price < 0:
+        raise FleetRowError("price_per_hour must be zero or more")
+    price = price.quantize(Decimal(1).scaleb(-field.decimal_places))
+    if len(price.as_tuple().digits) > field.max_digits:
+        raise FleetRowError("price_per_hour is too large")
+    return price
+
+
+def clean_row(row):
+    """
+    Validates one fleet row.
+
+    Cheaper than a `ModelForm` per row, which matters for 100k rows,
+    but applies the same limits as the model fields.
+
+    **Args:**
+    - `row`: A dict read from a fleet file.
+
+    **Returns:**
+    - A `(bike_id, values)` tuple: the ID to update (None for a new
+    bike) and a dict of the field values.
+
+    **Raises:**
+    - `FleetRowError`: If a value is missing or invalid.
+    """
+    if isinstance(row, FleetRowError):
+        raise row
+    bike_id = row.get('id')
+    if bike_id in (None, ''):
+        bike_id = None
+    else:
+        try:
+            bike_id = int(bike_id)
+        except (TypeError, ValueError):
+            raise FleetRowError(f"id is not an integer: {bike_id!r}")
+    return bike_id, {
+        'name': clean_text(row, 'name'),
+        'type': clean_text(row, 'type'),
+        'size': clean_text(row, 'size'),
+        'description': clean_text(row, 'description', required=False),
+        'is_available': clean_bool(row.get('is_available')),
+        'price_per_hour': clean_price(row.get('price_per_hour')),
+        'featured_image': (
+            clean_text(row, 'featured_image', required=False)
+            or 'placeholder'
+        ),
+    }
+
+
+def export_row(values):
+    """
+    Returns one exported bike as a dict of plain values.
+
+    **Args:**
+    - `values`: The bike's values, in `FLEET_FIELDS` order.
+    """
+    row = dict(zip(FLEET_FIELDS, values))
+    row['price_per_hour'] = str(row['price_per_hour'])
+    row['featured_image'] = str(row['featured_image'] or '')
+    return row
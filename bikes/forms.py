@@ -0,0 +1,44 @@
+from django import forms
+
+from .search import PRICE_BANDS
+
+
+class CatalogSearchForm(forms.Form):
+    """
+    The search and facet filters of the bike list (a GET form).
+
+    **Fields:**
+    - `q`: Words to look for in the bikes' name, type and description.
+    - `type`, `size`: Only list bikes of this type or size.
+    - `price`: Only list bikes in this price band (see `PRICE_BANDS`).
+    """
+    q = forms.CharField(
+        label="Search", required=False, max_length=100,
+        widget=forms.TextInput(attrs={
+            'type': 'search', 'class': 'form-control',
+            'placeholder': 'Search bikes',
+        }),
+    )
+    type = forms.CharField(
+        required=False, max_length=50, widget=forms.HiddenInput
+    )
+    size = forms.CharField(
+        required=False, max_length=10, widget=forms.HiddenInput
+    )
+    price = forms.ChoiceField(
+        required=False, widget=forms.HiddenInput,
+        choices=[('', 'Any')] + [
+            (key, label) for key, label, _, _ in PRICE_BANDS
+        ],
+    )
+
+    def filters(self):
+        """
+        Returns the valid search and filters, empty ones left out.
+
+        An invalid value (a price band that does not exist) is ignored,
+        the other filters still apply.
+        """
+        self.is_valid()
+        cleaned_data = getattr(self, 'cleaned_data', {})
+        return {name: value for name, value in cleaned_data.items() if value}
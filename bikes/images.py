@@ -0,0 +1,59 @@
+from collections import namedtuple
+from functools import lru_cache
+
+from cloudinary import CloudinaryImage
+
+# Widths (pixels) of the responsive variants of a bike image. The
+# browser picks one from the `srcset` for the displayed size.
+IMAGE_WIDTHS = (320, 480, 640, 960, 1280)
+# Width of the `src` variant, for browsers without `srcset` support.
+DEFAULT_WIDTH = 640
+# Width of the blurred placeholder shown while the image loads.
+PLACEHOLDER_WIDTH = 32
+# Number of memoized images, a few kilobytes of URLs each.
+IMAGE_CACHE_SIZE = 4096
+
+# The URLs of an image: `src`, the `srcset` attribute and the
+# `placeholder` URL.
+ResponsiveImage = namedtuple('ResponsiveImage', 'src srcset placeholder')
+
+
+@lru_cache(maxsize=IMAGE_CACHE_SIZE)
+def image_urls(public_id, version, image_format, delivery_type):
+    """
+    Builds the responsive URLs of one version of a Cloudinary image.
+
+    Every variant lets Cloudinary choose the format (`f_auto`) and
+    the compression (`q_auto`), and is never upscaled (`c_limit`).
+    The URLs are built locally, without calling Cloudinary, and
+    memoized: a new upload has a new version, hence new URLs.
+
+    **Returns:**
+    - A `ResponsiveImage`.
+    """
+    image = CloudinaryImage(
+        public_id, version=version, format=image_format, type=delivery_type,
+    )
+
+    def url(width, **options):
+        return image.build_url(
+            width=width, crop='limit', fetch_format='auto', quality='auto',
+            **options
+        )
+    return ResponsiveImage(
+        src=url(DEFAULT_WIDTH),
+        srcset=', '.join(f'{url(width)} {width}w' for width in IMAGE_WIDTHS),
+        placeholder=url(PLACEHOLDER_WIDTH, effect='blur:1000'),
+    )
+
+
+def responsive_image(image):
+    """
+    Returns the `ResponsiveImage` of a `CloudinaryResource`,
+    or None if there is no image.
+    """
+    if not image or not image.public_id:
+        return None
+    return image_urls(
+        image.public_id, image.version, image.format, image.type
+    )
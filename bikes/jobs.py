@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from core.jobs import register
+from .cache import card_key, render_cards
+from .models import Bike
+
+
+@register('bikes.warm_bike_card')
+def warm_bike_card(bike_id):
+    """
+    Renders a bike's catalog cards (eager and lazy image) into the
+    cache, so the first catalog page after a change does not render it.
+
+    **Args:**
+    - `bike_id`: The ID of the bike, skipped if it was deleted.
+    """
+    bike = Bike.objects.filter(pk=bike_id).first()
+    if bike is None:
+        return
+    cards = {card_key(bike, eager): (bike, eager) for eager in (True, False)}
+    cache.set_many(render_cards(cards), settings.BIKE_CARD_CACHE_TIMEOUT)
@@ -0,0 +1,78 @@
+import csv
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bikes.fleet import FLEET_FIELDS, FLEET_FORMATS, export_row, guess_format
+from bikes.models import Bike
+
+
+class Command(BaseCommand):
+    """
+    Writes every bike to a CSV or JSON Lines fleet file.
+
+    Bikes are read with `.iterator()`, a chunk of rows at a time,
+    so large fleets are exported without loading them all in memory.
+    The file can be edited and loaded back with `import_fleet`.
+
+    **Usage:**
+    - `python manage.py export_fleet fleet.jsonl`
+    - `python manage.py export_fleet - --format csv > fleet.csv`
+    """
+    help = "Exports all bikes to a CSV or JSON Lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help="The file to write, or '-' for standard output.",
+        )
+        parser.add_argument(
+            '--format', choices=FLEET_FORMATS,
+            help="The file format (default: from the extension, or csv).",
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help="Number of rows fetched from the database at a time.",
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fleet_format = options['format'] or guess_format(path)
+        to_stdout = path == '-'
+        try:
+            stream = (
+                self.stdout if to_stdout
+                else open(path, 'w', newline='', encoding='utf-8')
+            )
+        except OSError as error:
+            raise CommandError(f"Cannot write {path}: {error}")
+
+        if fleet_format == 'csv':
+            writer = csv.DictWriter(
+                stream, fieldnames=FLEET_FIELDS, lineterminator='\n'
+            )
+            writer.writeheader()
+            write = writer.writerow
+        else:
+            def write(row):
+                stream.write(json.dumps(row) + '\n')
+
+        started = time.perf_counter()
+        count = 0
+        rows = Bike.objects.order_by('id').values_list(*FLEET_FIELDS)
+        try:
+            for values in rows.iterator(chunk_size=options['chunk_size']):
+                write(export_row(values))
+                count += 1
+        finally:
+            if not to_stdout:
+                stream.close()
+
+        elapsed = time.perf_counter() - started
+        # Keep the report out of the exported data.
+        report = self.stderr if to_stdout else self.stdout
+        report.write(self.style.SUCCESS(
+            f"Exported {count} bikes in {elapsed:.2f}s, "
+            f"{count / elapsed:.0f} rows/s."
+        ))
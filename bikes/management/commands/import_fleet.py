@@ -0,0 +1,186 @@
+import sys
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+
+from bikes.cache import invalidate_catalog, invalidate_all_bike_pages
+from bikes.fleet import (
+    FLEET_FORMATS, IMPORT_FIELDS, FleetRowError, batched, clean_row,
+    guess_format, read_rows,
+)
+from bikes.models import Bike, size_rank
+from bikes.signals import bike_prices_changed
+
+# Number of bikes changed by each UPDATE statement.
+UPDATE_STATEMENT_SIZE = 100
+
+
+def fleet_values(values):
+    """
+    Returns bike values in a form that compares equal to a clean row.
+    """
+    return tuple(str(value) for value in values)
+
+
+class Command(BaseCommand):
+    """
+    Creates and updates bikes from a CSV or JSON Lines fleet file.
+
+    Rows without an `id` create new bikes, rows with the `id` of an
+    existing bike replace its fields (bikes that did not change are
+    left alone). The file is read as a stream and written in batches,
+    with `bulk_create` and `bulk_update`, so memory use does not grow
+    with the size of the file. Invalid rows are reported and skipped.
+
+    **Usage:**
+    - `python manage.py import_fleet fleet.csv`
+    - `python manage.py export_fleet - | python manage.py import_fleet -`
+    """
+    help = "Creates and updates bikes from a CSV or JSON Lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help="The file to read, or '-' for standard input.",
+        )
+        parser.add_argument(
+            '--format', choices=FLEET_FORMATS,
+            help="The file format (default: from the extension, or csv).",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Number of rows written per batch.",
+        )
+        parser.add_argument(
+            '--max-errors', type=int, default=20,
+            help="Number of invalid rows to print (all are counted).",
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fleet_format = options['format'] or guess_format(path)
+        try:
+            stream = (
+                sys.stdin if path == '-'
+                else open(path, newline='', encoding='utf-8')
+            )
+        except OSError as error:
+            raise CommandError(f"Cannot read {path}: {error}")
+
+        self.errors = 0
+        self.max_errors = options['max_errors']
+        created = updated = unchanged = 0
+        started = time.perf_counter()
+        with stream:
+            rows = read_rows(stream, fleet_format)
+            for batch in batched(rows, options['batch_size']):
+                batch_created, batch_updated, batch_unchanged = (
+                    self.write_batch(batch)
+                )
+                created += batch_created
+                updated += batch_updated
+                unchanged += batch_unchanged
+                if options['verbosity'] > 1:
+                    read = created + updated + unchanged + self.errors
+                    self.stdout.write(f"{read} rows read...")
+
+        # Cached pages and cards are refreshed once, for all the rows.
+        invalidate_catalog()
+        invalidate_all_bike_pages()
+        elapsed = time.perf_counter() - started
+        total = created + updated + unchanged + self.errors
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {total - self.errors} bikes ({created} created, "
+            f"{updated} updated, {unchanged} unchanged, "
+            f"{self.errors} invalid rows skipped) "
+            f"in {elapsed:.2f}s, {total / elapsed:.0f} rows/s."
+        ))
+
+    def row_error(self, line, message):
+        """
+        Counts an invalid row and prints it, up to --max-errors.
+        """
+        self.errors += 1
+        if self.errors <= self.max_errors:
+            self.stderr.write(f"Line {line}: {message}")
+
+    def write_batch(self, batch):
+        """
+        Validates a batch of rows and saves it in one transaction.
+
+        **Returns:**
+        - The numbers of created, updated and unchanged bikes.
+        """
+        new_bikes = []
+        # Keyed by id, a later row for the same bike wins.
+        changes = {}
+        for line, row in batch:
+            try:
+                bike_id, values = clean_row(row)
+            except FleetRowError as error:
+                self.row_error(line, error)
+                continue
+            # bulk_create and bulk_update skip the signal that ranks
+            # the size, so it is set here.
+            values['size_rank'] = size_rank(values['size'])
+            if bike_id is None:
+                new_bikes.append(Bike(**values))
+            else:
+                changes[bike_id] = (line, values)
+
+        with transaction.atomic():
+            # Current values of the bikes to update, in one query.
+            current = {
+                values[0]: fleet_values(values[1:])
+                for values in Bike.objects.filter(pk__in=changes)
+                .values_list('pk', *IMPORT_FIELDS)
+            }
+            # Bikes to update, grouped by the fields that changed.
+            # bulk_update builds one CASE WHEN expression per field, so
+            # only writing changed fields keeps a typical sync cheap.
+            updates = defaultdict(list)
+            # {bike id: (old price, new price)}, for the price history.
+            price_changes = {}
+            for bike_id, (line, values) in changes.items():
+                if bike_id not in current:
+                    self.row_error(line, f"no bike with id {bike_id}")
+                    continue
+                changed = tuple(
+                    field for field, old, new in zip(
+                        IMPORT_FIELDS, current[bike_id],
+                        fleet_values(values.values()),
+                    )
+                    if old != new
+                )
+                if 'size' in changed:
+                    changed += ('size_rank',)
+                if 'price_per_hour' in changed:
+                    old_price = current[bike_id][
+                        IMPORT_FIELDS.index('price_per_hour')
+                    ]
+                    price_changes[bike_id] = (
+                        Decimal(old_price), values['price_per_hour']
+                    )
+                if changed:
+                    updates[changed].append(Bike(id=bike_id, **values))
+            Bike.objects.bulk_create(new_bikes)
+            updated_ids = []
+            for fields, bikes in updates.items():
+                Bike.objects.bulk_update(
+                    bikes, fields, batch_size=UPDATE_STATEMENT_SIZE
+                )
+                updated_ids.extend(bike.pk for bike in bikes)
+            # bulk_update skips the save signals, which record the
+            # price history: announce the new prices instead.
+            if price_changes:
+                bike_prices_changed.send(sender=Bike, changes=price_changes)
+            if updated_ids:
+                # bulk_update skips the signals, refresh the cards here.
+                Bike.objects.filter(pk__in=updated_ids).update(
+                    card_version=F('card_version') + 1
+                )
+        unchanged = len(current) - len(updated_ids)
+        return len(new_bikes), len(updated_ids), unchanged
@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F
+
+from bikes.cache import invalidate_catalog, invalidate_all_bike_pages
+from bikes.models import Bike, RATING_VALUES
+from reviews.models import Review
+
+
+class Command(BaseCommand):
+    """
+    Recalculates the stored rating aggregates of every bike from its reviews.
+
+    Use it after importing data or if the aggregates drift
+    (for example after editing the database by hand).
+
+    **Usage:**
+    - `python manage.py rebuild_rating_stats`
+    """
+    help = "Rebuilds the stored rating aggregates of all bikes from reviews."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Number of bikes written per UPDATE batch.",
+        )
+
+    def handle(self, *args, **options):
+        # One grouped query counts the reviews per bike and rating.
+        histograms = {}
+        counts = (
+            Review.objects.order_by()
+            .values_list('bike_id', 'rating')
+            .annotate(total=Count('id'))
+        )
+        for bike_id, rating, total in counts:
+            histograms.setdefault(bike_id, {})[rating] = total
+
+        fields = ['rating_average', 'rating_count', 'card_version'] + [
+            f'rating_{rating}_count' for rating in RATING_VALUES
+        ]
+        updated = 0
+        with transaction.atomic():
+            bikes = Bike.objects.only('id').order_by('id')
+            batch = []
+            for bike in bikes.iterator(chunk_size=options['batch_size']):
+                histogram = histograms.get(bike.id, {})
+                count = sum(histogram.values())
+                for rating in RATING_VALUES:
+                    setattr(
+                        bike, f'rating_{rating}_count',
+                        histogram.get(rating, 0)
+                    )
+                bike.rating_count = count
+                # Cached cards show the rating, render them again.
+                bike.card_version = F('card_version') + 1
+                bike.rating_average = (
+                    sum(r * n for r, n in histogram.items()) / count
+                    if count else 0
+                )
+                batch.append(bike)
+                if len(batch) >= options['batch_size']:
+                    Bike.objects.bulk_update(batch, fields)
+                    updated += len(batch)
+                    batch = []
+            if batch:
+                Bike.objects.bulk_update(batch, fields)
+                updated += len(batch)
+
+        invalidate_catalog()
+        invalidate_all_bike_pages()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt rating stats for {updated} bikes."
+        ))
@@ -0,0 +1,47 @@
+from django.db import migrations
+from django.db.models import Count
+
+
+def backfill_rating_stats(apps, schema_editor):
+    """
+    Fills the new rating aggregates from the existing reviews.
+    """
+    Bike = apps.get_model('bikes', 'Bike')
+    Review = apps.get_model('reviews', 'Review')
+    histograms = {}
+    counts = (
+        Review.objects.order_by()
+        .values_list('bike_id', 'rating')
+        .annotate(total=Count('id'))
+    )
+    for bike_id, rating, total in counts:
+        histograms.setdefault(bike_id, {})[rating] = total
+
+    bikes = []
+    for bike in Bike.objects.filter(pk__in=histograms):
+        histogram = histograms[bike.pk]
+        for rating in range(1, 6):
+            setattr(bike, f'rating_{rating}_count', histogram.get(rating, 0))
+        bike.rating_count = sum(histogram.values())
+        bike.rating_average = (
+            sum(r * n for r, n in histogram.items()) / bike.rating_count
+        )
+        bikes.append(bike)
+    fields = ['rating_average', 'rating_count'] + [
+        f'rating_{rating}_count' for rating in range(1, 6)
+    ]
+    Bike.objects.bulk_update(bikes, fields, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bikes', '0003_bike_rating_stats'),
+        ('reviews', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            backfill_rating_stats, migrations.RunPython.noop
+        ),
+    ]
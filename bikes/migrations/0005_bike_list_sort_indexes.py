@@ -0,0 +1,38 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bikes', '0004_backfill_rating_stats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bike',
+            name='rating_average',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='bike',
+            index=models.Index(fields=['is_available', 'name', 'id'], name='bike_avail_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bike',
+            index=models.Index(fields=['is_available', 'type', 'id'], name='bike_avail_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bike',
+            index=models.Index(fields=['is_available', 'size', 'id'], name='bike_avail_size_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bike',
+            index=models.Index(fields=['is_available', 'price_per_hour', 'id'], name='bike_avail_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bike',
+            index=models.Index(fields=['is_available', 'rating_average', 'id'], name='bike_avail_rating_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bikes', '0005_bike_list_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bike',
+            name='card_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
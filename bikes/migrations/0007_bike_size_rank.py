@@ -0,0 +1,66 @@
+import re
+
+from django.db import migrations, models
+
+# A copy of bikes.models.size_rank as it was when this migration was
+# written: the migration must keep ranking the same way if it changes.
+LETTER_SIZES = ('XXS', 'XS', 'S', 'M', 'L', 'XL', 'XXL')
+SIZE_WORDS = {'SMALL': 'S', 'MEDIUM': 'M', 'LARGE': 'L'}
+NUMERIC_SIZE_RANK = 100
+UNKNOWN_SIZE_RANK = 32767
+SIZE_NUMBER = re.compile(r'\d+(?:[.,]\d+)?')
+
+
+def size_rank(size):
+    """
+    Returns the sort position of a bike size (see bikes.models).
+    """
+    text = (size or '').strip().upper()
+    text = SIZE_WORDS.get(text, text)
+    if text in LETTER_SIZES:
+        return LETTER_SIZES.index(text) + 1
+    number = SIZE_NUMBER.search(text)
+    if number is None:
+        return UNKNOWN_SIZE_RANK
+    value = float(number.group().replace(',', '.'))
+    return min(NUMERIC_SIZE_RANK + round(value * 10), UNKNOWN_SIZE_RANK - 1)
+
+
+def backfill_size_rank(apps, schema_editor):
+    """
+    Ranks the sizes of the existing bikes, one UPDATE per distinct size.
+    """
+    Bike = apps.get_model('bikes', 'Bike')
+    sizes = Bike.objects.order_by().values_list('size', flat=True).distinct()
+    for size in list(sizes):
+        Bike.objects.filter(size=size).update(size_rank=size_rank(size))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bikes', '0006_bike_card_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bike',
+            name='size_rank',
+            field=models.PositiveSmallIntegerField(
+                default=32767, editable=False
+            ),
+        ),
+        migrations.RunPython(backfill_size_rank, migrations.RunPython.noop),
+        # The size sorts now use the rank instead of the text.
+        migrations.RemoveIndex(
+            model_name='bike',
+            name='bike_avail_size_idx',
+        ),
+        migrations.AddIndex(
+            model_name='bike',
+            index=models.Index(
+                fields=['is_available', 'size_rank', 'id'],
+                name='bike_avail_size_rank_idx',
+            ),
+        ),
+    ]
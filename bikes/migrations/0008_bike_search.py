@@ -0,0 +1,116 @@
+import django.contrib.postgres.search
+from django.db import migrations
+
+# PostgreSQL: a trigger keeps search_vector up to date, the name weighing
+# most, and a GIN index serves the searches. It only runs when a statement
+# writes the searched columns, not when a rental flips is_available.
+POSTGRES_INSTALL = """
+CREATE FUNCTION bikes_bike_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('english', coalesce(NEW.name, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(NEW.type, '')), 'B')
+        || setweight(
+            to_tsvector('english', coalesce(NEW.description, '')), 'C'
+        );
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER bikes_bike_search_vector_update
+    BEFORE INSERT OR UPDATE OF name, type, description, search_vector
+    ON bikes_bike FOR EACH ROW EXECUTE FUNCTION bikes_bike_search_vector();
+UPDATE bikes_bike SET search_vector = NULL;
+CREATE INDEX bike_search_idx ON bikes_bike USING gin (search_vector);
+"""
+POSTGRES_REMOVE = """
+DROP INDEX IF EXISTS bike_search_idx;
+DROP TRIGGER IF EXISTS bikes_bike_search_vector_update ON bikes_bike;
+DROP FUNCTION IF EXISTS bikes_bike_search_vector();
+"""
+
+# SQLite: an FTS5 index of the bikes table (external content, so the
+# text is not stored twice), kept up to date by triggers. Migrations
+# that rebuild bikes_bike on SQLite drop the triggers: a post_migrate
+# handler (bikes.search.restore_sqlite_search) creates them again and
+# rebuilds the index.
+SQLITE_INSTALL = [
+    """
+    CREATE VIRTUAL TABLE bikes_bike_fts USING fts5(
+        name, type, description,
+        content='bikes_bike', content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER bikes_bike_fts_insert AFTER INSERT ON bikes_bike BEGIN
+        INSERT INTO bikes_bike_fts(rowid, name, type, description)
+        VALUES (new.id, new.name, new.type, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER bikes_bike_fts_delete AFTER DELETE ON bikes_bike BEGIN
+        INSERT INTO bikes_bike_fts(
+            bikes_bike_fts, rowid, name, type, description
+        ) VALUES ('delete', old.id, old.name, old.type, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER bikes_bike_fts_update
+    AFTER UPDATE OF name, type, description ON bikes_bike BEGIN
+        INSERT INTO bikes_bike_fts(
+            bikes_bike_fts, rowid, name, type, description
+        ) VALUES ('delete', old.id, old.name, old.type, old.description);
+        INSERT INTO bikes_bike_fts(rowid, name, type, description)
+        VALUES (new.id, new.name, new.type, new.description);
+    END
+    """,
+    "INSERT INTO bikes_bike_fts(bikes_bike_fts) VALUES ('rebuild')",
+]
+SQLITE_REMOVE = [
+    "DROP TRIGGER IF EXISTS bikes_bike_fts_insert",
+    "DROP TRIGGER IF EXISTS bikes_bike_fts_delete",
+    "DROP TRIGGER IF EXISTS bikes_bike_fts_update",
+    "DROP TABLE IF EXISTS bikes_bike_fts",
+]
+
+
+def install_search(apps, schema_editor):
+    """
+    Creates the full-text index of the database in use, if it has one.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_INSTALL)
+    elif vendor == 'sqlite':
+        for statement in SQLITE_INSTALL:
+            schema_editor.execute(statement)
+
+
+def remove_search(apps, schema_editor):
+    """
+    Drops the full-text index created by `install_search`.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_REMOVE)
+    elif vendor == 'sqlite':
+        for statement in SQLITE_REMOVE:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bikes', '0007_bike_size_rank'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bike',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(install_search, remove_search),
+    ]
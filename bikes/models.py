@@ -1,8 +1,64 @@
+import re
+
 from django.db import models
+# Full-text search column, filled by a trigger on PostgreSQL.
+from django.contrib.postgres.search import SearchVectorField
 # For images on Cloudinary.
 from cloudinary.models import CloudinaryField
-# Calculate the average rating.
-from django.db.models import Avg
+# Build the rating update statements at the database level.
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from .images import responsive_image
+
+# Ratings a review can have (see the Review model validators).
+RATING_VALUES = range(1, 6)
+# Rating aggregates of a bike, written in the database only (see
+# Bike.adjust_rating_stats), never by a save.
+RATING_FIELDS = (
+    'rating_average', 'rating_count',
+    *(f'rating_{rating}_count' for rating in RATING_VALUES),
+)
+
+# Letter sizes, smallest first, and the words accepted for them.
+LETTER_SIZES = ('XXS', 'XS', 'S', 'M', 'L', 'XL', 'XXL')
+SIZE_WORDS = {'SMALL': 'S', 'MEDIUM': 'M', 'LARGE': 'L'}
+# Numeric sizes (frame or wheel sizes such as 54cm or 26") rank after
+# the letter sizes, by their number; anything else ranks last.
+NUMERIC_SIZE_RANK = 100
+UNKNOWN_SIZE_RANK = 32767
+SIZE_NUMBER = re.compile(r'\d+(?:[.,]\d+)?')
+
+
+def size_rank(size):
+    """
+    Returns the sort position of a bike size.
+
+    `size` is free text, sorting it as text puts 'L' before 'M' and
+    'XS'. The rank orders letter sizes from XXS to XXL, then numeric
+    sizes by value.
+
+    **Returns:**
+    - An integer, stored in `Bike.size_rank`.
+    """
+    text = (size or '').strip().upper()
+    text = SIZE_WORDS.get(text, text)
+    if text in LETTER_SIZES:
+        return LETTER_SIZES.index(text) + 1
+    number = SIZE_NUMBER.search(text)
+    if number is None:
+        return UNKNOWN_SIZE_RANK
+    value = float(number.group().replace(',', '.'))
+    return min(NUMERIC_SIZE_RANK + round(value * 10), UNKNOWN_SIZE_RANK - 1)
+
+
+class BikeManager(models.Manager):
+    """
+    Leaves the search vector out of the loaded columns: only the
+    database reads it, and saves then leave it to the trigger.
+    """
+    def get_queryset(self):
+        return super().get_queryset().defer('search_vector')
 
 
 # Defines the structure of the 'Bike' table.
@@ -19,10 +75,18 @@ class Bike(models.Model):
     currently available for rent.
     - `price_per_hour`: The cost to rent the bike for one hour.
     - `featured_image`: The main image of the bike, hosted on Cloudinary.
+    - `size_rank`: The sort position of `size` (see `size_rank`).
+    - `search_vector`: The weighted words of the name, type and
+    description, kept up to date by a trigger (PostgreSQL only).
+    - `rating_average`: The stored average rating of the bike's reviews.
+    - `rating_count`: The stored number of reviews for the bike.
+    - `rating_1_count` ... `rating_5_count`: How many reviews gave
+    each star rating (the rating histogram).
 
     **Properties:**
-    - `average_rating`: Calculates and returns the average
-    rating for the bike based on its reviews.
+    - `average_rating`: Returns the stored average rating for the bike.
+    - `rating_histogram`: Returns the review counts per star rating.
+    - `image`: Returns the responsive URLs of the featured image.
     """
     name = models.CharField(max_length=100)
     type = models.CharField(max_length=50)
@@ -31,20 +95,181 @@ class Bike(models.Model):
     is_available = models.BooleanField(default=True)
     price_per_hour = models.DecimalField(max_digits=6, decimal_places=2)
     featured_image = CloudinaryField('image', default='placeholder')
+    # Set from size on every save (bikes/signals.py) and import.
+    size_rank = models.PositiveSmallIntegerField(
+        default=UNKNOWN_SIZE_RANK, editable=False
+    )
+    # Written by the database, see bikes/search.py.
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Rating aggregates, kept up to date by the review signals.
+    # Indexed (see Meta) so the list can be sorted by rating without a join.
+    rating_average = models.FloatField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+    # Part of the cache key of the bike's card on the home page.
+    # Bumped on every save (bikes/signals.py) and every review write.
+    card_version = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = BikeManager()
+
+    class Meta:
+        # One index per BikeList sort order. Each starts with the
+        # is_available filter and ends with the 'id' tie-break, so a
+        # cursor page is a single index range scan (read backwards
+        # for the descending sorts).
+        indexes = [
+            models.Index(
+                fields=['is_available', 'name', 'id'],
+                name='bike_avail_name_idx',
+            ),
+            models.Index(
+                fields=['is_available', 'type', 'id'],
+                name='bike_avail_type_idx',
+            ),
+            models.Index(
+                fields=['is_available', 'size_rank', 'id'],
+                name='bike_avail_size_rank_idx',
+            ),
+            models.Index(
+                fields=['is_available', 'price_per_hour', 'id'],
+                name='bike_avail_price_idx',
+            ),
+            models.Index(
+                fields=['is_available', 'rating_average', 'id'],
+                name='bike_avail_rating_idx',
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remembers the hourly price a bike was loaded with.
+
+        The rentals signals compare it with the saved price
+        to record the bike's price history.
+        """
+        instance = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        if 'price_per_hour' in loaded:
+            instance._loaded_price = loaded['price_per_hour']
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Saves the bike, without the rating aggregates once it exists.
+
+        The aggregates are only written in the database by
+        `adjust_rating_stats` and `rebuild_rating_stats`: a full save
+        of a bike loaded before a review was posted would otherwise
+        write back its stale counts and undo the review's increments.
+        """
+        if (
+            not self._state.adding and kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert')
+        ):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in RATING_FIELDS
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
 
-    # Property that calculates the average rating on the fly.
+    # Property kept for the templates, reads the stored average.
     @property
     def average_rating(self):
         """
-        Calculates the average rating for the bike.
+        Returns the average rating for the bike.
 
         **Returns:**
         - The average rating as a float, or 0 if there are no ratings.
         """
-        return self.reviews.aggregate(Avg('rating'))['rating__avg'] or 0
+        return self.rating_average
+
+    @property
+    def rating_histogram(self):
+        """
+        Returns the number of reviews for each star rating.
+
+        **Returns:**
+        - A dictionary mapping each rating (1-5) to its review count.
+        """
+        return {
+            rating: getattr(self, f'rating_{rating}_count')
+            for rating in RATING_VALUES
+        }
+
+    @property
+    def image(self):
+        """
+        Returns the responsive URLs of the featured image.
+
+        **Returns:**
+        - A `ResponsiveImage` (see `bikes.images`), or None without image.
+        """
+        image = self.featured_image
+        if isinstance(image, str):
+            # Unsaved bikes hold the field's default as a string.
+            image = self._meta.get_field('featured_image').to_python(image)
+        return responsive_image(image)
+
+    @classmethod
+    def adjust_rating_stats(cls, bike_id, added=None, removed=None):
+        """
+        Updates the stored rating aggregates of a bike in place.
+
+        Both statements run in the database with `F()` expressions,
+        so concurrent review writes never overwrite each other.
+        Call it inside a transaction together with the review write.
+        `Bike.save` never writes these columns back from memory.
+
+        **Args:**
+        - `bike_id`: The ID of the bike whose reviews changed.
+        - `added`: The rating of a review that was added, if any.
+        - `removed`: The rating of a review that was removed, if any.
+        """
+        changes = {}
+        count_change = 0
+        for rating, step in ((added, 1), (removed, -1)):
+            if rating is None:
+                continue
+            field = f'rating_{rating}_count'
+            changes[field] = changes.get(field, F(field)) + step
+            count_change += step
+        if not changes:
+            return
+        changes['rating_count'] = F('rating_count') + count_change
+        # The rating is shown on the card, so it has to be re-rendered.
+        changes['card_version'] = F('card_version') + 1
+        bikes = cls.objects.filter(pk=bike_id)
+        bikes.update(**changes)
+        # Second statement sees the new histogram values.
+        bikes.update(rating_average=rating_average_expression())
 
     def __str__(self):
         """
         Returns the string representation of the Bike model.
         """
         return self.name
+
+
+def rating_average_expression():
+    """
+    Builds the expression that computes the average from the histogram.
+
+    **Returns:**
+    - A float expression, 0 when the bike has no reviews.
+    """
+    total = sum(
+        F(f'rating_{rating}_count') * rating for rating in RATING_VALUES
+    )
+    return Coalesce(
+        Cast(total, FloatField()) / NullIf(F('rating_count'), 0),
+        Value(0.0),
+        output_field=FloatField(),
+    )
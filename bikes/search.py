@@ -0,0 +1,279 @@
+import re
+from collections import Counter, namedtuple
+
+from django.contrib.postgres.search import SearchQuery
+from django.db import connections
+from django.db.models import Case, CharField, Count, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+# Words of a search, anything else (quotes, operators) is dropped
+# before the words reach the full-text query syntax.
+SEARCH_WORD = re.compile(r'\w+')
+# At most this many words are searched.
+MAX_SEARCH_WORDS = 8
+# Text search configuration of the PostgreSQL index (see the
+# bikes.0008 migration), the same stemming applies to the query.
+SEARCH_CONFIG = 'english'
+
+# Price bands of the price facet: key, label, lowest and highest
+# hourly price (None for no limit; the highest is excluded).
+PRICE_BANDS = (
+    ('under-10', 'Under €10', None, 10),
+    ('10-20', '€10 to €20', 10, 20),
+    ('20-plus', '€20 and more', 20, None),
+)
+# The facets of the catalog, in display order: GET parameter and title.
+FACETS = (('type', 'Type'), ('size', 'Size'), ('price', 'Price per hour'))
+
+# One value of a facet: the value, its label, the number of listed bikes
+# having it, and whether it is the selected filter.
+FacetValue = namedtuple('FacetValue', 'value label count selected')
+
+# Triggers keeping the SQLite FTS5 table in sync with bikes_bike (the
+# same as the bikes.0008 migration). SQLite drops them whenever a
+# migration rebuilds bikes_bike, `restore_sqlite_search` adds them back.
+SQLITE_TRIGGERS = {
+    'bikes_bike_fts_insert': """
+    CREATE TRIGGER bikes_bike_fts_insert AFTER INSERT ON bikes_bike BEGIN
+        INSERT INTO bikes_bike_fts(rowid, name, type, description)
+        VALUES (new.id, new.name, new.type, new.description);
+    END
+    """,
+    'bikes_bike_fts_delete': """
+    CREATE TRIGGER bikes_bike_fts_delete AFTER DELETE ON bikes_bike BEGIN
+        INSERT INTO bikes_bike_fts(
+            bikes_bike_fts, rowid, name, type, description
+        ) VALUES ('delete', old.id, old.name, old.type, old.description);
+    END
+    """,
+    'bikes_bike_fts_update': """
+    CREATE TRIGGER bikes_bike_fts_update
+    AFTER UPDATE OF name, type, description ON bikes_bike BEGIN
+        INSERT INTO bikes_bike_fts(
+            bikes_bike_fts, rowid, name, type, description
+        ) VALUES ('delete', old.id, old.name, old.type, old.description);
+        INSERT INTO bikes_bike_fts(rowid, name, type, description)
+        VALUES (new.id, new.name, new.type, new.description);
+    END
+    """,
+}
+
+
+def search_words(text):
+    """
+    Returns the words of a search, at most `MAX_SEARCH_WORDS`.
+    """
+    return SEARCH_WORD.findall(text or '')[:MAX_SEARCH_WORDS]
+
+
+def search_bikes(queryset, text):
+    """
+    Keeps the bikes whose name, type or description match a search.
+
+    Every word must match, as a prefix ('moun' finds 'Mountain'). On
+    PostgreSQL the words are looked up in the `search_vector` GIN
+    index, on SQLite in the `bikes_bike_fts` FTS5 table. Both are
+    kept up to date by triggers (see the bikes.0008 migration).
+    Other databases fall back to `icontains` scans.
+
+    **Args:**
+    - `queryset`: The bikes to search.
+    - `text`: The search, as typed by the visitor.
+
+    **Returns:**
+    - The filtered queryset, unchanged for an empty search.
+    """
+    words = search_words(text)
+    if not words:
+        return queryset
+    # The database the queryset reads from (a replica, see
+    # core/db_router.py), not necessarily the default one.
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        query = SearchQuery(
+            ' & '.join(f'{word}:*' for word in words),
+            config=SEARCH_CONFIG, search_type='raw',
+        )
+        return queryset.filter(search_vector=query)
+    if vendor == 'sqlite':
+        match = ' '.join(f'"{word}"*' for word in words)
+        return queryset.filter(id__in=RawSQL(
+            'SELECT rowid FROM bikes_bike_fts WHERE bikes_bike_fts MATCH %s',
+            [match],
+        ))
+    for word in words:
+        queryset = queryset.filter(
+            Q(name__icontains=word) | Q(type__icontains=word)
+            | Q(description__icontains=word)
+        )
+    return queryset
+
+
+def restore_sqlite_search(using='default'):
+    """
+    Recreates the SQLite FTS5 sync triggers if a migration dropped them.
+
+    Run after every `migrate` (see `BikesConfig.ready`). When a trigger
+    is missing, the bikes may have changed without the index, so it is
+    rebuilt from the bikes table as well.
+
+    **Args:**
+    - `using`: The alias of the migrated database.
+
+    **Returns:**
+    - The names of the recreated triggers, empty when none was missing.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT type, name FROM sqlite_master "
+            "WHERE name = 'bikes_bike_fts' OR type = 'trigger'"
+        )
+        found = {(kind, name) for kind, name in cursor.fetchall()}
+        # The bikes.0008 migration has not run (or was reverted).
+        if ('table', 'bikes_bike_fts') not in found:
+            return []
+        missing = [
+            name for name in SQLITE_TRIGGERS
+            if ('trigger', name) not in found
+        ]
+        for name in missing:
+            cursor.execute(SQLITE_TRIGGERS[name])
+        if missing:
+            cursor.execute(
+                "INSERT INTO bikes_bike_fts(bikes_bike_fts) VALUES ('rebuild')"
+            )
+    return missing
+
+
+def price_band_condition(low, high):
+    """
+    Returns the `Q` filter of the hourly prices from `low` (included)
+    to `high` (excluded), either being None for no limit.
+    """
+    condition = Q()
+    if low is not None:
+        condition &= Q(price_per_hour__gte=low)
+    if high is not None:
+        condition &= Q(price_per_hour__lt=high)
+    return condition
+
+
+def price_band_expression():
+    """
+    Returns an expression giving the `PRICE_BANDS` key of a bike.
+    """
+    return Case(
+        *(
+            When(price_band_condition(low, high), then=Value(key))
+            for key, _, low, high in PRICE_BANDS
+        ),
+        output_field=CharField(),
+    )
+
+
+def filter_facets(queryset, filters):
+    """
+    Keeps the bikes matching the selected facet values.
+
+    **Args:**
+    - `queryset`: The bikes to filter.
+    - `filters`: A dict with the selected `type`, `size` and `price`
+    (empty values are ignored).
+    """
+    if filters.get('type'):
+        queryset = queryset.filter(type=filters['type'])
+    if filters.get('size'):
+        queryset = queryset.filter(size=filters['size'])
+    for key, _, low, high in PRICE_BANDS:
+        if filters.get('price') == key:
+            queryset = queryset.filter(price_band_condition(low, high))
+    return queryset
+
+
+def facet_rows(queryset):
+    """
+    Returns the bike counts of each (type, size, price band) found.
+
+    This single GROUP BY query holds everything the facet counts need:
+    a few rows per type, not one row per bike nor one query per facet.
+
+    **Args:**
+    - `queryset`: The listed bikes, before the facet filters.
+
+    **Returns:**
+    - A list of `(type, size, size_rank, price_band, count)` tuples.
+    """
+    return list(facet_rows_query(queryset))
+
+
+async def afacet_rows(queryset):
+    """
+    Async version of `facet_rows`.
+    """
+    return [row async for row in facet_rows_query(queryset)]
+
+
+def facet_rows_query(queryset):
+    """
+    Returns the grouped queryset of `facet_rows`.
+    """
+    return (
+        queryset.order_by()
+        .annotate(price_band=price_band_expression())
+        .values_list('type', 'size', 'size_rank', 'price_band')
+        .annotate(count=Count('id'))
+    )
+
+
+def facet_counts(rows, filters):
+    """
+    Counts the listed bikes of every facet value.
+
+    The count of a value is the number of bikes listed if it were
+    selected instead: each facet's counts apply the other facets'
+    filters but not its own, so the visitor can switch values.
+
+    **Args:**
+    - `rows`: The rows from `facet_rows`.
+    - `filters`: The selected facet values (see `filter_facets`).
+
+    **Returns:**
+    - A list of `(name, title, values)` tuples, one per facet in
+    `FACETS` order, `values` being a list of `FacetValue`.
+    """
+    selected = {name: filters.get(name) or None for name, _ in FACETS}
+    counts = {name: Counter() for name, _ in FACETS}
+    size_ranks = {}
+    for bike_type, size, rank, band, count in rows:
+        row = {'type': bike_type, 'size': size, 'price': band}
+        size_ranks[size] = rank
+        for name, _ in FACETS:
+            if all(
+                selected[other] in (None, row[other])
+                for other, _ in FACETS if other != name
+            ):
+                counts[name][row[name]] += count
+
+    labels = {key: label for key, label, _, _ in PRICE_BANDS}
+    values = {
+        'type': sorted(counts['type']),
+        'size': sorted(
+            counts['size'], key=lambda size: (size_ranks[size], size)
+        ),
+        'price': [key for key, _, _, _ in PRICE_BANDS],
+    }
+    facets = []
+    for name, title in FACETS:
+        facet_values = [
+            FacetValue(
+                value, labels.get(value, value) if name == 'price' else value,
+                counts[name][value], value == selected[name],
+            )
+            for value in values[name]
+            if counts[name][value] or value == selected[name]
+        ]
+        facets.append((name, title, facet_values))
+    return facets
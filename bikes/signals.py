@@ -0,0 +1,66 @@
+# Import the necessary modules
+from django.db.models.signals import pre_save, post_save, post_delete
+# Decorator to receive the signal, and the signal class
+from django.dispatch import Signal, receiver
+# Sender model
+from .models import Bike, size_rank
+# Catalog cache invalidation
+from .cache import invalidate_catalog, invalidate_bike_page
+
+# Sent with `changes`, `{bike id: (old price, new price)}`, by code that
+# changes hourly prices without `Bike.save` (the bulk writes of the
+# fleet import), so the price history is still recorded.
+bike_prices_changed = Signal()
+
+
+# Run this function before a bike is saved.
+@receiver(pre_save, sender=Bike)
+def bump_card_version(sender, instance, raw, **kwargs):
+    """
+    Gives the bike a new card version, so its cached card is not reused.
+
+    The new version is written by the save itself. Code that saves
+    with `update_fields` must include `card_version` to refresh the card.
+    Code holding a bike loaded earlier (e.g. through `select_related`)
+    should bump it with an `F('card_version') + 1` update instead, as
+    a review may have bumped it in the meantime.
+
+    **Args:**
+    - `sender`: The model class that sent the signal (Bike).
+    - `instance`: The actual instance being saved.
+    - `raw`: A boolean; True when loading fixtures.
+    - `**kwargs`: Wildcard keyword arguments.
+    """
+    if not raw:
+        instance.card_version = (instance.card_version or 0) + 1
+
+
+@receiver(pre_save, sender=Bike)
+def set_size_rank(sender, instance, **kwargs):
+    """
+    Stores the sort position of the bike's size, used by the
+    size sort of the bike list.
+
+    **Args:**
+    - `sender`: The model class that sent the signal (Bike).
+    - `instance`: The actual instance being saved.
+    - `**kwargs`: Wildcard keyword arguments.
+    """
+    instance.size_rank = size_rank(instance.size)
+
+
+# Run this function after a bike is saved or deleted.
+@receiver(post_save, sender=Bike)
+@receiver(post_delete, sender=Bike)
+def invalidate_catalog_on_change(sender, instance, **kwargs):
+    """
+    Invalidates the cached catalog pages (the bike may have moved in,
+    out of, or within them) and the bike's own detail page.
+
+    **Args:**
+    - `sender`: The model class that sent the signal (Bike).
+    - `instance`: The actual instance being saved or deleted.
+    - `**kwargs`: Wildcard keyword arguments.
+    """
+    invalidate_catalog()
+    invalidate_bike_page(instance.pk)
@@ -0,0 +1,30 @@
+from django import template
+
+register = template.Library()
+
+
+@register.inclusion_tag('bikes/bike_image.html')
+def bike_image(bike, sizes, css_class='', lazy=True):
+    """
+    Renders a bike's featured image as a responsive `<img>`.
+
+    The browser downloads the smallest variant of the `srcset` that
+    fills the `sizes` width, over a tiny blurred placeholder. Images
+    below the fold wait until they scroll near the viewport.
+
+    **Args:**
+    - `bike`: The `Bike` whose image is shown.
+    - `sizes`: The `sizes` attribute, the displayed width of the image.
+    - `css_class`: The classes of the `<img>`.
+    - `lazy`: False for images visible when the page opens.
+
+    **Usage:**
+    - `{% bike_image bike "(min-width: 768px) 33vw, 100vw" "card-img-top" %}`
+    """
+    return {
+        'bike': bike,
+        'image': bike.image,
+        'sizes': sizes,
+        'css_class': css_class,
+        'lazy': lazy,
+    }
@@ -1,3 +1,964 @@
-from django.test import TestCase  # noqa: F401
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import path, reverse
+
+from bikes.fleet import FLEET_FIELDS
+from bikes.images import IMAGE_WIDTHS, image_urls
+from bikes.search import facet_rows, restore_sqlite_search
+from bikes.models import Bike, size_rank
+from bikes import views
+from bikes.views import BIKE_ORDERINGS
+from bike_rental.urls import urlpatterns as project_urlpatterns
+from core.pagination import keyset_filter, paginate_keyset
+from core.testing import QueryBudgetMixin
+from rentals.models import Rental
+from reviews.models import Review
+
+LOCMEM_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+}
+
+# The project's URLs with the async bike views, as routed under ASGI
+# (see settings.ASYNC_VIEWS). Used with ROOT_URLCONF='bikes.tests'.
+urlpatterns = [
+    path('', views.async_bike_list, name='home'),
+    path('bike/<int:pk>/', views.async_bike_detail, name='bike_detail'),
+] + project_urlpatterns
+
+
+class ResponsiveImageTest(TestCase):
+    """
+    Tests for the responsive Cloudinary image URLs and their markup.
+    """
+
+    def setUp(self):
+        """
+        Set up a bike with an uploaded image.
+        """
+        self.bike = Bike.objects.create(
+            name='Photo', type='City', price_per_hour=5,
+            featured_image='image/upload/v1712345678/bikes/photo.jpg',
+        )
+        self.bike.refresh_from_db()
+
+    def test_variants_are_built_and_memoized_per_version(self):
+        """
+        Test the srcset lists every width with automatic format and
+        quality, and the URLs are only built once per image version.
+        """
+        image = self.bike.image
+        for width in IMAGE_WIDTHS:
+            self.assertIn(f'c_limit,f_auto,q_auto,w_{width}/', image.srcset)
+            self.assertIn(f' {width}w', image.srcset)
+        self.assertIn('v1712345678/bikes/photo.jpg', image.src)
+        self.assertIn('e_blur:1000', image.placeholder)
+        self.assertIs(Bike.objects.get(pk=self.bike.pk).image, image)
+
+        hits = image_urls.cache_info().hits
+        self.bike.refresh_from_db()
+        self.bike.image
+        self.assertEqual(image_urls.cache_info().hits, hits + 1)
+
+        Bike.objects.filter(pk=self.bike.pk).update(
+            featured_image='image/upload/v1712349999/bikes/photo.jpg'
+        )
+        self.bike.refresh_from_db()
+        self.assertIn('v1712349999', self.bike.image.src)
+
+    def test_default_image(self):
+        """
+        Test unsaved bikes get the URLs of the placeholder image.
+        """
+        bike = Bike(name='New', type='City', price_per_hour=5)
+        self.assertIn('/placeholder', bike.image.src)
+
+    def test_only_the_first_row_of_cards_loads_eagerly(self):
+        """
+        Test the first row of the catalog loads its images right away
+        and the next cards are lazy loaded, while the detail page
+        image is never lazy.
+        """
+        for number in range(4):
+            Bike.objects.create(
+                name=f'Card {number}', type='City', price_per_hour=5
+            )
+        response = self.client.get(reverse('home'))
+        cards = response.context['bike_cards']
+        self.assertEqual(len(cards), 5)
+        for card in cards[:3]:
+            self.assertIn('fetchpriority="high"', card)
+            self.assertNotIn('loading="lazy"', card)
+        for card in cards[3:]:
+            self.assertIn('loading="lazy"', card)
+            self.assertIn('srcset=', card)
+
+        response = self.client.get(
+            reverse('bike_detail', kwargs={'pk': self.bike.pk})
+        )
+        self.assertContains(response, 'sizes="(min-width: 768px) 66vw')
+        self.assertNotContains(response, 'loading="lazy"')
+
+
+class BikeListRatingSortTest(TestCase):
+    """
+    Tests for sorting the bike list by the stored rating.
+    """
+
+    def setUp(self):
+        """
+        Set up three bikes with different ratings.
+        """
+        self.user = User.objects.create_user(
+            username='rater', password='password'
+        )
+        self.low = Bike.objects.create(
+            name='Low', type='City', price_per_hour=5.00
+        )
+        self.high = Bike.objects.create(
+            name='High', type='City', price_per_hour=5.00
+        )
+        self.unrated = Bike.objects.create(
+            name='Unrated', type='City', price_per_hour=5.00
+        )
+        Review.objects.create(
+            bike=self.low, user=self.user, rating=2, comment="Slow"
+        )
+        Review.objects.create(
+            bike=self.high, user=self.user, rating=5, comment="Fast"
+        )
+
+    def test_rating_desc_sort(self):
+        """
+        Test that rating_desc lists the best rated bike first.
+        """
+        response = self.client.get(reverse('home'), {'sort_by': 'rating_desc'})
+        self.assertEqual(
+            list(response.context['bike_list']),
+            [self.high, self.low, self.unrated],
+        )
+
+    def test_rating_asc_sort(self):
+        """
+        Test that rating_asc lists unrated bikes first.
+        """
+        response = self.client.get(reverse('home'), {'sort_by': 'rating_asc'})
+        self.assertEqual(
+            list(response.context['bike_list']),
+            [self.unrated, self.low, self.high],
+        )
+
+
+class RebuildRatingStatsCommandTest(TestCase):
+    """
+    Tests for the rebuild_rating_stats management command.
+    """
+
+    def test_command_restores_drifted_stats(self):
+        """
+        Test that the command recalculates stats from the reviews.
+        """
+        user = User.objects.create_user(username='rater', password='pw')
+        bike = Bike.objects.create(
+            name='Drifted', type='Road', price_per_hour=9.00
+        )
+        Review.objects.create(bike=bike, user=user, rating=4, comment="Ok")
+        Review.objects.create(bike=bike, user=user, rating=2, comment="Hm")
+        # Break the stored aggregates on purpose.
+        Bike.objects.filter(pk=bike.pk).update(
+            rating_average=0, rating_count=7, rating_4_count=0
+        )
+
+        call_command('rebuild_rating_stats', stdout=StringIO())
+
+        bike.refresh_from_db()
+        self.assertEqual(bike.rating_count, 2)
+        self.assertEqual(bike.average_rating, 3)
+        self.assertEqual(bike.rating_4_count, 1)
+        self.assertEqual(bike.rating_2_count, 1)
+
+
+class RatingStatsSaveTest(TestCase):
+    """
+    Tests that saving a bike keeps the rating aggregates of the reviews.
+    """
+
+    def test_stale_save_keeps_review_counts(self):
+        """
+        Test a bike loaded before a review, then saved (as by a return
+        or the admin), does not write back its old counts.
+        """
+        user = User.objects.create_user(username='rater', password='pw')
+        bike = Bike.objects.create(
+            name='Busy', type='Road', price_per_hour=9.00
+        )
+        stale = Bike.objects.get(pk=bike.pk)
+        Review.objects.create(bike=bike, user=user, rating=4, comment="Ok")
+        stale.is_available = False
+        stale.save()
+        bike.refresh_from_db()
+        self.assertFalse(bike.is_available)
+        self.assertEqual((bike.rating_count, bike.rating_4_count), (1, 1))
+        self.assertEqual(bike.average_rating, 4)
+
+
+class BikeListPaginationTest(TestCase):
+    """
+    Tests for the keyset (cursor) pagination of the bike list.
+    """
+
+    def setUp(self):
+        """
+        Set up 30 bikes with many equal sort values to exercise ties.
+        """
+        for number in range(30):
+            Bike.objects.create(
+                name=f'Bike {number % 7}',
+                type=['City', 'Road', 'Mountain'][number % 3],
+                size=['S', 'M', 'L', 'XL'][number % 4],
+                price_per_hour=5 + number % 5,
+                rating_average=(number % 6) / 2,
+            )
+        Bike.objects.create(
+            name='Rented', type='City', price_per_hour=5, is_available=False
+        )
+
+    def walk(self, sort_by):
+        """
+        Follows the next page links and returns the ids in the order shown.
+        """
+        ids = []
+        response = self.client.get(reverse('home'), {'sort_by': sort_by})
+        pages = 0
+        while True:
+            pages += 1
+            ids.extend(bike.id for bike in response.context['bike_list'])
+            link = response.context.get('next_page_url')
+            if not link:
+                return ids, response, pages
+            response = self.client.get(reverse('home') + link)
+
+    def test_every_sort_visits_each_bike_once_in_order(self):
+        """
+        Test that paging forward lists each available bike exactly once,
+        in the same order as the unpaginated query.
+        """
+        for sort_by, ordering in BIKE_ORDERINGS.items():
+            with self.subTest(sort_by=sort_by):
+                expected = list(
+                    Bike.objects.filter(is_available=True)
+                    .order_by(*ordering).values_list('id', flat=True)
+                )
+                ids, _, pages = self.walk(sort_by)
+                self.assertEqual(ids, expected)
+                self.assertEqual(pages, 3)
+
+    def test_previous_links_walk_back_to_first_page(self):
+        """
+        Test that the previous links return the same pages in reverse.
+        """
+        response = self.client.get(reverse('home'), {'sort_by': 'price_desc'})
+        first_page = [bike.id for bike in response.context['bike_list']]
+        self.assertNotIn('previous_page_url', response.context)
+        # Go to the last page.
+        while response.context.get('next_page_url'):
+            response = self.client.get(
+                reverse('home') + response.context['next_page_url']
+            )
+        while response.context.get('previous_page_url'):
+            response = self.client.get(
+                reverse('home') + response.context['previous_page_url']
+            )
+        self.assertEqual(
+            [bike.id for bike in response.context['bike_list']], first_page
+        )
+        self.assertIn('next_page_url', response.context)
+
+    def test_invalid_cursor_shows_first_page(self):
+        """
+        Test that a malformed or mismatched cursor falls back to page one.
+        """
+        first = self.client.get(reverse('home'))
+        name_cursor = first.context['page_obj'].next_cursor
+        for cursor in ('not-a-cursor', name_cursor):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(
+                    reverse('home'),
+                    {'sort_by': 'price_asc', 'cursor': cursor},
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn('previous_page_url', response.context)
+
+    def test_cursor_condition_is_a_row_comparison(self):
+        """
+        Test a same-direction ordering gets one row value comparison,
+        and a mixed one the OR chain with a leading bound that still
+        pages through every bike once.
+        """
+        query = str(Bike.objects.filter(
+            keyset_filter(('-rating_average', '-id'), ['1.5', 3])
+        ).query)
+        self.assertIn(
+            '("bikes_bike"."rating_average", "bikes_bike"."id") < (', query
+        )
+        self.assertNotIn(' OR ', query)
+
+        mixed = Bike.objects.order_by('name', '-id')
+        query = str(mixed.filter(
+            keyset_filter(('name', '-id'), ['Bike 3', 3])
+        ).query)
+        self.assertIn(' OR ', query)
+        self.assertIn('"bikes_bike"."name" >= ', query)
+        ids, cursor = [], None
+        while True:
+            page = paginate_keyset(mixed, cursor, page_size=7)
+            ids.extend(bike.id for bike in page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(ids, list(mixed.values_list('id', flat=True)))
+
+
+class BikeViewQueryBudgetTest(QueryBudgetMixin, TestCase):
+    """
+    Query budgets for the home and bike detail pages.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Set up a catalog of 40 bikes, one of them with 30 reviews.
+        """
+        cls.users = [
+            User.objects.create_user(
+                username=f'rider{number}', password='password',
+                first_name='Rider', last_name=str(number),
+            )
+            for number in range(30)
+        ]
+        cls.bikes = [
+            Bike.objects.create(
+                name=f'Bike {number:02}', type='City', size='M',
+                price_per_hour=5 + number % 4,
+            )
+            for number in range(40)
+        ]
+        cls.popular = cls.bikes[0]
+        for number, user in enumerate(cls.users):
+            Review.objects.create(
+                bike=cls.popular, user=user, rating=number % 5 + 1,
+                comment=f"Review {number}",
+            )
+        for bike in cls.bikes[1:20]:
+            Review.objects.create(
+                bike=bike, user=cls.users[0], rating=4, comment="Good"
+            )
+
+    def test_home_page_budget(self):
+        """
+        Test the home page in every sort order, on the first and next page:
+        the page of bikes and the facet counts.
+        """
+        for sort_by in BIKE_ORDERINGS:
+            with self.subTest(sort_by=sort_by):
+                with self.assertQueryBudget(2):
+                    response = self.client.get(
+                        reverse('home'), {'sort_by': sort_by}
+                    )
+                with self.assertQueryBudget(2):
+                    self.client.get(
+                        reverse('home') + response.context['next_page_url']
+                    )
+
+    def test_home_page_budget_logged_in(self):
+        """
+        Test the home page for a logged-in user (session and user lookup).
+        """
+        self.client.force_login(self.users[0])
+        with self.assertQueryBudget(4):
+            self.client.get(reverse('home'))
+
+    def test_bike_detail_budget(self):
+        """
+        Test the detail page of a bike with 30 reviews:
+        bike, reviews with authors and upcoming reservations.
+        """
+        url = reverse('bike_detail', kwargs={'pk': self.popular.pk})
+        with self.assertQueryBudget(3):
+            self.client.get(url)
+
+    def test_bike_detail_budget_logged_in(self):
+        """
+        Test the detail page for a logged-in review author.
+        """
+        self.client.force_login(self.users[3])
+        url = reverse('bike_detail', kwargs={'pk': self.popular.pk})
+        with self.assertQueryBudget(5):
+            self.client.get(url)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class BikeListCacheTest(QueryBudgetMixin, TestCase):
+    """
+    Tests for the cached catalog pages and bike cards.
+    """
+
+    def setUp(self):
+        """
+        Set up a few bikes and an empty cache.
+        """
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(
+            username='cached', password='password'
+        )
+        self.bikes = [
+            Bike.objects.create(
+                name=f'Bike {number}', type='City', price_per_hour=5.00
+            )
+            for number in range(3)
+        ]
+
+    def get_home(self):
+        """
+        Returns the rendered home page, running on-commit invalidations.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get(reverse('home')).content.decode()
+
+    def test_warm_page_runs_no_query(self):
+        """
+        Test a second visit is served from the cache.
+        """
+        first = self.get_home()
+        with self.assertQueryBudget(0):
+            second = self.get_home()
+        self.assertEqual(first, second)
+
+    def test_bike_change_renders_only_its_card(self):
+        """
+        Test editing a bike refreshes its card and keeps the others.
+        """
+        self.get_home()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bikes[1].name = 'Renamed'
+            self.bikes[1].save()
+        # Id list and facet counts (both under the new catalog
+        # version), then the one bike whose card is missing.
+        with self.assertQueryBudget(3):
+            html = self.get_home()
+        self.assertIn('Renamed', html)
+        self.assertNotIn('Bike 1', html)
+
+    def test_review_refreshes_card(self):
+        """
+        Test a new review updates the rating shown on the card.
+        """
+        self.get_home()
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(
+                bike=self.bikes[0], user=self.user, rating=4, comment="Ok"
+            )
+        html = self.get_home()
+        self.assertIn('4.0', html)
+
+    def test_rented_bike_leaves_cached_list(self):
+        """
+        Test a claimed bike disappears from the cached page.
+        """
+        self.get_home()
+        with self.captureOnCommitCallbacks(execute=True):
+            Rental.claim(self.user, self.bikes[2])
+        html = self.get_home()
+        self.assertNotIn('Bike 2', html)
+        self.assertIn('Bike 0', html)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class AnonymousPageCacheTest(QueryBudgetMixin, TestCase):
+    """
+    Tests for the full-page cache of anonymous home and detail pages.
+    """
+
+    def setUp(self):
+        """
+        Set up a bike with a review and an empty cache.
+        """
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(
+            username='visitor', password='password'
+        )
+        self.bike = Bike.objects.create(
+            name='Cached', type='City', price_per_hour=5.00
+        )
+        self.review = Review.objects.create(
+            bike=self.bike, user=self.user, rating=4, comment="Original"
+        )
+        self.detail_url = reverse('bike_detail', kwargs={'pk': self.bike.pk})
+
+    def get(self, url, data=None, **extra):
+        """
+        Returns the response, running on-commit invalidations first.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get(url, data, **extra)
+
+    def test_second_visit_is_a_hit_without_queries(self):
+        """
+        Test an anonymous page is served from the cache, gzip encoded.
+        """
+        first = self.get(self.detail_url)
+        self.assertEqual(first['X-Page-Cache'], 'MISS')
+        with self.assertQueryBudget(0):
+            second = self.get(self.detail_url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(second['X-Page-Cache'], 'HIT')
+        self.assertEqual(second['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(second.content), first.content)
+        # Clients without gzip get the plain body.
+        third = self.get(self.detail_url)
+        self.assertEqual(third.content, first.content)
+
+    def test_varies_on_sort_and_cursor_only(self):
+        """
+        Test other query parameters skip the cache.
+        """
+        self.get(reverse('home'), {'sort_by': 'price_asc'})
+        hit = self.get(reverse('home'), {'sort_by': 'price_asc'})
+        self.assertEqual(hit['X-Page-Cache'], 'HIT')
+        other = self.get(reverse('home'), {'sort_by': 'name_desc'})
+        self.assertEqual(other['X-Page-Cache'], 'MISS')
+        filtered = self.get(reverse('home'), {'available_from': ''})
+        self.assertNotIn('X-Page-Cache', filtered)
+
+    def test_authenticated_users_skip_cache(self):
+        """
+        Test logged-in users always get a fresh page.
+        """
+        self.get(self.detail_url)
+        self.client.force_login(self.user)
+        response = self.get(self.detail_url)
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertContains(response, 'Leave a Review')
+
+    def test_pending_messages_skip_cache(self):
+        """
+        Test a page showing flash messages is neither served nor stored.
+        """
+        self.get(self.detail_url)
+        # Logging out leaves a message for the next page.
+        self.client.force_login(self.user)
+        self.client.post(reverse('account_logout'))
+        response = self.get(self.detail_url)
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertContains(response, 'signed out')
+        self.assertEqual(self.get(self.detail_url)['X-Page-Cache'], 'HIT')
+
+    def test_review_change_purges_only_its_bike(self):
+        """
+        Test editing a review purges its bike page but not the catalog.
+        """
+        self.get(self.detail_url)
+        self.get(reverse('home'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.review.comment = "Edited"
+            self.review.save()
+        detail = self.get(self.detail_url)
+        self.assertEqual(detail['X-Page-Cache'], 'MISS')
+        self.assertContains(detail, 'Edited')
+        # The comment is not shown on the home page.
+        self.assertEqual(self.get(reverse('home'))['X-Page-Cache'], 'HIT')
+
+    def test_rental_purges_home_page(self):
+        """
+        Test renting a bike removes it from the cached home page.
+        """
+        self.get(reverse('home'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Rental.claim(self.user, self.bike)
+        home = self.get(reverse('home'))
+        self.assertEqual(home['X-Page-Cache'], 'MISS')
+        self.assertNotContains(home, 'Cached')
+
+    def test_stats_report_hit_ratio(self):
+        """
+        Test the command reports hits and misses per page.
+        """
+        for _ in range(4):
+            self.get(self.detail_url)
+        out = StringIO()
+        call_command('page_cache_stats', stdout=out)
+        self.assertIn(
+            'bike_detail: hits=3 misses=1 bypassed=0 hit_ratio=75.0%',
+            out.getvalue()
+        )
+
+
+class CatalogSearchTest(QueryBudgetMixin, TestCase):
+    """
+    Tests for the full-text search, the facets and the size sort.
+    """
+
+    def setUp(self):
+        """
+        Set up city and mountain bikes of several sizes and prices.
+        """
+        specs = [
+            ('Mountain Explorer', 'Mountain', 'L', 25, 'Rocky trails'),
+            ('Summit Pro', 'Mountain', 'XS', 15, 'Steep climbs'),
+            ('City Cruiser', 'City', 'M', 8, 'Comfortable commuting'),
+            ('Urban Glide', 'City', 'S', 12, 'Smooth streets'),
+            ('Canal Tourer', 'City', '54cm', 9, 'Long rides'),
+        ]
+        self.bikes = {
+            name: Bike.objects.create(
+                name=name, type=bike_type, size=size, price_per_hour=price,
+                description=description,
+            )
+            for name, bike_type, size, price, description in specs
+        }
+
+    def listed_names(self, **params):
+        """
+        Returns the names of the bikes the home page lists.
+        """
+        response = self.client.get(reverse('home'), params)
+        return [bike.name for bike in response.context['bike_list']]
+
+    def test_size_rank(self):
+        """
+        Test letter sizes rank in size order, before numeric sizes.
+        """
+        ranks = [
+            size_rank(size)
+            for size in ('XXS', 'xs', 'Small', 'M', 'L', 'XL', '26"', '54cm')
+        ]
+        self.assertEqual(ranks, sorted(ranks))
+        self.assertEqual(size_rank('S'), size_rank('small'))
+        self.assertGreater(size_rank('one size'), size_rank('54cm'))
+
+    def test_size_sort_uses_the_rank(self):
+        """
+        Test the size sort orders XS < S < M < L < numeric sizes.
+        """
+        self.assertEqual(self.listed_names(sort_by='size_asc'), [
+            'Summit Pro', 'Urban Glide', 'City Cruiser', 'Mountain Explorer',
+            'Canal Tourer',
+        ])
+        self.assertEqual(
+            self.listed_names(sort_by='size_desc')[0], 'Canal Tourer'
+        )
+
+    def test_search_matches_word_prefixes(self):
+        """
+        Test every searched word must match the name, type or
+        description, as a prefix, and search syntax is ignored.
+        """
+        self.assertEqual(self.listed_names(q='moun'), [
+            'Mountain Explorer', 'Summit Pro',
+        ])
+        self.assertEqual(self.listed_names(q='commut city'), ['City Cruiser'])
+        self.assertEqual(self.listed_names(q='"rocky'), ['Mountain Explorer'])
+        self.assertEqual(self.listed_names(q='smooth*) ('), ['Urban Glide'])
+        self.assertEqual(len(self.listed_names(q='  ')), 5)
+
+    def test_search_index_follows_changes(self):
+        """
+        Test renamed and deleted bikes are searched by their new data.
+        """
+        bike = self.bikes['Urban Glide']
+        bike.name = 'Harbour Sprinter'
+        bike.save()
+        self.bikes['Summit Pro'].delete()
+        Bike.objects.filter(pk=self.bikes['Canal Tourer'].pk).update(
+            description='Harbour views'
+        )
+        self.assertEqual(self.listed_names(q='urban'), [])
+        self.assertEqual(self.listed_names(q='harbour'), [
+            'Canal Tourer', 'Harbour Sprinter',
+        ])
+        self.assertEqual(self.listed_names(q='summit'), [])
+
+    @unittest.skipUnless(
+        connection.vendor == 'sqlite', 'SQLite FTS5 triggers'
+    )
+    def test_dropped_search_triggers_are_restored(self):
+        """
+        Test the triggers a table rebuild drops are created again,
+        with the index, after a migrate.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER bikes_bike_fts_update')
+        bike = self.bikes['Urban Glide']
+        bike.name = 'Harbour Sprinter'
+        bike.save()
+        self.assertEqual(self.listed_names(q='harbour'), [])
+
+        self.assertEqual(restore_sqlite_search(), ['bikes_bike_fts_update'])
+        self.assertEqual(self.listed_names(q='harbour'), ['Harbour Sprinter'])
+        self.assertEqual(restore_sqlite_search(), [])
+
+    def test_facet_counts_come_from_one_query(self):
+        """
+        Test the facet counts of a filtered list: each facet counts the
+        bikes listed with the other facets' filters.
+        """
+        queryset = Bike.objects.filter(is_available=True)
+        with self.assertQueryBudget(1):
+            facet_rows(queryset)
+
+        response = self.client.get(
+            reverse('home'), {'type': 'City', 'sort_by': 'price_asc'}
+        )
+        self.assertEqual(
+            [bike.name for bike in response.context['bike_list']],
+            ['City Cruiser', 'Canal Tourer', 'Urban Glide'],
+        )
+        facets = {
+            facet['name']: {
+                value['label']: (value['count'], value['selected'])
+                for value in facet['values']
+            }
+            for facet in response.context['facets']
+        }
+        self.assertEqual(facets['type'], {
+            'City': (3, True), 'Mountain': (2, False),
+        })
+        self.assertEqual(list(facets['size']), ['S', 'M', '54cm'])
+        self.assertEqual(facets['price'], {
+            'Under €10': (2, False), '€10 to €20': (1, False),
+        })
+        # Links keep the other parameters and unselect a selected value.
+        links = {
+            value['label']: value['url']
+            for facet in response.context['facets']
+            for value in facet['values']
+        }
+        self.assertEqual(links['City'], '?sort_by=price_asc')
+        self.assertIn('type=City', links['M'])
+        self.assertIn('size=M', links['M'])
+
+    def test_search_and_facets_combine(self):
+        """
+        Test a search narrows the facet counts, and a price band
+        filters the list.
+        """
+        response = self.client.get(
+            reverse('home'), {'q': 'mountain', 'price': '10-20'}
+        )
+        self.assertEqual(
+            [bike.name for bike in response.context['bike_list']],
+            ['Summit Pro'],
+        )
+        type_facet = response.context['facets'][0]
+        self.assertEqual(
+            [(value['label'], value['count'])
+             for value in type_facet['values']],
+            [('Mountain', 1)],
+        )
+
+    def test_invalid_price_band_is_ignored(self):
+        """
+        Test an unknown price band lists all the bikes.
+        """
+        self.assertEqual(len(self.listed_names(price='free')), 5)
+
+
+class FleetCommandsTest(QueryBudgetMixin, TestCase):
+    """
+    Tests for the import_fleet and export_fleet commands.
+    """
+
+    def setUp(self):
+        """
+        Set up a temporary directory for the fleet files.
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write_file(self, name, content):
+        """
+        Writes a fleet file and returns its path.
+        """
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as stream:
+            stream.write(content)
+        return path
+
+    def run_command(self, *args):
+        """
+        Runs a command and returns its (stdout, stderr) output.
+        """
+        out, err = StringIO(), StringIO()
+        call_command(*args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_import_creates_updates_and_skips_invalid_rows(self):
+        """
+        Test new rows, updated rows and invalid rows of a CSV file.
+        """
+        bike = Bike.objects.create(
+            name='Old name', type='City', size='M', price_per_hour=5.00
+        )
+        path = self.write_file('fleet.csv', (
+            'id,name,type,size,price_per_hour,is_available\n'
+            ',Trail One,Mountain,L,12.5,yes\n'
+            f'{bike.pk},New name,City,M,6,false\n'
+            ',,Road,S,8,true\n'
+            ',Pricey,Road,S,abc,true\n'
+            '999999,Ghost,Road,S,8,true\n'
+        ))
+        out, err = self.run_command('import_fleet', path)
+        self.assertIn(
+            '1 created, 1 updated, 0 unchanged, 3 invalid rows skipped', out
+        )
+        # The bulk writes rank the sizes and index the names.
+        trail = Bike.objects.get(name='Trail One')
+        self.assertEqual(trail.size_rank, size_rank('L'))
+        self.assertTrue(
+            Bike.objects.filter(name='New name', size_rank=size_rank('M'))
+            .exists()
+        )
+        response = self.client.get(reverse('home'), {'q': 'trail'})
+        self.assertEqual(list(response.context['bike_list']), [trail])
+        self.assertIn('rows/s', out)
+        self.assertIn('Line 4: name is required', err)
+        self.assertIn('Line 5: price_per_hour is not a number', err)
+        self.assertIn('no bike with id 999999', err)
+        bike.refresh_from_db()
+        self.assertEqual(bike.name, 'New name')
+        self.assertFalse(bike.is_available)
+        self.assertEqual(bike.card_version, 2)
+        # bulk_update skips the signals, the import records the price.
+        self.assertEqual(list(
+            bike.price_history.values_list('price_per_hour', flat=True)
+        ), [Decimal('6.00')])
+        trail = Bike.objects.get(name='Trail One')
+        self.assertEqual(str(trail.price_per_hour), '12.50')
+        self.assertEqual(str(trail.featured_image), 'placeholder')
+
+    def test_import_runs_a_fixed_number_of_queries_per_batch(self):
+        """
+        Test 50 rows in batches of 25 cost the same as one batch each.
+        """
+        path = self.write_file('fleet.jsonl', ''.join(
+            json.dumps({
+                'name': f'Bike {number}', 'type': 'City', 'size': 'M',
+                'price_per_hour': 4, 'is_available': True,
+            }) + '\n'
+            for number in range(50)
+        ))
+        # Per batch: the existing ids lookup and one INSERT.
+        with self.assertQueryBudget(4, repeat_limit=2):
+            self.run_command('import_fleet', path, '--batch-size', '25')
+        self.assertEqual(Bike.objects.count(), 50)
+
+    def test_export_round_trips_through_import(self):
+        """
+        Test exported files import back to the same bikes, in both formats.
+        """
+        for number in range(5):
+            Bike.objects.create(
+                name=f'Bike {number}', type='Hybrid', size='S',
+                description='<p>"Quoted", with a comma</p>',
+                price_per_hour=number + 0.5,
+            )
+        # Unchanged bikes are not written, their cards stay cached.
+        fields = FLEET_FIELDS[:-1] + ('card_version',)
+        before = list(Bike.objects.order_by('id').values_list(*fields))
+        for fleet_format in ('csv', 'jsonl'):
+            with self.subTest(fleet_format=fleet_format):
+                path = os.path.join(self.directory, f'out.{fleet_format}')
+                out, _ = self.run_command(
+                    'export_fleet', path, '--chunk-size', '2'
+                )
+                self.assertIn('Exported 5 bikes', out)
+                self.run_command('import_fleet', path)
+                after = Bike.objects.order_by('id').values_list(*fields)
+                self.assertEqual(list(after), before)
+
+    def test_export_to_stdout_keeps_report_separate(self):
+        """
+        Test exporting to standard output writes only JSON lines there.
+        """
+        Bike.objects.create(name='Solo', type='City', price_per_hour=3)
+        out, err = self.run_command('export_fleet', '--format', 'jsonl')
+        self.assertEqual(json.loads(out)['name'], 'Solo')
+        self.assertIn('Exported 1 bikes', err)
+
+
+@override_settings(CACHES=LOCMEM_CACHE, ROOT_URLCONF='bikes.tests')
+class AsyncBikeViewsTest(TestCase):
+    """
+    Tests for the async bike list and detail views served under ASGI.
+    """
+
+    def setUp(self):
+        """
+        Set up 15 bikes, a review and an empty cache.
+        """
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(
+            username='async', password='password'
+        )
+        self.bikes = [
+            Bike.objects.create(
+                name=f'Async {number:02}', type='City', price_per_hour=5
+            )
+            for number in range(15)
+        ]
+        Review.objects.create(
+            bike=self.bikes[0], user=self.user, rating=5, comment="Smooth"
+        )
+
+    async def test_list_matches_sync_view_and_shares_its_cache(self):
+        """
+        Test the async list renders the sync view's cards and pages,
+        and caches the page for the sync view.
+        """
+        response = await self.async_client.get(reverse('home'))
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertEqual(len(response.context['bike_cards']), 12)
+        self.assertContains(response, 'Async 00')
+        self.assertIn('next_page_url', response.context)
+        with override_settings(ROOT_URLCONF='bike_rental.urls'):
+            sync_response = await self.async_client.get(reverse('home'))
+        self.assertEqual(sync_response['X-Page-Cache'], 'HIT')
+        self.assertEqual(sync_response.content, response.content)
+
+    async def test_detail_page(self):
+        """
+        Test the async detail page shows the bike and its reviews,
+        and a missing bike is a 404.
+        """
+        url = reverse('bike_detail', kwargs={'pk': self.bikes[0].pk})
+        response = await self.async_client.get(url)
+        self.assertContains(response, 'Async 00')
+        self.assertContains(response, 'Smooth')
+        missing = reverse('bike_detail', kwargs={'pk': 0})
+        response = await self.async_client.get(missing)
+        self.assertEqual(response.status_code, 404)
+
+    def test_review_submission_uses_sync_view(self):
+        """
+        Test POSTing a review to the async route still saves it.
+        """
+        self.client.force_login(self.user)
+        url = reverse('bike_detail', kwargs={'pk': self.bikes[1].pk})
+        response = self.client.post(
+            url, {'rating': 4, 'comment': 'Posted'}
+        )
+        self.assertRedirects(response, url)
+        self.assertTrue(Review.objects.filter(comment='Posted').exists())
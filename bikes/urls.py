@@ -1,10 +1,19 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# Under ASGI the async versions of the views serve the same URLs.
+if settings.ASYNC_VIEWS:
+    bike_list = views.async_bike_list
+    bike_detail = views.async_bike_detail
+else:
+    bike_list = views.BikeList.as_view()
+    bike_detail = views.bike_detail_view
+
 urlpatterns = [
     # Path '' represents homepage linked to BikeList view
     # Name 'home' for reference.
-    path('', views.BikeList.as_view(), name='home'),
+    path('', bike_list, name='home'),
     # Dynamic path captures the bike primary key and passes to view.
-    path('bike/<int:pk>/', views.BikeDetail.as_view(), name='bike_detail'),
+    path('bike/<int:pk>/', bike_detail, name='bike_detail'),
 ]
@@ -1,24 +1,200 @@
 # Import necessary modules.
+from asgiref.sync import sync_to_async
+from django.http import Http404
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views import View, generic
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
-# Import Avg to calculate the average rating at the database level.
-from django.db.models import Avg
+from django.utils import timezone
+from django.db.models import Exists, OuterRef
 
 # Import models and forms.
 from .models import Bike
+from .forms import CatalogSearchForm
+from .search import (
+    FACETS, afacet_rows, facet_counts, facet_rows, filter_facets,
+    search_bikes,
+)
 from reviews.forms import ReviewForm
+from reviews.views import areview_page, next_reviews_url, review_page
+from rentals.forms import AvailabilityForm, ReservationForm
+from rentals.models import Reservation
+from core.async_views import aget_user
+from core.db_router import read_from_replica, stick_to_primary
+from core.pagination import apaginate_keyset, paginate_keyset, cursor_url
+from core.page_cache import anonymous_page_cache
+from .cache import (
+    get_catalog_page, render_bike_cards, catalog_version, bike_page_version,
+    aget_catalog_page, arender_bike_cards, get_facet_rows, aget_facet_rows,
+)
+
+
+# Map the sort_by parameter to an ordering.
+# Every ordering ends with 'id', so rows with equal values keep a stable
+# order and the keyset (cursor) pagination can continue after any row.
+# Each one matches a composite index declared on the Bike model.
+BIKE_ORDERINGS = {
+    'name_asc': ('name', 'id'),
+    'name_desc': ('-name', '-id'),
+    'type_asc': ('type', 'id'),
+    'type_desc': ('-type', '-id'),
+    # Sizes sort by rank (XS < S < M...), see Bike.size_rank.
+    'size_asc': ('size_rank', 'id'),
+    'size_desc': ('-size_rank', '-id'),
+    'price_asc': ('price_per_hour', 'id'),
+    'price_desc': ('-price_per_hour', '-id'),
+    # Stored average, see Bike.rating_average.
+    'rating_asc': ('rating_average', 'id'),
+    'rating_desc': ('-rating_average', '-id'),
+}
+# Default sort if the parameter is missing or invalid.
+DEFAULT_SORT = 'name_asc'
+
+
+def get_sort_by(request):
+    """
+    Returns the valid sort key requested in the URL, or the default.
+    """
+    sort_by = request.GET.get('sort_by', DEFAULT_SORT)
+    return sort_by if sort_by in BIKE_ORDERINGS else DEFAULT_SORT
+
+
+# GET parameters of the bike list whose pages are cached for anonymous
+# visitors. Searches ('q') are not: almost every one is different.
+CATALOG_PAGE_PARAMS = ('sort_by', 'cursor') + tuple(name for name, _ in FACETS)
+
+
+def catalog_queryset(request):
+    """
+    Returns the listed bikes, sorted, and the forms that filter them.
+
+    Only builds the queries, so the sync and async views share it.
+
+    **Returns:**
+    - A `(queryset, facet_queryset, availability_form, search_form)`
+    tuple, `facet_queryset` being the listed bikes before the facet
+    filters, whose values are counted (see `bikes.search`).
+    """
+    queryset = Bike.objects.all()
+    # Optionally keep only the bikes not reserved during a period.
+    if 'available_from' in request.GET:
+        availability_form = AvailabilityForm(request.GET)
+    else:
+        availability_form = AvailabilityForm()
+    if availability_form.is_valid():
+        start = availability_form.cleaned_data['available_from']
+        reserved = Reservation.objects.overlapping(
+            start, availability_form.cleaned_data['available_to'],
+        ).filter(bike=OuterRef('pk'))
+        # NOT EXISTS subquery, one index lookup per listed bike.
+        queryset = queryset.exclude(Exists(reserved))
+        # An open rental (is_available is false) only overlaps a period
+        # that has already started: a bike rented now can be free later.
+        if start <= timezone.now():
+            queryset = queryset.filter(is_available=True)
+    else:
+        queryset = queryset.filter(is_available=True)
+    # Optional full-text search, then the facet filters.
+    search_form = CatalogSearchForm(request.GET)
+    filters = search_form.filters()
+    facet_queryset = search_bikes(queryset, filters.get('q'))
+    queryset = filter_facets(facet_queryset, filters)
+    # Get the sorting parameter from the URL, default 'name_asc'.
+    sort_by = get_sort_by(request)
+    return (
+        queryset.order_by(*BIKE_ORDERINGS[sort_by]), facet_queryset,
+        availability_form, search_form,
+    )
+
+
+def plain_catalog(availability_form, filters):
+    """
+    Returns True if the bikes are neither searched nor limited to a
+    period, so the facet counts of the whole catalog apply and are
+    cached (see `get_facet_rows`).
+    """
+    return not availability_form.is_valid() and not filters.get('q')
+
+
+def filter_url(request, name, value):
+    """
+    Returns a link to the first page of the list with a facet value
+    selected, or unselected if it already is.
+    """
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    if params.get(name) == value:
+        params.pop(name)
+    else:
+        params[name] = value
+    return '?' + params.urlencode()
+
+
+def catalog_facets(request, rows, search_form):
+    """
+    Returns the `facets` context of the bike list: for each facet,
+    its name, title and values, with their counts and links.
+    """
+    return [
+        {
+            'name': name,
+            'title': title,
+            'values': [
+                {
+                    'label': value.label,
+                    'count': value.count,
+                    'selected': value.selected,
+                    'url': filter_url(request, name, value.value),
+                }
+                for value in values
+            ],
+        }
+        for name, title, values in facet_counts(rows, search_form.filters())
+    ]
+
+
+def page_links(request, page):
+    """
+    Returns the `next_page_url` and `previous_page_url` of a page.
+    """
+    links = {}
+    if page.has_next:
+        links['next_page_url'] = cursor_url(request, page.next_cursor)
+    if page.has_previous:
+        links['previous_page_url'] = cursor_url(
+            request, page.previous_cursor
+        )
+    return links
 
 
 # View inherits Django ListView.
+# Anonymous visitors get whole pages from the cache, until a change
+# to the listed bikes bumps the catalog version.
+@method_decorator(anonymous_page_cache(
+    'home', lambda request: catalog_version(),
+    vary_on=CATALOG_PAGE_PARAMS,
+), name='dispatch')
+# Reads from the replica (if any) on cache misses.
+@method_decorator(read_from_replica, name='dispatch')
 class BikeList(generic.ListView):
     """
     Displays a list of available bikes, with sorting options.
 
+    The list is split into pages with keyset (cursor) pagination,
+    so deep pages cost the same as the first one. Pages of the plain
+    catalog and the rendered bike cards are cached (see `bikes.cache`),
+    a warm page runs no query at all.
+
     **Context:**
-    - `bike_list`: A queryset of `Bike` objects where `is_available` is True.
+    - `bike_list`: The `Bike` objects on the current page (only `id`
+    and `card_version` are loaded when the page came from the cache).
+    - `bike_cards`: The rendered HTML card of each bike.
+    - `page_obj`: The `CursorPage` with the next/previous cursors.
+    - `next_page_url`, `previous_page_url`: Links to the other pages.
+    - `sort_by`: The active sort key.
+    - `availability_form`: The form to only list bikes free during
+    a period (not reserved by anyone, nor rented if it starts now).
 
     **Template:**
     - `index.html`
@@ -29,6 +205,8 @@ class BikeList(generic.ListView):
     template_name = 'index.html'
     # Variable that holds the list of bikes in the template.
     context_object_name = 'bike_list'
+    # Number of bikes on each page.
+    paginate_by = 12
 
     def get_queryset(self):
         """
@@ -36,48 +214,145 @@ class BikeList(generic.ListView):
         optionally sorted by a user-selected parameter.
         Optimized to perform sorting at the database level.
         """
-        queryset = Bike.objects.filter(is_available=True)
-        # Get the sorting parameter from the URL, default 'name_asc'.
-        sort_by = self.request.GET.get('sort_by', 'name_asc')
-
-        # A dictionary to map the sort_by parameter to ordering field.
-        ordering_map = {
-            'name_asc': 'name',
-            'name_desc': '-name',
-            'type_asc': 'type',
-            'type_desc': '-type',
-            'price_asc': 'price_per_hour',
-            'price_desc': '-price_per_hour',
-            # Special handling for size and rating.
-        }
+        (
+            queryset, self.facet_queryset, self.availability_form,
+            self.search_form,
+        ) = catalog_queryset(self.request)
+        return queryset
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Paginates with a cursor from the URL instead of a page number.
+
+        Only pages of the whole catalog are cached; searches and
+        availability periods are different for almost every request,
+        and a facet filter sees only part of the catalog.
 
-        if sort_by in ordering_map:
-            queryset = queryset.order_by(ordering_map[sort_by])
-
-        # Handling for size (allow for custom or numeric sorting).
-        elif sort_by == 'size_asc':
-            queryset = queryset.order_by('size')
-        elif sort_by == 'size_desc':
-            queryset = queryset.order_by('-size')
-
-        # Handling for rating (annotate method to calculate average rating).
-        elif sort_by == 'rating_asc':
-            queryset = queryset.annotate(
-                avg_rating=Avg('reviews__rating')
-            ).order_by('avg_rating')
-        elif sort_by == 'rating_desc':
-            queryset = queryset.annotate(
-                avg_rating=Avg('reviews__rating')
-            ).order_by('-avg_rating')
-
-        # Default sort if invalid parameter
+        **Returns:**
+        - The `(paginator, page, object_list, is_paginated)` tuple
+        expected by `ListView`.
+        """
+        cursor = self.request.GET.get('cursor')
+        if self.availability_form.is_valid() or self.search_form.filters():
+            page = paginate_keyset(queryset, cursor, page_size)
         else:
-            queryset = queryset.order_by('name')
+            page = get_catalog_page(
+                queryset, get_sort_by(self.request), cursor, page_size,
+                paginate_keyset,
+            )
+        return (None, page, page.object_list, page.has_other_pages())
 
-        return queryset
+    def get_context_data(self, **kwargs):
+        """
+        Adds the sort key, the bike cards, the search and facets,
+        and the links to the other pages.
+        """
+        context = super().get_context_data(**kwargs)
+        page = context['page_obj']
+        context['bike_cards'] = render_bike_cards(
+            page.object_list,
+            complete=not getattr(page, 'from_cache', False),
+        )
+        context['sort_by'] = get_sort_by(self.request)
+        context['availability_form'] = self.availability_form
+        context['search_form'] = self.search_form
+        # One GROUP BY query (or none, from the cache) for all facets.
+        if plain_catalog(self.availability_form, self.search_form.filters()):
+            rows = get_facet_rows(self.facet_queryset)
+        else:
+            rows = facet_rows(self.facet_queryset)
+        context['facets'] = catalog_facets(
+            self.request, rows, self.search_form
+        )
+        context.update(page_links(self.request, page))
+        return context
+
+
+# Async version of BikeList, routed instead of it under ASGI
+# (see settings.ASYNC_VIEWS). Shares its page cache entries.
+@anonymous_page_cache(
+    'home', lambda request: catalog_version(),
+    vary_on=CATALOG_PAGE_PARAMS,
+)
+@read_from_replica
+async def async_bike_list(request):
+    """
+    Displays the list of available bikes, like `BikeList`, with the
+    async ORM and cache API.
+
+    **Returns:**
+    - An `HttpResponse` rendering `index.html` with the same context
+    as `BikeList`.
+    """
+    queryset, facet_queryset, availability_form, search_form = (
+        catalog_queryset(request)
+    )
+    filters = search_form.filters()
+    cursor = request.GET.get('cursor')
+    page_size = BikeList.paginate_by
+    if availability_form.is_valid() or filters:
+        page = await apaginate_keyset(queryset, cursor, page_size)
+    else:
+        page = await aget_catalog_page(
+            queryset, get_sort_by(request), cursor, page_size
+        )
+    bike_cards = await arender_bike_cards(
+        page.object_list, complete=not getattr(page, 'from_cache', False),
+    )
+    if plain_catalog(availability_form, filters):
+        rows = await aget_facet_rows(facet_queryset)
+    else:
+        rows = await afacet_rows(facet_queryset)
+    # Loaded before rendering, the templates show the user's menu.
+    await aget_user(request)
+    context = {
+        'bike_list': page.object_list,
+        'object_list': page.object_list,
+        'page_obj': page,
+        'is_paginated': page.has_other_pages(),
+        'bike_cards': bike_cards,
+        'sort_by': get_sort_by(request),
+        'availability_form': availability_form,
+        'search_form': search_form,
+        'facets': catalog_facets(request, rows, search_form),
+        **page_links(request, page),
+    }
+    return render(request, BikeList.template_name, context)
+
+
+def upcoming_reservations(bike, limit=10):
+    """
+    Returns the next booked periods of a bike, shown on its detail page.
+    """
+    return bike.reservations.filter(
+        end_time__gt=timezone.now()
+    ).only('start_time', 'end_time')[:limit]
+
+
+def bike_detail_context(bike, reviews, reservations, review_form=None):
+    """
+    Returns the context of the bike detail page.
+    """
+    return {
+        "bike": bike,
+        "reviews": reviews,
+        "next_reviews_url": next_reviews_url(bike.pk, reviews),
+        # Empty ReviewForm instance to render form on the page.
+        "review_form": review_form or ReviewForm(),
+        "reservation_form": ReservationForm(),
+        "upcoming_reservations": reservations,
+    }
 
 
 # Standard view to handle GET and POST requests (view page, submit review)
+# Anonymous GETs are cached until the bike, one of its reviews
+# or reservations changes.
+@method_decorator(anonymous_page_cache(
+    'bike_detail', lambda request, pk: bike_page_version(pk),
+), name='dispatch')
+# The page reads from the replica, review submissions write
+# to the primary and keep their author on it.
+@method_decorator(read_from_replica, name='get')
 class BikeDetail(View):
     """
     Displays the details of a single bike and handles review submissions.
@@ -106,24 +381,19 @@ class BikeDetail(View):
         pk = kwargs.get('pk')
         # If the bike doesn't exist, show 404 Not Found page.
         bike = get_object_or_404(Bike, pk=pk)
-        # Get all reviews associated with this bike.
-        reviews = bike.reviews.all()
-
-        # Empty ReviewForm instance to render form on the page.
-        review_form = ReviewForm()
+        # Only the newest reviews, with their authors in the same query.
+        # The next pages are loaded from the 'bike_reviews' view.
+        reviews = review_page(bike.pk)
 
         # Request, template file, context data to pass to the template.
         return render(
             request,
             "bike_detail.html",
-            {
-                "bike": bike,
-                "reviews": reviews,
-                "review_form": review_form,
-            },
+            bike_detail_context(bike, reviews, upcoming_reservations(bike)),
         )
 
     # Decorator ensures only logged-in users can post reviews.
+    @method_decorator(stick_to_primary)
     @method_decorator(login_required)
     def post(self, request, *args, **kwargs):
         """
@@ -177,14 +447,54 @@ class BikeDetail(View):
                                "There was an error with your submission. "
                                "Please check the form for details."
                                )
-            reviews = bike.reviews.all()
+            reviews = review_page(bike.pk)
+            # Pass the form with errors back to the template.
             return render(
                 request,
                 "bike_detail.html",
-                {
-                    "bike": bike,
-                    "reviews": reviews,
-                    # Pass the form with errors back to the template
-                    "review_form": review_form,
-                },
+                bike_detail_context(
+                    bike, reviews, upcoming_reservations(bike), review_form
+                ),
             )
+
+
+@anonymous_page_cache(
+    'bike_detail', lambda request, pk: bike_page_version(pk),
+)
+@read_from_replica
+async def async_bike_detail_page(request, pk):
+    """
+    Renders the bike detail page, like `BikeDetail.get`, with the
+    async ORM.
+    """
+    try:
+        bike = await Bike.objects.aget(pk=pk)
+    except Bike.DoesNotExist:
+        raise Http404("No Bike matches the given query.")
+    reviews = await areview_page(bike.pk)
+    reservations = [
+        reservation
+        async for reservation in upcoming_reservations(bike)
+    ]
+    # Loaded before rendering, the page depends on the user.
+    await aget_user(request)
+    return render(
+        request, "bike_detail.html",
+        bike_detail_context(bike, reviews, reservations),
+    )
+
+
+# The sync view still handles review submissions under ASGI.
+bike_detail_view = BikeDetail.as_view()
+
+
+async def async_bike_detail(request, pk):
+    """
+    Async version of `BikeDetail`, routed instead of it under ASGI.
+
+    GET requests are served by `async_bike_detail_page`, review
+    submissions (POST) by `BikeDetail.post` in a worker thread.
+    """
+    if request.method in ('GET', 'HEAD'):
+        return await async_bike_detail_page(request, pk=pk)
+    return await sync_to_async(bike_detail_view)(request, pk=pk)
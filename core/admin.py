@@ -1,3 +1,288 @@
-from django.contrib import admin  # noqa: F401
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.db.models import Avg, Count, Max, Sum
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404, redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.html import format_html
 
-# Register your models here.
+from core.models import Job, RequestProfile, SlowQuery
+from core.pagination import EstimatedCountPaginator
+from core.profiling import compare_profiles, profile_filename, top_functions
+
+
+class LargeTableAdminMixin:
+    """
+    Changelist settings for models with millions of rows.
+
+    Mix into a `ModelAdmin` before it:
+    - Pages use an estimated count (`EstimatedCountPaginator`).
+    - The unfiltered total ("N total") is not counted on every
+    filtered page.
+
+    The admin still needs `list_select_related` for the displayed
+    relations, and indexes matching its ordering, filters and
+    `date_hierarchy`.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+# Decorator to register a custom admin class
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    """
+    Customizes the admin interface for the RequestProfile model.
+
+    **Admin Panel Features:**
+    - Lists the recent profiles with their view, time and queries,
+    filtered by view or trigger.
+    - Shows the slowest functions and the query log of a profile.
+    - Downloads a profile as a `.prof` file (`python -m pstats`,
+    snakeviz, or flameprof for a flame graph).
+    - Compares two selected profiles, function by function.
+    - Read only: the rows are saved by `ProfilerMiddleware`.
+    """
+    list_display = (
+        'created_at', 'view_name', 'method', 'path', 'status', 'trigger',
+        'duration_ms', 'query_count', 'query_ms',
+    )
+    list_filter = ('view_name', 'trigger')
+    list_select_related = ('user',)
+    fields = (
+        'created_at', 'view_name', 'method', 'path', 'status', 'user',
+        'trigger', 'duration_ms', 'query_count', 'query_ms', 'download',
+        'functions', 'query_log',
+    )
+    readonly_fields = fields
+    actions = ['compare']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        # Loaded by the profile page only, not for every listed row.
+        return super().get_queryset(request).defer('stats', 'queries')
+
+    def get_urls(self):
+        opts = self.model._meta
+        prefix = f'{opts.app_label}_{opts.model_name}'
+        return [
+            path(
+                '<int:pk>/download/',
+                self.admin_site.admin_view(self.download_view),
+                name=f'{prefix}_download',
+            ),
+            path(
+                'compare/<int:first>/<int:second>/',
+                self.admin_site.admin_view(self.compare_view),
+                name=f'{prefix}_compare',
+            ),
+        ] + super().get_urls()
+
+    @admin.display(description="Profile file")
+    def download(self, profile):
+        url = reverse('admin:core_requestprofile_download', args=[profile.pk])
+        return format_html(
+            '<a href="{}">{}</a>', url, profile_filename(profile)
+        )
+
+    @admin.display(description="Slowest functions")
+    def functions(self, profile):
+        return format_html('<pre>{}</pre>', top_functions(profile.stats))
+
+    @admin.display(description="Queries")
+    def query_log(self, profile):
+        return format_html('<pre>{}</pre>', '\n'.join(
+            f"{query['ms']:8.2f}ms [{query['alias']}] {query['sql']}"
+            for query in profile.queries
+        ))
+
+    @admin.action(description="Compare the two selected profiles")
+    def compare(self, request, queryset):
+        """
+        Opens the comparison of the two selected profiles, the older
+        one first.
+        """
+        ids = sorted(queryset.values_list('id', flat=True)[:3])
+        if len(ids) != 2:
+            self.message_user(
+                request, "Select exactly two profiles to compare.",
+                messages.WARNING,
+            )
+            return None
+        return redirect('admin:core_requestprofile_compare', *ids)
+
+    def download_view(self, request, pk):
+        """
+        Downloads the cProfile statistics of a profile.
+        """
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        if not self.has_view_permission(request, profile):
+            raise PermissionDenied
+        response = HttpResponse(
+            bytes(profile.stats), content_type='application/octet-stream'
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{profile_filename(profile)}"'
+        )
+        return response
+
+    def compare_view(self, request, first, second):
+        """
+        Shows the query counts and times of two profiles and the
+        functions whose cumulative time changed most.
+        """
+        profiles = [
+            get_object_or_404(RequestProfile, pk=pk) for pk in (first, second)
+        ]
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': "Compare profiles",
+            'profiles': profiles,
+            'rows': compare_profiles(*profiles),
+        }
+        return TemplateResponse(
+            request, 'admin/core/requestprofile/compare.html', context
+        )
+
+
+# Decorator to register a custom admin class
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    """
+    Customizes the admin interface for the SlowQuery model.
+
+    **Admin Panel Features:**
+    - Groups the slow queries by fingerprint (one row per ORM query)
+    with their count, average and worst time, views and last run,
+    slowest total first.
+    - Lists the executions of one fingerprint, with their view,
+    calling frame and time, and shows their EXPLAIN plan.
+    - Read only: the rows are saved by `SlowQueryMiddleware`.
+    """
+    list_display = (
+        'created_at', 'duration_ms', 'view_name', 'frame', 'alias',
+        'fingerprint',
+    )
+    list_filter = ('view_name', 'alias')
+    search_fields = ('fingerprint', 'sql')
+    fields = (
+        'created_at', 'fingerprint', 'duration_ms', 'alias', 'view_name',
+        'frame', 'query', 'query_plan',
+    )
+    readonly_fields = fields
+    change_list_template = 'admin/core/slowquery/change_list.html'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        opts = self.model._meta
+        return [
+            path(
+                'fingerprints/',
+                self.admin_site.admin_view(self.fingerprints_view),
+                name=f'{opts.app_label}_{opts.model_name}_fingerprints',
+            ),
+        ] + super().get_urls()
+
+    @admin.display(description="SQL")
+    def query(self, slow_query):
+        return format_html('<pre>{}</pre>', slow_query.sql)
+
+    @admin.display(description="Plan")
+    def query_plan(self, slow_query):
+        return format_html('<pre>{}</pre>', slow_query.plan or "-")
+
+    def fingerprints_view(self, request):
+        """
+        Shows one row per fingerprint, the ones taking the most time
+        in total first.
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        groups = (
+            SlowQuery.objects.values('fingerprint')
+            .annotate(
+                count=Count('id'), total_ms=Sum('duration_ms'),
+                average_ms=Avg('duration_ms'), max_ms=Max('duration_ms'),
+                last_seen=Max('created_at'),
+                views=Count('view_name', distinct=True),
+            )
+            .order_by('-total_ms')
+        )
+        groups = list(groups)
+        # One SQL text per fingerprint, all its rows share it.
+        samples = dict(
+            SlowQuery.objects.filter(
+                fingerprint__in=[group['fingerprint'] for group in groups]
+            ).order_by().values_list('fingerprint', 'sql').distinct()
+        )
+        for group in groups:
+            group['sql'] = samples.get(group['fingerprint'], '')
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': "Slow queries by fingerprint",
+            'groups': groups,
+        }
+        return TemplateResponse(
+            request, 'admin/core/slowquery/fingerprints.html', context
+        )
+
+
+# Decorator to register a custom admin class
+@admin.register(Job)
+class JobAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    """
+    Customizes the admin interface for the Job model.
+
+    **Admin Panel Features:**
+    - Lists the jobs with their status, attempts and run times,
+    filtered by status or kind.
+    - Shows the traceback of a job's last failed attempt.
+    - Queues the selected failed jobs again, with fresh attempts.
+    - Read only otherwise: jobs are queued by the code
+    (`core.jobs.enqueue`) and run by `manage.py run_worker`.
+    """
+    list_display = (
+        'id', 'kind', 'status', 'attempts', 'run_at', 'worker',
+        'finished_at',
+    )
+    list_filter = ('status', 'kind')
+    fields = (
+        'kind', 'payload', 'status', 'run_at', 'attempts', 'max_attempts',
+        'worker', 'created_at', 'locked_at', 'finished_at', 'error',
+    )
+    readonly_fields = fields
+    actions = ['retry']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description="Last error")
+    def error(self, job):
+        return format_html('<pre>{}</pre>', job.last_error or "-")
+
+    @admin.action(description="Retry the selected failed jobs")
+    def retry(self, request, queryset):
+        retried = queryset.filter(status=Job.FAILED).update(
+            status=Job.QUEUED, run_at=timezone.now(), attempts=0,
+            finished_at=None,
+        )
+        self.message_user(request, f"{retried} jobs queued again.")
@@ -1,6 +1,20 @@
 from django.apps import AppConfig
+from django.contrib.admin import apps as admin_apps
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Connects the wrapping of the connections opened from now on.
+        from . import query_wrappers  # noqa: F401
+
+
+class ReplicaAdminConfig(admin_apps.AdminConfig):
+    """
+    `django.contrib.admin` with `ReplicaAdminSite` as `admin.site`.
+    """
+    # Listed by path in INSTALLED_APPS, CoreConfig stays the default.
+    default = False
+    default_site = 'core.sites.ReplicaAdminSite'
@@ -0,0 +1,36 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+
+
+async def aget_user(request):
+    """
+    Loads `request.user` (and the session) for an async view.
+
+    `request.user` is lazy and loading it queries the session and user
+    tables, which Django 4.2 only allows from sync code. Once loaded,
+    templates can read the user and the flash messages without queries.
+
+    **Returns:**
+    - The user, or an `AnonymousUser`.
+    """
+    def load():
+        # Evaluating is_authenticated loads the lazy user.
+        request.user.is_authenticated
+        return request.user
+    return await sync_to_async(load)()
+
+
+def async_login_required(view):
+    """
+    `login_required` for async function views (Django 4.2's
+    decorator only wraps sync views).
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await aget_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
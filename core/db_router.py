@@ -0,0 +1,132 @@
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+
+# Cookie set after a write, holding the time until which the writer
+# reads everything from the primary database.
+PIN_COOKIE = 'primary_until'
+# Apps always read from the primary. Every request authenticates with
+# them, and a replica lagging behind a login, logout or signup would
+# show the wrong user.
+PRIMARY_APPS = {'auth', 'sessions'}
+
+# Set while a view marked with `read_from_replica` runs.
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends the reads of replica views to the read replica.
+
+    Writes always go to the primary (`default`) database. Reads go to
+    the replica (`settings.READ_REPLICA`) only while a view decorated
+    with `read_from_replica` runs, so every other view keeps reading
+    its own writes. Without a replica, everything uses the primary.
+    """
+    def db_for_read(self, model, **hints):
+        if (
+            settings.READ_REPLICA
+            and _replica_reads.get()
+            and model._meta.app_label not in PRIMARY_APPS
+        ):
+            return settings.READ_REPLICA
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary.
+        return True
+
+
+def pinned_to_primary(request):
+    """
+    Returns True if the client wrote recently (see `stick_to_primary`).
+    """
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def pin_to_primary(response):
+    """
+    Makes the client read from the primary for
+    `settings.REPLICA_PIN_SECONDS`, until the replica caught up
+    with its changes.
+
+    **Returns:**
+    - The response, with the pin cookie when a replica is configured.
+    """
+    if settings.READ_REPLICA:
+        seconds = settings.REPLICA_PIN_SECONDS
+        response.set_cookie(
+            PIN_COOKIE, f'{time.time() + seconds:.0f}', max_age=seconds,
+            httponly=True, samesite='Lax',
+        )
+    return response
+
+
+def read_from_replica(view):
+    """
+    Decorator reading the database from the replica during a view.
+
+    Only GET and HEAD requests of clients that did not write recently
+    use the replica. Works on sync and async function views; use
+    `method_decorator` on class based views.
+
+    **Usage:**
+    - `@read_from_replica` above a view that only reads.
+    """
+    def replica_allowed(request):
+        return (
+            request.method in ('GET', 'HEAD')
+            and not pinned_to_primary(request)
+        )
+
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if not replica_allowed(request):
+                return await view(request, *args, **kwargs)
+            token = _replica_reads.set(True)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _replica_reads.reset(token)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not replica_allowed(request):
+            return view(request, *args, **kwargs)
+        token = _replica_reads.set(True)
+        try:
+            response = view(request, *args, **kwargs)
+            # Template responses (the admin's) render after the view.
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+            return response
+        finally:
+            _replica_reads.reset(token)
+    return wrapper
+
+
+def stick_to_primary(view):
+    """
+    Decorator pinning the client to the primary after a view that
+    writes (see `pin_to_primary`), so the replica pages it is
+    redirected to show its changes.
+
+    **Usage:**
+    - `@stick_to_primary` above a view, or a `post` method with
+    `method_decorator`.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        return pin_to_primary(view(request, *args, **kwargs))
+    return wrapper
@@ -0,0 +1,179 @@
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from .models import Job
+
+# Job functions by name, filled in by `register`.
+REGISTRY = {}
+# Longest traceback kept for a failed attempt.
+MAX_ERROR_LENGTH = 10000
+
+
+def register(name):
+    """
+    Decorator registering a function as a background job.
+
+    Job functions live in the `jobs` module of an app, found by
+    `discover`. They take the job's payload as keyword arguments,
+    which must be JSON serializable, and may run more than once
+    (after a failure or a crashed worker), so they must be safe to
+    repeat.
+
+    **Usage:**
+    - `@register('bikes.warm_bike_card')` above `def warm(bike_id):`,
+    then `enqueue('bikes.warm_bike_card', bike_id=bike.pk)`.
+    """
+    def decorator(function):
+        REGISTRY[name] = function
+        return function
+    return decorator
+
+
+def discover():
+    """
+    Imports the `jobs` module of every installed app.
+    """
+    autodiscover_modules('jobs')
+
+
+def enqueue(kind, run_at=None, max_attempts=None, **payload):
+    """
+    Adds a job to the queue.
+
+    The job is a row of the database: inside a transaction it is only
+    visible to the workers once the transaction commits, and it is
+    dropped with it on a rollback.
+
+    **Args:**
+    - `kind`: The registered name of the job.
+    - `run_at`: When to run it, defaults to now.
+    - `max_attempts`: Attempts before it fails for good, defaults to
+    `settings.JOB_MAX_ATTEMPTS`.
+    - `**payload`: The arguments of the job function.
+
+    **Returns:**
+    - The queued `Job`.
+    """
+    return Job.objects.create(
+        kind=kind, payload=payload, run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+    )
+
+
+def claim_jobs(worker, limit):
+    """
+    Marks up to `limit` due jobs as running for a worker.
+
+    On PostgreSQL the due jobs are locked with
+    `SELECT ... FOR UPDATE SKIP LOCKED`: concurrent workers skip each
+    other's rows instead of waiting for them. Databases without it
+    (SQLite) claim them with one conditional UPDATE, which SQLite runs
+    alone, and the workers poll.
+
+    **Returns:**
+    - The claimed `Job` objects, oldest first.
+    """
+    now = timezone.now()
+    due = Job.objects.filter(
+        status=Job.QUEUED, run_at__lte=now
+    ).order_by('run_at', 'id')
+    claim = {
+        'status': Job.RUNNING, 'worker': worker, 'locked_at': now,
+        'attempts': F('attempts') + 1,
+    }
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(
+                due.select_for_update(skip_locked=True)
+                .values_list('id', flat=True)[:limit]
+            )
+            Job.objects.filter(id__in=ids).update(**claim)
+    else:
+        Job.objects.filter(
+            id__in=due.values('id')[:limit], status=Job.QUEUED
+        ).update(**claim)
+    return list(Job.objects.filter(
+        status=Job.RUNNING, worker=worker, locked_at=now
+    ).order_by('run_at', 'id'))
+
+
+def backoff(attempts):
+    """
+    Returns the delay before retrying a job that failed `attempts`
+    times: exponential from `settings.JOB_RETRY_DELAY` seconds, up to
+    `settings.JOB_MAX_RETRY_DELAY`, with jitter so that jobs failing
+    together do not retry together.
+    """
+    delay = min(
+        settings.JOB_RETRY_DELAY * 2 ** (attempts - 1),
+        settings.JOB_MAX_RETRY_DELAY,
+    )
+    return timedelta(seconds=delay * random.uniform(0.5, 1))
+
+
+def run_job(job):
+    """
+    Runs a claimed job and records the outcome.
+
+    **Returns:**
+    - 'done', 'retry' (failed, queued again after a backoff) or
+    'failed' (failed its last attempt, or is not registered).
+    """
+    function = REGISTRY.get(job.kind)
+    try:
+        if function is None:
+            raise LookupError(f"no job registered as {job.kind!r}")
+        function(**job.payload)
+    except Exception:
+        error = traceback.format_exc()[-MAX_ERROR_LENGTH:]
+        now = timezone.now()
+        if function is not None and job.attempts < job.max_attempts:
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.QUEUED, run_at=now + backoff(job.attempts),
+                last_error=error,
+            )
+            return 'retry'
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.FAILED, finished_at=now, last_error=error,
+        )
+        return 'failed'
+    Job.objects.filter(pk=job.pk).update(
+        status=Job.DONE, finished_at=timezone.now(),
+    )
+    return 'done'
+
+
+def requeue_stale_jobs():
+    """
+    Queues again the jobs running for longer than
+    `settings.JOB_LEASE_SECONDS`, left behind by a crashed worker.
+
+    **Returns:**
+    - The number of jobs queued again.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_LEASE_SECONDS)
+    return Job.objects.filter(
+        status=Job.RUNNING, locked_at__lt=cutoff
+    ).update(status=Job.QUEUED, run_at=timezone.now())
+
+
+def delete_old_jobs():
+    """
+    Deletes the done jobs finished more than
+    `settings.JOB_RETENTION_DAYS` days ago. Failed jobs are kept.
+
+    **Returns:**
+    - The number of deleted jobs.
+    """
+    cutoff = timezone.now() - timedelta(days=settings.JOB_RETENTION_DAYS)
+    deleted, _ = Job.objects.filter(
+        status=Job.DONE, finished_at__lt=cutoff
+    ).delete()
+    return deleted
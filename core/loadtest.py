@@ -0,0 +1,454 @@
+import http.client
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+# Scenarios of the realistic load and their default weights: browsing
+# dominates, and a few visitors log in, rent and review.
+DEFAULT_MIX = {
+    'home': 40, 'bike_detail': 35, 'login': 5, 'rental': 10, 'review': 10,
+}
+# Link of the open rental on the profile page.
+RETURN_LINK = re.compile(r'/rental/return/(\d+)/')
+
+
+def percentile(values, fraction):
+    """
+    Returns a percentile of sorted values (nearest rank), None if empty.
+    """
+    if not values:
+        return None
+    rank = max(0, min(len(values) - 1, round(fraction * len(values)) - 1))
+    return values[rank]
+
+
+def free_port():
+    """
+    Returns a local TCP port nobody listens on.
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def running_server(argv, port, env=None, timeout=30):
+    """
+    Runs a web server for the duration of a `with` block.
+
+    **Args:**
+    - `argv`: The server command line.
+    - `port`: The local port it listens on.
+    - `env`: Extra environment variables.
+    - `timeout`: Seconds to wait for the first successful response.
+
+    **Raises:**
+    - `RuntimeError`: If the server does not answer in time.
+    """
+    process = subprocess.Popen(
+        argv, env={**os.environ, **(env or {})},
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(
+                    f"{argv[0]} exited: {process.stderr.read().decode()}"
+                )
+            try:
+                connection = http.client.HTTPConnection(
+                    '127.0.0.1', port, timeout=5
+                )
+                connection.request('GET', '/')
+                connection.getresponse().read()
+                connection.close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{argv[0]} did not start in time")
+                time.sleep(0.2)
+        yield process
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def gunicorn_command(mode, port, workers):
+    """
+    Returns the gunicorn command line of a deployment mode.
+
+    **Args:**
+    - `mode`: 'wsgi' (sync workers, as in the Procfile) or 'asgi'
+    (uvicorn workers running the async views).
+    """
+    argv = [
+        sys.executable, '-m', 'gunicorn', '--workers', str(workers),
+        '--bind', f'127.0.0.1:{port}', '--log-level', 'warning',
+    ]
+    if mode == 'asgi':
+        return argv + [
+            '--worker-class', 'uvicorn_worker.UvicornWorker',
+            'bike_rental.asgi:application',
+        ]
+    return argv + ['bike_rental.wsgi']
+
+
+def run_load(port, paths, concurrency, seconds, headers=None):
+    """
+    Sends requests to a local server from several threads.
+
+    Each thread keeps one HTTP connection open and requests the paths
+    in turn, as fast as the server answers, until the time is up.
+
+    **Args:**
+    - `port`: The server's local port.
+    - `paths`: The paths to request.
+    - `concurrency`: The number of threads (requests in flight).
+    - `seconds`: How long the load lasts.
+    - `headers`: Headers sent with every request (e.g. a session cookie).
+
+    **Returns:**
+    - A dict with the overall `requests`, `errors`, `rps`, `p50`, `p95`
+    and `p99` (latencies in milliseconds), and an `endpoints` dict with
+    the same numbers per path.
+    """
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def worker(offset):
+        local = defaultdict(list)
+        failed = defaultdict(int)
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        number = offset
+        while time.monotonic() < deadline:
+            path = paths[number % len(paths)]
+            number += 1
+            started = time.perf_counter()
+            try:
+                connection.request('GET', path, headers=headers or {})
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 400:
+                    failed[path] += 1
+                    continue
+            except (OSError, http.client.HTTPException):
+                failed[path] += 1
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port)
+                continue
+            local[path].append((time.perf_counter() - started) * 1000)
+        connection.close()
+        with lock:
+            for path, values in local.items():
+                latencies[path].extend(values)
+            for path, count in failed.items():
+                errors[path] += count
+
+    started = time.monotonic()
+    threads = [
+        threading.Thread(target=worker, args=(offset,))
+        for offset in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    result = summarize(
+        [value for values in latencies.values() for value in values],
+        sum(errors.values()), elapsed,
+    )
+    result['endpoints'] = {
+        path: summarize(latencies[path], errors[path], elapsed)
+        for path in paths
+    }
+    return result
+
+
+def summarize(values, failed, elapsed):
+    """
+    Returns the `requests`, `errors`, `rps` and latency percentiles
+    (`p50`, `p95`, `p99`, in milliseconds) of successful request
+    latencies and a number of failed requests over `elapsed` seconds.
+    """
+    values = sorted(values)
+    return {
+        'requests': len(values),
+        'errors': failed,
+        'rps': round(len(values) / elapsed, 1) if elapsed else 0.0,
+        'p50': percentile(values, 0.50),
+        'p95': percentile(values, 0.95),
+        'p99': percentile(values, 0.99),
+    }
+
+
+def parse_mix(text):
+    """
+    Parses scenario weights like 'home=40,rental=10'.
+
+    **Returns:**
+    - A dict of scenario name to weight, in `DEFAULT_MIX` order.
+
+    **Raises:**
+    - `ValueError`: For unknown scenarios or invalid weights.
+    """
+    weights = {}
+    for item in text.split(','):
+        name, _, weight = item.strip().partition('=')
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"unknown scenario {name!r}")
+        try:
+            weights[name] = int(weight)
+        except ValueError:
+            raise ValueError(f"invalid weight for {name!r}")
+        if weights[name] < 0:
+            raise ValueError(f"negative weight for {name!r}")
+    if not any(weights.values()):
+        raise ValueError("the mix needs a positive weight")
+    return {name: weights[name] for name in DEFAULT_MIX if name in weights}
+
+
+class Client:
+    """
+    A browser-like HTTP client: one keep-alive connection to a local
+    server, a cookie jar, and the CSRF token of the `csrftoken` cookie
+    added to every form it posts. Redirects are not followed.
+    """
+    def __init__(self, port):
+        self.port = port
+        self.cookies = {}
+        self.connection = http.client.HTTPConnection('127.0.0.1', port)
+
+    def request(self, method, path, fields=None):
+        """
+        Sends a request, form encoded if `fields` are given.
+
+        **Returns:**
+        - The status and the decoded body of the response.
+        """
+        headers = {}
+        body = None
+        if self.cookies:
+            headers['Cookie'] = '; '.join(
+                f'{name}={value}' for name, value in self.cookies.items()
+            )
+        if fields is not None:
+            fields = {
+                'csrfmiddlewaretoken': self.cookies.get('csrftoken', ''),
+                **fields,
+            }
+            body = urlencode(fields)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            self.connection = http.client.HTTPConnection(
+                '127.0.0.1', self.port
+            )
+            raise
+        for header in response.msg.get_all('Set-Cookie') or []:
+            for name, morsel in SimpleCookie(header).items():
+                if morsel.value and morsel['max-age'] != '0':
+                    self.cookies[name] = morsel.value
+                else:
+                    self.cookies.pop(name, None)
+        return response.status, content.decode(errors='replace')
+
+    def close(self):
+        self.connection.close()
+
+
+class VirtualUser:
+    """
+    One visitor of a scenario load test, logged in as its own account.
+
+    Each scenario is a short sequence of requests a real visitor makes;
+    every request is timed under the name of the endpoint it hits.
+    """
+    def __init__(self, port, username, password, bike_ids, rng):
+        self.client = Client(port)
+        self.username = username
+        self.password = password
+        self.bike_ids = bike_ids
+        self.random = rng
+        # {endpoint: [latency in ms]} and {endpoint: failed requests}.
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        # (seconds since the start, latency or None if failed) of every
+        # request, for the timeline.
+        self.samples = []
+        self.started = time.monotonic()
+
+    def timed(self, endpoint, method, path, fields=None):
+        """
+        Sends a request and records its latency under `endpoint`.
+
+        **Returns:**
+        - The response body, or None if the request failed (an error
+        status or no response).
+        """
+        started = time.perf_counter()
+        try:
+            status, body = self.client.request(method, path, fields)
+        except (OSError, http.client.HTTPException):
+            status, body = None, None
+        latency = (time.perf_counter() - started) * 1000
+        offset = time.monotonic() - self.started
+        if status is None or status >= 400:
+            self.errors[endpoint] += 1
+            self.samples.append((offset, None))
+            return None
+        self.latencies[endpoint].append(latency)
+        self.samples.append((offset, latency))
+        return body
+
+    def bike_path(self):
+        return f'/bike/{self.random.choice(self.bike_ids)}/'
+
+    def home(self):
+        self.timed('home', 'GET', '/')
+
+    def bike_detail(self):
+        self.timed('bike_detail', 'GET', self.bike_path())
+
+    def login(self):
+        # A new visit: the old session is dropped, as by a new browser.
+        self.client.cookies.clear()
+        self.timed('login_form', 'GET', '/accounts/login/')
+        self.timed('login', 'POST', '/accounts/login/', {
+            'login': self.username, 'password': self.password,
+        })
+
+    def rental(self):
+        bike_id = self.random.choice(self.bike_ids)
+        created = self.timed(
+            'create_rental', 'GET', f'/rental/create/{bike_id}/'
+        )
+        if created is not None:
+            profile = self.timed('profile', 'GET', '/profile/')
+            match = RETURN_LINK.search(profile or '')
+            if match:
+                self.timed(
+                    'return_bike', 'POST', f'/rental/return/{match[1]}/', {}
+                )
+
+    def review(self):
+        self.timed('review', 'POST', self.bike_path(), {
+            'rating': self.random.randint(1, 5),
+            'comment': "Load test review.",
+        })
+
+
+def run_scenarios(port, accounts, bike_ids, mix, concurrency, seconds,
+                  interval=10, seed=0):
+    """
+    Drives a realistic mix of visits against a local server.
+
+    Each thread is a virtual user with its own account and session: it
+    logs in, then runs scenarios picked at random with the `mix`
+    weights until the time is up:
+    - `home`: the bike list.
+    - `bike_detail`: the page of a random bike.
+    - `login`: a new session, the login form and its POST.
+    - `rental`: `create_rental` of a random bike, the `profile`, and
+    `return_bike` of the rental found there.
+    - `review`: a review POSTed on a random bike.
+
+    All the load comes from one address: allauth's login rate limit
+    per IP (30 a minute) answers the extra logins with 429 errors.
+
+    **Args:**
+    - `port`: The server's local port.
+    - `accounts`: `(username, password)` of the virtual users, at least
+    `concurrency` of them.
+    - `bike_ids`: The bikes visited, rented and reviewed.
+    - `mix`: Scenario weights (see `parse_mix`).
+    - `concurrency`: The number of virtual users.
+    - `seconds`: How long the load lasts.
+    - `interval`: Width in seconds of the timeline buckets.
+    - `seed`: Random seed of the scenario choices.
+
+    **Returns:**
+    - The overall numbers of `summarize`, an `endpoints` dict with the
+    same numbers per endpoint, and a `timeline` list with the numbers
+    of each interval, to spot drifts during long runs.
+    """
+    scenarios = list(mix)
+    weights = list(mix.values())
+    users = [
+        VirtualUser(port, username, password, bike_ids,
+                    random.Random(seed + number))
+        for number, (username, password) in enumerate(
+            accounts[:concurrency]
+        )
+    ]
+
+    def worker(user):
+        user.login()
+        while time.monotonic() < deadline:
+            scenario = user.random.choices(scenarios, weights)[0]
+            getattr(user, scenario)()
+        user.client.close()
+
+    started = time.monotonic()
+    deadline = started + seconds
+    for user in users:
+        user.started = started
+    threads = [threading.Thread(target=worker, args=(user,)) for user in users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    buckets = defaultdict(lambda: ([], [0]))
+    for user in users:
+        for endpoint, values in user.latencies.items():
+            latencies[endpoint].extend(values)
+        for endpoint, count in user.errors.items():
+            errors[endpoint] += count
+        for offset, latency in user.samples:
+            values, failed = buckets[int(offset // interval)]
+            if latency is None:
+                failed[0] += 1
+            else:
+                values.append(latency)
+
+    result = summarize(
+        [value for values in latencies.values() for value in values],
+        sum(errors.values()), elapsed,
+    )
+    result['endpoints'] = {
+        endpoint: summarize(latencies[endpoint], errors[endpoint], elapsed)
+        for endpoint in sorted(set(latencies) | set(errors))
+    }
+    result['timeline'] = []
+    for bucket in sorted(buckets):
+        values, failed = buckets[bucket]
+        width = min(interval, elapsed - bucket * interval)
+        result['timeline'].append({
+            'second': bucket * interval,
+            **summarize(values, failed[0], width),
+        })
+    return result
@@ -0,0 +1,160 @@
+import json
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import (
+    BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY,
+)
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from bikes.models import Bike
+from core.loadtest import free_port, gunicorn_command, run_load, running_server
+
+# User created for the benchmark when --username is not given.
+BENCH_USERNAME = 'asgi-bench'
+
+
+class Command(BaseCommand):
+    """
+    Compares the sync (WSGI) and async (ASGI) deployments under load.
+
+    Each mode is started with gunicorn on a free local port, against
+    the database and cache configured in the environment: sync workers
+    running the sync views (as in the Procfile), then uvicorn workers
+    running the async views. The bike list, a bike detail page and the
+    profile are requested at each concurrency level, and the requests
+    per second and latency percentiles are reported.
+
+    Requests are logged in by default, so the anonymous page cache does
+    not answer them and the views themselves are measured. Use
+    `--anonymous` to measure the cached pages instead. The load comes
+    from threads of this process; compare modes on the same machine.
+    Like a deployment, the servers need `collectstatic` to have run.
+
+    **Usage:**
+    - `python manage.py benchmark_asgi`
+    - `python manage.py benchmark_asgi --concurrency 1,16,64 --seconds 20`
+    - `python manage.py benchmark_asgi --output benchmark.json`
+    """
+    help = "Benchmarks requests/s and p99 latency under WSGI and ASGI."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--modes', default='wsgi,asgi',
+            help="Comma separated deployment modes to run.",
+        )
+        parser.add_argument(
+            '--concurrency', default='1,8,32',
+            help="Comma separated numbers of requests in flight.",
+        )
+        parser.add_argument(
+            '--seconds', type=float, default=10.0,
+            help="Duration of each run.",
+        )
+        parser.add_argument(
+            '--workers', type=int, default=2,
+            help="Number of gunicorn workers of each server.",
+        )
+        parser.add_argument(
+            '--username',
+            help="Benchmark logged in as this existing user.",
+        )
+        parser.add_argument(
+            '--anonymous', action='store_true',
+            help="Send anonymous requests (served by the page cache).",
+        )
+        parser.add_argument(
+            '--output', help="Also write the results to this JSON file.",
+        )
+
+    def handle(self, *args, **options):
+        modes = options['modes'].split(',')
+        if set(modes) - {'wsgi', 'asgi'}:
+            raise CommandError("--modes accepts wsgi and asgi.")
+        try:
+            levels = [
+                int(level) for level in options['concurrency'].split(',')
+            ]
+        except ValueError:
+            raise CommandError("--concurrency must list integers.")
+        bike = Bike.objects.filter(is_available=True).order_by('id').first()
+        if bike is None:
+            raise CommandError("Add some bikes before benchmarking.")
+        paths = ['/', f'/bike/{bike.pk}/']
+
+        created = None
+        headers = {}
+        if not options['anonymous']:
+            if options['username']:
+                user = User.objects.filter(
+                    username=options['username']
+                ).first()
+                if user is None:
+                    raise CommandError("No user with that username.")
+            else:
+                user, _ = User.objects.get_or_create(username=BENCH_USERNAME)
+                created = user
+            headers['Cookie'] = (
+                f'{settings.SESSION_COOKIE_NAME}={self.login(user)}'
+            )
+            paths.append('/profile/')
+
+        results = []
+        try:
+            for mode in modes:
+                port = free_port()
+                argv = gunicorn_command(mode, port, options['workers'])
+                with running_server(argv, port):
+                    for concurrency in levels:
+                        result = run_load(
+                            port, paths, concurrency, options['seconds'],
+                            headers,
+                        )
+                        result.update(mode=mode, concurrency=concurrency)
+                        results.append(result)
+                        self.report(result)
+        finally:
+            if created is not None:
+                created.delete()
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({
+                    'workers': options['workers'],
+                    'seconds': options['seconds'],
+                    'anonymous': options['anonymous'],
+                    'paths': paths,
+                    'results': results,
+                }, output, indent=2)
+
+    def login(self, user):
+        """
+        Creates a session for `user` and returns its key.
+        """
+        engine = import_module(settings.SESSION_ENGINE)
+        session = engine.SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return session.session_key
+
+    def report(self, result):
+        """
+        Writes one line per run, then one per endpoint.
+        """
+        def line(stats):
+            def ms(value):
+                return '-' if value is None else f'{value:.1f}ms'
+            return (
+                f"rps={stats['rps']:.1f} p50={ms(stats['p50'])} "
+                f"p95={ms(stats['p95'])} p99={ms(stats['p99'])} "
+                f"errors={stats['errors']}"
+            )
+        self.stdout.write(
+            f"{result['mode']} concurrency={result['concurrency']}: "
+            f"{line(result)}"
+        )
+        for path, stats in result['endpoints'].items():
+            self.stdout.write(f"    {path} {line(stats)}")
@@ -0,0 +1,205 @@
+import json
+import subprocess
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from bikes.models import Bike
+from core.loadtest import (
+    DEFAULT_MIX, free_port, gunicorn_command, parse_mix, run_scenarios,
+    running_server,
+)
+from rentals.models import Rental
+from reviews.models import Review
+
+# Number of available bikes the virtual users pick from.
+BIKE_SAMPLE = 1000
+
+
+class Command(BaseCommand):
+    """
+    Load tests the site with a realistic mix of visits.
+
+    gunicorn is started as in the Procfile (sync workers) on a free
+    local port, against the database and cache configured in the
+    environment, unless `--port` points at a server already running.
+    Each virtual user logs in as its own account from `seed_scale`
+    (`<prefix>-1`, `<prefix>-2`, ...) and browses, rents, returns and
+    reviews bikes (see `core.loadtest.run_scenarios`).
+
+    The throughput and p50/p95/p99 latencies, overall, per endpoint
+    and per `--interval`, are written to a JSON file with the settings
+    of the run and the size of the dataset, so runs can be compared
+    over time; `--compare` prints the changes since an earlier file.
+    The load writes rentals and reviews: run it against a seeded,
+    disposable database.
+
+    **Usage:**
+    - `python manage.py loadtest`
+    - `python manage.py loadtest --concurrency 64 --seconds 600
+    --label nightly --output nightly.json`
+    - `python manage.py loadtest --mix home=50,bike_detail=50`
+    - `python manage.py loadtest --compare last.json`
+    """
+    help = "Load tests a realistic mix of visits and reports latencies."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=16,
+            help="Number of virtual users.",
+        )
+        parser.add_argument(
+            '--seconds', type=float, default=60.0,
+            help="Duration of the load.",
+        )
+        parser.add_argument(
+            '--mix',
+            default=','.join(f'{k}={v}' for k, v in DEFAULT_MIX.items()),
+            help="Comma separated scenario weights.",
+        )
+        parser.add_argument(
+            '--workers', type=int, default=2,
+            help="Number of gunicorn workers.",
+        )
+        parser.add_argument(
+            '--port', type=int,
+            help="Load a server already listening on this local port.",
+        )
+        parser.add_argument(
+            '--prefix', default='seed',
+            help="Username prefix of the seeded accounts.",
+        )
+        parser.add_argument(
+            '--password', default='seed-password',
+            help="Password of the seeded accounts.",
+        )
+        parser.add_argument(
+            '--interval', type=float, default=10.0,
+            help="Seconds per timeline entry.",
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help="Random seed of the scenario choices.",
+        )
+        parser.add_argument(
+            '--label', default='',
+            help="Name of the run, saved in the results.",
+        )
+        parser.add_argument(
+            '--output',
+            help="JSON results file, defaults to loadtest-<time>.json.",
+        )
+        parser.add_argument(
+            '--compare', help="Earlier results file to compare with.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as error:
+            raise CommandError(f"--mix: {error}.")
+        if options['concurrency'] < 1 or options['interval'] <= 0:
+            raise CommandError(
+                "--concurrency and --interval must be positive."
+            )
+        concurrency = options['concurrency']
+        prefix = options['prefix']
+        usernames = [f'{prefix}-{number}' for number in range(
+            1, concurrency + 1
+        )]
+        if User.objects.filter(username__in=usernames).count() < concurrency:
+            raise CommandError(
+                f"The load needs the users {usernames[0]} to "
+                f"{usernames[-1]}, run seed_scale first."
+            )
+        bike_ids = list(
+            Bike.objects.filter(is_available=True).order_by('?')
+            .values_list('id', flat=True)[:BIKE_SAMPLE]
+        )
+        if not bike_ids:
+            raise CommandError("Add some bikes before load testing.")
+        previous = None
+        if options['compare']:
+            with open(options['compare']) as results:
+                previous = json.load(results)
+
+        started = timezone.now()
+        run = {
+            'label': options['label'],
+            'started': started.isoformat(),
+            'commit': self.commit(),
+            'database': connection.vendor,
+            'dataset': {
+                'bikes': Bike.objects.count(),
+                'users': User.objects.count(),
+                'reviews': Review.objects.count(),
+                'rentals': Rental.objects.count(),
+            },
+            'workers': None if options['port'] else options['workers'],
+            'concurrency': concurrency,
+            'seconds': options['seconds'],
+            'mix': mix,
+        }
+        accounts = [(username, options['password']) for username in usernames]
+
+        def load(port):
+            return run_scenarios(
+                port, accounts, bike_ids, mix, concurrency,
+                options['seconds'], options['interval'], options['seed'],
+            )
+        if options['port']:
+            run['results'] = load(options['port'])
+        else:
+            port = free_port()
+            argv = gunicorn_command('wsgi', port, options['workers'])
+            with running_server(argv, port):
+                run['results'] = load(port)
+
+        output = options['output'] or (
+            f"loadtest-{started:%Y%m%d-%H%M%S}.json"
+        )
+        with open(output, 'w') as results:
+            json.dump(run, results, indent=2)
+        self.report(run['results'], previous and previous['results'])
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}."))
+
+    def commit(self):
+        """
+        Returns the checked out git commit, None outside a checkout.
+        """
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def report(self, results, previous=None):
+        """
+        Writes the overall line, then one line per endpoint, with the
+        changes since `previous` results when given.
+        """
+        def ms(value):
+            return '-' if value is None else f'{value:.1f}ms'
+
+        def change(stats, before, key):
+            if not before or not stats[key] or not before.get(key):
+                return ''
+            return f" ({(stats[key] / before[key] - 1) * 100:+.0f}%)"
+
+        def line(stats, before):
+            return (
+                f"rps={stats['rps']:.1f}{change(stats, before, 'rps')} "
+                f"p50={ms(stats['p50'])} "
+                f"p95={ms(stats['p95'])}{change(stats, before, 'p95')} "
+                f"p99={ms(stats['p99'])}{change(stats, before, 'p99')} "
+                f"errors={stats['errors']}"
+            )
+        previous = previous or {}
+        self.stdout.write(f"overall: {line(results, previous)}")
+        for endpoint, stats in results['endpoints'].items():
+            before = previous.get('endpoints', {}).get(endpoint)
+            self.stdout.write(f"    {endpoint} {line(stats, before)}")
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.urls import get_resolver
+
+from core.page_cache import page_cache_stats, reset_page_cache_stats
+
+
+class Command(BaseCommand):
+    """
+    Reports the hit ratio of the anonymous page cache.
+
+    The counters are kept in the cache backend, so with a shared
+    backend (Redis or the file cache) they cover all the workers.
+
+    **Usage:**
+    - `python manage.py page_cache_stats`
+    - `python manage.py page_cache_stats --reset`
+    """
+    help = "Shows the hits, misses and hit ratio of the page cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true',
+            help="Set the counters back to zero after reporting.",
+        )
+
+    def handle(self, *args, **options):
+        # Loading the URLs imports the views, which register their pages.
+        get_resolver().url_patterns
+        for name, page in page_cache_stats().items():
+            ratio = page['hit_ratio']
+            self.stdout.write(
+                f"{name}: hits={page['hit']} misses={page['miss']} "
+                f"bypassed={page['bypass']} hit_ratio="
+                + (f"{ratio:.1%}" if ratio is not None else "n/a")
+            )
+        if options['reset']:
+            reset_page_cache_stats()
+            self.stdout.write(self.style.SUCCESS("Counters reset."))
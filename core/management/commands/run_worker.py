@@ -0,0 +1,221 @@
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections, connections
+
+from core import metrics
+from core.jobs import (
+    claim_jobs, delete_old_jobs, discover, requeue_stale_jobs, run_job,
+)
+
+# Seconds between two checks for crashed workers' jobs and old jobs.
+HOUSEKEEPING_SECONDS = 60
+# Outcomes of a job run, as returned by run_job.
+OUTCOMES = ('done', 'retry', 'failed')
+
+
+class Throughput:
+    """
+    Job runs and run time per job kind, since the last report.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.started = time.monotonic()
+        self.kinds = defaultdict(lambda: dict.fromkeys(OUTCOMES, 0))
+        self.seconds = defaultdict(float)
+
+    def record(self, kind, outcome, seconds):
+        with self.lock:
+            self.kinds[kind][outcome] += 1
+            self.seconds[kind] += seconds
+
+    def report(self):
+        """
+        Returns one line per job kind, then starts over.
+        """
+        with self.lock:
+            elapsed = max(time.monotonic() - self.started, 1e-9)
+            lines = []
+            for kind, counts in sorted(self.kinds.items()):
+                runs = sum(counts.values())
+                lines.append(
+                    f"{kind}: {counts['done']} done, {counts['retry']} "
+                    f"retried, {counts['failed']} failed, "
+                    f"{runs / elapsed:.2f} jobs/s, "
+                    f"{self.seconds[kind] / runs * 1000:.0f}ms avg"
+                )
+            self.reset()
+            return lines
+
+
+class Command(BaseCommand):
+    """
+    Runs the background jobs queued with `core.jobs.enqueue`.
+
+    The worker claims due jobs (see `core.jobs.claim_jobs`) as threads
+    of its pool free up, and polls the queue every `--poll` seconds
+    when it is empty. A failed job is retried with an exponential
+    backoff. Every `--report` seconds the worker prints the jobs done,
+    retried and failed per kind with their throughput and average run
+    time; the same numbers are exported at `/metrics`
+    (`job_runs_total`, `job_duration_seconds`).
+
+    `--processes` forks several workers, each with its own pool and
+    database connections. SIGTERM or SIGINT stops claiming jobs and
+    waits for the running ones.
+
+    **Usage:**
+    - `python manage.py run_worker`
+    - `python manage.py run_worker --processes 2 --threads 8`
+    - `python manage.py run_worker --burst` (exits once the queue is
+    empty)
+    """
+    help = "Runs the queued background jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads', type=int, default=4,
+            help="Jobs run at once by each process.",
+        )
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help="Worker processes to fork.",
+        )
+        parser.add_argument(
+            '--poll', type=float, default=1.0,
+            help="Seconds between two looks at an empty queue.",
+        )
+        parser.add_argument(
+            '--report', type=float, default=60.0,
+            help="Seconds between two throughput reports.",
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help="Exit once no job is due.",
+        )
+
+    def handle(self, *args, **options):
+        discover()
+        if options['processes'] <= 1:
+            self.work(options)
+            return
+        # The children open their own database connections.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        children = [
+            context.Process(target=self.work, args=(options,))
+            for _ in range(options['processes'])
+        ]
+        for child in children:
+            child.start()
+
+        def stop(signum, frame):
+            for child in children:
+                if child.is_alive():
+                    os.kill(child.pid, signum)
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        for child in children:
+            child.join()
+
+    def work(self, options):
+        """
+        Runs jobs until stopped (or, with `--burst`, until none is due).
+        """
+        name = f"{socket.gethostname()}:{os.getpid()}"[:100]
+        threads = max(options['threads'], 1)
+        stopping = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *args: stopping.set())
+            signal.signal(signal.SIGINT, lambda *args: stopping.set())
+        throughput = Throughput()
+        reported_at = housekept_at = time.monotonic()
+        self.stdout.write(f"Worker {name} started with {threads} threads.")
+        with ThreadPoolExecutor(threads, thread_name_prefix='job') as pool:
+            running = set()
+            while not stopping.is_set():
+                now = time.monotonic()
+                if now - housekept_at >= HOUSEKEEPING_SECONDS:
+                    housekept_at = now
+                    self.housekeeping()
+                if now - reported_at >= options['report']:
+                    reported_at = now
+                    self.report(throughput)
+                running = {future for future in running if not future.done()}
+                try:
+                    jobs = claim_jobs(name, threads - len(running))
+                except DatabaseError as error:
+                    # The database restarted or is unreachable: reconnect
+                    # on the next claim.
+                    self.stderr.write(f"Cannot claim jobs: {error}")
+                    connections.close_all()
+                    jobs = []
+                for job in jobs:
+                    if threads == 1:
+                        # No thread handoff, nor a second connection.
+                        self.run(job, throughput)
+                    else:
+                        running.add(pool.submit(self.run, job, throughput))
+                if options['burst'] and not jobs and not running:
+                    break
+                if len(running) == threads:
+                    wait(running, options['poll'], FIRST_COMPLETED)
+                elif not jobs:
+                    stopping.wait(options['poll'])
+        self.report(throughput)
+        if settings.METRICS_DB:
+            metrics.flush()
+        self.stdout.write(f"Worker {name} stopped.")
+
+    def run(self, job, throughput):
+        """
+        Runs one job and records its outcome.
+        """
+        close_old_connections()
+        started = time.perf_counter()
+        try:
+            outcome = run_job(job)
+        except DatabaseError as error:
+            # The outcome could not be saved: the job stays running and
+            # is queued again after settings.JOB_LEASE_SECONDS.
+            self.stderr.write(f"Cannot save {job}: {error}")
+            return
+        finally:
+            close_old_connections()
+        elapsed = time.perf_counter() - started
+        throughput.record(job.kind, outcome, elapsed)
+        if settings.METRICS_DB:
+            metrics.inc(
+                'job_runs_total', [('kind', job.kind), ('outcome', outcome)]
+            )
+            metrics.observe('job_duration_seconds', [('kind', job.kind)],
+                            elapsed)
+            metrics.flush(force=False)
+
+    def housekeeping(self):
+        """
+        Queues again the jobs of crashed workers and deletes old jobs.
+        """
+        try:
+            requeued = requeue_stale_jobs()
+            delete_old_jobs()
+        except DatabaseError as error:
+            self.stderr.write(f"Cannot clean up the jobs: {error}")
+            return
+        if requeued:
+            self.stderr.write(f"Queued {requeued} stale jobs again.")
+
+    def report(self, throughput):
+        for line in throughput.report():
+            self.stdout.write(self.style.SUCCESS(line))
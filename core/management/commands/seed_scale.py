@@ -0,0 +1,280 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from bikes.cache import invalidate_all_bike_pages, invalidate_catalog
+from bikes.fleet import batched
+from bikes.models import LETTER_SIZES, Bike, size_rank
+from profiles.models import Profile
+from rentals.models import Rental
+from rentals.pricing import billed_hours, charge
+from reviews.models import Review
+
+# Words the synthetic bike names, types and reviews are made of.
+NAME_WORDS = (
+    'Trail', 'Summit', 'Urban', 'Canal', 'Harbour', 'Ridge', 'Metro',
+    'Coast', 'Forest', 'River', 'Glide', 'Cruiser', 'Explorer', 'Sprint',
+)
+BIKE_TYPES = ('City', 'Mountain', 'Road', 'Hybrid', 'Electric', 'Cargo')
+COMMENTS = (
+    "Smooth ride.", "Comfortable for long trips.", "Brakes were soft.",
+    "Great value.", "The saddle could be better.", "Would rent again.",
+)
+# Ratings, the better ones more frequent, as in real reviews.
+RATING_WEIGHTS = {1: 1, 2: 2, 3: 4, 4: 8, 5: 6}
+# Shortest and longest synthetic rental, in minutes.
+RENTAL_MINUTES = (10, 6 * 60)
+
+
+@contextmanager
+def explicit_timestamps(*fields):
+    """
+    Lets `bulk_create` write `auto_now_add` fields, which otherwise
+    overwrite every row's value with the current time.
+    """
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    """
+    Fills the database with a synthetic dataset at production scale.
+
+    Everything is written with `bulk_create` in batches, without the
+    model signals: users share one password hash (hashing a password
+    takes tens of milliseconds), and the stored aggregates (bike
+    ratings, rider statistics, daily rollups) are rebuilt at the end
+    with their management commands. Rentals are finished and spread
+    over the last `--days` days, so every bike stays available.
+
+    Seeded users are named `<prefix>-<number>` (from 1) and log in with
+    `--password`, as `loadtest` expects. Run it against a disposable
+    database: the defaults write millions of rows.
+
+    **Usage:**
+    - `python manage.py seed_scale`
+    - `python manage.py seed_scale --bikes 500 --users 2000
+    --reviews 20000 --rentals 50000`
+    """
+    help = "Bulk creates synthetic bikes, users, reviews and rentals."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bikes', type=int, default=50_000)
+        parser.add_argument('--users', type=int, default=1_000_000)
+        parser.add_argument('--reviews', type=int, default=5_000_000)
+        parser.add_argument('--rentals', type=int, default=10_000_000)
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help="Spread the reviews and rentals over this many days.",
+        )
+        parser.add_argument(
+            '--prefix', default='seed',
+            help="Prefix of the seeded usernames.",
+        )
+        parser.add_argument(
+            '--password', default='seed-password',
+            help="Password of every seeded user.",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help="Number of rows per INSERT.",
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help="Random seed, the same seed gives the same dataset.",
+        )
+        parser.add_argument(
+            '--skip-rebuild', action='store_true',
+            help="Do not rebuild the stored aggregates afterwards.",
+        )
+
+    def handle(self, *args, **options):
+        for name in ('bikes', 'users', 'reviews', 'rentals', 'days'):
+            if options[name] < 0:
+                raise CommandError(f"--{name} cannot be negative.")
+        if options['days'] < 1:
+            raise CommandError("--days must be at least 1.")
+        if (options['reviews'] or options['rentals']) and not (
+            options['bikes'] and options['users']
+        ):
+            raise CommandError(
+                "Reviews and rentals need at least one bike and one user."
+            )
+        if User.objects.filter(
+            username__startswith=f"{options['prefix']}-"
+        ).exists():
+            raise CommandError(
+                f"Users named {options['prefix']}-... exist already, "
+                "pick another --prefix."
+            )
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.days = options['days']
+        started = time.perf_counter()
+
+        bikes = self.timed('bikes', self.seed_bikes, options['bikes'])
+        users = self.timed(
+            'users', self.seed_users, options['users'], options['prefix'],
+            options['password'],
+        )
+        self.timed('reviews', self.seed_reviews, options['reviews'],
+                   bikes, users)
+        self.timed('rentals', self.seed_rentals, options['rentals'],
+                   bikes, users)
+
+        if not options['skip_rebuild']:
+            output = {
+                'verbosity': options['verbosity'], 'stdout': self.stdout,
+            }
+            call_command('rebuild_rating_stats', **output)
+            call_command('rebuild_rider_stats', **output)
+            if options['rentals']:
+                call_command('rebuild_rollups', days=self.days + 1, **output)
+        invalidate_catalog()
+        invalidate_all_bike_pages()
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded the database in {time.perf_counter() - started:.1f}s."
+        ))
+
+    def timed(self, label, seed, count, *args):
+        """
+        Runs one seeding step and reports its speed.
+        """
+        started = time.perf_counter()
+        result = seed(count, *args)
+        elapsed = time.perf_counter() - started
+        rate = count / elapsed if elapsed else 0
+        self.stdout.write(
+            f"{count} {label} in {elapsed:.1f}s ({rate:.0f} rows/s)."
+        )
+        return result
+
+    def insert(self, model, rows):
+        """
+        Bulk creates the rows of a generator, one batch at a time.
+        """
+        for batch in batched(rows, self.batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(batch)
+
+    def moment(self):
+        """
+        Returns a random moment of the last `--days` days.
+        """
+        return self.now - timedelta(
+            seconds=self.random.uniform(0, self.days * 86400)
+        )
+
+    def seed_bikes(self, count):
+        """
+        Creates the bikes and returns their `{id: (price, type)}`.
+        """
+        first_id = (Bike.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0)
+
+        def rows():
+            for number in range(count):
+                size = self.random.choice(LETTER_SIZES[1:6])
+                words = self.random.sample(NAME_WORDS, 2)
+                yield Bike(
+                    name=f"{words[0]} {words[1]} {number + 1}",
+                    type=self.random.choice(BIKE_TYPES),
+                    size=size,
+                    size_rank=size_rank(size),
+                    description=self.random.choice(COMMENTS),
+                    price_per_hour=Decimal(
+                        self.random.randrange(300, 3000)
+                    ) / 100,
+                    card_version=1,
+                )
+        self.insert(Bike, rows())
+        return {
+            bike_id: (price, bike_type)
+            for bike_id, price, bike_type in Bike.objects.filter(
+                id__gt=first_id
+            ).values_list('id', 'price_per_hour', 'type')
+        }
+
+    def seed_users(self, count, prefix, password):
+        """
+        Creates the users and their profiles, returns the user IDs.
+        """
+        # Hashed once: every user gets the same (valid) hash.
+        password_hash = make_password(password)
+        joined = self.now - timedelta(days=self.days)
+        self.insert(User, (
+            User(
+                username=f'{prefix}-{number}', password=password_hash,
+                email=f'{prefix}-{number}@example.com', date_joined=joined,
+            )
+            for number in range(1, count + 1)
+        ))
+        user_ids = list(User.objects.filter(
+            username__startswith=f'{prefix}-'
+        ).order_by('id').values_list('id', flat=True))
+        # The profile signal does not run for bulk_create.
+        self.insert(Profile, (
+            Profile(user_id=user_id) for user_id in user_ids
+        ))
+        return user_ids
+
+    def seed_reviews(self, count, bikes, users):
+        """
+        Creates reviews of random bikes by random users.
+        """
+        bike_ids = list(bikes)
+        ratings = list(RATING_WEIGHTS)
+        weights = list(RATING_WEIGHTS.values())
+
+        def rows():
+            for _ in range(count):
+                yield Review(
+                    bike_id=self.random.choice(bike_ids),
+                    user_id=self.random.choice(users),
+                    rating=self.random.choices(ratings, weights)[0],
+                    comment=self.random.choice(COMMENTS),
+                    created_at=self.moment(),
+                )
+        with explicit_timestamps(Review._meta.get_field('created_at')):
+            self.insert(Review, rows())
+
+    def seed_rentals(self, count, bikes, users):
+        """
+        Creates finished rentals, priced at the bikes' hourly price.
+        """
+        bike_ids = list(bikes)
+
+        def rows():
+            for _ in range(count):
+                bike_id = self.random.choice(bike_ids)
+                start = self.moment()
+                end = min(self.now, start + timedelta(
+                    minutes=self.random.randint(*RENTAL_MINUTES)
+                ))
+                yield Rental(
+                    bike_id=bike_id,
+                    user_id=self.random.choice(users),
+                    start_time=start,
+                    end_time=end,
+                    total_cost=charge(
+                        billed_hours(start, end), bikes[bike_id][0]
+                    ),
+                )
+        with explicit_timestamps(Rental._meta.get_field('start_time')):
+            self.insert(Rental, rows())
@@ -0,0 +1,416 @@
+import atexit
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import (
+    iscoroutinefunction, markcoroutinefunction, sync_to_async,
+)
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import (
+    DjangoTemplates, Template, reraise,
+)
+
+from .query_wrappers import query_wrapper
+
+# Upper bounds (seconds) of the latency histogram buckets.
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+# Upper bounds (bytes) of the response size histogram buckets.
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+# Upper bounds of the queries per request histogram buckets.
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+# The metric families: name, type, help text and histogram buckets.
+METRICS = (
+    ('http_requests_total', 'counter',
+     "Requests by view, method and status class.", None),
+    ('http_request_duration_seconds', 'histogram',
+     "Request latency through the whole middleware stack.",
+     LATENCY_BUCKETS),
+    ('http_response_size_bytes', 'histogram',
+     "Size of the response bodies.", SIZE_BUCKETS),
+    ('db_queries_per_request', 'histogram',
+     "Database queries run by each request.", QUERY_BUCKETS),
+    ('db_query_duration_seconds', 'histogram',
+     "Time each request spent running database queries.",
+     LATENCY_BUCKETS),
+    ('template_render_duration_seconds', 'histogram',
+     "Time each request spent rendering templates.", LATENCY_BUCKETS),
+    ('job_runs_total', 'counter',
+     "Background job runs by kind and outcome (done, retry, failed).",
+     None),
+    ('job_duration_seconds', 'histogram',
+     "Run time of the background jobs.", LATENCY_BUCKETS),
+)
+BUCKETS = {name: buckets for name, _, _, buckets in METRICS}
+# Label of the requests no URL pattern matched (404s, static files).
+UNMATCHED = 'unmatched'
+# Methods counted under their own name, the others count as 'other'.
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+# Bucket bound at the end of a sample's labels.
+BUCKET_LABEL = re.compile(r',?le="([^"]+)"$')
+
+# Statistics of the request being handled, None outside requests.
+_current = ContextVar('request_metrics', default=None)
+
+# Increments of this process not written to the store yet,
+# {(family, sample name, labels): amount}.
+_pending = defaultdict(float)
+_pending_lock = threading.Lock()
+_flushed_at = time.monotonic()
+
+
+class RequestStats:
+    """
+    Database and template time of one request.
+    """
+    __slots__ = ('queries', 'query_seconds', 'template_seconds', 'rendering')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.template_seconds = 0.0
+        self.rendering = False
+
+    def record_query(self, execute, sql, params, many, context):
+        """
+        Database execute wrapper timing every query.
+        """
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_seconds += time.perf_counter() - started
+
+
+class MetricsStore:
+    """
+    The metric samples of all the processes, in a local SQLite file.
+
+    Each process adds its increments in one transaction; SQLite locks
+    the file, so the gunicorn workers of a machine can share it.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = None
+        self.pid = None
+
+    def connect(self):
+        # A connection is not shared with forked processes.
+        if self.connection is None or self.pid != os.getpid():
+            if self.path != ':memory:':
+                os.makedirs(
+                    os.path.dirname(os.path.abspath(self.path)), exist_ok=True
+                )
+            self.connection = sqlite3.connect(
+                self.path, timeout=5, isolation_level=None,
+                check_same_thread=False,
+            )
+            self.pid = os.getpid()
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS metric_samples ('
+                'family TEXT, name TEXT, labels TEXT, value REAL, '
+                'PRIMARY KEY (name, labels))'
+            )
+        return self.connection
+
+    def add(self, increments):
+        """
+        Adds `{(family, name, labels): amount}` to the samples.
+        """
+        with self.lock:
+            connection = self.connect()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.executemany(
+                    'INSERT INTO metric_samples VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (name, labels) '
+                    'DO UPDATE SET value = value + excluded.value',
+                    [(*key, amount) for key, amount in increments.items()],
+                )
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+
+    def samples(self):
+        """
+        Returns every `(family, name, labels, value)` sample.
+        """
+        with self.lock:
+            return self.connect().execute(
+                'SELECT family, name, labels, value FROM metric_samples'
+            ).fetchall()
+
+    def reset(self):
+        with self.lock:
+            self.connect().execute('DELETE FROM metric_samples')
+
+
+_stores = {}
+
+
+def get_store():
+    """
+    Returns the store of `settings.METRICS_DB`.
+    """
+    path = settings.METRICS_DB
+    if path not in _stores:
+        _stores[path] = MetricsStore(path)
+    return _stores[path]
+
+
+def label_text(labels):
+    """
+    Formats labels as in the exposition format: `a="1",b="2"`.
+    """
+    def escape(value):
+        return (
+            str(value).replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n')
+        )
+    return ','.join(f'{name}="{escape(value)}"' for name, value in labels)
+
+
+def bound_text(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+def inc(family, labels, amount=1):
+    """
+    Adds to a counter of this process.
+    """
+    with _pending_lock:
+        _pending[family, family, label_text(labels)] += amount
+
+
+def observe(family, labels, value):
+    """
+    Records a value in a histogram of this process.
+    """
+    text = label_text(labels)
+    prefix = f'{text},' if text else ''
+    with _pending_lock:
+        for bound in (*BUCKETS[family], float('inf')):
+            if value <= bound:
+                _pending[
+                    family, f'{family}_bucket',
+                    f'{prefix}le="{bound_text(bound)}"',
+                ] += 1
+        _pending[family, f'{family}_sum', text] += value
+        _pending[family, f'{family}_count', text] += 1
+
+
+def flush_due():
+    """
+    Returns True if increments wait for longer than
+    `settings.METRICS_FLUSH_SECONDS`.
+    """
+    return bool(_pending) and (
+        time.monotonic() - _flushed_at >= settings.METRICS_FLUSH_SECONDS
+    )
+
+
+def flush(force=True):
+    """
+    Writes the increments of this process to the store.
+
+    **Args:**
+    - `force`: If False, only writes when `flush_due`.
+    """
+    global _flushed_at
+    with _pending_lock:
+        if not _pending or not force and not flush_due():
+            return
+        increments = dict(_pending)
+        _pending.clear()
+        _flushed_at = time.monotonic()
+    try:
+        get_store().add(increments)
+    except sqlite3.Error:
+        # Kept for the next flush rather than lost.
+        with _pending_lock:
+            for key, amount in increments.items():
+                _pending[key] += amount
+
+
+def exposition():
+    """
+    Returns all the metrics in the Prometheus text exposition format.
+    """
+    flush()
+    families = defaultdict(list)
+    for family, name, labels, value in get_store().samples():
+        bound = BUCKET_LABEL.search(labels)
+        order = float(bound[1]) if bound else 0
+        families[family].append((name, labels, order, value))
+    lines = []
+    for family, kind, text, _ in METRICS:
+        lines += [f'# HELP {family} {text}', f'# TYPE {family} {kind}']
+        for name, labels, _, value in sorted(
+            families[family],
+            key=lambda sample: (
+                BUCKET_LABEL.sub('', sample[1]), sample[0], sample[2]
+            ),
+        ):
+            series = f'{name}{{{labels}}}' if labels else name
+            lines.append(f'{series} {value:g}')
+    return '\n'.join(lines) + '\n'
+
+
+def view_name(request):
+    """
+    Returns the URL name of the view that handled a request.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None or not match.view_name:
+        return UNMATCHED
+    return match.view_name
+
+
+def response_size(response):
+    """
+    Returns the body size of a response, None if it is streamed
+    without a Content-Length.
+    """
+    if not response.streaming:
+        return len(response.content)
+    if response.has_header('Content-Length'):
+        return int(response['Content-Length'])
+    return None
+
+
+class MetricsMiddleware:
+    """
+    Records the latency, database queries, template rendering time and
+    response size of every request, labelled with its URL name.
+
+    Put it first in `MIDDLEWARE`, so the latency covers the whole
+    stack. The numbers are buffered per process and written to the
+    shared store every `settings.METRICS_FLUSH_SECONDS`; `/metrics`
+    serves them. An empty `settings.METRICS_DB` turns metrics off.
+
+    It is sync and async capable: under ASGI the async views are
+    called without a thread hop, and only a due flush (SQLite file
+    I/O) runs in a thread. The queries they run with `sync_to_async`
+    are counted too (see `core.query_wrappers`).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_DB:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            with timed_queries(stats):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        record_request(request, response, stats, started)
+        flush(force=False)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            with timed_queries(stats):
+                response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        record_request(request, response, stats, started)
+        if flush_due():
+            await sync_to_async(flush)(force=False)
+        return response
+
+
+def timed_queries(stats):
+    """
+    Returns a context manager timing the queries of every database
+    for a request's `RequestStats`.
+    """
+    stack = ExitStack()
+    for alias in connections:
+        stack.enter_context(query_wrapper(stats.record_query, alias))
+    return stack
+
+
+def record_request(request, response, stats, started):
+    """
+    Records the numbers of a request that started at `started`
+    (a `time.perf_counter` value).
+    """
+    elapsed = time.perf_counter() - started
+    view = [('view', view_name(request))]
+    method = request.method if request.method in METHODS else 'other'
+    inc('http_requests_total', view + [
+        ('method', method), ('status', f'{response.status_code // 100}xx'),
+    ])
+    observe('http_request_duration_seconds', view, elapsed)
+    observe('db_queries_per_request', view, stats.queries)
+    observe('db_query_duration_seconds', view, stats.query_seconds)
+    observe('template_render_duration_seconds', view, stats.template_seconds)
+    size = response_size(response)
+    if size is not None:
+        observe('http_response_size_bytes', view, size)
+
+
+class TimedTemplate(Template):
+    """
+    A Django template adding its render time to the request's metrics.
+    """
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        # Templates rendered by another one are part of its time.
+        if stats is None or stats.rendering:
+            return super().render(context, request)
+        stats.rendering = True
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.rendering = False
+            stats.template_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, timing renders for `MetricsMiddleware`.
+    """
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(
+                self.engine.get_template(template_name), self
+            )
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+# Gunicorn workers exit normally when recycled or stopped.
+atexit.register(flush)
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.23 on 2026-10-18 09:39
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('fingerprint', models.CharField(max_length=16)),
+                ('sql', models.TextField()),
+                ('duration_ms', models.FloatField()),
+                ('alias', models.CharField(max_length=100)),
+                ('view_name', models.CharField(max_length=200)),
+                ('frame', models.CharField(blank=True, max_length=500)),
+                ('plan', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name_plural': 'slow queries',
+                'ordering': ['-created_at', '-id'],
+                'indexes': [models.Index(fields=['fingerprint', '-created_at'], name='slow_query_fingerprint_idx')],
+            },
+        ),
+    ]
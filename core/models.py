@@ -1,3 +1,152 @@
-from django.db import models  # noqa: F401
+from django.contrib.auth.models import User
+from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+# A cProfile run of one request, saved by core.profiling.
+class RequestProfile(models.Model):
+    """
+    Represents the profile of one request (see `ProfilerMiddleware`).
+
+    **Fields:**
+    - `created_at`: When the request was profiled.
+    - `view_name`: The URL name of the view that handled it.
+    - `method`, `path`, `status`: The request and its response status.
+    - `user`: The user who sent it, if logged in.
+    - `trigger`: Whether the staff header or the sampling rate
+    triggered the profile.
+    - `duration_ms`: The request time, profiler overhead included.
+    - `query_count`, `query_ms`: The database queries and their time.
+    - `stats`: The cProfile statistics, in the `pstats` file format.
+    - `queries`: The query log, a list of `{alias, sql, ms}`.
+    """
+    TRIGGERS = (('header', "Header"), ('sample', "Sampled"))
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    view_name = models.CharField(max_length=200)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=2000)
+    status = models.PositiveSmallIntegerField()
+    user = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='+',
+    )
+    trigger = models.CharField(max_length=10, choices=TRIGGERS)
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField()
+    query_ms = models.FloatField()
+    stats = models.BinaryField()
+    queries = models.JSONField(default=list)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+
+    def __str__(self):
+        """
+        Returns the string representation of the RequestProfile model.
+        """
+        return f"{self.view_name} {self.created_at:%Y-%m-%d %H:%M:%S}"
+
+
+# A query slower than settings.SLOW_QUERY_MS, saved by core.slow_queries.
+class SlowQuery(models.Model):
+    """
+    Represents one slow execution of a query (see `SlowQueryMiddleware`).
+
+    **Fields:**
+    - `created_at`: When the query ran.
+    - `fingerprint`: The key of the normalized SQL, shared by all the
+    executions of one ORM query.
+    - `sql`: The normalized SQL (literal values replaced with '?').
+    - `duration_ms`: The query time.
+    - `alias`: The database it ran on.
+    - `view_name`: The URL name of the view that ran it.
+    - `frame`: The project code that ran it, as 'path:line in function'.
+    - `plan`: The EXPLAIN output, empty if none was captured.
+    """
+    created_at = models.DateTimeField(default=timezone.now)
+    fingerprint = models.CharField(max_length=16)
+    sql = models.TextField()
+    duration_ms = models.FloatField()
+    alias = models.CharField(max_length=100)
+    view_name = models.CharField(max_length=200)
+    frame = models.CharField(max_length=500, blank=True)
+    plan = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        verbose_name_plural = "slow queries"
+        indexes = [
+            # The admin groups and filters the rows by fingerprint.
+            models.Index(
+                fields=['fingerprint', '-created_at'],
+                name='slow_query_fingerprint_idx',
+            ),
+        ]
+
+    def __str__(self):
+        """
+        Returns the string representation of the SlowQuery model.
+        """
+        return f"{self.fingerprint} {self.duration_ms:.0f}ms"
+
+
+# A background job, run by the run_worker command (see core.jobs).
+class Job(models.Model):
+    """
+    Represents one background job in the database queue.
+
+    **Fields:**
+    - `kind`: The registered name of the job function.
+    - `payload`: The keyword arguments of the function (JSON).
+    - `status`: Queued, running, done or failed (out of attempts).
+    - `run_at`: When the job can run, later after a failed attempt.
+    - `attempts`, `max_attempts`: Attempts made and allowed.
+    - `worker`: The worker running (or that last ran) the job.
+    - `locked_at`: When a worker claimed the job.
+    - `finished_at`: When the job succeeded or failed for good.
+    - `last_error`: The traceback of the last failed attempt.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, "Queued"), (RUNNING, "Running"), (DONE, "Done"),
+        (FAILED, "Failed"),
+    )
+
+    kind = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-id']
+        indexes = [
+            # The workers' claim query: the due queued jobs, oldest
+            # first. Done jobs, the vast majority, are not indexed.
+            models.Index(
+                fields=['run_at', 'id'], name='job_queued_idx',
+                condition=models.Q(status='queued'),
+            ),
+            # The cleanup of old done jobs, and the few running jobs
+            # checked for crashed workers.
+            models.Index(
+                fields=['status', 'finished_at'],
+                name='job_status_finished_idx',
+            ),
+        ]
+
+    def __str__(self):
+        """
+        Returns the string representation of the Job model.
+        """
+        return f"{self.kind} #{self.pk} ({self.status})"
@@ -0,0 +1,223 @@
+import gzip
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+# Names of the cached pages, filled in by `anonymous_page_cache`.
+CACHED_PAGES = []
+# What can happen to a request, counted per page.
+OUTCOMES = ('hit', 'miss', 'bypass')
+
+
+def stats_key(name, outcome):
+    """
+    Returns the cache key of one page cache counter.
+    """
+    return f'page-cache:stats:{name}:{outcome}'
+
+
+def record(name, outcome):
+    """
+    Adds one to a page cache counter.
+
+    The counters live in the cache itself, so the numbers are shared
+    by all the workers using the same cache backend.
+    """
+    key = stats_key(name, outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # First request since the counter was reset or evicted.
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def page_cache_stats():
+    """
+    Returns the hit, miss and bypass counts of every cached page.
+
+    **Returns:**
+    - A dict mapping each page name to a dict with the `hit`, `miss`
+    and `bypass` counts and the `hit_ratio` (hits / cacheable requests,
+    None before the first one).
+    """
+    keys = {
+        stats_key(name, outcome): (name, outcome)
+        for name in CACHED_PAGES for outcome in OUTCOMES
+    }
+    counts = cache.get_many(list(keys))
+    stats = {}
+    for key, (name, outcome) in keys.items():
+        stats.setdefault(name, {})[outcome] = counts.get(key, 0)
+    for page in stats.values():
+        cacheable = page['hit'] + page['miss']
+        page['hit_ratio'] = page['hit'] / cacheable if cacheable else None
+    return stats
+
+
+def reset_page_cache_stats():
+    """
+    Sets all the page cache counters back to zero.
+    """
+    cache.delete_many([
+        stats_key(name, outcome)
+        for name in CACHED_PAGES for outcome in OUTCOMES
+    ])
+
+
+def accepts_gzip(request):
+    """
+    Returns True if the client accepts a gzip encoded response.
+    """
+    return 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+
+
+def cached_response(request, entry):
+    """
+    Builds the response for a cache entry, compressed if possible.
+    """
+    if accepts_gzip(request):
+        response = HttpResponse(entry['body'], status=entry['status'])
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(
+            gzip.decompress(entry['body']), status=entry['status']
+        )
+    response['Content-Type'] = entry['content_type']
+    response['Content-Length'] = str(len(response.content))
+    return response
+
+
+def cache_lookup(request, name, version, vary_on, kwargs):
+    """
+    Looks a request up in the page cache and counts the outcome.
+
+    **Returns:**
+    - A `(key, response)` tuple: `key` is None if the request must
+    bypass the cache, `response` is the cached response on a hit.
+    """
+    if (
+        request.method != 'GET'
+        or request.user.is_authenticated
+        or set(request.GET) - set(vary_on)
+        or len(get_messages(request))
+    ):
+        record(name, 'bypass')
+        return None, None
+
+    params = '&'.join(
+        f'{param}={request.GET.get(param, "")}' for param in vary_on
+    )
+    position = hashlib.md5(f'{request.path}?{params}'.encode()).hexdigest()
+    key = f'page-cache:{name}:{version(request, **kwargs)}:{position}'
+    entry = cache.get(key)
+    if entry is None:
+        record(name, 'miss')
+        return key, None
+    record(name, 'hit')
+    response = cached_response(request, entry)
+    response['X-Page-Cache'] = 'HIT'
+    return key, response
+
+
+def cache_store(request, key, response):
+    """
+    Stores a freshly rendered page under `key`, when it can be shared.
+
+    **Returns:**
+    - The rendered response.
+    """
+    if hasattr(response, 'render'):
+        response = response.render()
+    # Never share a page that sets cookies or was rendered
+    # with flash messages added by the view itself.
+    if (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and not len(get_messages(request))
+    ):
+        cache.set(key, {
+            'status': response.status_code,
+            'content_type': response['Content-Type'],
+            'body': gzip.compress(response.content, mtime=0),
+        }, settings.PAGE_CACHE_TIMEOUT)
+    response['X-Page-Cache'] = 'MISS'
+    return response
+
+
+def anonymous_page_cache(name, version, vary_on=()):
+    """
+    Caches the whole response of a view for anonymous visitors.
+
+    Only GET requests from anonymous users with no pending flash
+    messages use the cache, and only parameters listed in `vary_on`
+    may be present in the query string (any other one could change
+    the page, those requests are not cached). Bodies are stored
+    gzip compressed and sent as they are to clients that accept it.
+
+    Pages are purged through their version: changing the value
+    returned by `version` makes the old entries unreachable.
+
+    Works on sync and async views. For an async view the lookup (which
+    may load the session and user) runs in a worker thread, so
+    `version` is a sync function in both cases.
+
+    **Usage:**
+    ```
+    @method_decorator(anonymous_page_cache(
+        'home', lambda request: catalog_version(), vary_on=('sort_by',),
+    ), name='dispatch')
+    ```
+
+    **Args:**
+    - `name`: The page name, used in the keys and the statistics.
+    Sync and async versions of a page share it.
+    - `version`: Called with the request and the view's URL keyword
+    arguments, returns the current version of the page.
+    - `vary_on`: The GET parameters that select different pages.
+
+    **Returns:**
+    - The view decorator.
+    """
+    if name not in CACHED_PAGES:
+        CACHED_PAGES.append(name)
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                key, response = await sync_to_async(cache_lookup)(
+                    request, name, version, vary_on, kwargs
+                )
+                if key is None:
+                    return await view(request, *args, **kwargs)
+                if response is None:
+                    response = await sync_to_async(cache_store)(
+                        request, key, await view(request, *args, **kwargs)
+                    )
+                patch_vary_headers(response, ('Accept-Encoding', 'Cookie'))
+                return response
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key, response = cache_lookup(
+                request, name, version, vary_on, kwargs
+            )
+            if key is None:
+                return view(request, *args, **kwargs)
+            if response is None:
+                response = cache_store(
+                    request, key, view(request, *args, **kwargs)
+                )
+            patch_vary_headers(response, ('Accept-Encoding', 'Cookie'))
+            return response
+        return wrapper
+    return decorator
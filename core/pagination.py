@@ -0,0 +1,345 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import BooleanField, Expression, F, Q, Value
+from django.utils.functional import cached_property
+
+
+class CursorPage:
+    """
+    One page of results from keyset (cursor) pagination.
+
+    Behaves like a list of objects, and offers the cursors
+    needed to link to the next and previous pages.
+
+    **Attributes:**
+    - `object_list`: The objects on this page.
+    - `next_cursor`: Cursor of the next page, or None on the last page.
+    - `previous_cursor`: Cursor of the previous page, or None on the first.
+    """
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def encode_cursor(ordering, values, direction):
+    """
+    Encodes the position of a row into an opaque, URL-safe cursor.
+
+    **Args:**
+    - `ordering`: The `order_by` fields the cursor belongs to.
+    - `values`: The row's values for those fields.
+    - `direction`: 'next' to read after the row, 'prev' to read before it.
+
+    **Returns:**
+    - The cursor string.
+    """
+    data = json.dumps(
+        {'o': list(ordering), 'v': list(values), 'd': direction},
+        cls=DjangoJSONEncoder, separators=(',', ':'),
+    )
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, ordering):
+    """
+    Decodes a cursor created by `encode_cursor`.
+
+    **Returns:**
+    - A `(values, direction)` tuple, or None if the cursor is missing,
+    malformed or was made for a different ordering.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values, direction = data['v'], data['d']
+        valid = (
+            data['o'] == list(ordering)
+            and len(values) == len(ordering)
+            and direction in ('next', 'prev')
+        )
+    except (ValueError, TypeError, KeyError):
+        return None
+    return (values, direction) if valid else None
+
+
+class RowComparison(Expression):
+    """
+    A row value comparison, e.g. `(a, b, id) > (%s, %s, %s)`.
+
+    The cursor values are converted by their fields when the
+    expression is resolved, so a tampered cursor raises
+    `ValidationError` in `filter()`.
+
+    **Args:**
+    - `names`: The compared field names.
+    - `values`: The cursor row's values for those fields.
+    - `operator`: '>' or '<'.
+    """
+    output_field = BooleanField()
+
+    def __init__(self, names, values, operator):
+        super().__init__()
+        self.names = list(names)
+        self.values = list(values)
+        self.operator = operator
+        # The resolved columns and cursor values.
+        self.columns = []
+        self.params = []
+
+    def get_source_expressions(self):
+        return self.columns + self.params
+
+    def set_source_expressions(self, exprs):
+        count = len(self.columns)
+        self.columns, self.params = list(exprs[:count]), list(exprs[count:])
+
+    def resolve_expression(self, query=None, allow_joins=True, reuse=None,
+                           summarize=False, for_save=False):
+        clone = self.copy()
+        clone.columns = [
+            F(name).resolve_expression(query, allow_joins, reuse, summarize)
+            for name in self.names
+        ]
+        clone.params = [
+            Value(
+                column.output_field.to_python(value),
+                output_field=column.output_field,
+            )
+            for column, value in zip(clone.columns, self.values)
+        ]
+        return clone
+
+    def as_sql(self, compiler, connection):
+        sides, params = [], []
+        for expressions in (self.columns, self.params):
+            parts = []
+            for expression in expressions:
+                sql, expression_params = compiler.compile(expression)
+                parts.append(sql)
+                params.extend(expression_params)
+            sides.append(f"({', '.join(parts)})")
+        return f'{sides[0]} {self.operator} {sides[1]}', params
+
+
+def keyset_filter(ordering, values, backwards=False):
+    """
+    Builds the WHERE clause that selects rows after a cursor position.
+
+    When every field sorts the same way, it is one row value
+    comparison: `(a, b, id) > (x, y, z)` for an ordering `(a, b, id)`,
+    `<` when descending. An index on the same columns answers it as
+    one range scan, without scanning the skipped rows.
+
+    A mixed ordering cannot be compared as a row. It gets
+    `a > x OR (a = x AND b > y) OR (a = x AND b = y AND id > z)`
+    (`<` for descending fields), ANDed with the redundant `a >= x`
+    that the planner can use as the index range.
+
+    **Args:**
+    - `ordering`: The `order_by` fields (a '-' prefix means descending).
+    - `values`: The cursor row's values for those fields.
+    - `backwards`: True to select the rows before the cursor instead.
+
+    **Returns:**
+    - A `RowComparison` expression or a `Q` object.
+    """
+    lookups = [
+        'lt' if field.startswith('-') != backwards else 'gt'
+        for field in ordering
+    ]
+    names = [field.lstrip('-') for field in ordering]
+    if len(ordering) > 1 and len(set(lookups)) == 1:
+        operator = '<' if lookups[0] == 'lt' else '>'
+        return RowComparison(names, values, operator)
+    condition = Q()
+    equal = Q()
+    for name, lookup, value in zip(names, lookups, values):
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    if len(ordering) > 1:
+        condition &= Q(**{f'{names[0]}__{lookups[0]}e': values[0]})
+    return condition
+
+
+def keyset_query(queryset, cursor):
+    """
+    Prepares the query of one keyset page (see `paginate_keyset`).
+
+    **Returns:**
+    - A `(queryset, position, backwards)` tuple: the queryset to read
+    (sliced to one row more than a page by the caller), the decoded
+    cursor and whether the page is read backwards.
+    """
+    ordering = tuple(queryset.query.order_by)
+    position = decode_cursor(cursor, ordering)
+    backwards = False
+    if position is not None:
+        values, direction = position
+        backwards = direction == 'prev'
+        try:
+            queryset = queryset.filter(
+                keyset_filter(ordering, values, backwards)
+            )
+        except (ValidationError, ValueError, TypeError):
+            # Tampered cursor values, start from the first page.
+            position, backwards = None, False
+            queryset = queryset.all()
+    if backwards:
+        queryset = queryset.reverse()
+    return queryset, position, backwards
+
+
+def keyset_page(rows, ordering, position, backwards, page_size):
+    """
+    Builds a `CursorPage` from the rows read for a keyset page.
+
+    **Args:**
+    - `rows`: Up to `page_size + 1` rows, in query order.
+    - `ordering`: The `order_by` fields of the paginated queryset.
+    - `position`, `backwards`: As returned by `keyset_query`.
+    - `page_size`: The maximum number of objects per page.
+    """
+    # One extra row was fetched to know if there is another page.
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+
+    def cursor_for(row, direction):
+        values = [getattr(row, field.lstrip('-')) for field in ordering]
+        return encode_cursor(ordering, values, direction)
+
+    more_after = has_more if not backwards else position is not None
+    more_before = has_more if backwards else position is not None
+    return CursorPage(
+        rows,
+        next_cursor=cursor_for(rows[-1], 'next')
+        if rows and more_after else None,
+        previous_cursor=cursor_for(rows[0], 'prev')
+        if rows and more_before else None,
+    )
+
+
+def paginate_keyset(queryset, cursor=None, page_size=12):
+    """
+    Returns one page of an ordered queryset using keyset pagination.
+
+    Unlike OFFSET pagination the cost of a page does not grow with
+    its depth. The queryset must be ordered by plain field names
+    and the ordering must end with a unique field (usually `id`).
+
+    **Args:**
+    - `queryset`: The ordered queryset to paginate.
+    - `cursor`: The cursor from the previous request, if any.
+    - `page_size`: The maximum number of objects per page.
+
+    **Returns:**
+    - A `CursorPage`.
+    """
+    ordering = tuple(queryset.query.order_by)
+    page_query, position, backwards = keyset_query(queryset, cursor)
+    rows = list(page_query[:page_size + 1])
+    return keyset_page(rows, ordering, position, backwards, page_size)
+
+
+async def apaginate_keyset(queryset, cursor=None, page_size=12):
+    """
+    Async version of `paginate_keyset`, for async views.
+    """
+    ordering = tuple(queryset.query.order_by)
+    page_query, position, backwards = keyset_query(queryset, cursor)
+    rows = [row async for row in page_query[:page_size + 1]]
+    return keyset_page(rows, ordering, position, backwards, page_size)
+
+
+def cursor_url(request, cursor):
+    """
+    Builds a link to another page, keeping the other GET parameters.
+
+    **Returns:**
+    - A query string such as `?sort_by=name_asc&cursor=...`.
+    """
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return '?' + params.urlencode()
+
+
+def estimate_count(queryset):
+    """
+    Returns the planner's estimate of a queryset's row count.
+
+    On PostgreSQL an unfiltered queryset uses the table statistics
+    (`pg_class.reltuples`, kept up to date by autovacuum) and a filtered
+    one the row estimate of its `EXPLAIN` plan. Neither reads the rows.
+
+    **Returns:**
+    - The estimated count, or None if the database cannot estimate it
+    (other databases, or a table that was never analyzed).
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where and not queryset.query.distinct:
+            cursor.execute(
+                "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+            estimate = row[0] if row else -1
+        else:
+            sql, params = queryset.order_by().query.sql_with_params()
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            estimate = plan[0]['Plan']['Plan Rows']
+    # reltuples is -1 until the table is first analyzed.
+    return int(estimate) if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A `Paginator` that estimates large counts instead of counting.
+
+    `COUNT(*)` reads every matching row, which takes seconds on tables
+    with millions of rows. When the database estimates more rows than
+    `exact_count_limit`, the estimate is used for the number of pages;
+    smaller results are counted exactly. See `estimate_count`.
+    """
+    # Below this many rows an exact count is cheap enough.
+    exact_count_limit = 10000
+
+    @cached_property
+    def count(self):
+        estimate = None
+        if hasattr(self.object_list, 'query'):
+            estimate = estimate_count(self.object_list)
+        if estimate is None or estimate < self.exact_count_limit:
+            return super().count
+        return estimate
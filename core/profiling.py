@@ -0,0 +1,253 @@
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import random
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import (
+    iscoroutinefunction, markcoroutinefunction, sync_to_async,
+)
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .metrics import view_name
+from .models import RequestProfile
+from .query_wrappers import query_wrapper
+
+# Header of a staff request asking to be profiled, any value.
+PROFILE_HEADER = 'X-Profile'
+# Functions listed on a profile's admin page and in comparisons.
+TOP_FUNCTIONS = 40
+# Longest SQL kept per query in the query log.
+MAX_SQL_LENGTH = 2000
+
+
+class QueryLogRecorder:
+    """
+    Database execute wrapper logging every query with its time.
+    """
+    def __init__(self, alias):
+        self.alias = alias
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': self.alias,
+                'sql': sql[:MAX_SQL_LENGTH],
+                'ms': round((time.perf_counter() - started) * 1000, 3),
+            })
+
+
+class StatsHolder:
+    """
+    A loaded `pstats` dump, in the shape `pstats.Stats` accepts.
+    """
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def load_stats(data, stream=None):
+    """
+    Returns the `pstats.Stats` of a saved profile.
+
+    **Args:**
+    - `data`: The `RequestProfile.stats` bytes.
+    - `stream`: Where `print_stats` writes.
+    """
+    return pstats.Stats(StatsHolder(marshal.loads(bytes(data))), stream=stream)
+
+
+def top_functions(data, limit=TOP_FUNCTIONS):
+    """
+    Returns the `pstats` report of the slowest functions (by cumulative
+    time) of a saved profile, as text.
+    """
+    output = io.StringIO()
+    load_stats(data, output).strip_dirs().sort_stats(
+        'cumulative'
+    ).print_stats(limit)
+    return output.getvalue()
+
+
+def function_times(data):
+    """
+    Returns `{function: (calls, own time, cumulative time)}` of a saved
+    profile, functions named like 'file.py:12(name)'.
+    """
+    stats = load_stats(data).strip_dirs().stats
+    return {
+        pstats.func_std_string(function): (calls, own, cumulative)
+        for function, (_, calls, own, cumulative, _) in stats.items()
+    }
+
+
+def compare_profiles(first, second, limit=TOP_FUNCTIONS):
+    """
+    Compares the functions of two profiles.
+
+    **Returns:**
+    - The `limit` functions whose cumulative time changed most, as
+    `(function, first, second, change)` tuples, `first` and `second`
+    being `(calls, own, cumulative)` or None where the function did
+    not run, `change` the cumulative seconds gained (or lost).
+    """
+    before = function_times(first.stats)
+    after = function_times(second.stats)
+    rows = []
+    for function in before.keys() | after.keys():
+        old, new = before.get(function), after.get(function)
+        change = (new[2] if new else 0) - (old[2] if old else 0)
+        rows.append((function, old, new, change))
+    rows.sort(key=lambda row: abs(row[3]), reverse=True)
+    return rows[:limit]
+
+
+def profile_trigger(request):
+    """
+    Returns why a request is profiled ('header' or 'sample'), or None.
+
+    Only staff members can ask for a profile with the header. The
+    sampling rate (`settings.PROFILE_SAMPLE_RATE`) picks any request.
+    """
+    if PROFILE_HEADER in request.headers and request.user.is_staff:
+        return 'header'
+    rate = settings.PROFILE_SAMPLE_RATE
+    if rate and random.random() < rate:
+        return 'sample'
+    return None
+
+
+def save_profile(request, response, trigger, profiler, recorders, elapsed):
+    """
+    Saves a `RequestProfile` and deletes those beyond
+    `settings.PROFILE_KEEP`, oldest first.
+    """
+    profiler.create_stats()
+    queries = [query for recorder in recorders for query in recorder.queries]
+    user = request.user if request.user.is_authenticated else None
+    RequestProfile.objects.create(
+        view_name=view_name(request),
+        method=request.method[:10],
+        path=request.get_full_path()[:2000],
+        status=response.status_code,
+        user=user,
+        trigger=trigger,
+        duration_ms=elapsed * 1000,
+        query_count=len(queries),
+        query_ms=sum(query['ms'] for query in queries),
+        stats=marshal.dumps(profiler.stats),
+        queries=queries,
+    )
+    oldest_kept = RequestProfile.objects.order_by('-id').values_list(
+        'id', flat=True
+    )[settings.PROFILE_KEEP - 1:settings.PROFILE_KEEP]
+    RequestProfile.objects.filter(id__lt=oldest_kept).delete()
+
+
+class ProfilerMiddleware:
+    """
+    Profiles the requests asked for by staff or picked by sampling.
+
+    A profiled request runs under cProfile with its database queries
+    logged, then is saved as a `RequestProfile`, listed, downloaded
+    (a `.prof` file for `pstats`, snakeviz or flameprof) and compared
+    in the admin. Put it after `AuthenticationMiddleware`.
+
+    With `settings.PROFILING` off the middleware is removed from the
+    stack; on, a request that is not profiled costs a header lookup
+    (and a random number with a sampling rate).
+
+    It is sync and async capable. Under ASGI, cProfile only sees the
+    event loop thread: the code an async view runs with
+    `sync_to_async` is missing from the profile, its queries are in
+    the query log.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        trigger = profile_trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        recorders = [QueryLogRecorder(alias) for alias in connections]
+        with logging_queries(recorders):
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another request of this process is being profiled.
+                return self.get_response(request)
+            started = time.perf_counter()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+            elapsed = time.perf_counter() - started
+        save_profile(request, response, trigger, profiler, recorders, elapsed)
+        return response
+
+    async def __acall__(self, request):
+        if PROFILE_HEADER in request.headers:
+            # request.user is loaded from the database.
+            trigger = await sync_to_async(profile_trigger)(request)
+        else:
+            trigger = profile_trigger(request)
+        if trigger is None:
+            return await self.get_response(request)
+        profiler = cProfile.Profile()
+        recorders = [QueryLogRecorder(alias) for alias in connections]
+        with logging_queries(recorders):
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another request of this process is being profiled.
+                return await self.get_response(request)
+            started = time.perf_counter()
+            try:
+                response = await self.get_response(request)
+            finally:
+                profiler.disable()
+            elapsed = time.perf_counter() - started
+        await sync_to_async(save_profile)(
+            request, response, trigger, profiler, recorders, elapsed
+        )
+        return response
+
+
+def logging_queries(recorders):
+    """
+    Returns a context manager running each recorder around the queries
+    of its database.
+    """
+    stack = ExitStack()
+    for recorder in recorders:
+        stack.enter_context(query_wrapper(recorder, recorder.alias))
+    return stack
+
+
+def profile_filename(profile):
+    """
+    Returns the download name of a profile.
+    """
+    name = profile.view_name.replace(':', '-').replace(os.sep, '-')
+    return f"{name}-{profile.created_at:%Y%m%d-%H%M%S}-{profile.pk}.prof"
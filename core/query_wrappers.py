@@ -0,0 +1,51 @@
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+# Execute wrappers of the current request, as (alias, wrapper) pairs.
+_wrappers = ContextVar('query_wrappers', default=())
+
+
+def run_wrappers(execute, sql, params, many, context):
+    """
+    Database execute wrapper installed on every connection, running
+    the wrappers of the current context for its database.
+    """
+    alias = context['connection'].alias
+    for wrapper_alias, wrapper in reversed(_wrappers.get()):
+        if wrapper_alias == alias:
+            execute = functools.partial(wrapper, execute)
+    return execute(sql, params, many, context)
+
+
+def install(connection, **kwargs):
+    """
+    Adds `run_wrappers` to a connection, once.
+    """
+    if run_wrappers not in connection.execute_wrappers:
+        connection.execute_wrappers.append(run_wrappers)
+
+
+@contextmanager
+def query_wrapper(wrapper, alias):
+    """
+    Runs an execute wrapper around the queries sent to `alias` in the
+    current context.
+
+    Unlike `connection.execute_wrapper`, which only wraps the
+    connection of the calling thread, it follows the context: the
+    queries an async view runs with `sync_to_async` (on another
+    thread, another connection) are wrapped too.
+    """
+    install(connections[alias])
+    token = _wrappers.set(_wrappers.get() + ((alias, wrapper),))
+    try:
+        yield
+    finally:
+        _wrappers.reset(token)
+
+
+connection_created.connect(install, dispatch_uid='core.query_wrappers')
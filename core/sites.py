@@ -0,0 +1,25 @@
+from functools import update_wrapper
+
+from django.contrib import admin
+
+from core.db_router import pin_to_primary, read_from_replica
+
+
+class ReplicaAdminSite(admin.AdminSite):
+    """
+    The admin site, reading its pages from the read replica.
+
+    GET requests (changelists, change forms) read from the replica,
+    submissions write to the primary and pin the staff member to it
+    for a while, so the page they are redirected to shows the change.
+    Installed as the default site by `core.apps.ReplicaAdminConfig`.
+    """
+    def admin_view(self, view, cacheable=False):
+        replica_view = read_from_replica(view)
+
+        def inner(request, *args, **kwargs):
+            response = replica_view(request, *args, **kwargs)
+            if request.method == 'POST':
+                pin_to_primary(response)
+            return response
+        return super().admin_view(update_wrapper(inner, view), cacheable)
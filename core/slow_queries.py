@@ -0,0 +1,291 @@
+import os
+import queue
+import threading
+import time
+import traceback
+from contextlib import ExitStack
+
+from asgiref.sync import (
+    iscoroutinefunction, markcoroutinefunction, sync_to_async,
+)
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connections, transaction
+from django.utils import timezone
+
+from .metrics import view_name
+from .models import SlowQuery
+from .query_wrappers import query_wrapper
+from .sql import fingerprint, normalize_sql
+
+# Modules whose frames are skipped when looking for the calling code:
+# the database instrumentation itself.
+INSTRUMENTATION = tuple(
+    os.path.join(os.path.dirname(__file__), name)
+    for name in ('slow_queries.py', 'metrics.py', 'profiling.py')
+)
+# Slow queries waiting for their plan and their row, per process.
+# When the queue is full, new slow queries are dropped.
+QUEUE_SIZE = 200
+# Only statements reading rows are run again by EXPLAIN ANALYZE.
+ANALYZED_STATEMENTS = ('SELECT',)
+
+_jobs = queue.Queue(QUEUE_SIZE)
+_worker = None
+_worker_lock = threading.Lock()
+# {(alias, fingerprint): monotonic time of its last EXPLAIN}.
+_explained = {}
+
+
+class SlowQueryRecord:
+    """
+    A slow query seen during a request, before it is saved.
+    """
+    __slots__ = ('sql', 'params', 'many', 'alias', 'seconds', 'frame', 'at')
+
+    def __init__(self, sql, params, many, alias, seconds, frame):
+        self.sql = sql
+        self.params = params
+        self.many = many
+        self.alias = alias
+        self.seconds = seconds
+        self.frame = frame
+        self.at = timezone.now()
+
+
+def calling_frame():
+    """
+    Returns the innermost project frame of the current stack, as
+    'path:line in function', skipping Django, the libraries and the
+    instrumentation. Empty if there is none.
+    """
+    base = str(settings.BASE_DIR) + os.sep
+    for frame in reversed(traceback.extract_stack()):
+        filename = frame.filename
+        if (
+            filename.startswith(base)
+            and 'site-packages' not in filename
+            and not filename.startswith(INSTRUMENTATION)
+        ):
+            return (
+                f"{os.path.relpath(filename, base)}:{frame.lineno} "
+                f"in {frame.name}"
+            )[:500]
+    return ''
+
+
+class SlowQueryRecorder:
+    """
+    Database execute wrapper keeping the queries slower than
+    `settings.SLOW_QUERY_MS`.
+    """
+    def __init__(self, alias):
+        self.alias = alias
+        self.threshold = settings.SLOW_QUERY_MS / 1000
+        self.records = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            if elapsed >= self.threshold:
+                self.records.append(SlowQueryRecord(
+                    sql, params, many, self.alias, elapsed, calling_frame(),
+                ))
+
+
+def explain(record):
+    """
+    Returns the plan of a slow query, or an empty string.
+
+    On PostgreSQL, SELECT statements are run again under
+    `EXPLAIN (ANALYZE, BUFFERS)` for the real row counts and buffer
+    hits, other statements only get `EXPLAIN` (ANALYZE would execute
+    them). The plan runs in a transaction that is rolled back, with a
+    `settings.SLOW_QUERY_EXPLAIN_TIMEOUT_MS` statement timeout.
+    SQLite gives its `EXPLAIN QUERY PLAN`.
+    """
+    if record.many:
+        return ''
+    connection = connections[record.alias]
+    try:
+        if connection.vendor == 'postgresql':
+            analyze = record.sql.lstrip().upper().startswith(
+                ANALYZED_STATEMENTS
+            )
+            options = '(ANALYZE, BUFFERS) ' if analyze else ''
+            with transaction.atomic(using=record.alias):
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        'SET LOCAL statement_timeout = %s',
+                        [settings.SLOW_QUERY_EXPLAIN_TIMEOUT_MS],
+                    )
+                    cursor.execute(f'EXPLAIN {options}{record.sql}',
+                                   record.params)
+                    rows = cursor.fetchall()
+                transaction.set_rollback(True, using=record.alias)
+            return '\n'.join(row[0] for row in rows)
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'EXPLAIN QUERY PLAN {record.sql}', record.params
+                )
+                rows = cursor.fetchall()
+            # Rows are (id, parent id, unused, detail): indent children.
+            depth = {0: -1}
+            lines = []
+            for node, parent, _, detail in rows:
+                depth[node] = depth.get(parent, -1) + 1
+                lines.append('  ' * depth[node] + detail)
+            return '\n'.join(lines)
+    except DatabaseError as error:
+        return f"EXPLAIN failed: {error}"
+    return ''
+
+
+def should_explain(alias, key):
+    """
+    Returns True if a query's plan was not captured by this process
+    in the last `settings.SLOW_QUERY_EXPLAIN_INTERVAL` seconds, so a
+    frequent slow query is not run again and again.
+    """
+    if not settings.SLOW_QUERY_EXPLAIN:
+        return False
+    now = time.monotonic()
+    last = _explained.get((alias, key))
+    if last is not None and now - last < settings.SLOW_QUERY_EXPLAIN_INTERVAL:
+        return False
+    _explained[alias, key] = now
+    return True
+
+
+def save_slow_queries(records, view):
+    """
+    Saves slow queries with their plans, then deletes the rows beyond
+    `settings.SLOW_QUERY_KEEP`, oldest first.
+    """
+    for record in records:
+        shape = normalize_sql(record.sql)
+        key = fingerprint(shape)
+        SlowQuery.objects.create(
+            created_at=record.at,
+            fingerprint=key,
+            sql=shape,
+            duration_ms=record.seconds * 1000,
+            alias=record.alias,
+            view_name=view,
+            frame=record.frame,
+            plan=explain(record) if should_explain(record.alias, key) else '',
+        )
+    keep = settings.SLOW_QUERY_KEEP
+    oldest_kept = SlowQuery.objects.order_by('-id').values_list(
+        'id', flat=True
+    )[keep - 1:keep]
+    SlowQuery.objects.filter(id__lt=oldest_kept).delete()
+
+
+def run_worker():
+    """
+    Saves the queued slow queries, in a thread with its own database
+    connections.
+    """
+    while True:
+        records, view = _jobs.get()
+        try:
+            save_slow_queries(records, view)
+        except DatabaseError:
+            pass
+        finally:
+            connections.close_all()
+            _jobs.task_done()
+
+
+def submit(records, view):
+    """
+    Queues slow queries for the background thread, started on first
+    use. They are dropped if the queue is full.
+    """
+    global _worker
+    with _worker_lock:
+        # A forked worker process does not inherit the thread.
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(
+                target=run_worker, name='slow-queries', daemon=True
+            )
+            _worker.start()
+    try:
+        _jobs.put_nowait((records, view))
+    except queue.Full:
+        pass
+
+
+class SlowQueryMiddleware:
+    """
+    Logs the database queries slower than `settings.SLOW_QUERY_MS`.
+
+    A query over the threshold is kept with the project frame that
+    ran it; after the response, its normalized SQL, view name and
+    EXPLAIN plan are saved as a `SlowQuery` by a background thread
+    (`settings.SLOW_QUERY_ASYNC`), off the request path. The admin
+    groups them by fingerprint. `SLOW_QUERY_MS = 0` turns it off.
+
+    It is sync and async capable, like `MetricsMiddleware`; the
+    queries async views run with `sync_to_async` are recorded too.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SLOW_QUERY_MS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorders = [SlowQueryRecorder(alias) for alias in connections]
+        with recording(recorders):
+            response = self.get_response(request)
+        records = slow_queries(recorders)
+        if records:
+            if settings.SLOW_QUERY_ASYNC:
+                submit(records, view_name(request))
+            else:
+                save_slow_queries(records, view_name(request))
+        return response
+
+    async def __acall__(self, request):
+        recorders = [SlowQueryRecorder(alias) for alias in connections]
+        with recording(recorders):
+            response = await self.get_response(request)
+        records = slow_queries(recorders)
+        if records:
+            if settings.SLOW_QUERY_ASYNC:
+                submit(records, view_name(request))
+            else:
+                await sync_to_async(save_slow_queries)(
+                    records, view_name(request)
+                )
+        return response
+
+
+def recording(recorders):
+    """
+    Returns a context manager running each recorder around the queries
+    of its database.
+    """
+    stack = ExitStack()
+    for recorder in recorders:
+        stack.enter_context(query_wrapper(recorder, recorder.alias))
+    return stack
+
+
+def slow_queries(recorders):
+    """
+    Returns the slow queries kept by the recorders of a request.
+    """
+    return [record for recorder in recorders for record in recorder.records]
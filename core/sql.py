@@ -0,0 +1,36 @@
+import hashlib
+import re
+
+# Literals and placeholders that vary between executions of one query.
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+VALUE_LIST = re.compile(r'\((?:\s*(?:\?|%s)\s*,)+\s*(?:\?|%s)\s*\)')
+
+
+def normalize_sql(sql):
+    """
+    Reduces a query to its shape by replacing literal values with '?'.
+
+    Two executions of the same ORM query with different parameters
+    (the typical N+1 pattern) normalize to the same string.
+
+    **Args:**
+    - `sql`: The executed SQL, with parameters interpolated or as
+    placeholders.
+
+    **Returns:**
+    - The normalized SQL string.
+    """
+    shape = STRING_LITERAL.sub('?', sql)
+    shape = NUMBER_LITERAL.sub('?', shape)
+    shape = shape.replace('%s', '?')
+    shape = VALUE_LIST.sub('(...)', shape)
+    return ' '.join(shape.split())
+
+
+def fingerprint(shape):
+    """
+    Returns a short stable key of a normalized query (see
+    `normalize_sql`), grouping all the executions of one ORM query.
+    """
+    return hashlib.sha1(shape.encode()).hexdigest()[:16]
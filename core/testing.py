@@ -0,0 +1,105 @@
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+from .sql import normalize_sql
+
+# Transaction bookkeeping is not part of a view's query shape.
+IGNORED_STATEMENTS = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO')
+
+
+class QueryLog:
+    """
+    The SQL statements captured while a block of code ran.
+
+    **Attributes:**
+    - `queries`: The executed SQL strings, in order.
+    """
+    def __init__(self, queries):
+        self.queries = [
+            sql for sql in queries
+            if not sql.lstrip().upper().startswith(IGNORED_STATEMENTS)
+        ]
+
+    def __len__(self):
+        return len(self.queries)
+
+    @property
+    def shapes(self):
+        """
+        Returns a `Counter` of how often each query shape ran.
+        """
+        return Counter(normalize_sql(sql) for sql in self.queries)
+
+    def repeated(self, limit):
+        """
+        Returns the shapes that ran more than `limit` times.
+        """
+        return {
+            shape: count for shape, count in self.shapes.items()
+            if count > limit
+        }
+
+    def report(self):
+        """
+        Returns a readable, numbered list of the captured queries.
+        """
+        return '\n'.join(
+            f'{number}. {sql}' for number, sql in enumerate(self.queries, 1)
+        )
+
+
+class QueryBudgetMixin:
+    """
+    Adds query budget assertions to a `TestCase`.
+
+    **Usage:**
+    ```
+    with self.assertQueryBudget(4):
+        self.client.get(url)
+    ```
+    The block fails if it runs more than the given number of queries,
+    or if any query shape repeats more than `repeat_limit` times,
+    which is how an N+1 (one query per row) shows up.
+    """
+    # How many times one query shape may run before it counts as an N+1.
+    repeat_limit = 2
+
+    @contextmanager
+    def assertQueryBudget(self, budget, repeat_limit=None, using='default'):
+        """
+        Asserts the block stays within `budget` queries without N+1s.
+
+        **Args:**
+        - `budget`: The maximum number of queries allowed.
+        - `repeat_limit`: Overrides the class level `repeat_limit`.
+        - `using`: The database alias to capture.
+
+        **Yields:**
+        - The `QueryLog`, filled in when the block exits.
+        """
+        if repeat_limit is None:
+            repeat_limit = self.repeat_limit
+        log = QueryLog([])
+        with CaptureQueriesContext(connections[using]) as context:
+            yield log
+        log.queries = QueryLog(
+            [query['sql'] for query in context.captured_queries]
+        ).queries
+
+        repeated = log.repeated(repeat_limit)
+        if repeated:
+            details = '\n'.join(
+                f'{count}x {shape}' for shape, count in repeated.items()
+            )
+            self.fail(
+                f"Repeated query shapes (possible N+1):\n{details}\n\n"
+                f"Captured queries:\n{log.report()}"
+            )
+        if len(log) > budget:
+            self.fail(
+                f"{len(log)} queries executed, budget is {budget}.\n\n"
+                f"Captured queries:\n{log.report()}"
+            )
@@ -1,3 +1,773 @@
-from django.test import TestCase  # noqa: F401
+import marshal
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import re
+import time
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, override_settings,
+)
+from django.urls import reverse
+from django.utils import timezone
+
+from bikes.cache import card_key
+from bikes.models import Bike
+from core.db_router import PIN_COOKIE
+from core.loadtest import DEFAULT_MIX, parse_mix, summarize
+from core.metrics import MetricsMiddleware, flush, get_store
+from core import jobs
+from core.models import Job, RequestProfile, SlowQuery
+from core.profiling import ProfilerMiddleware, top_functions
+from core.slow_queries import SlowQueryMiddleware
+from core.sql import fingerprint
+from core import slow_queries
+from core.pagination import EstimatedCountPaginator
+from rentals.models import Rental
+from rentals.pricing import billed_hours, charge
+from reviews.models import Review
+from core.testing import QueryLog, normalize_sql
+
+
+class NormalizeSqlTest(SimpleTestCase):
+    """
+    Tests for the query shape normalization used by the query budgets.
+    """
+
+    def test_literals_are_replaced(self):
+        """
+        Test that queries differing only in parameters share a shape.
+        """
+        first = normalize_sql(
+            "SELECT * FROM auth_user WHERE id = 12 AND name = 'a''b' LIMIT 21"
+        )
+        second = normalize_sql(
+            "SELECT * FROM auth_user WHERE id = 7 AND name = 'c'  LIMIT 21"
+        )
+        self.assertEqual(first, second)
+        self.assertEqual(
+            first, "SELECT * FROM auth_user WHERE id = ? AND name = ? LIMIT ?"
+        )
+
+    def test_in_lists_of_any_length_share_a_shape(self):
+        """
+        Test that IN lists collapse regardless of their length.
+        """
+        self.assertEqual(
+            normalize_sql("SELECT * FROM t WHERE id IN (1, 2, 3)"),
+            normalize_sql("SELECT * FROM t WHERE id IN (4, 5)"),
+        )
+
+    def test_repeated_shapes_ignore_savepoints(self):
+        """
+        Test N+1 detection and that savepoints are not counted.
+        """
+        log = QueryLog([
+            'SAVEPOINT "s1_x1"',
+            "SELECT * FROM auth_user WHERE id = 1",
+            "SELECT * FROM auth_user WHERE id = 2",
+            "SELECT * FROM auth_user WHERE id = 3",
+            'RELEASE SAVEPOINT "s1_x1"',
+        ])
+        self.assertEqual(len(log), 3)
+        self.assertEqual(
+            log.repeated(2), {"SELECT * FROM auth_user WHERE id = ?": 3}
+        )
+        self.assertEqual(log.repeated(3), {})
+
+
+class EstimatedCountPaginatorTest(TestCase):
+    """
+    Tests for the paginator used by the large-table admins.
+    """
+
+    def test_counts_exactly_without_estimates(self):
+        """
+        Test databases without planner estimates (SQLite) get exact counts.
+        """
+        for number in range(3):
+            User.objects.create_user(username=f'user{number}')
+        paginator = EstimatedCountPaginator(User.objects.order_by('id'), 2)
+        self.assertEqual(paginator.count, 3)
+        self.assertEqual(paginator.num_pages, 2)
+
+    def test_uses_large_estimates(self):
+        """
+        Test an estimate above the limit replaces the count.
+        """
+        paginator = EstimatedCountPaginator(User.objects.order_by('id'), 2)
+        with mock.patch(
+            'core.pagination.estimate_count', return_value=50000
+        ):
+            self.assertEqual(paginator.count, 50000)
+            self.assertEqual(paginator.num_pages, 25000)
+
+
+@override_settings(READ_REPLICA='replica')
+class ReplicaRoutingTest(TestCase):
+    """
+    Tests for the read replica routing, against two separate databases:
+    the replica copy of the bike has another name than the primary one.
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        """
+        Set up a rider and a bike stored differently in each database.
+        """
+        self.user = User.objects.create_user(
+            username='rider', password='password'
+        )
+        self.bike = Bike.objects.create(
+            name='Primary copy', type='City', price_per_hour=5
+        )
+        Bike.objects.using('replica').create(
+            id=self.bike.pk, name='Replica copy', type='City',
+            price_per_hour=5,
+        )
+
+    def test_read_views_use_the_replica(self):
+        """
+        Test the bike list, detail page and reviews read the replica.
+        """
+        for url in (
+            reverse('home'),
+            reverse('bike_detail', kwargs={'pk': self.bike.pk}),
+        ):
+            response = self.client.get(url)
+            self.assertContains(response, 'Replica copy')
+            self.assertNotContains(response, 'Primary copy')
+        response = self.client.get(
+            reverse('bike_reviews', kwargs={'bike_id': self.bike.pk})
+        )
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(READ_REPLICA=None)
+    def test_without_replica_everything_reads_the_primary(self):
+        """
+        Test the primary is read when no replica is configured,
+        and writes do not set the pin cookie.
+        """
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Primary copy')
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse('create_rental', kwargs={'bike_id': self.bike.pk})
+        )
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_writer_is_pinned_to_the_primary(self):
+        """
+        Test a rental is written to the primary, and its rider then
+        reads the primary until the pin expires.
+        """
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse('create_rental', kwargs={'bike_id': self.bike.pk})
+        )
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(Rental.objects.count(), 1)
+        self.assertFalse(Rental.objects.using('replica').exists())
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Primary copy')
+
+        self.client.cookies[PIN_COOKIE] = str(time.time() - 1)
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Replica copy')
+
+    def test_review_post_writes_to_the_primary(self):
+        """
+        Test a review submission reads and writes the primary,
+        and pins its author.
+        """
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('bike_detail', kwargs={'pk': self.bike.pk}),
+            {'rating': 5, 'comment': 'Great'},
+        )
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(self.bike.reviews.count(), 1)
+        response = self.client.get(response.url)
+        self.assertContains(response, 'Primary copy')
+        self.assertContains(response, 'Great')
+
+    def test_admin_reads_the_replica_and_pins_after_a_post(self):
+        """
+        Test the admin changelist reads the replica, and a submitted
+        admin form pins the staff member to the primary.
+        """
+        admin = User.objects.create_superuser(
+            username='admin', password='password'
+        )
+        self.client.force_login(admin)
+        changelist = reverse('admin:bikes_bike_changelist')
+        response = self.client.get(changelist)
+        self.assertContains(response, 'Replica copy')
+        response = self.client.post(
+            changelist, {'action': 'delete_selected', '_selected_action': []}
+        )
+        self.assertIn(PIN_COOKIE, response.cookies)
+        response = self.client.get(changelist)
+        self.assertContains(response, 'Primary copy')
+
+    @override_settings(ROOT_URLCONF='bikes.tests')
+    async def test_async_views_use_the_replica(self):
+        """
+        Test the async bike list and detail page read the replica.
+        """
+        for url in (
+            reverse('home'),
+            reverse('bike_detail', kwargs={'pk': self.bike.pk}),
+        ):
+            response = await self.async_client.get(url)
+            self.assertContains(response, 'Replica copy')
+
+
+class SeedScaleTest(TestCase):
+    """
+    Tests for the synthetic dataset of the load tests.
+    """
+    def test_seeds_a_consistent_dataset(self):
+        """
+        Test the rows, their timestamps, prices and stored aggregates,
+        and that the seeded users can log in.
+        """
+        call_command(
+            'seed_scale', bikes=5, users=8, reviews=40, rentals=60, days=10,
+            batch_size=16, password='secret', stdout=StringIO(),
+        )
+        self.assertEqual(Bike.objects.count(), 5)
+        self.assertEqual(
+            User.objects.filter(username__startswith='seed-').count(), 8
+        )
+        self.assertEqual(Review.objects.count(), 40)
+        self.assertEqual(
+            Rental.objects.filter(end_time__isnull=False).count(), 60
+        )
+        self.assertFalse(Bike.objects.filter(is_available=False).exists())
+        # Timestamps are spread over the days, not set to now.
+        self.assertGreater(
+            len(set(Rental.objects.values_list('start_time', flat=True))), 1
+        )
+        for rental in Rental.objects.select_related('bike')[:10]:
+            self.assertEqual(rental.total_cost, charge(
+                billed_hours(rental.start_time, rental.end_time),
+                rental.bike.price_per_hour,
+            ))
+        user = User.objects.select_related('profile').get(username='seed-1')
+        self.assertEqual(
+            user.profile.ride_count, Rental.objects.filter(user=user).count()
+        )
+        bike = Bike.objects.first()
+        self.assertEqual(
+            bike.rating_count, Review.objects.filter(bike=bike).count()
+        )
+        self.assertTrue(
+            self.client.login(username='seed-8', password='secret')
+        )
+
+
+class ScenarioMixTest(SimpleTestCase):
+    """
+    Tests for the load test helpers.
+    """
+    def test_parse_mix(self):
+        """
+        Test scenario weights are parsed in the default order and
+        invalid mixes are rejected.
+        """
+        self.assertEqual(
+            parse_mix('review=1, home=3'), {'home': 3, 'review': 1}
+        )
+        self.assertEqual(
+            parse_mix(','.join(f'{k}={v}' for k, v in DEFAULT_MIX.items())),
+            DEFAULT_MIX,
+        )
+        for mix in ('home=x', 'checkout=1', 'home=0', 'home=-1'):
+            with self.assertRaises(ValueError):
+                parse_mix(mix)
+
+    def test_summarize(self):
+        """
+        Test throughput and nearest-rank percentiles.
+        """
+        result = summarize(range(100, 0, -1), 3, 10)
+        self.assertEqual(result['requests'], 100)
+        self.assertEqual(result['errors'], 3)
+        self.assertEqual(result['rps'], 10.0)
+        self.assertEqual(
+            (result['p50'], result['p95'], result['p99']), (50, 95, 99)
+        )
+
+
+class MetricsTest(TestCase):
+    """
+    Tests for the request metrics and the /metrics endpoint.
+    """
+    def setUp(self):
+        flush()
+        get_store().reset()
+        self.staff = User.objects.create_user(
+            username='staff', password='password', is_staff=True
+        )
+
+    def sample(self, text, series):
+        """
+        Returns the value of a series in the exposition text.
+        """
+        match = re.search(rf'^{re.escape(series)} (\S+)$', text, re.M)
+        self.assertIsNotNone(match, f"{series} not in the metrics")
+        return float(match[1])
+
+    def test_metrics_are_protected(self):
+        """
+        Test only staff and the scraper's bearer token see the metrics.
+        """
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with override_settings(METRICS_TOKEN='scrape'):
+            self.assertEqual(self.client.get(
+                '/metrics', HTTP_AUTHORIZATION='Bearer wrong'
+            ).status_code, 403)
+            response = self.client.get(
+                '/metrics', HTTP_AUTHORIZATION='Bearer scrape'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def test_requests_are_recorded_per_url_name(self):
+        """
+        Test latency, queries, template time and size are recorded
+        under the URL name of each view.
+        """
+        bike = Bike.objects.create(
+            name='Metro', type='City', size='M', price_per_hour=10,
+        )
+        for _ in range(2):
+            self.client.get(reverse('home'))
+        self.client.get(reverse('bike_detail', kwargs={'pk': bike.pk}))
+        self.client.get('/no-such-page/')
+        self.client.force_login(self.staff)
+        text = self.client.get('/metrics').content.decode()
+
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+        self.assertEqual(self.sample(
+            text,
+            'http_requests_total{view="home",method="GET",status="2xx"}',
+        ), 2)
+        self.assertEqual(self.sample(
+            text, 'http_requests_total'
+            '{view="unmatched",method="GET",status="4xx"}',
+        ), 1)
+        self.assertEqual(self.sample(
+            text, 'http_request_duration_seconds_bucket'
+            '{view="bike_detail",le="+Inf"}',
+        ), 1)
+        self.assertGreater(self.sample(
+            text, 'db_queries_per_request_sum{view="bike_detail"}'
+        ), 0)
+        self.assertGreater(self.sample(
+            text, 'db_query_duration_seconds_sum{view="home"}'
+        ), 0)
+        self.assertGreater(self.sample(
+            text, 'template_render_duration_seconds_sum{view="home"}'
+        ), 0)
+        self.assertGreater(self.sample(
+            text, 'http_response_size_bytes_sum{view="home"}'
+        ), 1000)
+
+    def test_async_requests_are_recorded_without_adapting(self):
+        """
+        Test the middleware is async under an async stack and records
+        the queries of the awaited view.
+        """
+        async def view(request):
+            await Bike.objects.acount()
+            return HttpResponse('ok')
+
+        middleware = MetricsMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = RequestFactory().get('/async/')
+        response = async_to_sync(middleware)(request)
+        self.assertEqual(response.status_code, 200)
+        flush()
+        samples = {
+            (name, labels): value
+            for _, name, labels, value in get_store().samples()
+        }
+        self.assertEqual(samples[
+            'http_requests_total',
+            'view="unmatched",method="GET",status="2xx"',
+        ], 1)
+        self.assertEqual(samples[
+            'db_queries_per_request_sum', 'view="unmatched"'
+        ], 1)
+
+
+@override_settings(PROFILING=True, PROFILE_SAMPLE_RATE=0)
+class ProfilerTest(TestCase):
+    """
+    Tests for the on-demand request profiler and its admin pages.
+    """
+    def setUp(self):
+        self.staff = User.objects.create_superuser(
+            username='staff', password='password'
+        )
+        self.bike = Bike.objects.create(
+            name='Metro', type='City', size='M', price_per_hour=10,
+        )
+        self.url = reverse('bike_detail', kwargs={'pk': self.bike.pk})
+
+    def test_staff_header_profiles_a_request(self):
+        """
+        Test the header profiles staff requests only, with the view
+        name, the query log and loadable statistics.
+        """
+        self.client.get(self.url, HTTP_X_PROFILE='1')
+        self.assertFalse(RequestProfile.objects.exists())
+        self.client.force_login(self.staff)
+        self.client.get(self.url)
+        self.assertFalse(RequestProfile.objects.exists())
+
+        self.client.get(self.url, HTTP_X_PROFILE='1')
+        profile = RequestProfile.objects.get()
+        self.assertEqual(profile.view_name, 'bike_detail')
+        self.assertEqual(profile.trigger, 'header')
+        self.assertEqual(profile.user, self.staff)
+        self.assertEqual(profile.query_count, len(profile.queries))
+        self.assertGreater(profile.query_count, 0)
+        self.assertIn('cumulative', top_functions(profile.stats))
+
+    @override_settings(PROFILE_SAMPLE_RATE=1, PROFILE_KEEP=2)
+    def test_sampling_keeps_the_latest_profiles(self):
+        """
+        Test sampled requests are profiled and old profiles deleted.
+        """
+        for _ in range(3):
+            self.client.get(self.url)
+        profiles = RequestProfile.objects.all()
+        self.assertEqual(len(profiles), 2)
+        self.assertEqual({profile.trigger for profile in profiles}, {'sample'})
+
+    def test_async_request_is_profiled(self):
+        """
+        Test the middleware is async under an async stack and profiles
+        a staff request with the queries its view runs in a thread.
+        """
+        async def view(request):
+            await Bike.objects.acount()
+            return HttpResponse('ok')
+
+        middleware = ProfilerMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = RequestFactory().get('/async/', HTTP_X_PROFILE='1')
+        request.user = self.staff
+        async_to_sync(middleware)(request)
+        profile = RequestProfile.objects.get()
+        self.assertEqual(profile.trigger, 'header')
+        self.assertEqual(profile.user, self.staff)
+        self.assertEqual(profile.query_count, 1)
+
+    def test_admin_lists_downloads_and_compares(self):
+        """
+        Test the admin pages of the profiles.
+        """
+        self.client.force_login(self.staff)
+        for _ in range(2):
+            self.client.get(self.url, HTTP_X_PROFILE='1')
+        first, second = RequestProfile.objects.order_by('id')
+
+        changelist = reverse('admin:core_requestprofile_changelist')
+        self.assertContains(self.client.get(changelist), 'bike_detail')
+        self.assertContains(
+            self.client.get(reverse(
+                'admin:core_requestprofile_change', args=[first.pk]
+            )),
+            'Slowest functions',
+        )
+        response = self.client.get(reverse(
+            'admin:core_requestprofile_download', args=[first.pk]
+        ))
+        self.assertIn('.prof', response['Content-Disposition'])
+        self.assertIsInstance(marshal.loads(response.content), dict)
+
+        response = self.client.post(changelist, {
+            'action': 'compare',
+            '_selected_action': [first.pk, second.pk],
+        })
+        compare = reverse(
+            'admin:core_requestprofile_compare', args=[first.pk, second.pk]
+        )
+        self.assertRedirects(response, compare)
+        self.assertContains(self.client.get(compare), 'Compare profiles')
+
+
+# Every query is slower than this threshold (milliseconds).
+@override_settings(SLOW_QUERY_MS=0.000001, SLOW_QUERY_EXPLAIN=True)
+class SlowQueryLogTest(TestCase):
+    """
+    Tests for the slow query log and its admin pages.
+    """
+    def setUp(self):
+        self.bike = Bike.objects.create(
+            name='Metro', type='City', size='M', price_per_hour=10,
+        )
+        # Plans captured by earlier tests would not be captured again.
+        slow_queries._explained.clear()
+
+    def test_slow_queries_are_saved_with_view_frame_and_plan(self):
+        """
+        Test slow queries are saved normalized, with their view, the
+        project frame that ran them and the SQLite query plan.
+        """
+        self.client.get(reverse('bike_detail', kwargs={'pk': self.bike.pk}))
+        queries = list(SlowQuery.objects.filter(view_name='bike_detail'))
+        self.assertTrue(queries)
+        bike_query = next(
+            query for query in queries
+            if query.sql.startswith('SELECT') and 'FROM "bikes_bike"' in
+            query.sql
+        )
+        self.assertEqual(bike_query.fingerprint, fingerprint(bike_query.sql))
+        self.assertRegex(bike_query.frame, r'^\w+/[\w/]+\.py:\d+ in \w+')
+        self.assertTrue(bike_query.plan)
+        # A plan per query and process: the second time, none.
+        self.client.get(reverse('bike_detail', kwargs={'pk': self.bike.pk}))
+        latest = SlowQuery.objects.filter(
+            fingerprint=bike_query.fingerprint
+        ).first()
+        self.assertNotEqual(latest.pk, bike_query.pk)
+        self.assertEqual(latest.plan, '')
+
+    @override_settings(SLOW_QUERY_KEEP=5)
+    def test_log_is_bounded(self):
+        """
+        Test only the latest slow queries are kept.
+        """
+        for _ in range(3):
+            self.client.get(reverse('home'))
+        self.assertEqual(SlowQuery.objects.count(), 5)
+
+    def test_admin_groups_by_fingerprint(self):
+        """
+        Test the fingerprint page and the list of one fingerprint.
+        """
+        for _ in range(2):
+            self.client.get(reverse('home'))
+        staff = User.objects.create_superuser(
+            username='staff', password='password'
+        )
+        self.client.force_login(staff)
+        query = SlowQuery.objects.first()
+        response = self.client.get(
+            reverse('admin:core_slowquery_fingerprints')
+        )
+        self.assertContains(response, query.fingerprint)
+        response = self.client.get(
+            reverse('admin:core_slowquery_changelist'),
+            {'fingerprint': query.fingerprint},
+        )
+        self.assertContains(response, 'Group by fingerprint')
+        self.assertContains(response, query.fingerprint)
+        response = self.client.get(
+            reverse('admin:core_slowquery_change', args=[query.pk])
+        )
+        self.assertContains(response, 'Plan')
+
+    @override_settings(SLOW_QUERY_ASYNC=False)
+    def test_async_view_queries_are_logged(self):
+        """
+        Test the middleware is async under an async stack and logs the
+        queries an async view runs in a thread.
+        """
+        async def view(request):
+            await Bike.objects.acount()
+            return HttpResponse('ok')
+
+        middleware = SlowQueryMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        async_to_sync(middleware)(RequestFactory().get('/async/'))
+        query = SlowQuery.objects.get(view_name='unmatched')
+        self.assertIn('COUNT(*)', query.sql)
+
+
+class JobQueueTest(TestCase):
+    """
+    Tests for the database job queue and the run_worker command.
+    """
+    def setUp(self):
+        self.calls = []
+
+        def record(value):
+            self.calls.append(value)
+
+        def broken():
+            raise ValueError("broken job")
+        # The test jobs, unregistered after each test.
+        for name, function in (
+            ('tests.record', record), ('tests.broken', broken),
+        ):
+            jobs.register(name)(function)
+            self.addCleanup(jobs.REGISTRY.pop, name)
+
+    def test_claim_runs_due_jobs_once(self):
+        """
+        Test a worker claims the due jobs, oldest first, and that a
+        claimed job is not claimed again.
+        """
+        later = jobs.enqueue(
+            'tests.record', run_at=timezone.now() + timedelta(hours=1),
+            value='later',
+        )
+        first = jobs.enqueue('tests.record', value='first')
+        second = jobs.enqueue('tests.record', value='second')
+        claimed = jobs.claim_jobs('worker-1', 10)
+        self.assertEqual([job.pk for job in claimed], [first.pk, second.pk])
+        self.assertEqual(jobs.claim_jobs('worker-2', 10), [])
+        for job in claimed:
+            self.assertEqual(job.attempts, 1)
+            self.assertEqual(jobs.run_job(job), 'done')
+        self.assertEqual(self.calls, ['first', 'second'])
+        self.assertEqual(
+            Job.objects.filter(status=Job.DONE).count(), 2
+        )
+        later.refresh_from_db()
+        self.assertEqual(later.status, Job.QUEUED)
+
+    def test_limit(self):
+        """
+        Test a worker claims no more jobs than it has free threads.
+        """
+        for value in range(3):
+            jobs.enqueue('tests.record', value=value)
+        self.assertEqual(len(jobs.claim_jobs('worker-1', 2)), 2)
+        self.assertEqual(len(jobs.claim_jobs('worker-1', 2)), 1)
+
+    @override_settings(JOB_RETRY_DELAY=10, JOB_MAX_RETRY_DELAY=3600)
+    def test_failed_job_is_retried_with_backoff_then_fails(self):
+        """
+        Test a failing job is queued again later after each attempt,
+        and fails for good after its last one.
+        """
+        job = jobs.enqueue('tests.broken', max_attempts=2)
+        [claimed] = jobs.claim_jobs('worker-1', 1)
+        self.assertEqual(jobs.run_job(claimed), 'retry')
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertIn("broken job", job.last_error)
+        delay = (job.run_at - timezone.now()).total_seconds()
+        self.assertTrue(4 < delay <= 10)
+        self.assertEqual(jobs.claim_jobs('worker-1', 1), [])
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        [claimed] = jobs.claim_jobs('worker-1', 1)
+        self.assertEqual(jobs.run_job(claimed), 'failed')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertIsNotNone(job.finished_at)
+
+    @override_settings(JOB_RETRY_DELAY=10, JOB_MAX_RETRY_DELAY=60)
+    def test_backoff_is_capped(self):
+        """
+        Test the retry delay doubles up to its maximum.
+        """
+        self.assertLessEqual(jobs.backoff(2).total_seconds(), 20)
+        self.assertGreaterEqual(jobs.backoff(2).total_seconds(), 10)
+        self.assertLessEqual(jobs.backoff(30).total_seconds(), 60)
+
+    def test_unknown_job_fails_at_once(self):
+        """
+        Test a job nobody registered is not retried.
+        """
+        job = jobs.enqueue('tests.unknown')
+        [claimed] = jobs.claim_jobs('worker-1', 1)
+        self.assertEqual(jobs.run_job(claimed), 'failed')
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn('tests.unknown', job.last_error)
+
+    @override_settings(JOB_LEASE_SECONDS=60, JOB_RETENTION_DAYS=7)
+    def test_stale_jobs_are_queued_again_and_old_jobs_deleted(self):
+        """
+        Test the jobs of a crashed worker run again, and old done jobs
+        are deleted while failed ones are kept.
+        """
+        stale = jobs.enqueue('tests.record', value='stale')
+        jobs.claim_jobs('crashed', 1)
+        self.assertEqual(jobs.requeue_stale_jobs(), 0)
+        Job.objects.filter(pk=stale.pk).update(
+            locked_at=timezone.now() - timedelta(minutes=2)
+        )
+        self.assertEqual(jobs.requeue_stale_jobs(), 1)
+        self.assertEqual(len(jobs.claim_jobs('worker-1', 1)), 1)
+        old = timezone.now() - timedelta(days=8)
+        done = Job.objects.create(
+            kind='tests.record', status=Job.DONE, finished_at=old
+        )
+        failed = Job.objects.create(
+            kind='tests.record', status=Job.FAILED, finished_at=old
+        )
+        self.assertEqual(jobs.delete_old_jobs(), 1)
+        self.assertFalse(Job.objects.filter(pk=done.pk).exists())
+        self.assertTrue(Job.objects.filter(pk=failed.pk).exists())
+
+    def test_run_worker_reports_throughput_and_metrics(self):
+        """
+        Test the worker runs the queued jobs in burst mode, prints the
+        throughput per kind and exports the runs at /metrics.
+        """
+        get_store().reset()
+        for value in range(3):
+            jobs.enqueue('tests.record', value=value)
+        jobs.enqueue('tests.broken')
+        output = StringIO()
+        call_command(
+            'run_worker', burst=True, threads=1, stdout=output,
+            stderr=StringIO(),
+        )
+        self.assertEqual(self.calls, [0, 1, 2])
+        self.assertIn("tests.record: 3 done, 0 retried, 0 failed",
+                      output.getvalue())
+        self.assertIn("tests.broken: 0 done, 1 retried, 0 failed",
+                      output.getvalue())
+        flush()
+        samples = {
+            (name, labels): value
+            for _, name, labels, value in get_store().samples()
+        }
+        self.assertEqual(samples[
+            'job_runs_total', 'kind="tests.record",outcome="done"'
+        ], 3)
+        self.assertEqual(samples[
+            'job_duration_seconds_count', 'kind="tests.broken"'
+        ], 1)
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+    })
+    def test_returned_bike_card_is_warmed(self):
+        """
+        Test returning a bike queues a job caching its new card.
+        """
+        user = User.objects.create_user(username='rider', password='pw')
+        bike = Bike.objects.create(
+            name='Metro', type='City', size='M', price_per_hour=10,
+            is_available=False,
+        )
+        rental = Rental.objects.create(user=user, bike=bike)
+        self.client.force_login(user)
+        self.client.post(reverse('return_bike', args=[rental.pk]))
+        job = Job.objects.get(kind='bikes.warm_bike_card')
+        self.assertEqual(job.payload, {'bike_id': bike.pk})
+        jobs.discover()
+        [claimed] = jobs.claim_jobs('worker-1', 1)
+        self.assertEqual(jobs.run_job(claimed), 'done')
+        bike.refresh_from_db()
+        self.assertIn('Metro', cache.get(card_key(bike, eager=False)))
+        self.assertIn('Metro', cache.get(card_key(bike, eager=True)))
@@ -1,4 +1,11 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
 from django.shortcuts import render
+from django.views.decorators.cache import never_cache
+
+from .metrics import exposition
 
 
 def handler404(request, exception):
@@ -6,3 +13,35 @@ def handler404(request, exception):
     Custom view for 404 Not Found errors.
     """
     return render(request, '404.html', status=404)
+
+
+def metrics_allowed(request):
+    """
+    Returns True for staff members and for requests bearing
+    `settings.METRICS_TOKEN` (a Prometheus scraper).
+    """
+    if request.user.is_staff:
+        return True
+    token = settings.METRICS_TOKEN
+    return bool(token) and hmac.compare_digest(
+        request.headers.get('Authorization', ''), f'Bearer {token}'
+    )
+
+
+@never_cache
+def metrics(request):
+    """
+    Serves the request and ORM metrics of all the workers in the
+    Prometheus text exposition format (see `core.metrics`).
+
+    **Returns:**
+    - The metrics, or a 403 response if the client is neither staff
+    nor a scraper with the token, or a 404 when metrics are off.
+    """
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    if not settings.METRICS_DB:
+        return render(request, '404.html', status=404)
+    return HttpResponse(
+        exposition(), content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -0,0 +1,69 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from profiles.models import Profile
+from rentals.models import Rental
+
+
+class Command(BaseCommand):
+    """
+    Recalculates the stored ride statistics of every user from their
+    finished rentals.
+
+    Use it after deploying the statistics, after importing data or if
+    the counters drift (for example after editing rentals by hand).
+
+    **Usage:**
+    - `python manage.py rebuild_rider_stats`
+    """
+    help = "Rebuilds the stored ride statistics of all users from rentals."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Number of profiles written per UPDATE batch.",
+        )
+
+    def handle(self, *args, **options):
+        # One grouped query counts the rides and spend per user and type.
+        stats = {}
+        totals = (
+            Rental.objects.filter(end_time__isnull=False).order_by()
+            .values_list('user_id', 'bike__type')
+            .annotate(rides=Count('id'), spent=Sum('total_cost'))
+        )
+        for user_id, bike_type, rides, spent in totals:
+            user_stats = stats.setdefault(user_id, [0, Decimal(0), {}])
+            user_stats[0] += rides
+            user_stats[1] += spent or Decimal(0)
+            user_stats[2][bike_type] = rides
+
+        fields = ['ride_count', 'total_spent', 'rides_by_type']
+        updated = 0
+        with transaction.atomic():
+            profiles = Profile.objects.only('id', 'user_id').order_by('id')
+            batch = []
+            for profile in profiles.iterator(
+                chunk_size=options['batch_size']
+            ):
+                rides, spent, by_type = stats.get(
+                    profile.user_id, (0, Decimal(0), {})
+                )
+                profile.ride_count = rides
+                profile.total_spent = spent
+                profile.rides_by_type = by_type
+                batch.append(profile)
+                if len(batch) >= options['batch_size']:
+                    Profile.objects.bulk_update(batch, fields)
+                    updated += len(batch)
+                    batch = []
+            if batch:
+                Profile.objects.bulk_update(batch, fields)
+                updated += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt ride stats for {updated} users."
+        ))
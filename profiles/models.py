@@ -1,3 +1,5 @@
+from decimal import Decimal
+
 from django.db import models
 # Import Django built-in User model
 from django.contrib.auth.models import User
@@ -12,11 +14,91 @@ class Profile(models.Model):
     **Fields:**
     - `user`: A one-to-one relationship with the User model.
     - `date_of_birth`: The user's date of birth.
+    - `ride_count`: The number of rentals the user finished.
+    - `total_spent`: The total cost of those rentals.
+    - `rides_by_type`: The number of rides per bike type, as a dict.
+
+    The ride statistics are stored counters, updated by `record_ride`
+    when a bike is returned (and rebuilt by the `rebuild_rider_stats`
+    command), so the profile page never aggregates the rentals.
     """
     # One-to-one link (if a User is deleted, their Profile is deleted too).
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     # To store the user's date of birth, can be empty.
     date_of_birth = models.DateField(null=True, blank=True)
+    # Lifetime ride statistics, maintained by record_ride.
+    ride_count = models.PositiveIntegerField(default=0, editable=False)
+    total_spent = models.DecimalField(
+        max_digits=12, decimal_places=2, default=0, editable=False
+        )
+    rides_by_type = models.JSONField(default=dict, editable=False)
+
+    @classmethod
+    def record_ride(cls, rental):
+        """
+        Adds a returned rental to its user's ride statistics.
+
+        The profile row is locked until the end of the transaction,
+        so concurrent returns cannot lose a ride. Call it only when
+        `Rental.finish` closed the rental, so a ride closed twice at
+        once (by two requests, or a request and the sweeper) counts
+        once.
+
+        **Args:**
+        - `rental`: The finished `Rental`, with its bike.
+        """
+        profile, _ = cls.objects.select_for_update().get_or_create(
+            user_id=rental.user_id
+        )
+        bike_type = rental.bike.type
+        profile.ride_count += 1
+        profile.total_spent += rental.total_cost or Decimal(0)
+        profile.rides_by_type[bike_type] = (
+            profile.rides_by_type.get(bike_type, 0) + 1
+        )
+        profile.save(
+            update_fields=['ride_count', 'total_spent', 'rides_by_type']
+        )
+
+    @classmethod
+    def add_spending(cls, changes):
+        """
+        Adds cost changes of finished rentals (a repricing, a waived
+        cost) to the riders' `total_spent`, with one
+        `UPDATE ... SET total_spent = total_spent + CASE ...`.
+
+        **Args:**
+        - `changes`: A dict mapping user IDs to the amount added
+        (negative for a refund).
+        """
+        changes = {
+            user_id: amount for user_id, amount in changes.items() if amount
+        }
+        if not changes:
+            return
+        amount = models.Case(
+            *(
+                models.When(user_id=user_id, then=models.Value(amount))
+                for user_id, amount in changes.items()
+            ),
+            output_field=models.DecimalField(),
+        )
+        cls.objects.filter(user_id__in=changes).update(
+            total_spent=models.F('total_spent') + amount
+        )
+
+    @property
+    def favourite_type(self):
+        """
+        Returns the bike type the user rode most, or None.
+
+        Ties go to the type that comes first alphabetically.
+        """
+        if not self.rides_by_type:
+            return None
+        return min(
+            self.rides_by_type.items(), key=lambda item: (-item[1], item[0])
+        )[0]
 
     def __str__(self):
         """
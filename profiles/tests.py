@@ -1,3 +1,221 @@
-from django.test import TestCase  # noqa: F401
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import path, reverse
+from django.utils import timezone
+
+from bikes.models import Bike
+from core.testing import QueryBudgetMixin
+from bike_rental.urls import urlpatterns as project_urlpatterns
+from profiles.models import Profile
+from profiles.views import PAST_RENTALS_PER_PAGE, async_profile_view
+from rentals.models import Rental
+
+# The project's URLs with the async profile view, as routed under ASGI
+# (see settings.ASYNC_VIEWS). Used with ROOT_URLCONF='profiles.tests'.
+urlpatterns = [
+    path('profile/', async_profile_view, name='profile'),
+] + project_urlpatterns
+
+
+class ProfileViewQueryBudgetTest(QueryBudgetMixin, TestCase):
+    """
+    Query budget for the profile page.
+    """
+
+    def setUp(self):
+        """
+        Set up a rider with one active rental and 60 past rentals.
+        """
+        self.user = User.objects.create_user(
+            username='rider', password='password'
+        )
+        bikes = [
+            Bike.objects.create(
+                name=f'Bike {number}', type='Road', price_per_hour=9.00
+            )
+            for number in range(15)
+        ]
+        now = timezone.now()
+        for number in range(60):
+            rental = Rental.objects.create(
+                user=self.user, bike=bikes[number % 15]
+            )
+            Rental.objects.filter(pk=rental.pk).update(
+                start_time=now - timedelta(days=number + 1, hours=1),
+                end_time=now - timedelta(days=number + 1),
+                total_cost=18,
+            )
+        Rental.objects.create(user=self.user, bike=bikes[0])
+        self.client.force_login(self.user)
+
+    def test_profile_budget(self):
+        """
+        Test the profile page: session, user, the two rental lists,
+        the upcoming reservations and the stored ride stats.
+        """
+        with self.assertQueryBudget(6):
+            response = self.client.get(reverse('profile'))
+        self.assertEqual(
+            len(response.context['past_rentals']), PAST_RENTALS_PER_PAGE
+        )
+
+    def test_past_rentals_are_paginated(self):
+        """
+        Test following the links shows every past rental once.
+        """
+        seen = []
+        url = reverse('profile')
+        while url:
+            response = self.client.get(url)
+            seen += [rental.pk for rental in response.context['past_rentals']]
+            next_url = response.context.get('next_page_url')
+            url = reverse('profile') + next_url if next_url else None
+        self.assertEqual(len(seen), 60)
+        self.assertEqual(len(set(seen)), 60)
+        self.assertIn('previous_page_url', response.context)
+
+
+class RiderStatsTest(TestCase):
+    """
+    Tests for the stored ride statistics shown on the profile.
+    """
+
+    def setUp(self):
+        """
+        Set up a rider, a city bike and a road bike.
+        """
+        self.user = User.objects.create_user(
+            username='stats', password='password'
+        )
+        self.city = Bike.objects.create(
+            name='City', type='City', price_per_hour=Decimal('2.00')
+        )
+        self.road = Bike.objects.create(
+            name='Road', type='Road', price_per_hour=Decimal('5.00')
+        )
+        self.client.force_login(self.user)
+
+    def ride(self, bike):
+        """
+        Rents a bike and returns it through the views.
+        """
+        self.client.post(reverse('create_rental', args=[bike.id]))
+        rental = Rental.objects.get(user=self.user, end_time__isnull=True)
+        self.client.post(reverse('return_bike', args=[rental.id]))
+
+    def test_return_bike_updates_stats(self):
+        """
+        Test each return adds a ride, its cost and its bike type.
+        """
+        self.ride(self.city)
+        self.ride(self.road)
+        self.ride(self.road)
+        profile = Profile.objects.get(user=self.user)
+        self.assertEqual(profile.ride_count, 3)
+        self.assertEqual(profile.total_spent, Decimal('12.00'))
+        self.assertEqual(profile.favourite_type, 'Road')
+        response = self.client.get(reverse('profile'))
+        self.assertContains(response, '€12.00')
+
+    def test_concurrent_returns_count_one_ride(self):
+        """
+        Test a return that read the rental before another one closed
+        it does not add the ride to the stats again.
+        """
+        rental = Rental.objects.create(user=self.user, bike=self.city)
+        stale = Rental.objects.select_related('bike').get(pk=rental.pk)
+        url = reverse('return_bike', args=[rental.id])
+        self.client.post(url)
+        with mock.patch(
+            'rentals.views.get_object_or_404', return_value=stale
+        ):
+            self.client.post(url)
+        profile = Profile.objects.get(user=self.user)
+        self.assertEqual(
+            (profile.ride_count, profile.total_spent), (1, Decimal('2.00'))
+        )
+
+    def test_rebuild_matches_recorded_stats(self):
+        """
+        Test the rebuild command computes the same counters.
+        """
+        self.ride(self.city)
+        self.ride(self.road)
+        recorded = Profile.objects.get(user=self.user)
+        Profile.objects.filter(user=self.user).update(
+            ride_count=0, total_spent=0, rides_by_type={}
+        )
+        call_command('rebuild_rider_stats', stdout=StringIO())
+        rebuilt = Profile.objects.get(user=self.user)
+        self.assertEqual(
+            (rebuilt.ride_count, rebuilt.total_spent, rebuilt.rides_by_type),
+            (recorded.ride_count, recorded.total_spent,
+             recorded.rides_by_type),
+        )
+        self.assertEqual(rebuilt.favourite_type, 'City')
+
+
+@override_settings(ROOT_URLCONF='profiles.tests')
+class AsyncProfileViewTest(TestCase):
+    """
+    Tests for the async profile view served under ASGI.
+    """
+
+    def setUp(self):
+        """
+        Set up a rider with one active and 12 past rentals.
+        """
+        self.user = User.objects.create_user(
+            username='async', password='password'
+        )
+        bike = Bike.objects.create(
+            name='Async Bike', type='Road', price_per_hour=9.00
+        )
+        now = timezone.now()
+        for number in range(12):
+            rental = Rental.objects.create(user=self.user, bike=bike)
+            Rental.objects.filter(pk=rental.pk).update(
+                start_time=now - timedelta(days=number + 1, hours=1),
+                end_time=now - timedelta(days=number + 1),
+                total_cost=9,
+            )
+        self.active = Rental.objects.create(user=self.user, bike=bike)
+
+    async def get_async_profile(self):
+        return await self.async_client.get(reverse('profile'))
+
+    async def test_anonymous_users_are_sent_to_login(self):
+        """
+        Test the async view requires a login like the sync one.
+        """
+        response = await self.async_client.get(reverse('profile'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/accounts/login/', response['Location'])
+
+    def test_profile_matches_sync_view(self):
+        """
+        Test the async view shows the same rentals as the sync view.
+        """
+        self.async_client.force_login(self.user)
+        self.client.force_login(self.user)
+        response = async_to_sync(self.get_async_profile)()
+        with override_settings(ROOT_URLCONF='bike_rental.urls'):
+            expected = self.client.get(reverse('profile'))
+        self.assertEqual(
+            [rental.pk for rental in response.context['past_rentals']],
+            [rental.pk for rental in expected.context['past_rentals']],
+        )
+        self.assertEqual(
+            response.context['active_rentals'], [self.active]
+        )
+        self.assertEqual(
+            response.context['next_page_url'],
+            expected.context['next_page_url'],
+        )
@@ -1,7 +1,14 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# Under ASGI the async version of the view serves the same URL.
+if settings.ASYNC_VIEWS:
+    profile_view = views.async_profile_view
+else:
+    profile_view = views.profile_view
+
 urlpatterns = [
     # Map the URL '/profile/' to profile_view function.
-    path('', views.profile_view, name='profile'),
+    path('', profile_view, name='profile'),
 ]
@@ -1,34 +1,120 @@
 from django.shortcuts import render
 # Ensure that only logged-in users can access view.
 from django.contrib.auth.decorators import login_required
-from rentals.models import Rental
+from django.utils import timezone
+from core.async_views import async_login_required
+from core.pagination import apaginate_keyset, cursor_url, paginate_keyset
+from profiles.models import Profile
+from rentals.models import Rental, Reservation
+from rentals.forms import DateRangeForm
 
+# Past rentals shown per page of the profile.
+PAST_RENTALS_PER_PAGE = 10
+# Newest first, served by the rental_user_start_idx index.
+PAST_RENTAL_ORDERING = ('-start_time', '-id')
 
-@login_required
-def profile_view(request):
+
+def profile_queries(user):
     """
-    Displays the user's profile page, including their active and past rentals.
+    Returns the querysets shown on a user's profile page.
 
-    **Context:**
-    - `active_rentals`: A queryset of the user's current rentals.
-    - `past_rentals`: A queryset of the user's completed rentals.
+    Only builds the queries, so the sync and async views share them.
 
-    **Template:**
-    - `profiles/profile.html`
+    **Returns:**
+    - An `(active_rentals, past_rentals, reservations)` tuple.
     """
     # Get active rentals for the current user (end_time is null).
+    # The bike is joined in, the template shows its name for each rental.
     active_rentals = Rental.objects.filter(
-        user=request.user, end_time__isnull=True
-        )
-    # Get returned rentals for the current user (end_time is NOT null).
-    # Order by the most recently returned first.
+        user=user, end_time__isnull=True
+        ).select_related('bike')
+    # Get returned rentals for the current user (end_time is NOT null),
+    # the most recent first (paginated by the views).
     past_rentals = (
-        Rental.objects.filter(user=request.user, end_time__isnull=False)
-                      .order_by('-end_time')
+        Rental.objects.filter(user=user, end_time__isnull=False)
+                      .select_related('bike')
+                      .order_by(*PAST_RENTAL_ORDERING)
     )
-    # Pass rental querysets to the template.
+    # Reservations that have not ended yet, soonest first.
+    reservations = Reservation.objects.filter(
+        user=user, end_time__gt=timezone.now()
+        ).select_related('bike')
+    return active_rentals, past_rentals, reservations
+
+
+def profile_context(request, active_rentals, past_rentals, reservations,
+                    stats):
+    """
+    Returns the context of the profile page (see `profile_view`).
+    """
     context = {
         'active_rentals': active_rentals,
         'past_rentals': past_rentals,
+        'stats': stats,
+        'reservations': reservations,
+        'export_form': DateRangeForm(),
     }
+    if past_rentals.has_next:
+        context['next_page_url'] = cursor_url(
+            request, past_rentals.next_cursor
+        )
+    if past_rentals.has_previous:
+        context['previous_page_url'] = cursor_url(
+            request, past_rentals.previous_cursor
+        )
+    return context
+
+
+@login_required
+def profile_view(request):
+    """
+    Displays the user's profile page, including their active and past rentals.
+
+    Past rentals are split into pages with keyset (cursor) pagination,
+    so a page costs the same for a rider with thousands of rentals.
+
+    **Context:**
+    - `active_rentals`: A queryset of the user's current rentals.
+    - `past_rentals`: The `CursorPage` of the user's completed rentals.
+    - `next_page_url`, `previous_page_url`: Links to the other pages
+    of past rentals, when there are some.
+    - `stats`: The user's `Profile`, with the stored ride statistics.
+    - `reservations`: A queryset of the user's upcoming reservations.
+    - `export_form`: The form to download the rental history as CSV.
+
+    **Template:**
+    - `profiles/profile.html`
+    """
+    active_rentals, past_rentals, reservations = profile_queries(
+        request.user
+    )
+    past_page = paginate_keyset(
+        past_rentals, request.GET.get('cursor'), PAST_RENTALS_PER_PAGE
+    )
+    # Stored counters, updated when a bike is returned.
+    stats, _ = Profile.objects.get_or_create(user=request.user)
+    context = profile_context(
+        request, active_rentals, past_page, reservations, stats
+    )
+    return render(request, 'profiles/profile.html', context)
+
+
+@async_login_required
+async def async_profile_view(request):
+    """
+    Async version of `profile_view`, routed instead of it under ASGI
+    (see settings.ASYNC_VIEWS). Same context, read with the async ORM.
+    """
+    active_rentals, past_rentals, reservations = profile_queries(
+        request.user
+    )
+    active_rentals = [rental async for rental in active_rentals]
+    past_page = await apaginate_keyset(
+        past_rentals, request.GET.get('cursor'), PAST_RENTALS_PER_PAGE
+    )
+    reservations = [reservation async for reservation in reservations]
+    stats, _ = await Profile.objects.aget_or_create(user=request.user)
+    context = profile_context(
+        request, active_rentals, past_page, reservations, stats
+    )
     return render(request, 'profiles/profile.html', context)
@@ -1,7 +1,188 @@
 from django.contrib import admin
-# Import Rental model.
-from .models import Rental
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from core.admin import LargeTableAdminMixin
+from profiles.models import Profile
+# Import Rental and Reservation models.
+from .models import BikeDayStats, BikePrice, Rental, Reservation, Tariff
+from .export import rental_csv_response
+from .rollups import add_revenue_changes
 
-# Register Rental model.
-# See all rental transactions that have occurred.
-admin.site.register(Rental)
+
+class RentalStatusFilter(admin.SimpleListFilter):
+    """
+    Filters rentals by whether the bike was returned.
+
+    Open rentals are read through the partial indexes on
+    `end_time IS NULL` (`rental_open_start_idx` and the
+    `one_open_rental_per_*` constraints). Overdue rentals are the open
+    ones flagged by the sweeper.
+    """
+    title = "status"
+    parameter_name = 'status'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('open', "Open"), ('overdue', "Overdue"),
+            ('finished', "Finished"),
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() == 'open':
+            return queryset.filter(end_time__isnull=True)
+        if self.value() == 'overdue':
+            return queryset.filter(
+                end_time__isnull=True, overdue_at__isnull=False
+            )
+        if self.value() == 'finished':
+            return queryset.filter(end_time__isnull=False)
+        return queryset
+
+
+# Decorator to register a custom admin class
+@admin.register(Rental)
+class RentalAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    """
+    Customizes the admin interface for the Rental model.
+
+    **Admin Panel Features:**
+    - Lists rentals with their user, bike, period and cost, newest
+    first, with estimated page counts (the table has millions of rows).
+    - Filters open and overdue rentals, browses by start date and searches by
+    username or bike name, which is how an export is narrowed to
+    a period or a user.
+    - Exports the selected rentals as a streamed CSV file.
+    - Waives the cost of the selected rentals with one UPDATE.
+    """
+    list_display = (
+        'id', 'user', 'bike', 'start_time', 'end_time', 'total_cost',
+        'overdue_at',
+    )
+    list_select_related = ('user', 'bike')
+    list_filter = (RentalStatusFilter,)
+    date_hierarchy = 'start_time'
+    # Served by the rental_start_idx index.
+    ordering = ('-start_time', '-id')
+    search_fields = ('user__username', 'bike__name')
+    # Pick the user and bike by ID instead of loading every row.
+    raw_id_fields = ('user', 'bike')
+    actions = ['export_csv', 'waive_cost']
+
+    @admin.action(description="Export selected rentals to CSV")
+    def export_csv(self, request, queryset):
+        """
+        Streams the selected rentals (or all the filtered ones, with
+        "select all") as a CSV file.
+        """
+        filename = f"rentals-{timezone.now():%Y%m%d-%H%M%S}.csv"
+        return rental_csv_response(queryset, filename)
+
+    @admin.action(description="Waive the cost of selected rentals")
+    def waive_cost(self, request, queryset):
+        """
+        Sets the cost of the selected finished rentals to zero.
+
+        One UPDATE whatever the number of rentals. In the same
+        transaction, the waived amounts are taken off the revenue
+        rollups of the days the rentals were returned and off the
+        riders' total spent.
+        """
+        finished = queryset.filter(end_time__isnull=False).order_by()
+        with transaction.atomic():
+            # Grouped by the local day the bike was returned.
+            revenue = {
+                (bike_id, day): -waived for bike_id, day, waived in
+                finished.annotate(day=TruncDate('end_time')).values(
+                    'bike_id', 'day'
+                ).annotate(
+                    waived=Sum('total_cost')
+                ).values_list('bike_id', 'day', 'waived')
+                if waived
+            }
+            refunds = {
+                user_id: -spent for user_id, spent in
+                finished.values('user_id').annotate(
+                    spent=Sum('total_cost')
+                ).values_list('user_id', 'spent')
+                if spent
+            }
+            waived = finished.update(total_cost=0)
+            add_revenue_changes(revenue)
+            Profile.add_spending(refunds)
+        self.message_user(request, f"Waived the cost of {waived} rentals.")
+
+
+# Decorator to register a custom admin class
+@admin.register(Reservation)
+class ReservationAdmin(admin.ModelAdmin):
+    """
+    Customizes the admin interface for the Reservation model.
+
+    **Admin Panel Features:**
+    - Lists reservations with their bike, user and period.
+    - Filters by bike type and browses by start date.
+    """
+    list_display = ('id', 'bike', 'user', 'start_time', 'end_time')
+    list_select_related = ('bike', 'user')
+    list_filter = ('bike__type',)
+    date_hierarchy = 'start_time'
+    # Pick the user and bike by ID instead of loading every row.
+    raw_id_fields = ('user', 'bike')
+
+
+# Decorator to register a custom admin class
+@admin.register(Tariff)
+class TariffAdmin(admin.ModelAdmin):
+    """
+    Customizes the admin interface for the Tariff model.
+
+    **Admin Panel Features:**
+    - Lists tariffs with their bike type, start date and rules.
+    """
+    list_display = (
+        'name', 'bike_type', 'valid_from', 'multiplier', 'hourly_cap',
+        'daily_rate',
+    )
+    list_filter = ('bike_type',)
+
+
+# Decorator to register a custom admin class
+@admin.register(BikePrice)
+class BikePriceAdmin(admin.ModelAdmin):
+    """
+    Customizes the admin interface for the BikePrice model.
+
+    **Admin Panel Features:**
+    - Lists the price history with the bike name, newest first.
+    """
+    list_display = ('bike', 'price_per_hour', 'valid_from')
+    list_select_related = ('bike',)
+    ordering = ('-valid_from',)
+    # Pick the bike by ID instead of loading every row.
+    raw_id_fields = ('bike',)
+
+
+# Decorator to register a custom admin class
+@admin.register(BikeDayStats)
+class BikeDayStatsAdmin(admin.ModelAdmin):
+    """
+    Customizes the admin interface for the BikeDayStats model.
+
+    **Admin Panel Features:**
+    - Lists the daily usage of each bike, newest days first.
+    - Read only: the rows are maintained by `return_bike` and the
+    `rebuild_rollups` command.
+    """
+    list_display = ('day', 'bike', 'rides', 'rented_minutes', 'revenue')
+    list_select_related = ('bike',)
+    date_hierarchy = 'day'
+    ordering = ('-day', 'bike')
+    raw_id_fields = ('bike',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class RentalsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'rentals'
+
+    # Import signals that purge the cached bike detail pages.
+    def ready(self):
+        import rentals.signals  # noqa: F401
@@ -0,0 +1,92 @@
+import csv
+
+from django.http import StreamingHttpResponse
+
+# Columns of the rental history CSV file.
+EXPORT_HEADER = (
+    'rental_id', 'user', 'bike_id', 'bike', 'start_time', 'end_time',
+    'total_cost',
+)
+# Values read for each row, in header order (no model instances built).
+EXPORT_VALUES = (
+    'id', 'user__username', 'bike_id', 'bike__name', 'start_time',
+    'end_time', 'total_cost',
+)
+# Number of rows fetched from the database at a time.
+EXPORT_CHUNK_SIZE = 2000
+# Spreadsheet programs run cells starting with these as formulas.
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class Echo:
+    """
+    A file-like object whose `write` returns the value it is given,
+    so `csv.writer` formats a row without buffering it.
+    """
+    def write(self, value):
+        return value
+
+
+def csv_value(value):
+    """
+    Formats one cell: ISO dates, empty cells for None, and text that
+    cannot be read as a spreadsheet formula.
+    """
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    value = str(value)
+    if value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def filter_rentals(queryset, date_from=None, date_to=None, user=None):
+    """
+    Restricts rentals to those started in a date range, and to a user.
+
+    **Args:**
+    - `queryset`: The rentals to filter.
+    - `date_from`, `date_to`: The first and last day (inclusive)
+    the rentals started on, or None for no limit.
+    - `user`: A `User`, or None for the rentals of all users.
+
+    **Returns:**
+    - The filtered queryset.
+    """
+    if date_from:
+        queryset = queryset.filter(start_time__date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(start_time__date__lte=date_to)
+    if user is not None:
+        queryset = queryset.filter(user=user)
+    return queryset
+
+
+def rental_csv_rows(queryset):
+    """
+    Yields the CSV lines of a rental export, header first.
+
+    Rows are read with `.iterator()`, which uses a server-side cursor
+    on PostgreSQL, so only one chunk of rows is in memory at a time.
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_HEADER)
+    rows = queryset.order_by('start_time', 'id').values_list(*EXPORT_VALUES)
+    for row in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield writer.writerow([csv_value(value) for value in row])
+
+
+def rental_csv_response(queryset, filename):
+    """
+    Returns a streaming CSV download of the given rentals.
+
+    The file is written while it is sent, the worker never holds
+    the whole export in memory.
+    """
+    response = StreamingHttpResponse(
+        rental_csv_rows(queryset), content_type='text/csv'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
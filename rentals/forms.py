@@ -0,0 +1,125 @@
+from datetime import timedelta
+
+from django import forms
+from django.utils import timezone
+
+# Longest period a bike can be reserved for.
+MAX_RESERVATION_LENGTH = timedelta(days=7)
+
+
+def check_period(start, end):
+    """
+    Validates a period picked in one of the forms below.
+
+    **Raises:**
+    - `forms.ValidationError`: If the period ends before it starts
+    or starts in the past.
+    """
+    if start and end:
+        if end <= start:
+            raise forms.ValidationError(
+                "The end of the period must be after its start."
+            )
+        if start < timezone.now() - timedelta(minutes=1):
+            raise forms.ValidationError(
+                "The period cannot start in the past."
+            )
+
+
+# Widget for the HTML5 date and time picker.
+def period_widget():
+    return forms.DateTimeInput(
+        attrs={'type': 'datetime-local', 'class': 'form-control'},
+        format='%Y-%m-%dT%H:%M',
+    )
+
+
+# HTML5 date pickers always send ISO dates, whatever DATE_INPUT_FORMATS is.
+DATE_PICKER_FORMATS = ['%Y-%m-%d', '%d/%m/%Y']
+
+
+# Widget for the HTML5 date picker.
+def date_widget():
+    return forms.DateInput(
+        attrs={'type': 'date', 'class': 'form-control'}, format='%Y-%m-%d',
+    )
+
+
+class ReservationForm(forms.Form):
+    """
+    A form for booking a bike for a future period.
+
+    **Fields:**
+    - `start_time`: When the reservation begins.
+    - `end_time`: When the reservation ends.
+
+    **Validation:**
+    - The period must start in the future, end after it starts
+    and last at most 7 days.
+    """
+    start_time = forms.DateTimeField(label="From", widget=period_widget())
+    end_time = forms.DateTimeField(label="Until", widget=period_widget())
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start = cleaned_data.get('start_time')
+        end = cleaned_data.get('end_time')
+        check_period(start, end)
+        if start and end and end - start > MAX_RESERVATION_LENGTH:
+            raise forms.ValidationError(
+                "A reservation can last at most 7 days."
+            )
+        return cleaned_data
+
+
+class AvailabilityForm(forms.Form):
+    """
+    A form (sent with GET) to list the bikes free during a period.
+
+    **Fields:**
+    - `available_from`: The start of the period.
+    - `available_to`: The end of the period.
+    """
+    available_from = forms.DateTimeField(
+        label="Free from", widget=period_widget()
+    )
+    available_to = forms.DateTimeField(
+        label="until", widget=period_widget()
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        check_period(
+            cleaned_data.get('available_from'),
+            cleaned_data.get('available_to'),
+        )
+        return cleaned_data
+
+
+class DateRangeForm(forms.Form):
+    """
+    A form (sent with GET) to pick a range of days, used to download
+    rental history as CSV and by the staff dashboard.
+
+    **Fields:**
+    - `date_from`: The first day, optional.
+    - `date_to`: The last day (inclusive), optional.
+    """
+    date_from = forms.DateField(
+        label="From", required=False,
+        input_formats=DATE_PICKER_FORMATS, widget=date_widget(),
+    )
+    date_to = forms.DateField(
+        label="Until", required=False,
+        input_formats=DATE_PICKER_FORMATS, widget=date_widget(),
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date_from = cleaned_data.get('date_from')
+        date_to = cleaned_data.get('date_to')
+        if date_from and date_to and date_to < date_from:
+            raise forms.ValidationError(
+                "The end of the period must be after its start."
+            )
+        return cleaned_data
@@ -0,0 +1,155 @@
+import random
+import threading
+import time
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, OperationalError, connection
+from django.utils import timezone
+
+from bikes.models import Bike
+from rentals.models import Rental
+
+# Prefix of the users and bikes the benchmark creates (and removes).
+BENCH_PREFIX = 'claim-bench'
+
+
+class Command(BaseCommand):
+    """
+    Measures bike claims per second under contention.
+
+    Several threads (each with its own database connection) keep
+    renting and returning a small pool of bikes with `Rental.claim`,
+    the same code path `create_rental` uses. Half of the threads share
+    a user, so the "one open rental per user" rule is raced as well.
+
+    Every thread counts a rental as held from the moment its claim
+    committed until just before it starts returning the bike. If two
+    threads ever hold the same bike (or the same user's rental) at
+    once, the claim was not atomic and a double rental is reported.
+
+    **Usage:**
+    - `python manage.py benchmark_claims --threads 8 --seconds 5`
+    """
+    help = "Benchmarks concurrent bike claims and checks for double rentals."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--bikes', type=int, default=4)
+        parser.add_argument(
+            '--seconds', type=float, default=5.0,
+            help="How long the threads keep claiming bikes.",
+        )
+        parser.add_argument(
+            '--hold-ms', type=float, default=1.0,
+            help="How long a thread keeps a bike before returning it.",
+        )
+        parser.add_argument(
+            '--keep-data', action='store_true',
+            help="Do not delete the benchmark users and bikes afterwards.",
+        )
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        users = [
+            User.objects.create_user(username=f'{BENCH_PREFIX}-{number}')
+            for number in range((threads + 1) // 2)
+        ]
+        bikes = [
+            Bike.objects.create(
+                name=f'{BENCH_PREFIX}-{number}', type='Bench',
+                price_per_hour=1,
+            )
+            for number in range(options['bikes'])
+        ]
+        totals = {'claims': 0, 'attempts': 0, 'conflicts': 0, 'retries': 0}
+        lock = threading.Lock()
+        # Rentals currently held per bike and per user, and how often
+        # one was held twice at the same time.
+        held = Counter()
+        doubles = Counter()
+        hold = options['hold_ms'] / 1000
+        deadline = time.monotonic() + options['seconds']
+
+        def worker(user):
+            counts = dict.fromkeys(totals, 0)
+            try:
+                while time.monotonic() < deadline:
+                    bike = random.choice(bikes)
+                    counts['attempts'] += 1
+                    try:
+                        rental = Rental.claim(user, bike)
+                    except IntegrityError:
+                        # The shared user already has an open rental.
+                        counts['conflicts'] += 1
+                        continue
+                    except OperationalError:
+                        # SQLite reports write lock contention as an error.
+                        counts['retries'] += 1
+                        continue
+                    if rental is None:
+                        counts['conflicts'] += 1
+                        continue
+                    counts['claims'] += 1
+                    keys = (('bike', rental.bike_id), ('user', user.pk))
+                    with lock:
+                        for key in keys:
+                            held[key] += 1
+                            if held[key] > 1:
+                                doubles[key[0]] += 1
+                    # Keep the bike for a moment, like a (very short) ride.
+                    time.sleep(hold)
+                    with lock:
+                        for key in keys:
+                            held[key] -= 1
+                    self.release(rental)
+            finally:
+                connection.close()
+                with lock:
+                    for key, value in counts.items():
+                        totals[key] += value
+
+        # Two threads per user: they race for the same user's rental.
+        pool = [
+            threading.Thread(target=worker, args=(users[number // 2],))
+            for number in range(threads)
+        ]
+        started = time.monotonic()
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(
+            f"threads={threads} bikes={len(bikes)} "
+            f"seconds={elapsed:.2f}\n"
+            f"claims={totals['claims']} attempts={totals['attempts']} "
+            f"conflicts={totals['conflicts']} "
+            f"lock_retries={totals['retries']}\n"
+            f"claims_per_second={totals['claims'] / elapsed:.1f} "
+            f"attempts_per_second={totals['attempts'] / elapsed:.1f}\n"
+            f"double_rented_bikes={doubles['bike']} "
+            f"users_with_two_open_rentals={doubles['user']}"
+        )
+        if not options['keep_data']:
+            # Deleting the users and bikes cascades to their rentals.
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+            Bike.objects.filter(pk__in=[bike.pk for bike in bikes]).delete()
+
+    def release(self, rental):
+        """
+        Returns a claimed bike so the next attempt can rent it again.
+        """
+        while True:
+            try:
+                Rental.objects.filter(pk=rental.pk).update(
+                    end_time=timezone.now()
+                )
+                Bike.objects.filter(pk=rental.bike_id).update(
+                    is_available=True
+                )
+                return
+            except OperationalError:
+                time.sleep(0.001)
@@ -0,0 +1,85 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from rentals.models import Rental
+from rentals.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the daily bike usage rollups from the rentals.
+
+    `return_bike` keeps the rollups up to date; run this to fill them
+    in for past rentals, or to repair a range of days after rentals
+    were edited or repriced.
+
+    **Usage:**
+    - `python manage.py rebuild_rollups` (the whole rental history)
+    - `python manage.py rebuild_rollups --days 7`
+    - `python manage.py rebuild_rollups --from 2024-05-01 --to 2024-05-31`
+    """
+    help = "Recomputes the daily bike usage rollups in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--from', dest='day_from',
+            help="First day to rebuild (YYYY-MM-DD).",
+        )
+        parser.add_argument(
+            '--to', dest='day_to',
+            help="Last day to rebuild (YYYY-MM-DD), defaults to today.",
+        )
+        parser.add_argument(
+            '--days', type=int,
+            help="Rebuild this many days, ending today.",
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=5000,
+            help="Number of rentals read at a time.",
+        )
+        parser.add_argument(
+            '--window-days', type=int, default=31,
+            help="Number of days rebuilt (and held in memory) per pass.",
+        )
+
+    def parse_day(self, value, option):
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"{option} must be YYYY-MM-DD.")
+        return day
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        day_to = today
+        if options['day_to']:
+            day_to = self.parse_day(options['day_to'], '--to')
+        if options['day_from']:
+            day_from = self.parse_day(options['day_from'], '--from')
+        elif options['days']:
+            day_from = day_to - timedelta(days=options['days'] - 1)
+        else:
+            history = Rental.objects.filter(
+                end_time__isnull=False
+            ).aggregate(first=Min('start_time'), last=Max('end_time'))
+            if history['first'] is None:
+                self.stdout.write("No finished rentals, nothing to rebuild.")
+                return
+            day_from = timezone.localtime(history['first']).date()
+            day_to = max(day_to, timezone.localtime(history['last']).date())
+        if day_from > day_to:
+            raise CommandError("--from must not be after --to.")
+
+        started = time.perf_counter()
+        read, written = rebuild_rollups(
+            day_from, day_to, options['chunk_size'], options['window_days']
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {day_from} to {day_to}: {read} rentals read, "
+            f"{written} rollup rows written in {elapsed:.2f}s."
+        ))
@@ -0,0 +1,59 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from rentals.models import Rental
+from rentals.pricing import reprice_rentals
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the cost of finished rentals with the pricing engine.
+
+    Run it at the end of the day to invoice the day's rentals, or with
+    `--all` after changing tariffs or the price history retroactively.
+    The cost changes are also added to the daily revenue rollups and
+    the riders' total spent.
+
+    **Usage:**
+    - `python manage.py reprice_rentals` (rentals returned yesterday)
+    - `python manage.py reprice_rentals --date 2024-05-01`
+    - `python manage.py reprice_rentals --all`
+    """
+    help = "Recomputes the cost of finished rentals in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            help="Reprice rentals returned on this day (YYYY-MM-DD).",
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help="Reprice every finished rental.",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Number of rentals priced per batch.",
+        )
+
+    def handle(self, *args, **options):
+        rentals = Rental.objects.all()
+        if not options['all']:
+            if options['date']:
+                day = parse_date(options['date'])
+                if day is None:
+                    raise CommandError("--date must be YYYY-MM-DD.")
+            else:
+                day = timezone.localdate() - timedelta(days=1)
+            rentals = rentals.filter(end_time__date=day)
+
+        started = time.perf_counter()
+        priced, changed = reprice_rentals(rentals, options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Priced {priced} rentals ({changed} changed) "
+            f"in {elapsed:.2f}s."
+        ))
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from rentals.sweeper import sweep_rentals
+
+
+class Command(BaseCommand):
+    """
+    Flags the overdue rentals and closes the abandoned ones.
+
+    Rentals open for longer than `settings.RENTAL_OVERDUE_HOURS` are
+    marked overdue (listed in the admin); after
+    `settings.RENTAL_CLOSE_HOURS` they are closed and priced as if the
+    rider returned the bike, which makes the bike available again (see
+    `rentals.sweeper`). Run it periodically, e.g. every 10 minutes
+    from Heroku Scheduler or cron.
+
+    **Usage:**
+    - `python manage.py sweep_rentals`
+    - `python manage.py sweep_rentals --flag-only`
+    """
+    help = "Flags overdue rentals and closes abandoned ones in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--flag-only', action='store_true',
+            help="Only flag overdue rentals, close none.",
+        )
+        parser.add_argument(
+            '--batch-size', type=int,
+            help="Number of rentals per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        flagged, closed = sweep_rentals(
+            batch_size=options['batch_size'],
+            close=not options['flag_only'],
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Closed {closed} abandoned rentals and flagged {flagged} "
+            f"overdue rentals in {elapsed:.2f}s."
+        ))
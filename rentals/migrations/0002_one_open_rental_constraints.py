@@ -0,0 +1,49 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:12
+
+from django.db import migrations, models
+
+
+def close_duplicate_open_rentals(apps, schema_editor):
+    """
+    Closes the open rentals the new constraints would reject.
+
+    Per rider and per bike the newest open rental stays open; an older
+    one is closed when the newer one started and left without a cost,
+    to be priced by hand in the admin (finished rentals with no cost).
+    """
+    Rental = apps.get_model('rentals', 'Rental')
+    open_rentals = Rental.objects.filter(end_time__isnull=True).order_by(
+        '-start_time', '-id'
+    ).values_list('id', 'user_id', 'bike_id', 'start_time')
+    # {user id or bike id: start time of its newest open rental}.
+    users, bikes = {}, {}
+    for rental_id, user_id, bike_id, start_time in open_rentals:
+        newer = [
+            started for started in (users.get(user_id), bikes.get(bike_id))
+            if started is not None
+        ]
+        if newer:
+            Rental.objects.filter(pk=rental_id).update(end_time=min(newer))
+            continue
+        users[user_id] = bikes[bike_id] = start_time
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentals', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            close_duplicate_open_rentals, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='rental',
+            constraint=models.UniqueConstraint(condition=models.Q(('end_time__isnull', True)), fields=('user',), name='one_open_rental_per_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='rental',
+            constraint=models.UniqueConstraint(condition=models.Q(('end_time__isnull', True)), fields=('bike',), name='one_open_rental_per_bike'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def add_exclusion_constraint(apps, schema_editor):
+    """
+    Rejects overlapping reservations of a bike on PostgreSQL.
+
+    The GiST index behind the constraint also serves the
+    `Reservation.objects.overlapping()` queries. btree_gist is needed
+    for the `bike_id WITH =` part. Other databases rely on the
+    overlap check in `Reservation.book`.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    schema_editor.execute(
+        'ALTER TABLE rentals_reservation '
+        'ADD CONSTRAINT reservation_no_overlap EXCLUDE USING gist '
+        "(bike_id WITH =, tstzrange(start_time, end_time, '[)') WITH &&)"
+    )
+
+
+def remove_exclusion_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'ALTER TABLE rentals_reservation '
+        'DROP CONSTRAINT IF EXISTS reservation_no_overlap'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bikes', '0005_bike_list_sort_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('rentals', '0002_one_open_rental_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_time', models.DateTimeField()),
+                ('end_time', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('bike', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='bikes.bike')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['start_time'],
+                'indexes': [models.Index(fields=['bike', 'end_time', 'start_time'], name='reservation_bike_period_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='reservation',
+            constraint=models.CheckConstraint(check=models.Q(('end_time__gt', models.F('start_time'))), name='reservation_ends_after_start'),
+        ),
+        migrations.RunPython(
+            add_exclusion_constraint, remove_exclusion_constraint
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bikes', '0006_bike_card_version'),
+        ('rentals', '0004_rental_user_start_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tariff',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('bike_type', models.CharField(blank=True, max_length=50)),
+                ('valid_from', models.DateTimeField()),
+                ('multiplier', models.DecimalField(decimal_places=2, default=1, max_digits=5)),
+                ('hourly_cap', models.DecimalField(blank=True, decimal_places=2, max_digits=8, null=True)),
+                ('daily_rate', models.DecimalField(blank=True, decimal_places=2, max_digits=8, null=True)),
+            ],
+            options={
+                'ordering': ['bike_type', 'valid_from'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BikePrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price_per_hour', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('valid_from', models.DateTimeField()),
+                ('bike', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_history', to='bikes.bike')),
+            ],
+            options={
+                'ordering': ['bike', 'valid_from'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='bikeprice',
+            constraint=models.UniqueConstraint(fields=('bike', 'valid_from'), name='one_bike_price_per_moment'),
+        ),
+    ]
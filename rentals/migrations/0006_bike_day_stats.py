@@ -0,0 +1,33 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bikes', '0006_bike_card_version'),
+        ('rentals', '0005_tariffs_and_price_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BikeDayStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('rides', models.PositiveIntegerField(default=0)),
+                ('rented_minutes', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('bike', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='day_stats', to='bikes.bike')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'bike'], name='bike_day_stats_day_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='bikedaystats',
+            constraint=models.UniqueConstraint(fields=('bike', 'day'), name='one_stats_row_per_bike_day'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentals', '0006_bike_day_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(fields=['-start_time', '-id'], name='rental_start_idx'),
+        ),
+    ]
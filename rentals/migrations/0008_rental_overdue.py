@@ -0,0 +1,22 @@
+# Generated by Django 4.2.23 on 2026-10-18 09:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentals', '0007_rental_start_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rental',
+            name='overdue_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(condition=models.Q(('end_time__isnull', True)), fields=['start_time', 'id'], name='rental_open_start_idx'),
+        ),
+    ]
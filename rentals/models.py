@@ -1,7 +1,10 @@
-from django.db import models
+from django.db import connections, models, transaction
 from django.contrib.auth.models import User
+from django.utils import timezone
 # Import Bike model from bikes app
 from bikes.models import Bike
+# The catalog only lists available bikes, invalidate it on changes.
+from bikes.cache import invalidate_catalog
 
 
 # Track each individual rental transaction.
@@ -15,6 +18,8 @@ class Rental(models.Model):
     - `start_time`: The timestamp when the rental period begins.
     - `end_time`: The timestamp when the rental period ends.
     - `total_cost`: The total cost of the rental.
+    - `overdue_at`: When the sweeper found the rental still open past
+    `settings.RENTAL_OVERDUE_HOURS` (see `rentals.sweeper`).
     """
     # Many-to-one link to the User model. A user can have many rentals.
     user = models.ForeignKey(
@@ -33,9 +38,357 @@ class Rental(models.Model):
     total_cost = models.DecimalField(
         max_digits=8, decimal_places=2, null=True, blank=True
         )
+    # Set by the sweeper on rentals left open for too long.
+    overdue_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # A rental is open while end_time is null. The partial unique
+        # constraints let the database reject a second open rental for
+        # the same user or bike, even under concurrent requests.
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user'],
+                condition=models.Q(end_time__isnull=True),
+                name='one_open_rental_per_user',
+            ),
+            models.UniqueConstraint(
+                fields=['bike'],
+                condition=models.Q(end_time__isnull=True),
+                name='one_open_rental_per_bike',
+            ),
+        ]
+        indexes = [
+            # A user's rentals, newest first (API cursor pagination).
+            models.Index(
+                fields=['user', '-start_time', '-id'],
+                name='rental_user_start_idx',
+            ),
+            # All rentals, newest first (admin ordering, date hierarchy).
+            models.Index(
+                fields=['-start_time', '-id'], name='rental_start_idx',
+            ),
+            # The open rentals, oldest first (the overdue sweeper).
+            # Only the few open rows are indexed.
+            models.Index(
+                fields=['start_time', 'id'], name='rental_open_start_idx',
+                condition=models.Q(end_time__isnull=True),
+            ),
+        ]
+
+    @classmethod
+    def claim(cls, user, bike):
+        """
+        Rents a bike to a user in one transaction, safe under concurrency.
+
+        The bike is claimed with a conditional
+        `UPDATE ... SET is_available = false WHERE is_available`,
+        so only one of several concurrent requests can match the row.
+        The same statement skips bikes reserved by another user for
+        the current time.
+        The rental insert then relies on the `one_open_rental_per_user`
+        constraint; if it fails the bike claim is rolled back too.
+
+        **Args:**
+        - `user`: The user renting the bike.
+        - `bike`: The bike to rent.
+
+        **Returns:**
+        - The new `Rental`, or None if the bike is not available
+        or is reserved by someone else right now.
+
+        **Raises:**
+        - `IntegrityError`: If the user already has an open rental.
+        """
+        now = timezone.now()
+        # Another user's reservation running right now also blocks the bike.
+        reserved_now = Reservation.objects.active_at(now).filter(
+            bike=models.OuterRef('pk')
+        ).exclude(user=user)
+        with transaction.atomic():
+            claimed = Bike.objects.filter(
+                pk=bike.pk, is_available=True
+            ).exclude(models.Exists(reserved_now)).update(is_available=False)
+            if not claimed:
+                return None
+            rental = cls.objects.create(user=user, bike=bike)
+            # The cached detail page is kept: anonymous visitors
+            # are not shown whether a bike is available.
+            invalidate_catalog()
+            return rental
+
+    def finish(self, end_time, total_cost):
+        """
+        Closes the rental if it is still open, safe under concurrency.
+
+        One conditional `UPDATE ... WHERE end_time IS NULL`: of several
+        concurrent returns of the same rental (a double click, or the
+        rider and the overdue sweeper), only one matches the row, and
+        only that one must count the ride in the statistics. Call it
+        inside the transaction that counts it.
+
+        **Args:**
+        - `end_time`: When the rental ends.
+        - `total_cost`: Its final cost.
+
+        **Returns:**
+        - True if this call closed the rental, False if it was already
+        closed.
+        """
+        closed = Rental.objects.filter(
+            pk=self.pk, end_time__isnull=True
+        ).update(end_time=end_time, total_cost=total_cost)
+        if closed:
+            self.end_time = end_time
+            self.total_cost = total_cost
+        return bool(closed)
 
     def __str__(self):
         """
         Returns the string representation of the Rental model.
         """
-        return f"Rental {self.id} by {self.user.username}"
+        return f"Rental {self.id} by user {self.user_id}"
+
+
+class ReservationQuerySet(models.QuerySet):
+    """
+    Time interval queries for reservations.
+    """
+    def overlapping(self, start, end):
+        """
+        Returns reservations that overlap the period from start to end.
+
+        Periods are half-open (`[start, end)`), so a reservation ending
+        at 10:00 does not overlap one starting at 10:00. On PostgreSQL
+        the query uses the same `tstzrange` expression as the exclusion
+        constraint, so its GiST index answers it. Other databases use
+        the `(bike, end_time, start_time)` index.
+        """
+        if connections[self.db].vendor == 'postgresql':
+            from django.contrib.postgres.fields import (
+                DateTimeRangeField, RangeBoundary,
+            )
+            period = models.Func(
+                models.F('start_time'), models.F('end_time'),
+                RangeBoundary(), function='TSTZRANGE',
+                output_field=DateTimeRangeField(),
+            )
+            return self.annotate(period=period).filter(
+                period__overlap=(start, end)
+            )
+        return self.filter(start_time__lt=end, end_time__gt=start)
+
+    def active_at(self, moment):
+        """
+        Returns reservations whose period includes the given moment.
+        """
+        return self.filter(start_time__lte=moment, end_time__gt=moment)
+
+
+# Books a bike for a future time slot.
+class Reservation(models.Model):
+    """
+    Represents a booking of a bike for a future period.
+
+    **Fields:**
+    - `user`: A foreign key to the `User` who made the reservation.
+    - `bike`: A foreign key to the reserved `Bike`.
+    - `start_time`: When the reserved period begins.
+    - `end_time`: When the reserved period ends (exclusive).
+    - `created_at`: The timestamp when the reservation was made.
+
+    **Constraints:**
+    - The period must end after it starts.
+    - On PostgreSQL an exclusion constraint (added in the migration)
+    rejects overlapping reservations of the same bike.
+    """
+    # Many-to-one link to the User who booked the bike.
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="reservations"
+        )
+    # Many-to-one link to the reserved Bike.
+    bike = models.ForeignKey(
+        Bike, on_delete=models.CASCADE, related_name="reservations"
+        )
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ReservationQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['start_time']
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(end_time__gt=models.F('start_time')),
+                name='reservation_ends_after_start',
+            ),
+        ]
+        indexes = [
+            # Overlap lookups per bike: 'end_time > start' skips the
+            # reservations in the past, 'start_time < end' is checked
+            # inside the index.
+            models.Index(
+                fields=['bike', 'end_time', 'start_time'],
+                name='reservation_bike_period_idx',
+            ),
+        ]
+
+    @classmethod
+    def book(cls, user, bike, start_time, end_time):
+        """
+        Reserves a bike for a period if nobody else has booked it.
+
+        **Args:**
+        - `user`: The user making the reservation.
+        - `bike`: The bike to reserve.
+        - `start_time`, `end_time`: The period to reserve.
+
+        **Returns:**
+        - The new `Reservation`, or None if the period is taken.
+
+        **Raises:**
+        - `IntegrityError`: If a concurrent booking of the same period
+        won the race (PostgreSQL exclusion constraint).
+        """
+        with transaction.atomic():
+            # Lock the bike row so concurrent bookings of the same bike
+            # run one after the other (a no-op on SQLite, where writes
+            # are serialized anyway).
+            Bike.objects.select_for_update().filter(pk=bike.pk).exists()
+            taken = cls.objects.overlapping(start_time, end_time).filter(
+                bike=bike
+            ).exists()
+            if taken:
+                return None
+            return cls.objects.create(
+                user=user, bike=bike,
+                start_time=start_time, end_time=end_time,
+            )
+
+    def __str__(self):
+        """
+        Returns the string representation of the Reservation model.
+        """
+        return f"Reservation {self.id} of bike {self.bike_id}"
+
+
+# Pricing rules applied when a rental is billed (see rentals/pricing.py).
+class Tariff(models.Model):
+    """
+    Represents the pricing rules for a type of bike from a given date.
+
+    **Fields:**
+    - `name`: A label shown in the admin.
+    - `bike_type`: The bike type the tariff applies to, blank for
+    every type without a tariff of its own.
+    - `valid_from`: When the tariff starts to apply. Rentals are billed
+    with the tariff in force when they started.
+    - `multiplier`: Factor applied to the bike's hourly price.
+    - `hourly_cap`: The most charged in hourly fees for part of a day,
+    blank for no cap.
+    - `daily_rate`: The price of each full 24 hours, blank to charge
+    24 hourly fees.
+    """
+    name = models.CharField(max_length=100)
+    bike_type = models.CharField(max_length=50, blank=True)
+    valid_from = models.DateTimeField()
+    multiplier = models.DecimalField(
+        max_digits=5, decimal_places=2, default=1
+        )
+    hourly_cap = models.DecimalField(
+        max_digits=8, decimal_places=2, null=True, blank=True
+        )
+    daily_rate = models.DecimalField(
+        max_digits=8, decimal_places=2, null=True, blank=True
+        )
+
+    class Meta:
+        ordering = ['bike_type', 'valid_from']
+
+    def __str__(self):
+        """
+        Returns the string representation of the Tariff model.
+        """
+        return f"{self.name} ({self.bike_type or 'all types'})"
+
+
+# Scheduled and past hourly prices of a bike.
+class BikePrice(models.Model):
+    """
+    Represents the hourly price of a bike from a given date.
+
+    Rentals are billed with the price in force when they started.
+    A row is added whenever a bike's `price_per_hour` changes (see
+    `rentals.pricing.record_price_changes`); without an entry for
+    that time, the bike's current `price_per_hour` is used.
+
+    **Fields:**
+    - `bike`: A foreign key to the `Bike` the price belongs to.
+    - `price_per_hour`: The hourly price.
+    - `valid_from`: When the price starts to apply.
+    """
+    bike = models.ForeignKey(
+        Bike, on_delete=models.CASCADE, related_name="price_history"
+        )
+    price_per_hour = models.DecimalField(max_digits=6, decimal_places=2)
+    valid_from = models.DateTimeField()
+
+    class Meta:
+        ordering = ['bike', 'valid_from']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['bike', 'valid_from'],
+                name='one_bike_price_per_moment',
+            ),
+        ]
+
+    def __str__(self):
+        """
+        Returns the string representation of the BikePrice model.
+        """
+        return f"€{self.price_per_hour}/hour for bike {self.bike_id}"
+
+
+# Daily usage of each bike, kept up to date by return_bike.
+class BikeDayStats(models.Model):
+    """
+    Represents the usage of one bike on one day (a rollup of rentals).
+
+    Reports read these rows instead of scanning the rentals. They are
+    updated when a bike is returned (see rentals/rollups.py) and can be
+    rebuilt with the `rebuild_rollups` command.
+
+    **Fields:**
+    - `bike`: A foreign key to the `Bike`.
+    - `day`: The day (in the site's time zone).
+    - `rides`: The number of rentals returned that day.
+    - `rented_minutes`: The minutes of that day the bike was rented
+    (a rental over midnight counts on both days).
+    - `revenue`: The cost of the rentals returned that day.
+    """
+    bike = models.ForeignKey(
+        Bike, on_delete=models.CASCADE, related_name="day_stats"
+        )
+    day = models.DateField()
+    rides = models.PositiveIntegerField(default=0)
+    rented_minutes = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['bike', 'day'], name='one_stats_row_per_bike_day',
+            ),
+        ]
+        indexes = [
+            # The dashboard reads a range of days for all bikes.
+            models.Index(
+                fields=['day', 'bike'], name='bike_day_stats_day_idx',
+            ),
+        ]
+
+    def __str__(self):
+        """
+        Returns the string representation of the BikeDayStats model.
+        """
+        return f"Bike {self.bike_id} on {self.day}"
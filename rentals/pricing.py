@@ -0,0 +1,262 @@
+from bisect import bisect_right
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from profiles.models import Profile
+from .models import BikePrice, Rental, Tariff
+from .rollups import add_revenue_changes
+
+# Costs are rounded to the cent.
+CENT = Decimal('0.01')
+HOURS_PER_DAY = 24
+
+
+def billed_hours(start, end):
+    """
+    Returns the number of hours charged for a rental.
+
+    Every started hour is charged: 10 minutes cost one hour,
+    and 1 hour 10 minutes cost two.
+    """
+    return int((end - start).total_seconds() // 3600) + 1
+
+
+def charge(hours, hourly_price, tariff=None):
+    """
+    Returns the cost of renting a bike for a number of hours.
+
+    **Args:**
+    - `hours`: The billed hours (see `billed_hours`).
+    - `hourly_price`: The bike's hourly price.
+    - `tariff`: The `Tariff` to apply, or None for plain hourly billing.
+
+    **Returns:**
+    - The cost, a `Decimal` rounded to the cent.
+    """
+    if tariff is None:
+        return (hours * hourly_price).quantize(CENT, ROUND_HALF_UP)
+    hourly = hourly_price * tariff.multiplier
+    full_days, rest = divmod(hours, HOURS_PER_DAY)
+    day_price = (
+        tariff.daily_rate if tariff.daily_rate is not None
+        else hourly * HOURS_PER_DAY
+    )
+    # Hourly fees of the last, partial day never cost more than the cap,
+    # nor more than a full day.
+    rest_price = min(rest * hourly, day_price)
+    if tariff.hourly_cap is not None:
+        rest_price = min(rest_price, tariff.hourly_cap)
+    return (full_days * day_price + rest_price).quantize(CENT, ROUND_HALF_UP)
+
+
+def latest(timeline, moment):
+    """
+    Returns the value in force at `moment` from a `(dates, values)`
+    timeline sorted by date, or None if it starts later.
+    """
+    if timeline is None:
+        return None
+    dates, values = timeline
+    position = bisect_right(dates, moment)
+    return values[position - 1] if position else None
+
+
+def timelines(pairs):
+    """
+    Groups `(key, valid_from, value)` rows, sorted by date, into
+    `{key: (dates, values)}` timelines for `latest`.
+    """
+    grouped = defaultdict(lambda: ([], []))
+    for key, valid_from, value in pairs:
+        dates, values = grouped[key]
+        dates.append(valid_from)
+        values.append(value)
+    return dict(grouped)
+
+
+class PriceBook:
+    """
+    The tariffs and price history needed to price a set of rentals.
+
+    Everything is loaded up front (one query for the tariffs, one for
+    the prices of the bikes involved), then each rental is priced in
+    memory with a binary search in its timelines. Single rentals and
+    batches go through the same code, so they always agree.
+    """
+    def __init__(self, tariffs, prices):
+        self.tariffs = tariffs
+        self.prices = prices
+
+    @classmethod
+    def load(cls, bike_ids, tariffs=None):
+        """
+        Loads the price history of the given bikes.
+
+        **Args:**
+        - `bike_ids`: The IDs of the bikes that will be priced.
+        - `tariffs`: The tariff timelines from `load_tariffs`,
+        to reuse them between batches.
+        """
+        if tariffs is None:
+            tariffs = cls.load_tariffs()
+        prices = timelines(
+            BikePrice.objects.filter(bike_id__in=set(bike_ids))
+            .order_by('bike_id', 'valid_from')
+            .values_list('bike_id', 'valid_from', 'price_per_hour')
+        )
+        return cls(tariffs, prices)
+
+    @staticmethod
+    def load_tariffs():
+        """
+        Returns the timelines of all tariffs, keyed by bike type.
+        """
+        return timelines(
+            (tariff.bike_type, tariff.valid_from, tariff)
+            for tariff in Tariff.objects.order_by('bike_type', 'valid_from')
+        )
+
+    def tariff_at(self, bike_type, moment):
+        """
+        Returns the tariff for a bike type at a moment, if any.
+        """
+        tariff = latest(self.tariffs.get(bike_type), moment)
+        if tariff is None:
+            tariff = latest(self.tariffs.get(''), moment)
+        return tariff
+
+    def hourly_price_at(self, bike, moment):
+        """
+        Returns a bike's hourly price at a moment.
+        """
+        price = latest(self.prices.get(bike.pk), moment)
+        return bike.price_per_hour if price is None else price
+
+    def price(self, bike, start, end):
+        """
+        Returns the cost of renting `bike` from `start` to `end`.
+        """
+        return charge(
+            billed_hours(start, end),
+            self.hourly_price_at(bike, start),
+            self.tariff_at(bike.type, start),
+        )
+
+
+def price_rental(rental, end_time=None):
+    """
+    Returns the cost of one rental, as `return_bike` charges it.
+
+    **Args:**
+    - `rental`: The `Rental`, with its bike.
+    - `end_time`: The end of the rental, defaults to `rental.end_time`.
+    """
+    book = PriceBook.load([rental.bike_id])
+    return book.price(
+        rental.bike, rental.start_time, end_time or rental.end_time
+    )
+
+
+def record_price_changes(changes, now=None):
+    """
+    Adds the `BikePrice` rows of bikes whose hourly price changed, so
+    the rentals already started keep the price they started with.
+
+    A bike without a price history was billed with its old
+    `price_per_hour`: that price is first recorded from the start of
+    its first rental. Costs three queries whatever the number of bikes.
+
+    **Args:**
+    - `changes`: `{bike id: (old price, new price)}`; equal prices
+    are ignored.
+    - `now`: When the new prices apply, defaults to now.
+    """
+    changes = {
+        bike_id: prices for bike_id, prices in changes.items()
+        if prices[0] != prices[1]
+    }
+    if not changes:
+        return
+    now = now or timezone.now()
+    with_history = set(
+        BikePrice.objects.filter(bike_id__in=changes)
+        .values_list('bike_id', flat=True).distinct()
+    )
+    first_rentals = dict(
+        Rental.objects.filter(bike_id__in=changes.keys() - with_history)
+        .order_by().values('bike_id').annotate(first=Min('start_time'))
+        .values_list('bike_id', 'first')
+    )
+    prices = [
+        BikePrice(
+            bike_id=bike_id, price_per_hour=changes[bike_id][0],
+            valid_from=started,
+        )
+        for bike_id, started in first_rentals.items() if started < now
+    ]
+    prices += [
+        BikePrice(bike_id=bike_id, price_per_hour=new, valid_from=now)
+        for bike_id, (_, new) in changes.items()
+    ]
+    BikePrice.objects.bulk_create(prices)
+
+
+def reprice_rentals(queryset, batch_size=1000):
+    """
+    Recomputes the cost of finished rentals with the current tariffs.
+
+    Rentals are read in batches by ID. Each batch costs five queries
+    (rentals with their bikes, price history, then the rentals, the
+    daily revenue and the riders' spending updated) whatever its size.
+    Only rentals whose cost changed are written, with one
+    `bulk_update` per batch; the cost changes are added to the
+    `BikeDayStats` revenue and `Profile.total_spent` in the same
+    transaction, so reports and profiles agree with the invoices.
+
+    **Args:**
+    - `queryset`: The rentals to price; open rentals are skipped.
+    - `batch_size`: The number of rentals priced at a time.
+
+    **Returns:**
+    - A `(priced, changed)` tuple of rental counts.
+    """
+    rentals = queryset.filter(end_time__isnull=False).select_related(
+        'bike'
+    ).only(
+        'user', 'start_time', 'end_time', 'total_cost',
+        'bike__type', 'bike__price_per_hour',
+    ).order_by('id')
+    tariffs = PriceBook.load_tariffs()
+    priced = changed = 0
+    last_id = 0
+    while True:
+        batch = list(rentals.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            break
+        last_id = batch[-1].id
+        book = PriceBook.load(
+            [rental.bike_id for rental in batch], tariffs=tariffs
+        )
+        updated = []
+        revenue = defaultdict(Decimal)
+        spending = defaultdict(Decimal)
+        for rental in batch:
+            cost = book.price(rental.bike, rental.start_time, rental.end_time)
+            if cost != rental.total_cost:
+                change = cost - (rental.total_cost or Decimal(0))
+                day = timezone.localtime(rental.end_time).date()
+                revenue[rental.bike_id, day] += change
+                spending[rental.user_id] += change
+                rental.total_cost = cost
+                updated.append(rental)
+        with transaction.atomic():
+            Rental.objects.bulk_update(updated, ['total_cost'])
+            add_revenue_changes(revenue)
+            Profile.add_spending(spending)
+        priced += len(batch)
+        changed += len(updated)
+    return priced, changed
@@ -0,0 +1,196 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, DecimalField, F, Value, When
+from django.utils import timezone
+
+from .models import BikeDayStats, Rental
+
+
+def midnight(day):
+    """
+    Returns the aware datetime at which a day starts.
+    """
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def day_segments(start, end):
+    """
+    Splits a period at midnight (in the site's time zone).
+
+    **Args:**
+    - `start`, `end`: The aware datetimes of the period.
+
+    **Returns:**
+    - A list of `(day, minutes)` pairs, one per day the period covers,
+    with the whole minutes of that day inside the period.
+    """
+    segments = []
+    day = timezone.localtime(start).date()
+    while True:
+        day_start = midnight(day)
+        day_end = midnight(day + timedelta(days=1))
+        seconds = (min(end, day_end) - max(start, day_start)).total_seconds()
+        segments.append((day, round(seconds / 60)))
+        if end <= day_end:
+            return segments
+        day += timedelta(days=1)
+
+
+def rollup_changes(rental, day_from=None, day_to=None):
+    """
+    Returns what a finished rental adds to the daily rollups.
+
+    The ride and its cost count on the day the bike was returned,
+    the rented minutes on every day the rental covers.
+
+    **Args:**
+    - `rental`: A finished `Rental`.
+    - `day_from`, `day_to`: Only return the days in this range.
+
+    **Returns:**
+    - A dict mapping each day to a `[rides, minutes, revenue]` list.
+    """
+    changes = {}
+    for day, minutes in day_segments(rental.start_time, rental.end_time):
+        changes[day] = [0, minutes, Decimal(0)]
+    end_day = timezone.localtime(rental.end_time).date()
+    changes[end_day][0] = 1
+    changes[end_day][2] = rental.total_cost or Decimal(0)
+    return {
+        day: values for day, values in changes.items()
+        if (day_from is None or day >= day_from)
+        and (day_to is None or day <= day_to)
+    }
+
+
+def record_rental(rental):
+    """
+    Adds a returned rental to the daily rollups of its bike.
+
+    Each day is one `UPDATE ... SET rides = rides + 1 ...`, so concurrent
+    returns of the same bike cannot lose an update. The row is created
+    on the first return of the day.
+    """
+    for day, (rides, minutes, revenue) in rollup_changes(rental).items():
+        increments = {
+            'rides': F('rides') + rides,
+            'rented_minutes': F('rented_minutes') + minutes,
+            'revenue': F('revenue') + revenue,
+        }
+        rows = BikeDayStats.objects.filter(bike_id=rental.bike_id, day=day)
+        if rows.update(**increments):
+            continue
+        try:
+            with transaction.atomic():
+                BikeDayStats.objects.create(
+                    bike_id=rental.bike_id, day=day, rides=rides,
+                    rented_minutes=minutes, revenue=revenue,
+                )
+        except IntegrityError:
+            # Another return created the row first, add to it.
+            rows.update(**increments)
+
+
+def add_revenue_changes(changes):
+    """
+    Adds cost changes of finished rentals to the daily revenue, with
+    one `UPDATE ... SET revenue = revenue + CASE ...` (safe under
+    concurrent returns).
+
+    **Args:**
+    - `changes`: A dict mapping `(bike_id, day)` to the amount added,
+    the day being the one the rental was returned (see
+    `rollup_changes`). Days without a rollup row are left to
+    `rebuild_rollups`.
+    """
+    changes = {key: amount for key, amount in changes.items() if amount}
+    if not changes:
+        return
+    amount = Case(
+        *(
+            When(bike_id=bike_id, day=day, then=Value(amount))
+            for (bike_id, day), amount in changes.items()
+        ),
+        default=Value(Decimal(0)), output_field=DecimalField(),
+    )
+    BikeDayStats.objects.filter(
+        bike_id__in={bike_id for bike_id, _ in changes},
+        day__in={day for _, day in changes},
+    ).update(revenue=F('revenue') + amount)
+
+
+def rebuild_rollups(day_from, day_to, chunk_size=5000, window_days=31):
+    """
+    Recomputes the daily rollups of a range of days from the rentals.
+
+    The range is processed in windows of `window_days` days, so memory
+    holds at most one window of rollup rows. See `rebuild_window`.
+
+    **Args:**
+    - `day_from`, `day_to`: The first and last day to rebuild.
+    - `chunk_size`: The number of rentals read at a time.
+    - `window_days`: The number of days rebuilt in each pass.
+
+    **Returns:**
+    - The numbers of rentals read and of rollup rows written.
+    """
+    read = written = 0
+    while day_from <= day_to:
+        window_end = min(day_to, day_from + timedelta(days=window_days - 1))
+        window_read, window_written = rebuild_window(
+            day_from, window_end, chunk_size
+        )
+        read += window_read
+        written += window_written
+        day_from = window_end + timedelta(days=1)
+    return read, written
+
+
+def rebuild_window(day_from, day_to, chunk_size):
+    """
+    Recomputes the daily rollups of a few days from the rentals.
+
+    Finished rentals overlapping the days are read in chunks by ID,
+    and only their contribution to those days is counted. The old
+    rows of the days are replaced in one transaction.
+
+    **Returns:**
+    - The numbers of rentals read and of rollup rows written.
+    """
+    range_start = midnight(day_from)
+    range_end = midnight(day_to + timedelta(days=1))
+    rentals = Rental.objects.filter(
+        end_time__isnull=False,
+        start_time__lt=range_end, end_time__gte=range_start,
+    ).only('bike_id', 'start_time', 'end_time', 'total_cost').order_by('id')
+
+    totals = defaultdict(lambda: [0, 0, Decimal(0)])
+    read = 0
+    last_id = 0
+    while True:
+        chunk = list(rentals.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+        read += len(chunk)
+        for rental in chunk:
+            changes = rollup_changes(rental, day_from, day_to)
+            for day, values in changes.items():
+                total = totals[rental.bike_id, day]
+                for index, value in enumerate(values):
+                    total[index] += value
+
+    rows = [
+        BikeDayStats(
+            bike_id=bike_id, day=day, rides=rides,
+            rented_minutes=minutes, revenue=revenue,
+        )
+        for (bike_id, day), (rides, minutes, revenue) in totals.items()
+    ]
+    with transaction.atomic():
+        BikeDayStats.objects.filter(day__range=(day_from, day_to)).delete()
+        BikeDayStats.objects.bulk_create(rows, batch_size=chunk_size)
+    return read, len(rows)
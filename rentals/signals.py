@@ -0,0 +1,74 @@
+# Import the necessary modules
+from django.db.models.signals import post_save, post_delete
+# Decorator to receive the signal
+from django.dispatch import receiver
+# Sender models
+from bikes.models import Bike
+from bikes.signals import bike_prices_changed
+from .models import Reservation
+from .pricing import record_price_changes
+# Page cache invalidation
+from bikes.cache import invalidate_bike_page
+
+
+# Run this function after a reservation is saved or deleted.
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+def invalidate_bike_page_on_change(sender, instance, **kwargs):
+    """
+    Purges the cached detail page of the bike, which lists its
+    upcoming reservations.
+
+    **Args:**
+    - `sender`: The model class that sent the signal (Reservation).
+    - `instance`: The actual instance being saved or deleted.
+    - `**kwargs`: Wildcard keyword arguments.
+    """
+    invalidate_bike_page(instance.bike_id)
+
+
+# Run this function after a bike is saved.
+@receiver(post_save, sender=Bike)
+def record_price_change(sender, instance, created, update_fields=None,
+                        raw=False, **kwargs):
+    """
+    Records a `BikePrice` when the admin (or any save) changes a
+    bike's hourly price, see `rentals.pricing.record_price_changes`.
+
+    The old price is the one the bike was loaded with (see
+    `Bike.from_db`), so the check adds no query to the save.
+
+    **Args:**
+    - `sender`: The model class that sent the signal (Bike).
+    - `instance`: The bike that was saved.
+    - `created`: A boolean; True if a new record was created.
+    - `update_fields`: The fields saved, or None for all of them.
+    - `raw`: A boolean; True when loading fixtures.
+    - `**kwargs`: Wildcard keyword arguments.
+    """
+    if raw or (
+        update_fields is not None and 'price_per_hour' not in update_fields
+    ):
+        return
+    price = Bike._meta.get_field('price_per_hour').to_python(
+        instance.price_per_hour
+    )
+    loaded_price = getattr(instance, '_loaded_price', None)
+    if not created and loaded_price is not None:
+        record_price_changes({instance.pk: (loaded_price, price)})
+    # Later saves of the same instance compare against this price.
+    instance._loaded_price = price
+
+
+# Run this function when bikes are repriced without a save.
+@receiver(bike_prices_changed)
+def record_bulk_price_changes(sender, changes, **kwargs):
+    """
+    Records the `BikePrice` rows of bikes repriced by a bulk write.
+
+    **Args:**
+    - `sender`: The model class that sent the signal (Bike).
+    - `changes`: `{bike id: (old price, new price)}`.
+    - `**kwargs`: Wildcard keyword arguments.
+    """
+    record_price_changes(changes)
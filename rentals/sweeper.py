@@ -0,0 +1,118 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from bikes.cache import invalidate_catalog
+from bikes.models import Bike
+from profiles.models import Profile
+from .models import Rental
+from .pricing import PriceBook
+from .rollups import record_rental
+
+
+def open_rentals_before(cutoff):
+    """
+    Returns the open rentals started before `cutoff`, oldest first,
+    read through the `rental_open_start_idx` partial index.
+    """
+    return Rental.objects.filter(
+        end_time__isnull=True, start_time__lt=cutoff
+    ).order_by('start_time', 'id')
+
+
+def flag_overdue_rentals(now, batch_size):
+    """
+    Marks the open rentals older than `settings.RENTAL_OVERDUE_HOURS`
+    as overdue, one UPDATE per batch.
+
+    **Returns:**
+    - The number of rentals flagged.
+    """
+    cutoff = now - timedelta(hours=settings.RENTAL_OVERDUE_HOURS)
+    overdue = open_rentals_before(cutoff).filter(overdue_at__isnull=True)
+    flagged = 0
+    while True:
+        ids = list(overdue.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return flagged
+        flagged += Rental.objects.filter(
+            id__in=ids, overdue_at__isnull=True
+        ).update(overdue_at=now)
+
+
+def close_abandoned_rentals(now, batch_size):
+    """
+    Returns the bikes of the rentals open for longer than
+    `settings.RENTAL_CLOSE_HOURS`, as if the riders returned them now.
+
+    Each batch is one transaction. The rentals are priced by the
+    `PriceBook` like `return_bike`, and each one is closed with the
+    same conditional UPDATE as a return (`Rental.finish`): a rental a
+    rider returned meanwhile is skipped, and its ride is not counted
+    twice. The bikes of the closed rentals are released with one
+    UPDATE. The daily rollups and rider statistics are incremented per
+    closed rental, as on a return.
+
+    **Returns:**
+    - The number of rentals closed.
+    """
+    cutoff = now - timedelta(hours=settings.RENTAL_CLOSE_HOURS)
+    abandoned = open_rentals_before(cutoff).select_related('bike')
+    tariffs = PriceBook.load_tariffs()
+    closed = 0
+    while True:
+        with transaction.atomic():
+            # On PostgreSQL, rows locked by another sweep are skipped.
+            batch = list(abandoned.select_for_update(
+                skip_locked=True, of=('self',)
+            )[:batch_size])
+            if not batch:
+                return closed
+            book = PriceBook.load(
+                [rental.bike_id for rental in batch], tariffs=tariffs
+            )
+            finished = []
+            for rental in batch:
+                cost = book.price(rental.bike, rental.start_time, now)
+                if rental.finish(now, cost):
+                    finished.append(rental)
+            if not finished:
+                continue
+            Rental.objects.filter(
+                pk__in=[rental.pk for rental in finished],
+                overdue_at__isnull=True,
+            ).update(overdue_at=now)
+            # The bikes' cards show their availability, re-render them.
+            Bike.objects.filter(
+                pk__in=[rental.bike_id for rental in finished]
+            ).update(is_available=True, card_version=F('card_version') + 1)
+            invalidate_catalog()
+            for rental in finished:
+                record_rental(rental)
+                Profile.record_ride(rental)
+        closed += len(finished)
+
+
+def sweep_rentals(now=None, batch_size=None, close=True):
+    """
+    Closes the abandoned rentals, then flags the overdue ones.
+
+    **Args:**
+    - `now`: The sweep time, defaults to now.
+    - `batch_size`: Rentals per batch, defaults to
+    `settings.RENTAL_SWEEP_BATCH_SIZE`.
+    - `close`: False to only flag, whatever
+    `settings.RENTAL_CLOSE_HOURS`.
+
+    **Returns:**
+    - A `(flagged, closed)` tuple of rental counts.
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or settings.RENTAL_SWEEP_BATCH_SIZE
+    closed = 0
+    if close and settings.RENTAL_CLOSE_HOURS:
+        closed = close_abandoned_rentals(now, batch_size)
+    return flag_overdue_rentals(now, batch_size), closed
@@ -1,8 +1,28 @@
-from django.test import TestCase, Client
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import (
+    TestCase, TransactionTestCase, Client, override_settings,
+)
 from django.contrib.auth.models import User
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from bikes.models import Bike
-from rentals.models import Rental
+from core.testing import QueryBudgetMixin
+from rentals.export import EXPORT_HEADER
+from rentals.models import (
+    BikeDayStats, BikePrice, Rental, Reservation, Tariff,
+)
+from rentals.pricing import (
+    PriceBook, billed_hours, price_rental, reprice_rentals,
+)
+from rentals.rollups import day_segments, rebuild_rollups
+from rentals.sweeper import sweep_rentals
+from profiles.models import Profile
 
 
 class CreateRentalViewTest(TestCase):
@@ -62,3 +82,952 @@ class CreateRentalViewTest(TestCase):
         self.assertRedirects(response, self.profile_url)
         # Only the initial rental should exist
         self.assertEqual(Rental.objects.count(), 1)
+        # The claimed bike is released again when the rental is rejected.
+        self.available_bike.refresh_from_db()
+        self.assertTrue(self.available_bike.is_available)
+
+    def test_unavailable_bike_cannot_be_rented(self):
+        """
+        Test that renting a bike that is not available is refused.
+        """
+        self.client.login(username='renter', password='password')
+        response = self.client.post(reverse(
+            'create_rental', kwargs={'bike_id': self.unavailable_bike.id}
+        ))
+
+        self.assertRedirects(response, reverse('home'))
+        self.assertFalse(Rental.objects.exists())
+
+    def test_database_rejects_second_open_rental(self):
+        """
+        Test the partial unique constraints on open rentals.
+        """
+        Rental.objects.create(user=self.user, bike=self.unavailable_bike)
+        other = User.objects.create_user(username='other', password='pw')
+        # Same user, another bike.
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Rental.objects.create(user=self.user, bike=self.available_bike)
+        # Same bike, another user.
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Rental.objects.create(user=other, bike=self.unavailable_bike)
+
+
+class ConcurrentClaimTest(TransactionTestCase):
+    """
+    Races several threads for the same bikes to prove claims are atomic.
+    """
+
+    def test_no_double_rentals_under_contention(self):
+        """
+        Test that no bike or user ever holds two open rentals.
+        """
+        out = StringIO()
+        call_command(
+            'benchmark_claims', threads=6, bikes=2, seconds=1, stdout=out
+        )
+        report = out.getvalue()
+        self.assertIn('double_rented_bikes=0 ', report)
+        self.assertIn('users_with_two_open_rentals=0', report)
+        self.assertNotIn('claims=0 ', report)
+        self.assertIn('claims_per_second=', report)
+        # The benchmark removes its users, bikes and rentals.
+        self.assertFalse(Rental.objects.exists())
+
+
+class RentalViewQueryBudgetTest(QueryBudgetMixin, TestCase):
+    """
+    Query budgets for the create_rental and return_bike views.
+    """
+
+    def setUp(self):
+        """
+        Set up a rider with a long rental history and a fleet of bikes.
+        """
+        self.user = User.objects.create_user(
+            username='regular', password='password'
+        )
+        self.bikes = [
+            Bike.objects.create(
+                name=f'Fleet Bike {number}', type='City',
+                price_per_hour=6.00,
+            )
+            for number in range(20)
+        ]
+        now = timezone.now()
+        for number in range(50):
+            rental = Rental.objects.create(
+                user=self.user, bike=self.bikes[number % 20]
+            )
+            Rental.objects.filter(pk=rental.pk).update(
+                start_time=now - timedelta(days=number + 1, hours=2),
+                end_time=now - timedelta(days=number + 1),
+                total_cost=12,
+            )
+        self.client.force_login(self.user)
+
+    def test_create_rental_budget(self):
+        """
+        Test renting a bike: session, user, bike, claim and insert.
+        """
+        url = reverse('create_rental', kwargs={'bike_id': self.bikes[0].id})
+        with self.assertQueryBudget(5):
+            self.client.post(url)
+
+    def test_return_bike_budget(self):
+        """
+        Test returning a bike: session, user, rental with its bike,
+        tariffs, price history, writes, the daily rollup (an update,
+        then an insert for the first ride of the day), the rider's
+        stats (locked, then updated) and the queued card warming job.
+        """
+        rental = Rental.objects.create(user=self.user, bike=self.bikes[1])
+        url = reverse('return_bike', kwargs={'rental_id': rental.id})
+        with self.assertQueryBudget(12):
+            self.client.post(url)
+
+
+class ReservationTest(TestCase):
+    """
+    Tests for advance reservations and their effect on renting and search.
+    """
+
+    def setUp(self):
+        """
+        Set up two users, two bikes and a period next Saturday-like day.
+        """
+        self.user = User.objects.create_user(
+            username='planner', password='password'
+        )
+        self.other = User.objects.create_user(
+            username='other', password='password'
+        )
+        self.bike = Bike.objects.create(
+            name='Bookable', type='City', price_per_hour=5.00
+        )
+        self.spare = Bike.objects.create(
+            name='Spare', type='City', price_per_hour=5.00
+        )
+        day = timezone.now().replace(
+            hour=0, minute=0, second=0, microsecond=0
+        ) + timedelta(days=3)
+        self.start = day + timedelta(hours=10)
+        self.end = day + timedelta(hours=14)
+        self.reserve_url = reverse(
+            'create_reservation', kwargs={'bike_id': self.bike.id}
+        )
+        self.client.login(username='planner', password='password')
+
+    def period(self, start, end):
+        """
+        Formats a period the way the datetime-local inputs send it.
+        """
+        return {
+            'start_time': start.strftime('%Y-%m-%dT%H:%M'),
+            'end_time': end.strftime('%Y-%m-%dT%H:%M'),
+        }
+
+    def test_user_can_reserve_free_period(self):
+        """
+        Test that booking a free period creates a reservation.
+        """
+        response = self.client.post(
+            self.reserve_url, self.period(self.start, self.end)
+        )
+        self.assertRedirects(response, reverse('profile'))
+        reservation = Reservation.objects.get()
+        self.assertEqual(reservation.user, self.user)
+        self.assertEqual(reservation.start_time, self.start)
+
+    def test_overlapping_period_is_refused(self):
+        """
+        Test that a period overlapping another reservation is refused,
+        while a period starting when the other one ends is accepted.
+        """
+        Reservation.objects.create(
+            user=self.other, bike=self.bike,
+            start_time=self.start, end_time=self.end,
+        )
+        self.client.post(self.reserve_url, self.period(
+            self.start + timedelta(hours=3), self.end + timedelta(hours=2)
+        ))
+        self.assertEqual(Reservation.objects.count(), 1)
+
+        self.client.post(self.reserve_url, self.period(
+            self.end, self.end + timedelta(hours=2)
+        ))
+        self.assertEqual(Reservation.objects.count(), 2)
+
+    def test_invalid_period_is_refused(self):
+        """
+        Test that a period ending before it starts is refused.
+        """
+        response = self.client.post(
+            self.reserve_url, self.period(self.end, self.start)
+        )
+        self.assertRedirects(
+            response, reverse('bike_detail', kwargs={'pk': self.bike.pk})
+        )
+        self.assertFalse(Reservation.objects.exists())
+
+    def test_bike_list_hides_bikes_reserved_during_period(self):
+        """
+        Test the availability filter of the bike list.
+        """
+        Reservation.objects.create(
+            user=self.other, bike=self.bike,
+            start_time=self.start, end_time=self.end,
+        )
+        params = {
+            'available_from': (
+                self.start + timedelta(hours=1)
+            ).strftime('%Y-%m-%dT%H:%M'),
+            'available_to': (
+                self.end + timedelta(hours=1)
+            ).strftime('%Y-%m-%dT%H:%M'),
+        }
+        response = self.client.get(reverse('home'), params)
+        self.assertEqual(list(response.context['bike_list']), [self.spare])
+
+        params['available_from'] = self.end.strftime('%Y-%m-%dT%H:%M')
+        response = self.client.get(reverse('home'), params)
+        self.assertEqual(
+            list(response.context['bike_list']), [self.bike, self.spare]
+        )
+
+    def test_bike_list_shows_rented_bikes_free_later(self):
+        """
+        Test a bike rented now is listed for a later period,
+        but not for a period starting now.
+        """
+        Rental.claim(self.other, self.bike)
+        params = self.period(self.start, self.end)
+        params = {
+            'available_from': params['start_time'],
+            'available_to': params['end_time'],
+        }
+        response = self.client.get(reverse('home'), params)
+        self.assertEqual(
+            list(response.context['bike_list']), [self.bike, self.spare]
+        )
+
+        params['available_from'] = timezone.now().strftime('%Y-%m-%dT%H:%M')
+        response = self.client.get(reverse('home'), params)
+        self.assertEqual(list(response.context['bike_list']), [self.spare])
+
+    def test_bike_reserved_now_by_someone_else_cannot_be_rented(self):
+        """
+        Test that create_rental respects a reservation running now,
+        unless it belongs to the user renting the bike.
+        """
+        now = timezone.now()
+        reservation = Reservation.objects.create(
+            user=self.other, bike=self.bike,
+            start_time=now - timedelta(minutes=5),
+            end_time=now + timedelta(hours=1),
+        )
+        url = reverse('create_rental', kwargs={'bike_id': self.bike.id})
+        response = self.client.post(url)
+        self.assertRedirects(response, reverse('home'))
+        self.assertFalse(Rental.objects.exists())
+
+        reservation.user = self.user
+        reservation.save()
+        response = self.client.post(url)
+        self.assertRedirects(response, reverse('profile'))
+        self.assertTrue(Rental.objects.filter(bike=self.bike).exists())
+
+    def test_user_can_cancel_own_reservation(self):
+        """
+        Test that only the author can cancel a reservation.
+        """
+        mine = Reservation.objects.create(
+            user=self.user, bike=self.bike,
+            start_time=self.start, end_time=self.end,
+        )
+        theirs = Reservation.objects.create(
+            user=self.other, bike=self.spare,
+            start_time=self.start, end_time=self.end,
+        )
+        self.client.post(reverse(
+            'cancel_reservation', kwargs={'reservation_id': mine.id}
+        ))
+        response = self.client.post(reverse(
+            'cancel_reservation', kwargs={'reservation_id': theirs.id}
+        ))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(list(Reservation.objects.all()), [theirs])
+
+
+class RentalExportTest(QueryBudgetMixin, TestCase):
+    """
+    Tests for the streamed CSV export of rental history.
+    """
+
+    def setUp(self):
+        """
+        Set up two users with rentals on different days.
+        """
+        self.user = User.objects.create_user(
+            username='exporter', password='password'
+        )
+        self.other = User.objects.create_user(
+            username='=other', password='password'
+        )
+        self.bike = Bike.objects.create(
+            name='Export Bike', type='City', price_per_hour=4.00
+        )
+        self.today = timezone.now()
+        for days_ago in (0, 10, 20):
+            rental = Rental.objects.create(
+                user=self.user, bike=self.bike,
+                end_time=self.today, total_cost=days_ago,
+            )
+            # start_time is set on creation, move it back in time.
+            Rental.objects.filter(pk=rental.pk).update(
+                start_time=self.today - timedelta(days=days_ago)
+            )
+        Rental.objects.create(user=self.other, bike=self.bike)
+
+    def read_csv(self, response):
+        """
+        Returns the lines of a streamed CSV response.
+        """
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_user_exports_own_rentals_oldest_first(self):
+        """
+        Test the profile download only contains the user's rentals.
+        """
+        self.client.force_login(self.user)
+        lines = self.read_csv(self.client.get(reverse('export_rentals')))
+        self.assertEqual(lines[0], ','.join(EXPORT_HEADER))
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[1].endswith(',20.00'))
+        self.assertTrue(all(',exporter,' in line for line in lines[1:]))
+
+    def test_user_export_date_range(self):
+        """
+        Test the date filters are inclusive and based on the start day.
+        """
+        self.client.force_login(self.user)
+        lines = self.read_csv(self.client.get(reverse('export_rentals'), {
+            'date_from': (self.today - timedelta(days=15)).date(),
+            'date_to': self.today.date(),
+        }))
+        self.assertEqual(len(lines), 3)
+
+    def test_invalid_dates_redirect_to_profile(self):
+        """
+        Test an inverted period shows an error instead of a file.
+        """
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('export_rentals'), {
+            'date_from': '2024-02-01', 'date_to': '2024-01-01',
+        })
+        self.assertRedirects(response, reverse('profile'))
+
+    def test_export_requires_login(self):
+        """
+        Test anonymous users are sent to the login page.
+        """
+        response = self.client.get(reverse('export_rentals'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('account_login'), response.url)
+
+    def test_admin_action_streams_selected_rentals(self):
+        """
+        Test the admin action, with a username that looks like a formula.
+        """
+        User.objects.create_superuser(
+            username='admin', password='password', email='a@example.com'
+        )
+        self.client.login(username='admin', password='password')
+        url = reverse('admin:rentals_rental_changelist')
+        response = self.client.post(url, {
+            'action': 'export_csv',
+            '_selected_action': Rental.objects.values_list('pk', flat=True),
+        })
+        lines = self.read_csv(response)
+        self.assertEqual(len(lines), 5)
+        self.assertIn(",'=other,", lines[-1])
+
+    def test_export_query_count_does_not_grow_with_rows(self):
+        """
+        Test the file is built from one query, without per-row lookups.
+        """
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('export_rentals'))
+        with self.assertQueryBudget(9):
+            b''.join(response.streaming_content)
+
+
+class PricingTest(QueryBudgetMixin, TestCase):
+    """
+    Tests for the pricing engine and batch repricing.
+    """
+
+    def setUp(self):
+        """
+        Set up a city bike and a mountain bike at €2/hour.
+        """
+        self.user = User.objects.create_user(
+            username='payer', password='password'
+        )
+        self.city = Bike.objects.create(
+            name='City', type='City', price_per_hour=Decimal('2.00')
+        )
+        self.mountain = Bike.objects.create(
+            name='Mountain', type='Mountain', price_per_hour=Decimal('2.00')
+        )
+        self.start = timezone.now() - timedelta(days=3)
+
+    def rent(self, bike, hours):
+        """
+        Returns a finished rental of `bike` lasting `hours` hours.
+        """
+        rental = Rental.objects.create(
+            user=User.objects.create_user(
+                username=f'rider{Rental.objects.count()}'
+            ),
+            bike=bike, end_time=self.start + timedelta(hours=hours),
+        )
+        Rental.objects.filter(pk=rental.pk).update(start_time=self.start)
+        return Rental.objects.select_related('bike').get(pk=rental.pk)
+
+    def tariff(self, **kwargs):
+        """
+        Creates a tariff valid since before the rentals started.
+        """
+        return Tariff.objects.create(
+            name='Tariff', valid_from=self.start - timedelta(days=1),
+            **kwargs,
+        )
+
+    def test_without_tariff_every_started_hour_is_charged(self):
+        """
+        Test the plain hourly rule.
+        """
+        self.assertEqual(billed_hours(self.start, self.start), 1)
+        self.assertEqual(
+            price_rental(self.rent(self.city, 2.5)), Decimal('6.00')
+        )
+
+    def test_type_tariff_overrides_default_tariff(self):
+        """
+        Test per-type multipliers, with the default tariff as fallback.
+        """
+        self.tariff(multiplier=Decimal('1.50'))
+        self.tariff(bike_type='Mountain', multiplier=Decimal('2.00'))
+        self.assertEqual(
+            price_rental(self.rent(self.city, 0.5)), Decimal('3.00')
+        )
+        self.assertEqual(
+            price_rental(self.rent(self.mountain, 0.5)), Decimal('4.00')
+        )
+
+    def test_daily_rate_and_hourly_cap(self):
+        """
+        Test full days at the daily rate and the cap on the rest.
+        """
+        self.tariff(
+            daily_rate=Decimal('30.00'), hourly_cap=Decimal('10.00')
+        )
+        # 26 hours billed: one day, then 2 hours at €2.
+        self.assertEqual(
+            price_rental(self.rent(self.city, 25.5)), Decimal('34.00')
+        )
+        # 30 hours billed: one day, then 6 hours capped at €10.
+        self.assertEqual(
+            price_rental(self.rent(self.city, 29.5)), Decimal('40.00')
+        )
+
+    def test_price_history_uses_price_at_start(self):
+        """
+        Test the price in force when the rental started is used.
+        """
+        BikePrice.objects.create(
+            bike=self.city, price_per_hour=Decimal('1.00'),
+            valid_from=self.start - timedelta(days=10),
+        )
+        BikePrice.objects.create(
+            bike=self.city, price_per_hour=Decimal('5.00'),
+            valid_from=self.start + timedelta(hours=1),
+        )
+        self.assertEqual(
+            price_rental(self.rent(self.city, 2.5)), Decimal('3.00')
+        )
+
+    def test_price_change_is_recorded(self):
+        """
+        Test changing a bike's price records the old and new prices,
+        so earlier rentals keep their price and later ones get the new
+        one. Saves that leave the price alone record nothing.
+        """
+        rental = self.rent(self.city, 2.5)
+        self.city.name = 'Renamed'
+        self.city.save()
+        self.city.price_per_hour = Decimal('4.00')
+        self.city.save()
+        self.assertEqual(list(
+            self.city.price_history.values_list('price_per_hour', flat=True)
+        ), [Decimal('2.00'), Decimal('4.00')])
+        self.assertEqual(price_rental(rental), Decimal('6.00'))
+        self.assertEqual(PriceBook.load([self.city.pk]).price(
+            self.city, timezone.now(), timezone.now()
+        ), Decimal('4.00'))
+        # A later change only records the new price.
+        self.city.price_per_hour = Decimal('5.00')
+        self.city.save()
+        self.assertEqual(self.city.price_history.count(), 3)
+        # A bike loaded from the database compares with its loaded price.
+        loaded = Bike.objects.get(pk=self.city.pk)
+        loaded.save()
+        self.assertEqual(self.city.price_history.count(), 3)
+        loaded.price_per_hour = Decimal('6.00')
+        loaded.save()
+        self.assertEqual(self.city.price_history.count(), 4)
+
+    def test_return_bike_uses_the_engine(self):
+        """
+        Test the cost charged on return follows the tariffs.
+        """
+        self.tariff(multiplier=Decimal('3.00'))
+        self.client.force_login(self.user)
+        rental = Rental.objects.create(user=self.user, bike=self.city)
+        url = reverse('return_bike', kwargs={'rental_id': rental.id})
+        self.client.post(url)
+        rental.refresh_from_db()
+        self.assertEqual(rental.total_cost, Decimal('6.00'))
+
+    def test_batch_matches_single_rental_pricing(self):
+        """
+        Test repricing writes the same costs as pricing one by one,
+        with a query count that does not grow with the rentals.
+        """
+        rentals = [
+            self.rent(bike, hours)
+            for hours in (0.5, 3, 25, 50)
+            for bike in (self.city, self.mountain)
+        ]
+        self.tariff(bike_type='Mountain', daily_rate=Decimal('20.00'))
+        expected = [price_rental(rental) for rental in rentals]
+        # Per batch of 5: rentals, price history and the updates of
+        # the rentals, the revenue and the spending, in a transaction;
+        # plus tariffs once and the empty last batch.
+        with self.assertQueryBudget(16, repeat_limit=3):
+            priced, changed = reprice_rentals(
+                Rental.objects.all(), batch_size=5
+            )
+        self.assertEqual((priced, changed), (8, 8))
+        costs = [
+            Rental.objects.get(pk=rental.pk).total_cost for rental in rentals
+        ]
+        self.assertEqual(costs, expected)
+
+    def test_reprice_updates_revenue_and_spending(self):
+        """
+        Test a repricing adds the cost changes to the daily revenue
+        and to the rider's total spent.
+        """
+        rental = self.rent(self.city, 3)
+        reprice_rentals(Rental.objects.all())
+        call_command('rebuild_rollups', stdout=StringIO())
+        call_command('rebuild_rider_stats', stdout=StringIO())
+        self.tariff(bike_type='City', multiplier=Decimal('2.00'))
+        self.assertEqual(reprice_rentals(Rental.objects.all()), (1, 1))
+        rental.refresh_from_db()
+        self.assertEqual(rental.total_cost, Decimal('16.00'))
+        self.assertEqual(
+            BikeDayStats.objects.get(bike=self.city).revenue,
+            Decimal('16.00'),
+        )
+        self.assertEqual(
+            Profile.objects.get(user=rental.user).total_spent,
+            Decimal('16.00'),
+        )
+
+    def test_reprice_command_defaults_to_yesterday(self):
+        """
+        Test the command only prices rentals returned on the given day.
+        """
+        rental = self.rent(self.city, 1)
+        out = StringIO()
+        call_command('reprice_rentals', stdout=out)
+        self.assertIn('Priced 0 rentals', out.getvalue())
+        call_command(
+            'reprice_rentals', '--date', str(rental.end_time.date()),
+            stdout=out,
+        )
+        self.assertIn('Priced 1 rentals (1 changed)', out.getvalue())
+
+
+class RollupTest(QueryBudgetMixin, TestCase):
+    """
+    Tests for the daily usage rollups and the staff dashboard.
+    """
+
+    def setUp(self):
+        """
+        Set up a rider, a staff member and two bikes.
+        """
+        self.user = User.objects.create_user(
+            username='rider', password='password'
+        )
+        self.staff = User.objects.create_user(
+            username='staff', password='password', is_staff=True
+        )
+        self.city = Bike.objects.create(
+            name='City', type='City', price_per_hour=Decimal('2.00')
+        )
+        self.mountain = Bike.objects.create(
+            name='Mountain', type='Mountain', price_per_hour=Decimal('3.00')
+        )
+
+    def rent(self, bike, start, end, cost):
+        """
+        Creates a finished rental without touching the rollups.
+        """
+        rental = Rental.objects.create(user=self.user, bike=bike)
+        Rental.objects.filter(pk=rental.pk).update(
+            start_time=start, end_time=end, total_cost=cost
+        )
+        return Rental.objects.get(pk=rental.pk)
+
+    def test_day_segments_split_at_midnight(self):
+        """
+        Test a rental over midnight is split between both days.
+        """
+        start = timezone.make_aware(timezone.datetime(2024, 5, 1, 23, 30))
+        segments = day_segments(start, start + timedelta(hours=2))
+        self.assertEqual([minutes for day, minutes in segments], [30, 90])
+        self.assertEqual(
+            [day.isoformat() for day, minutes in segments],
+            ['2024-05-01', '2024-05-02'],
+        )
+
+    def test_return_bike_updates_rollup(self):
+        """
+        Test each return adds a ride, its minutes and its cost.
+        """
+        self.client.force_login(self.user)
+        for number in range(2):
+            rental = Rental.objects.create(user=self.user, bike=self.city)
+            Rental.objects.filter(pk=rental.pk).update(
+                start_time=timezone.now() - timedelta(minutes=20)
+            )
+            self.client.post(
+                reverse('return_bike', kwargs={'rental_id': rental.id})
+            )
+        stats = BikeDayStats.objects.get(bike=self.city)
+        self.assertEqual(stats.rides, 2)
+        self.assertEqual(stats.revenue, Decimal('4.00'))
+        self.assertIn(stats.rented_minutes, (40, 41))
+        # Each return bumped the card version in the database.
+        self.city.refresh_from_db()
+        self.assertTrue(self.city.is_available)
+        self.assertEqual(self.city.card_version, 3)
+
+    def test_concurrent_returns_count_one_ride(self):
+        """
+        Test a return that read the rental before another one closed
+        it does not close it again nor count the ride twice.
+        """
+        self.client.force_login(self.user)
+        rental = Rental.objects.create(user=self.user, bike=self.city)
+        url = reverse('return_bike', kwargs={'rental_id': rental.id})
+        self.assertEqual(self.client.get(url).status_code, 405)
+        # Both requests read the open rental, then return it in turn.
+        stale = Rental.objects.select_related('bike').get(pk=rental.pk)
+        self.client.post(url)
+        with mock.patch(
+            'rentals.views.get_object_or_404', return_value=stale
+        ):
+            response = self.client.post(url, follow=True)
+        self.assertContains(response, "already been completed")
+        stats = BikeDayStats.objects.get(bike=self.city)
+        self.assertEqual((stats.rides, stats.revenue), (1, Decimal('2.00')))
+
+    def test_rebuild_matches_history(self):
+        """
+        Test the rebuild counts each day once, in chunks and windows,
+        and replaces stale rows.
+        """
+        start = timezone.make_aware(timezone.datetime(2024, 5, 2, 22, 0))
+        for hours in range(6):
+            self.rent(
+                self.city, start + timedelta(hours=hours * 10),
+                start + timedelta(hours=hours * 10 + 3), Decimal('6.00'),
+            )
+        BikeDayStats.objects.create(
+            bike=self.mountain, day=start.date(), rides=9
+        )
+        read, written = rebuild_rollups(
+            start.date() - timedelta(days=1), start.date() + timedelta(days=4),
+            chunk_size=2, window_days=2,
+        )
+        # The first rental spans two windows, it is read twice.
+        self.assertEqual(read, 7)
+        rows = BikeDayStats.objects.order_by('day')
+        self.assertEqual(written, rows.count())
+        self.assertFalse(rows.filter(bike=self.mountain).exists())
+        self.assertEqual(sum(row.rides for row in rows), 6)
+        self.assertEqual(sum(row.rented_minutes for row in rows), 6 * 180)
+        self.assertEqual(
+            sum(row.revenue for row in rows), Decimal('36.00')
+        )
+
+    def test_rebuild_command(self):
+        """
+        Test the command rebuilds the whole history by default.
+        """
+        now = timezone.now()
+        self.rent(
+            self.mountain, now - timedelta(days=3, hours=1),
+            now - timedelta(days=3), Decimal('3.00'),
+        )
+        out = StringIO()
+        call_command('rebuild_rollups', stdout=out)
+        self.assertIn('1 rentals read', out.getvalue())
+        self.assertEqual(BikeDayStats.objects.get().rides, 1)
+
+    def test_dashboard_is_staff_only(self):
+        """
+        Test riders are sent to the admin login page.
+        """
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('rental_dashboard'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_dashboard_reads_only_rollups(self):
+        """
+        Test the dashboard shows the rollups without reading the rentals.
+        """
+        today = timezone.localdate()
+        BikeDayStats.objects.create(
+            bike=self.city, day=today, rides=3, rented_minutes=720,
+            revenue=Decimal('12.50'),
+        )
+        BikeDayStats.objects.create(
+            bike=self.mountain, day=today - timedelta(days=40), rides=8,
+        )
+        self.client.force_login(self.staff)
+        with self.assertQueryBudget(8) as log:
+            response = self.client.get(reverse('rental_dashboard'))
+        self.assertFalse(
+            [sql for sql in log.queries if 'rentals_rental"' in sql]
+        )
+        self.assertEqual(response.context['period']['rides'], 3)
+        self.assertEqual(
+            [row['bike_id'] for row in response.context['top_bikes']],
+            [self.city.id],
+        )
+        # 12 of the 30 days x 24 hours one city bike could be out.
+        self.assertAlmostEqual(
+            response.context['by_type'][0]['utilization'], 100 / 60
+        )
+        self.assertContains(response, '€12.50')
+
+
+class RentalAdminTest(QueryBudgetMixin, TestCase):
+    """
+    Tests for the rental changelist on a large table.
+    """
+
+    def setUp(self):
+        """
+        Set up a superuser and 30 finished rentals by different users.
+        """
+        self.admin = User.objects.create_superuser(
+            username='admin', password='password'
+        )
+        self.bike = Bike.objects.create(
+            name='Busy Bike', type='City', price_per_hour=Decimal('2.00')
+        )
+        for number in range(30):
+            Rental.objects.create(
+                user=User.objects.create_user(username=f'rider{number}'),
+                bike=self.bike, end_time=timezone.now(), total_cost=4,
+            )
+        self.client.force_login(self.admin)
+
+    def test_changelist_has_no_per_row_queries(self):
+        """
+        Test the changelist joins the users and bikes of the rentals.
+        """
+        url = reverse('admin:rentals_rental_changelist')
+        with self.assertQueryBudget(8):
+            response = self.client.get(url, {'status': 'finished'})
+        self.assertEqual(response.context['cl'].result_count, 30)
+
+    def test_waive_cost_action(self):
+        """
+        Test the action zeroes the costs and the revenue of the return
+        days only, with a query count that does not depend on how far
+        apart the rentals were returned.
+        """
+        returned = timezone.now() - timedelta(days=730)
+        old = Rental.objects.create(
+            user=User.objects.create_user(username='old rider'),
+            bike=self.bike, end_time=returned, total_cost=4,
+        )
+        Rental.objects.filter(pk=old.pk).update(
+            start_time=returned - timedelta(minutes=30)
+        )
+        call_command('rebuild_rollups', stdout=StringIO())
+        call_command('rebuild_rider_stats', stdout=StringIO())
+        self.assertTrue(Profile.objects.filter(total_spent=4).exists())
+        with self.assertQueryBudget(9):
+            self.client.post(reverse('admin:rentals_rental_changelist'), {
+                'action': 'waive_cost',
+                '_selected_action': list(
+                    Rental.objects.values_list('pk', flat=True)
+                ),
+            })
+        self.assertFalse(Rental.objects.exclude(total_cost=0).exists())
+        stats = BikeDayStats.objects.get(
+            bike=self.bike, day=timezone.localdate()
+        )
+        self.assertEqual((stats.rides, stats.revenue), (30, 0))
+        self.assertFalse(BikeDayStats.objects.exclude(revenue=0).exists())
+        self.assertFalse(Profile.objects.exclude(total_spent=0).exists())
+
+
+@override_settings(RENTAL_OVERDUE_HOURS=24, RENTAL_CLOSE_HOURS=72)
+class RentalSweeperTest(QueryBudgetMixin, TestCase):
+    """
+    Tests for the overdue and abandoned rental sweeper.
+    """
+
+    def setUp(self):
+        """
+        Set up open rentals started 1 hour, 2 days and 4 days ago.
+        """
+        self.now = timezone.now()
+        self.rentals = {}
+        for hours in (1, 48, 96):
+            bike = Bike.objects.create(
+                name=f'Bike {hours}h', type='City', is_available=False,
+                price_per_hour=Decimal('2.00'),
+            )
+            rental = Rental.objects.create(
+                user=User.objects.create_user(username=f'rider{hours}'),
+                bike=bike,
+            )
+            Rental.objects.filter(pk=rental.pk).update(
+                start_time=self.now - timedelta(hours=hours, minutes=10)
+            )
+            self.rentals[hours] = rental
+
+    def state(self, hours):
+        return Rental.objects.select_related('bike').get(
+            pk=self.rentals[hours].pk
+        )
+
+    def test_overdue_rentals_are_flagged_and_abandoned_closed(self):
+        """
+        Test the sweep closes the abandoned rental at the price a
+        return would charge, releases its bike, counts the ride, and
+        only flags the overdue one.
+        """
+        abandoned = self.state(96)
+        expected = price_rental(abandoned, end_time=self.now)
+        flagged, closed = sweep_rentals(now=self.now)
+        self.assertEqual((flagged, closed), (1, 1))
+
+        abandoned = self.state(96)
+        self.assertEqual(abandoned.end_time, self.now)
+        self.assertEqual(abandoned.total_cost, expected)
+        self.assertEqual(abandoned.overdue_at, self.now)
+        self.assertTrue(abandoned.bike.is_available)
+        self.assertEqual(
+            abandoned.bike.card_version, self.rentals[96].bike.card_version + 1
+        )
+        profile = Profile.objects.get(user=abandoned.user)
+        self.assertEqual(
+            (profile.ride_count, profile.total_spent), (1, expected)
+        )
+        self.assertEqual(
+            BikeDayStats.objects.filter(bike=abandoned.bike).count(),
+            len(day_segments(abandoned.start_time, self.now)),
+        )
+
+        overdue = self.state(48)
+        self.assertIsNone(overdue.end_time)
+        self.assertEqual(overdue.overdue_at, self.now)
+        self.assertFalse(overdue.bike.is_available)
+        recent = self.state(1)
+        self.assertIsNone(recent.overdue_at)
+        # A second sweep finds nothing new.
+        self.assertEqual(sweep_rentals(now=self.now), (0, 0))
+
+    def test_rental_returned_during_the_sweep_is_skipped(self):
+        """
+        Test a rental the rider returns while the sweep prices it keeps
+        the return's cost and is not counted by the sweep.
+        """
+        abandoned = self.state(96)
+        price = PriceBook.price
+
+        def return_first(book, bike, start, end):
+            # The rider's return closes the rental first.
+            user_return = Rental.objects.get(pk=abandoned.pk)
+            user_return.finish(end, Decimal('1.00'))
+            return price(book, bike, start, end)
+        with mock.patch.object(PriceBook, 'price', return_first):
+            _, closed = sweep_rentals(now=self.now)
+        self.assertEqual(closed, 0)
+        self.assertEqual(self.state(96).total_cost, Decimal('1.00'))
+        self.assertFalse(Profile.objects.filter(
+            user=abandoned.user, ride_count__gt=0
+        ).exists())
+        self.assertFalse(BikeDayStats.objects.exists())
+
+    @override_settings(RENTAL_CLOSE_HOURS=1)
+    def test_bikes_are_released_with_one_update_per_batch(self):
+        """
+        Test each batch releases its bikes with a single UPDATE.
+        """
+        with CaptureQueriesContext(connection) as context:
+            _, closed = sweep_rentals(now=self.now, batch_size=2)
+        self.assertEqual(closed, 3)
+        releases = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('UPDATE "bikes_bike"')
+        ]
+        self.assertEqual(len(releases), 2)
+        self.assertFalse(Bike.objects.filter(is_available=False).exists())
+
+    def test_close_hours_zero_only_flags(self):
+        """
+        Test the command only flags rentals when closing is off.
+        """
+        out = StringIO()
+        with override_settings(RENTAL_CLOSE_HOURS=0):
+            call_command('sweep_rentals', stdout=out)
+        self.assertIn(
+            'Closed 0 abandoned rentals and flagged 2', out.getvalue()
+        )
+        self.assertFalse(Rental.objects.filter(
+            end_time__isnull=False
+        ).exists())
+        call_command('sweep_rentals', '--flag-only', stdout=out)
+        self.assertFalse(Rental.objects.filter(
+            end_time__isnull=False
+        ).exists())
+
+    def test_admin_lists_overdue_rentals(self):
+        """
+        Test the status filter of the rental admin shows the flagged
+        open rentals.
+        """
+        sweep_rentals(now=self.now, close=False)
+        admin = User.objects.create_superuser(
+            username='admin', password='password'
+        )
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:rentals_rental_changelist'), {'status': 'overdue'}
+        )
+        self.assertEqual(response.context['cl'].result_count, 2)
@@ -6,4 +6,18 @@ urlpatterns = [
     path('create/<int:bike_id>/', views.create_rental, name='create_rental'),
     # URL for returning a bike (uses rental_id).
     path('return/<int:rental_id>/', views.return_bike, name='return_bike'),
+    # URL for booking a bike in advance (uses bike_id).
+    path(
+        'reserve/<int:bike_id>/', views.create_reservation,
+        name='create_reservation'
+        ),
+    # URL for cancelling a reservation (uses reservation_id).
+    path(
+        'reservation/<int:reservation_id>/cancel/',
+        views.cancel_reservation, name='cancel_reservation'
+        ),
+    # URL for downloading the user's rental history as CSV.
+    path('export/', views.export_rentals, name='export_rentals'),
+    # URL for the staff usage and revenue dashboard.
+    path('dashboard/', views.rental_dashboard, name='rental_dashboard'),
 ]
@@ -1,13 +1,29 @@
-from django.shortcuts import get_object_or_404, redirect
+from datetime import timedelta
+
+from django.shortcuts import get_object_or_404, redirect, render
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
+from django.views.decorators.http import require_POST
 # Import messages framework to show feedback.
 from django.contrib import messages
+# Raised when the database rejects a second open rental.
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
 # Import timezone to get the current time.
 from django.utils import timezone
-from .models import Rental
+from .models import BikeDayStats, Rental, Reservation
+from .forms import ReservationForm, DateRangeForm
+from .export import filter_rentals, rental_csv_response
+from .pricing import price_rental
+from .rollups import record_rental
+from core.db_router import stick_to_primary
+from core.jobs import enqueue
 from bikes.models import Bike
+from bikes.cache import invalidate_catalog, invalidate_bike_page
+from profiles.models import Profile
 
 
+@stick_to_primary
 @login_required
 def create_rental(request, bike_id):
     """
@@ -21,20 +37,16 @@ def create_rental(request, bike_id):
     - A redirect to the user's profile page.
     """
     bike = get_object_or_404(Bike, id=bike_id)
-    # User cannot rent more than one bike at a time.
-    has_active_rental = Rental.objects.filter(
-        user=request.user, end_time__isnull=True
-    ).exists()
-    if has_active_rental:
+    try:
+        # Claim the bike and create the rental in one transaction.
+        new_rental = Rental.claim(request.user, bike)
+    except IntegrityError:
+        # User cannot rent more than one bike at a time
+        # (enforced by the one_open_rental_per_user constraint).
         messages.error(request, "You already have an active rental.")
         return redirect('profile')
-    # Check to ensure the bike is still available.
-    if bike.is_available:
-        # Create the new rental record and capture it to use its properties.
-        new_rental = Rental.objects.create(user=request.user, bike=bike)
-        # Update bike status to unavailable.
-        bike.is_available = False
-        bike.save()
+    # None means the bike was not available (or was just rented by someone).
+    if new_rental is not None:
         # Format the start time for a user-friendly message.
         start_time_formatted = new_rental.start_time.strftime("%H:%M on %B %d")
         # Create a detailed success message.
@@ -52,10 +64,13 @@ def create_rental(request, bike_id):
         return redirect('home')
 
 
+@require_POST
+@stick_to_primary
 @login_required
 def return_bike(request, rental_id):
     """
-    Handles the return of a rented bike.
+    Handles the return of a rented bike (a POST from the profile page,
+    so a prefetched or crawled link cannot return it).
 
     **Args:**
     - `request`: The HTTP request object.
@@ -65,23 +80,39 @@ def return_bike(request, rental_id):
     - A redirect to the user's profile page.
     """
     # Get the specific rental object, ensuring it belongs to the current user.
-    rental = get_object_or_404(Rental, id=rental_id, user=request.user)
+    # The bike is joined in, it is priced and released below.
+    rental = get_object_or_404(
+        Rental.objects.select_related('bike'), id=rental_id, user=request.user
+    )
+    returned = False
     # Check if the rental is still active.
     if rental.end_time is None:
-        # Set the end time to now.
-        rental.end_time = timezone.now()
-        # Duration of the rental.
-        duration = rental.end_time - rental.start_time
-        # Hours rounding up to the next full hour.
-        hours = int(duration.total_seconds() // 3600) + 1
-        # Rental final cost.
-        cost = hours * rental.bike.price_per_hour
-        rental.total_cost = cost
-        # Make the bike available again.
-        rental.bike.is_available = True
-        rental.bike.save()
-        # Save the changes to rental object.
-        rental.save()
+        end_time = timezone.now()
+        # Rental final cost, from the bike's price and tariff when
+        # the rental started (the same engine as batch invoicing).
+        cost = price_rental(rental, end_time)
+        with transaction.atomic():
+            # Close the rental with a conditional UPDATE: of concurrent
+            # returns (or the overdue sweeper), only one wins.
+            returned = rental.finish(end_time, cost)
+            if returned:
+                # Make the bike available again. The joined bike may
+                # be stale (a review may have bumped its card version),
+                # so the version is bumped in the database, as the
+                # sweeper does, then the cached pages are refreshed.
+                Bike.objects.filter(pk=rental.bike_id).update(
+                    is_available=True, card_version=F('card_version') + 1
+                )
+                invalidate_catalog()
+                invalidate_bike_page(rental.bike_id)
+                # Count the ride in the bike's daily usage
+                # and in the rider's lifetime statistics.
+                record_rental(rental)
+                Profile.record_ride(rental)
+                # Render the bike's new catalog card in the background
+                # (queued with the return, dropped if it rolls back).
+                enqueue('bikes.warm_bike_card', bike_id=rental.bike_id)
+    if returned:
         # The confirmation message.
         success_message = (
             f"Thank you for returning {rental.bike.name}. "
@@ -91,3 +122,161 @@ def return_bike(request, rental_id):
     else:
         messages.error(request, "This rental has already been completed.")
     return redirect('profile')
+
+
+@require_POST
+@stick_to_primary
+@login_required
+def create_reservation(request, bike_id):
+    """
+    Books a bike for a future period chosen on the bike detail page.
+
+    **Args:**
+    - `request`: The HTTP request object, with the `ReservationForm` data.
+    - `bike_id`: The ID of the bike to be reserved.
+
+    **Returns:**
+    - A redirect to the user's profile page if the bike was booked,
+    otherwise back to the bike detail page.
+    """
+    bike = get_object_or_404(Bike, id=bike_id)
+    form = ReservationForm(request.POST)
+    if not form.is_valid():
+        # Show the first validation problem as a message.
+        error = next(iter(form.errors.values()))[0]
+        messages.error(request, error)
+        return redirect('bike_detail', pk=bike.pk)
+    try:
+        reservation = Reservation.book(
+            request.user, bike,
+            form.cleaned_data['start_time'], form.cleaned_data['end_time'],
+        )
+    except IntegrityError:
+        # Someone booked an overlapping period at the same moment.
+        reservation = None
+    if reservation is None:
+        messages.error(
+            request, "Sorry, this bike is already reserved for that period."
+        )
+        return redirect('bike_detail', pk=bike.pk)
+    # Format the period for a user-friendly message.
+    start = timezone.localtime(reservation.start_time)
+    end = timezone.localtime(reservation.end_time)
+    messages.success(
+        request,
+        f"You have reserved '{bike.name}' from "
+        f"{start.strftime('%H:%M on %B %d')} "
+        f"until {end.strftime('%H:%M on %B %d')}."
+    )
+    return redirect('profile')
+
+
+@require_POST
+@stick_to_primary
+@login_required
+def cancel_reservation(request, reservation_id):
+    """
+    Cancels one of the current user's reservations.
+
+    **Args:**
+    - `request`: The HTTP request object.
+    - `reservation_id`: The ID of the reservation to cancel.
+
+    **Returns:**
+    - A redirect to the user's profile page.
+    """
+    # Only the user who made the reservation can cancel it.
+    reservation = get_object_or_404(
+        Reservation, id=reservation_id, user=request.user
+    )
+    reservation.delete()
+    messages.success(request, "Your reservation has been cancelled.")
+    return redirect('profile')
+
+
+@login_required
+def export_rentals(request):
+    """
+    Downloads the current user's rental history as a CSV file.
+
+    The file is streamed, see `rentals.export`.
+
+    **Args:**
+    - `request`: The HTTP request object, with optional `date_from`
+    and `date_to` GET parameters.
+
+    **Returns:**
+    - A `StreamingHttpResponse` with the CSV file, or a redirect
+    to the profile page if the dates are invalid.
+    """
+    form = DateRangeForm(request.GET)
+    if not form.is_valid():
+        messages.error(request, "Please choose a valid period to export.")
+        return redirect('profile')
+    rentals = filter_rentals(
+        Rental.objects.all(), user=request.user, **form.cleaned_data
+    )
+    return rental_csv_response(rentals, 'rentals.csv')
+
+
+# Days shown by the dashboard when no period is picked.
+DASHBOARD_DAYS = 30
+MINUTES_PER_DAY = 24 * 60
+
+
+@staff_member_required
+def rental_dashboard(request):
+    """
+    Shows staff the rides, rented time and revenue of a period.
+
+    Everything comes from the daily rollups (`BikeDayStats`), never from
+    the rentals table, so the page costs the same few aggregate queries
+    whatever the size of the rental history.
+
+    **Args:**
+    - `request`: The HTTP request object, with optional `date_from`
+    and `date_to` GET parameters (the last 30 days by default).
+
+    **Returns:**
+    - The rendered dashboard.
+    """
+    form = DateRangeForm(request.GET)
+    today = timezone.localdate()
+    date_from = today - timedelta(days=DASHBOARD_DAYS - 1)
+    date_to = today
+    if form.is_valid():
+        date_to = form.cleaned_data['date_to'] or date_to
+        date_from = form.cleaned_data['date_from'] or min(date_from, date_to)
+    days = (date_to - date_from).days + 1
+    totals = dict(
+        rides=Sum('rides'), minutes=Sum('rented_minutes'),
+        revenue=Sum('revenue'),
+    )
+    stats = BikeDayStats.objects.filter(day__range=(date_from, date_to))
+
+    by_day = list(stats.values('day').annotate(**totals).order_by('day'))
+    fleet = dict(
+        Bike.objects.values_list('type').annotate(Count('id')).order_by()
+    )
+    by_type = list(
+        stats.values('bike__type').annotate(**totals).order_by('-revenue')
+    )
+    for row in by_type:
+        # Share of the time the bikes of this type were out.
+        available = fleet.get(row['bike__type'], 0) * days * MINUTES_PER_DAY
+        row['utilization'] = (
+            100 * row['minutes'] / available if available else None
+        )
+    top_bikes = list(
+        stats.values('bike_id', 'bike__name')
+        .annotate(**totals).order_by('-revenue', 'bike_id')[:10]
+    )
+    return render(request, 'rentals/dashboard.html', {
+        'form': form,
+        'date_from': date_from,
+        'date_to': date_to,
+        'period': stats.aggregate(**totals),
+        'by_day': by_day,
+        'by_type': by_type,
+        'top_bikes': top_bikes,
+    })
@@ -1,18 +1,27 @@
 from django.contrib import admin
+from bikes.cache import invalidate_all_bike_pages
+from core.admin import LargeTableAdminMixin
 from .models import Review
 # Import SummernoteModelAdmin to get the rich text editor in the admin panel.
 from django_summernote.admin import SummernoteModelAdmin
 
+# Comment shown instead of a review hidden by a moderator.
+HIDDEN_COMMENT = "<p>This review was hidden by a moderator.</p>"
+
 
 # Decorator to register a model.
 @admin.register(Review)
-class ReviewAdmin(SummernoteModelAdmin):
+class ReviewAdmin(LargeTableAdminMixin, SummernoteModelAdmin):
     """
     Customizes the admin interface for the Review model.
 
     **Admin Panel Features:**
     - Uses the Summernote editor for the `comment` field
     for a rich text editing experience.
+    - Lists reviews with their bike and user, newest first, with
+    estimated page counts (the table has millions of rows).
+    - Filters by rating and browses by date (both indexed).
+    - Hides the comments of the selected reviews with one UPDATE.
 
     **Inherits from:**
     - `django_summernote.admin.SummernoteModelAdmin`: Provides
@@ -20,3 +29,26 @@ class ReviewAdmin(SummernoteModelAdmin):
     """
     # Apply Summernote editor to the 'comment' field.
     summernote_fields = ('comment',)
+    list_display = ('id', 'bike', 'user', 'rating', 'created_at')
+    list_select_related = ('bike', 'user')
+    list_filter = ('rating',)
+    date_hierarchy = 'created_at'
+    # Served by the review_created_idx index.
+    ordering = ('-created_at', '-id')
+    search_fields = ('user__username', 'bike__name')
+    # Pick the user and bike by ID instead of loading every row.
+    raw_id_fields = ('bike', 'user')
+    actions = ['hide_comments']
+
+    @admin.action(description="Hide the comments of selected reviews")
+    def hide_comments(self, request, queryset):
+        """
+        Replaces the selected comments with a moderation notice.
+
+        One UPDATE whatever the number of reviews. The ratings are
+        kept, so the bikes' rating aggregates do not change; only the
+        cached detail pages that show the comments are invalidated.
+        """
+        hidden = queryset.update(comment=HIDDEN_COMMENT)
+        invalidate_all_bike_pages()
+        self.message_user(request, f"Hid the comments of {hidden} reviews.")
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ReviewsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'reviews'
+
+    # Import signals that keep the bike rating aggregates up to date.
+    def ready(self):
+        import reviews.signals  # noqa: F401
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['bike', '-created_at', '-id'], name='review_bike_created_idx'),
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from bikes.models import Bike
 # Import validators to enforce rules on model fields.
@@ -40,9 +40,48 @@ class Review(models.Model):
         # Whenever we get a list of reviews, they are ordered
         # by the newest first.
         ordering = ["-created_at"]
+        indexes = [
+            # Serves the paginated reviews of a bike (see
+            # reviews.views.review_page) without sorting them.
+            models.Index(
+                fields=['bike', '-created_at', '-id'],
+                name='review_bike_created_idx',
+            ),
+            # All reviews, newest first, optionally for one rating
+            # (admin ordering, rating filter and date hierarchy).
+            models.Index(
+                fields=['-created_at', '-id'], name='review_created_idx',
+            ),
+            models.Index(
+                fields=['rating', '-created_at'],
+                name='review_rating_created_idx',
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remembers the bike and rating a review was loaded with.
+
+        The review signals compare them with the saved values
+        to update the bike's rating aggregates.
+        """
+        instance = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        if 'bike_id' in loaded and 'rating' in loaded:
+            instance._loaded_rating = (loaded['bike_id'], loaded['rating'])
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Saves the review and updates the bike's rating aggregates
+        (in the `post_save` signal) in one transaction.
+        """
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
 
     def __str__(self):
         """
         Returns the string representation of the Review model.
         """
-        return f"Review by {self.user.username} for {self.bike.name}"
+        return f"Review {self.id} of bike {self.bike_id} ({self.rating}/5)"
@@ -0,0 +1,68 @@
+# Import the necessary modules
+from django.db.models.signals import post_save, post_delete
+# Decorator to receive the signal
+from django.dispatch import receiver
+# Sender model
+from .models import Review
+# Model holding the rating aggregates
+from bikes.models import Bike
+# Catalog cache invalidation (the rating is shown and sorted on).
+from bikes.cache import invalidate_catalog, invalidate_bike_page
+
+
+# Run this function after a review is created or updated.
+@receiver(post_save, sender=Review)
+def update_rating_stats_on_save(sender, instance, created, raw, **kwargs):
+    """
+    Updates the bike's stored rating aggregates after a review is saved.
+
+    **Args:**
+    - `sender`: The model class that sent the signal (Review).
+    - `instance`: The actual instance being saved.
+    - `created`: A boolean; True if a new record was created.
+    - `raw`: A boolean; True when loading fixtures (stats come with them).
+    - `**kwargs`: Wildcard keyword arguments.
+    """
+    if raw:
+        return
+    current = (instance.bike_id, instance.rating)
+    loaded = getattr(instance, '_loaded_rating', None)
+    if created:
+        Bike.adjust_rating_stats(instance.bike_id, added=instance.rating)
+    elif loaded is not None and loaded != current:
+        old_bike_id, old_rating = loaded
+        if old_bike_id == instance.bike_id:
+            Bike.adjust_rating_stats(
+                instance.bike_id, added=instance.rating, removed=old_rating
+            )
+        else:
+            # The review was moved to another bike (admin only).
+            Bike.adjust_rating_stats(old_bike_id, removed=old_rating)
+            Bike.adjust_rating_stats(instance.bike_id, added=instance.rating)
+            invalidate_bike_page(old_bike_id)
+    if created or loaded != current:
+        invalidate_catalog()
+    # The detail page also shows the comment, purge it on any change.
+    invalidate_bike_page(instance.bike_id)
+    # Later saves of the same instance compare against these values.
+    instance._loaded_rating = current
+
+
+# Run this function after a review is deleted.
+# Also runs for bulk and cascade deletes (e.g. admin "delete selected").
+@receiver(post_delete, sender=Review)
+def update_rating_stats_on_delete(sender, instance, **kwargs):
+    """
+    Updates the bike's stored rating aggregates after a review is deleted.
+
+    **Args:**
+    - `sender`: The model class that sent the signal (Review).
+    - `instance`: The actual instance being deleted.
+    - `**kwargs`: Wildcard keyword arguments.
+    """
+    bike_id, rating = getattr(
+        instance, '_loaded_rating', (instance.bike_id, instance.rating)
+    )
+    Bike.adjust_rating_stats(bike_id, removed=rating)
+    invalidate_catalog()
+    invalidate_bike_page(bike_id)
@@ -3,7 +3,10 @@ from django.contrib.auth.models import User
 from django.urls import reverse
 from django.core.exceptions import ValidationError
 from bikes.models import Bike
+from core.testing import QueryBudgetMixin
+from reviews.admin import HIDDEN_COMMENT
 from reviews.models import Review
+from reviews.views import REVIEWS_PER_PAGE, REVIEW_ORDERING
 
 
 class ReviewModelTest(TestCase):
@@ -44,7 +47,9 @@ class ReviewModelTest(TestCase):
         """
         Test the string representation of the Review model.
         """
-        expected_str = f"Review by {self.user.username} for {self.bike.name}"
+        expected_str = (
+            f"Review {self.review.id} of bike {self.bike.id} (4/5)"
+        )
         self.assertEqual(str(self.review), expected_str)
 
     def test_rating_validator_too_high(self):
@@ -103,3 +108,285 @@ class DeleteReviewViewTest(TestCase):
         response = self.client.post(self.delete_url)
         self.assertRedirects(response, self.bike_detail_url)
         self.assertFalse(Review.objects.filter(pk=self.review.pk).exists())
+
+
+class BikeRatingStatsTest(TestCase):
+    """
+    Tests that review writes keep the bike rating aggregates up to date.
+    """
+
+    def setUp(self):
+        """
+        Set up a user, a bike, and a logged-in client.
+        """
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='rater', password='password'
+        )
+        self.other_user = User.objects.create_user(
+            username='other', password='password'
+        )
+        self.bike = Bike.objects.create(
+            name='Rated Bike', type='Road', price_per_hour=10.00
+        )
+        self.client.login(username='rater', password='password')
+
+    def test_creating_reviews_updates_stats(self):
+        """
+        Test that new reviews update the average, count and histogram.
+        """
+        Review.objects.create(
+            bike=self.bike, user=self.user, rating=5, comment="Great"
+        )
+        Review.objects.create(
+            bike=self.bike, user=self.other_user, rating=2, comment="Meh"
+        )
+        self.bike.refresh_from_db()
+        self.assertEqual(self.bike.rating_count, 2)
+        self.assertAlmostEqual(self.bike.average_rating, 3.5)
+        self.assertEqual(
+            self.bike.rating_histogram, {1: 0, 2: 1, 3: 0, 4: 0, 5: 1}
+        )
+
+    def test_review_submitted_on_detail_page_updates_stats(self):
+        """
+        Test that posting a review through BikeDetail updates the stats.
+        """
+        url = reverse('bike_detail', kwargs={'pk': self.bike.pk})
+        self.client.post(url, {'rating': 4, 'comment': "Nice ride"})
+        self.bike.refresh_from_db()
+        self.assertEqual(self.bike.rating_count, 1)
+        self.assertEqual(self.bike.average_rating, 4)
+
+    def test_editing_review_moves_rating_in_histogram(self):
+        """
+        Test that changing a rating through EditReview updates the stats.
+        """
+        review = Review.objects.create(
+            bike=self.bike, user=self.user, rating=1, comment="Bad"
+        )
+        url = reverse('edit_review', kwargs={'pk': review.pk})
+        self.client.post(url, {'rating': 5, 'comment': "Better now"})
+        self.bike.refresh_from_db()
+        self.assertEqual(self.bike.rating_count, 1)
+        self.assertEqual(self.bike.average_rating, 5)
+        self.assertEqual(self.bike.rating_1_count, 0)
+        self.assertEqual(self.bike.rating_5_count, 1)
+
+    def test_deleting_review_updates_stats(self):
+        """
+        Test that deleting reviews (single and bulk) updates the stats.
+        """
+        review = Review.objects.create(
+            bike=self.bike, user=self.user, rating=3, comment="Fine"
+        )
+        Review.objects.create(
+            bike=self.bike, user=self.other_user, rating=5, comment="Good"
+        )
+        self.client.post(reverse('delete_review', kwargs={'pk': review.pk}))
+        self.bike.refresh_from_db()
+        self.assertEqual(self.bike.rating_count, 1)
+        self.assertEqual(self.bike.average_rating, 5)
+
+        Review.objects.all().delete()
+        self.bike.refresh_from_db()
+        self.assertEqual(self.bike.rating_count, 0)
+        self.assertEqual(self.bike.average_rating, 0)
+
+
+class ReviewViewQueryBudgetTest(QueryBudgetMixin, TestCase):
+    """
+    Query budgets for the edit_review and delete_review views.
+    """
+
+    def setUp(self):
+        """
+        Set up a bike with 30 reviews, one of them by the logged-in user.
+        """
+        self.author = User.objects.create_user(
+            username='author', password='password'
+        )
+        self.bike = Bike.objects.create(
+            name='Busy Bike', type='City', price_per_hour=8.00
+        )
+        for number in range(29):
+            user = User.objects.create_user(
+                username=f'reader{number}', password='password'
+            )
+            Review.objects.create(
+                bike=self.bike, user=user, rating=number % 5 + 1,
+                comment=f"Review {number}",
+            )
+        self.review = Review.objects.create(
+            bike=self.bike, user=self.author, rating=3, comment="Mine"
+        )
+        self.client.force_login(self.author)
+
+    def test_edit_review_page_budget(self):
+        """
+        Test showing the edit form.
+        """
+        url = reverse('edit_review', kwargs={'pk': self.review.pk})
+        with self.assertQueryBudget(3):
+            self.client.get(url)
+
+    def test_edit_review_submit_budget(self):
+        """
+        Test saving an edited review, including the rating aggregates.
+        """
+        url = reverse('edit_review', kwargs={'pk': self.review.pk})
+        with self.assertQueryBudget(6):
+            self.client.post(url, {'rating': 5, 'comment': "Changed"})
+
+    def test_reviews_fragment_budget(self):
+        """
+        Test loading a page of reviews: one query, authors included.
+        """
+        self.client.logout()
+        url = reverse('bike_reviews', kwargs={'bike_id': self.bike.pk})
+        with self.assertQueryBudget(1):
+            self.client.get(url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def test_delete_review_budget(self):
+        """
+        Test deleting a review, including the rating aggregates.
+        """
+        url = reverse('delete_review', kwargs={'pk': self.review.pk})
+        with self.assertQueryBudget(6):
+            self.client.post(url)
+
+
+class BikeReviewsPaginationTest(TestCase):
+    """
+    Tests for the paginated reviews of the bike detail page.
+    """
+
+    def setUp(self):
+        """
+        Set up a bike with 25 reviews.
+        """
+        self.bike = Bike.objects.create(
+            name='Reviewed Bike', type='City', price_per_hour=8.00
+        )
+        for number in range(25):
+            user = User.objects.create_user(
+                username=f'writer{number}', password='password'
+            )
+            Review.objects.create(
+                bike=self.bike, user=user, rating=4,
+                comment=f"Comment {number}",
+            )
+        self.expected = list(
+            self.bike.reviews.order_by(*REVIEW_ORDERING)
+            .values_list('pk', flat=True)
+        )
+
+    def test_detail_page_renders_first_page_only(self):
+        """
+        Test the detail page shows the newest reviews and a loader.
+        """
+        response = self.client.get(
+            reverse('bike_detail', kwargs={'pk': self.bike.pk})
+        )
+        reviews = [review.pk for review in response.context['reviews']]
+        self.assertEqual(reviews, self.expected[:REVIEWS_PER_PAGE])
+        self.assertContains(response, 'Reviews (25)')
+        self.assertContains(response, 'class="review-loader')
+
+    def test_fragment_pages_cover_all_reviews(self):
+        """
+        Test following the loaders returns every review once, in order.
+        """
+        url = reverse('bike_reviews', kwargs={'bike_id': self.bike.pk})
+        seen = []
+        while url:
+            response = self.client.get(
+                url, HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+            )
+            self.assertTemplateUsed(response, 'reviews/review_list.html')
+            self.assertTemplateNotUsed(response, 'base.html')
+            seen.extend(review.pk for review in response.context['reviews'])
+            url = response.context['next_reviews_url']
+        self.assertEqual(seen, self.expected)
+        self.assertNotContains(response, 'class="review-loader')
+
+    def test_link_without_javascript_gets_a_full_page(self):
+        """
+        Test following 'More reviews' without JavaScript shows the
+        next reviews in the site layout, with a link to the bike.
+        """
+        first = self.client.get(
+            reverse('bike_detail', kwargs={'pk': self.bike.pk})
+        )
+        response = self.client.get(first.context['next_reviews_url'])
+        self.assertTemplateUsed(response, 'base.html')
+        self.assertTemplateUsed(response, 'reviews/review_page.html')
+        reviews = [review.pk for review in response.context['reviews']]
+        self.assertEqual(
+            reviews, self.expected[REVIEWS_PER_PAGE:2 * REVIEWS_PER_PAGE]
+        )
+        self.assertContains(
+            response, reverse('bike_detail', kwargs={'pk': self.bike.pk})
+        )
+        self.assertContains(response, 'class="review-loader')
+
+    def test_bike_without_reviews(self):
+        """
+        Test a bike without reviews shows the empty message and no loader.
+        """
+        bike = Bike.objects.create(
+            name='New Bike', type='City', price_per_hour=8.00
+        )
+        response = self.client.get(
+            reverse('bike_detail', kwargs={'pk': bike.pk})
+        )
+        self.assertContains(response, 'No reviews yet.')
+        self.assertNotContains(response, 'class="review-loader')
+
+
+class ReviewAdminTest(QueryBudgetMixin, TestCase):
+    """
+    Tests for the review changelist on a large table.
+    """
+
+    def setUp(self):
+        """
+        Set up a superuser and 30 reviews by different users.
+        """
+        self.admin = User.objects.create_superuser(
+            username='admin', password='password'
+        )
+        self.bike = Bike.objects.create(
+            name='Reviewed Bike', type='City', price_per_hour=5.00
+        )
+        self.reviews = [
+            Review.objects.create(
+                bike=self.bike, rating=number % 5 + 1, comment="Fine",
+                user=User.objects.create_user(username=f'critic{number}'),
+            )
+            for number in range(30)
+        ]
+        self.client.force_login(self.admin)
+
+    def test_changelist_has_no_per_row_queries(self):
+        """
+        Test the changelist joins the bikes and users of the reviews.
+        """
+        url = reverse('admin:reviews_review_changelist')
+        with self.assertQueryBudget(8):
+            response = self.client.get(url, {'rating__exact': 5})
+        self.assertEqual(response.context['cl'].result_count, 6)
+
+    def test_hide_comments_action(self):
+        """
+        Test the action hides the comments and keeps the ratings.
+        """
+        selected = [review.pk for review in self.reviews[:3]]
+        self.client.post(reverse('admin:reviews_review_changelist'), {
+            'action': 'hide_comments', '_selected_action': selected,
+        })
+        self.assertEqual(
+            Review.objects.filter(comment=HIDDEN_COMMENT).count(), 3
+        )
+        self.bike.refresh_from_db()
+        self.assertEqual(self.bike.rating_count, 30)
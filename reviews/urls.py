@@ -2,6 +2,10 @@ from django.urls import path
 from . import views
 
 urlpatterns = [
+    # HTML fragment with one page of a bike's reviews (infinite scroll).
+    path(
+        'bike/<int:bike_id>/', views.bike_reviews, name='bike_reviews'
+        ),
     # URL for editing a review (uses review primary key pk).
     path('edit/<int:pk>/', views.EditReview.as_view(), name='edit_review'),
     # URL for deleting a review (uses review primary key pk).
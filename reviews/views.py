@@ -6,12 +6,101 @@ from django.contrib.auth.mixins import (
     LoginRequiredMixin, UserPassesTestMixin
 )
 from django.contrib import messages
+from django.views.decorators.http import require_GET
+from django.urls import reverse
+from django.utils.decorators import method_decorator
 # Import Review model and ReviewForm
 from .models import Review
 from .forms import ReviewForm
-from django.shortcuts import get_object_or_404, redirect
+from django.shortcuts import get_object_or_404, redirect, render
+from bikes.models import Bike
+from core.db_router import read_from_replica, stick_to_primary
+from core.pagination import apaginate_keyset, paginate_keyset
 
+# Number of reviews rendered at once, on the bike page and per scroll.
+REVIEWS_PER_PAGE = 10
+# Newest first; 'id' keeps reviews created at the same time in order.
+REVIEW_ORDERING = ('-created_at', '-id')
 
+
+def review_page(bike_id, cursor=None):
+    """
+    Returns one page of a bike's reviews, with their authors.
+
+    **Args:**
+    - `bike_id`: The ID of the reviewed bike.
+    - `cursor`: The cursor of the page, None for the newest reviews.
+
+    **Returns:**
+    - A `CursorPage` of `Review` objects.
+    """
+    return paginate_keyset(
+        bike_reviews_query(bike_id), cursor, REVIEWS_PER_PAGE
+    )
+
+
+async def areview_page(bike_id, cursor=None):
+    """
+    Async version of `review_page`.
+    """
+    return await apaginate_keyset(
+        bike_reviews_query(bike_id), cursor, REVIEWS_PER_PAGE
+    )
+
+
+def bike_reviews_query(bike_id):
+    """
+    Returns a bike's reviews with their authors, newest first.
+    """
+    return Review.objects.filter(bike_id=bike_id).select_related(
+        'user'
+    ).order_by(*REVIEW_ORDERING)
+
+
+def next_reviews_url(bike_id, page):
+    """
+    Returns the URL of the page after `page`, or None on the last page.
+    """
+    if not page.has_next:
+        return None
+    url = reverse('bike_reviews', kwargs={'bike_id': bike_id})
+    return f'{url}?cursor={page.next_cursor}'
+
+
+@require_GET
+@read_from_replica
+def bike_reviews(request, bike_id):
+    """
+    Renders one page of a bike's reviews as an HTML fragment.
+
+    The bike detail page only renders the first page, the next ones
+    are requested by `review-loader.js` as the visitor scrolls. A
+    'More reviews' link followed without JavaScript (no
+    `X-Requested-With` header) gets the page inside the site layout.
+
+    **Args:**
+    - `request`: The HTTP request object, with an optional `cursor`.
+    - `bike_id`: The ID of the bike whose reviews are shown.
+
+    **Returns:**
+    - An `HttpResponse` rendering `reviews/review_list.html`, or
+    `reviews/review_page.html` for a full page.
+    """
+    page = review_page(bike_id, request.GET.get('cursor'))
+    context = {
+        'reviews': page,
+        'next_reviews_url': next_reviews_url(bike_id, page),
+    }
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return render(request, 'reviews/review_list.html', context)
+    context['bike'] = get_object_or_404(
+        Bike.objects.only('name', 'rating_count'), pk=bike_id
+    )
+    return render(request, 'reviews/review_page.html', context)
+
+
+# Keeps the author on the primary after saving, see core.db_router.
+@method_decorator(stick_to_primary, name='post')
 class EditReview(LoginRequiredMixin, UserPassesTestMixin, generic.UpdateView):
     """
     Allows a logged-in user to edit their own review.
@@ -31,6 +120,15 @@ class EditReview(LoginRequiredMixin, UserPassesTestMixin, generic.UpdateView):
     # Template used to render the edit form.
     template_name = "reviews/edit_review.html"
 
+    def get_object(self, queryset=None):
+        """
+        Returns the review, loading it only once per request
+        (`test_func` and the update view both need it).
+        """
+        if not hasattr(self, '_review'):
+            self._review = super().get_object(queryset)
+        return self._review
+
     def test_func(self):
         """
         Checks if the current user is the author of the review.
@@ -41,7 +139,8 @@ class EditReview(LoginRequiredMixin, UserPassesTestMixin, generic.UpdateView):
         # Get the review object that is being edited.
         review = self.get_object()
         # Check if the logged-in user is the same as the user who did review.
-        return self.request.user == review.user
+        # Compare ids so the author does not need to be loaded.
+        return self.request.user.pk == review.user_id
 
     def get_success_url(self):
         """
@@ -50,16 +149,17 @@ class EditReview(LoginRequiredMixin, UserPassesTestMixin, generic.UpdateView):
         **Returns:**
         - The URL of the bike's detail page.
         """
-        # Get the bike associated with the review that was just updated.
-        bike = self.object.bike
         # Create a success message to be displayed on the next page.
         messages.success(
             self.request, 'Your review has been updated successfully.'
             )
         # Return the URL for the associated bike's detail page.
-        return reverse_lazy('bike_detail', kwargs={'pk': bike.pk})
+        return reverse_lazy(
+            'bike_detail', kwargs={'pk': self.object.bike_id}
+            )
 
 
+@method_decorator(stick_to_primary, name='post')
 class DeleteReview(LoginRequiredMixin, UserPassesTestMixin, View):
     """
     Handles the deletion of a review via a POST request,
@@ -81,12 +181,10 @@ class DeleteReview(LoginRequiredMixin, UserPassesTestMixin, View):
         **Returns:** An `HttpResponseRedirect` to the bike's
         detail page.
         """
-        # Retrieve the specific review to be deleted.
-        review = get_object_or_404(
-            Review, pk=kwargs['pk'], user=request.user
-            )
+        # The review to be deleted, loaded (and checked) by test_func.
+        review = self.review
         # Store the primary key of bike before deleting the review.
-        bike_pk = review.bike.pk
+        bike_pk = review.bike_id
         # Delete review object from the database.
         review.delete()
         # Create a success message for the user.
@@ -103,6 +201,7 @@ class DeleteReview(LoginRequiredMixin, UserPassesTestMixin, View):
         - `True` if the user is the author, `False` otherwise.
         """
         # Get the review object based on primary key from the URL.
-        review = get_object_or_404(Review, pk=self.kwargs['pk'])
+        # Keep it for the post method.
+        self.review = get_object_or_404(Review, pk=self.kwargs['pk'])
         # Verify that logged-in user is the review author.
-        return self.request.user == review.user
+        return self.request.user.pk == self.review.user_id
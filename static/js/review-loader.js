@@ -0,0 +1,40 @@
+document.addEventListener('DOMContentLoaded', function () {
+    // Fetch the next page of reviews and put it in place of the loader
+    function loadNextPage(loader, observer) {
+        observer.unobserve(loader);
+        fetch(loader.dataset.nextUrl, { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`Reviews request failed (${response.status})`);
+                }
+                return response.text();
+            })
+            .then(html => {
+                // The fragment ends with its own loader if there are more pages
+                loader.insertAdjacentHTML('beforebegin', html);
+                const parent = loader.parentNode;
+                loader.remove();
+                parent.querySelectorAll('.review-loader').forEach(next => observer.observe(next));
+            })
+            .catch(() => {
+                // Keep the 'More reviews' link so the visitor can still follow it
+                loader.classList.add('review-loader-failed');
+            });
+    }
+
+    // Without IntersectionObserver the 'More reviews' link keeps working
+    if (!('IntersectionObserver' in window)) {
+        return;
+    }
+
+    // Start loading a little before the loader becomes visible
+    const observer = new IntersectionObserver(entries => {
+        entries.forEach(entry => {
+            if (entry.isIntersecting) {
+                loadNextPage(entry.target, observer);
+            }
+        });
+    }, { rootMargin: '200px' });
+
+    document.querySelectorAll('.review-loader').forEach(loader => observer.observe(loader));
+});
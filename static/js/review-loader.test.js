@@ -0,0 +1,83 @@
+/**
+ * @jest-environment jsdom
+ */
+
+// This helper function creates the first page of reviews with a loader
+const setupHTML = () => {
+  document.body.innerHTML = `
+    <div id="reviews">
+      <div class="card">First review</div>
+      <div class="review-loader" data-next-url="/reviews/bike/1/?cursor=abc">
+        <a href="/reviews/bike/1/?cursor=abc">More reviews</a>
+      </div>
+    </div>
+  `;
+};
+
+// Flush the pending promise callbacks of fetch() and response.text()
+const flushPromises = () => new Promise(resolve => setTimeout(resolve, 0));
+
+describe('Review Loader', () => {
+  let observed;
+  let callback;
+
+  beforeEach(() => {
+    jest.resetModules();
+    setupHTML();
+
+    // jsdom has no IntersectionObserver, record what the script observes instead
+    observed = [];
+    window.IntersectionObserver = jest.fn(cb => {
+      callback = cb;
+      return {
+        observe: element => observed.push(element),
+        unobserve: element => { observed = observed.filter(e => e !== element); },
+      };
+    });
+
+    require('./review-loader.js');
+    document.dispatchEvent(new Event('DOMContentLoaded'));
+  });
+
+  // Simulate the loader scrolling into view
+  const scrollToLoader = () => {
+    callback([{ isIntersecting: true, target: observed[0] }]);
+  };
+
+  test('should observe the loader of the first page', () => {
+    expect(observed).toHaveLength(1);
+    expect(observed[0]).toHaveClass('review-loader');
+  });
+
+  test('should append the next page and observe its loader', async () => {
+    global.fetch = jest.fn(() => Promise.resolve({
+      ok: true,
+      text: () => Promise.resolve(
+        '<div class="card">Second review</div>' +
+        '<div class="review-loader" data-next-url="/reviews/bike/1/?cursor=def"></div>'
+      ),
+    }));
+
+    scrollToLoader();
+    await flushPromises();
+
+    expect(global.fetch).toHaveBeenCalledWith('/reviews/bike/1/?cursor=abc', expect.anything());
+    expect(document.querySelectorAll('.card')).toHaveLength(2);
+    // The old loader is replaced by the one from the new page
+    const loaders = document.querySelectorAll('.review-loader');
+    expect(loaders).toHaveLength(1);
+    expect(loaders[0].dataset.nextUrl).toBe('/reviews/bike/1/?cursor=def');
+    expect(observed).toEqual([loaders[0]]);
+  });
+
+  test('should keep the link when the request fails', async () => {
+    global.fetch = jest.fn(() => Promise.resolve({ ok: false, status: 500 }));
+
+    scrollToLoader();
+    await flushPromises();
+
+    const loader = document.querySelector('.review-loader');
+    expect(loader).toHaveClass('review-loader-failed');
+    expect(loader.querySelector('a')).toHaveTextContent('More reviews');
+  });
+});